@@ -1,5 +1,7 @@
 __all__ = [
     "CorpusReplaceOrthFromReferenceCorpus",
+    "CorpusToParquetJob",
+    "ParquetToCorpusJob",
     "CorpusReplaceOrthFromTxtJob",
     "CorpusToStmJob",
     "CorpusToTextDictJob",
@@ -9,7 +11,7 @@ __all__ = [
 import itertools
 import re
 
-from typing import Dict, List, Optional, Tuple, Union
+from typing import Any, Dict, List, Optional, Tuple, Union
 
 from sisyphus import *
 
@@ -302,3 +304,82 @@ class CorpusToTxtJob(Job):
             for segment in c.segments():
                 if (not segments_whitelist) or (segment.fullname() in segments_whitelist):
                     f.write(segment.orth + "\n")
+
+
+class CorpusToParquetJob(Job):
+    """
+    Converts a Bliss corpus into a Parquet dataset with one row per segment, see :mod:`i6_core.lib.corpus_parquet`.
+
+    The columns can be read without parsing the XML, e.g. with
+    :func:`i6_core.lib.corpus_parquet.load_corpus_table` which pushes filters (duration, speaker, ...) down
+    to the row groups, or with any other Arrow based loader.
+    Requires `pyarrow`.
+    """
+
+    def __init__(
+        self,
+        bliss_corpus: tk.Path,
+        include_audio: bool = False,
+        rows_per_file: int = 1000000,
+        row_group_size: int = 10000,
+        compression: str = "zstd",
+    ):
+        """
+        :param bliss_corpus: Bliss corpus
+        :param include_audio: store the audio file content in the binary column `audio_bytes`,
+            only possible if each recording has a single segment
+        :param rows_per_file: maximum number of segments per Parquet file
+        :param row_group_size: number of segments per row group, the granularity of the filter pushdown
+        :param compression: Parquet compression codec
+        """
+        self.bliss_corpus = bliss_corpus
+        self.include_audio = include_audio
+        self.rows_per_file = rows_per_file
+        self.row_group_size = row_group_size
+        self.compression = compression
+
+        self.out_dataset = self.output_path("dataset", directory=True)
+
+        self.rqmt = {"cpu": 1, "mem": 4 if include_audio else 2, "time": 4 if include_audio else 1}
+
+    def tasks(self):
+        yield Task("run", rqmt=self.rqmt)
+
+    def run(self):
+        from i6_core.lib.corpus_parquet import bliss_to_parquet
+
+        bliss_to_parquet(
+            self.bliss_corpus.get_path(),
+            self.out_dataset.get_path(),
+            include_audio=self.include_audio,
+            rows_per_file=self.rows_per_file,
+            row_group_size=self.row_group_size,
+            compression=self.compression,
+        )
+
+
+class ParquetToCorpusJob(Job):
+    """
+    Converts a Parquet dataset written by :class:`CorpusToParquetJob` back into a Bliss corpus.
+    Without filters the corpus is identical to the original one.
+    Requires `pyarrow`.
+    """
+
+    def __init__(self, parquet_dataset: tk.Path, filters: Optional[List[Tuple[str, str, Any]]] = None):
+        """
+        :param parquet_dataset: output folder of :class:`CorpusToParquetJob`
+        :param filters: only keep the segments matching all these filters,
+            in the format of :func:`pyarrow.parquet.read_table`, e.g. `[("duration", "<=", 20.0)]`
+        """
+        self.parquet_dataset = parquet_dataset
+        self.filters = filters
+
+        self.out_corpus = self.output_path("corpus.xml.gz")
+
+    def tasks(self):
+        yield Task("run", rqmt={"cpu": 1, "mem": 2, "time": 1})
+
+    def run(self):
+        from i6_core.lib.corpus_parquet import parquet_to_bliss
+
+        parquet_to_bliss(self.parquet_dataset.get_path(), self.out_corpus.get_path(), filters=self.filters)
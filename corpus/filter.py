@@ -23,21 +23,15 @@ from sisyphus import *
 Path = setup_path(__package__)
 
 
-def _delete_empty_recordings(corpus: corpus.Corpus, removed_recordings_file: str):
+def _write_removed_recordings(removed_recordings: List[str], removed_recordings_file: str):
     """
-    Deletes all recordings that are empty after the filtering done by some of the jobs in this file.
+    Writes the recordings that are empty after the filtering done by some of the jobs in this file.
 
-    :param c: Corpus for which to delete the empty recordings.
+    :param removed_recordings: full names of the removed recordings
     :param removed_recordings_file: File in which to dump all recordings that have been deleted.
     """
-    to_delete = []
-    for rec in corpus.all_recordings():
-        if not rec.segments:
-            to_delete.append(rec)
-
-    corpus.remove_recordings(to_delete)
     with open(removed_recordings_file, "w") as f:
-        f.write("\n".join(rec.fullname() for rec in to_delete))
+        f.write("\n".join(removed_recordings))
 
 
 class FilterSegmentsByListJob(Job):
@@ -240,28 +234,29 @@ class FilterCorpusBySegmentsJob(Job):
         yield Task("run", resume="run", mini_task=True)
 
     def run(self):
-        segments = []
+        segments = set()
+        num_lines = 0
         for seg in self.segment_file_list:
             with open(tk.uncached_path(seg)) as f:
-                lines = f.readlines()
-                segments += [l.strip() for l in lines]
+                for line in f:
+                    segments.add(line.strip())
+                    num_lines += 1
 
-        logging.info("There are #{} segments in the segment list.".format(len(segments)))
-        segments = set(segments)
-        c = corpus.Corpus()
-        c.load(tk.uncached_path(self.bliss_corpus))
+        logging.info("There are #{} segments in the segment list.".format(num_lines))
 
-        for rec in c.all_recordings():
-            if self.invert_match:
-                rec.segments = [x for x in rec.segments if x.fullname() not in segments and x.name not in segments]
-            else:
-                rec.segments = [x for x in rec.segments if x.fullname() in segments or x.name in segments]
+        def segment_filter(c: corpus.Corpus, recording: corpus.Recording, segment: corpus.Segment) -> bool:
+            in_list = segment.name in segments or recording.fullname() + "/" + segment.name in segments
+            return in_list != self.invert_match
 
-        if self.delete_empty_recordings:
-            # Remove the recordings without segments due to the filtering.
-            _delete_empty_recordings(c, self.out_removed_recordings.get_path())
+        removed_recordings = corpus.filter_corpus(
+            tk.uncached_path(self.bliss_corpus),
+            tk.uncached_path(self.out_corpus),
+            segment_filter,
+            delete_empty_recordings=self.delete_empty_recordings,
+        )
 
-        c.dump(tk.uncached_path(self.out_corpus))
+        if self.delete_empty_recordings:
+            _write_removed_recordings(removed_recordings, self.out_removed_recordings.get_path())
 
 
 class FilterCorpusRemoveUnknownWordSegmentsJob(Job):
@@ -315,9 +310,6 @@ class FilterCorpusRemoveUnknownWordSegmentsJob(Job):
             for o in l.findall(".//orth")
         }
 
-        c = corpus.Corpus()
-        c.load(self.corpus.get_path())
-
         def unknown_filter(corpus: corpus.Corpus, recording: corpus.Recording, segment: corpus.Segment) -> bool:
             """
             :param corpus: needed to match the filter signature
@@ -335,13 +327,15 @@ class FilterCorpusRemoveUnknownWordSegmentsJob(Job):
             else:
                 return all(w in vocabulary for w in words)
 
-        c.filter_segments(unknown_filter)
+        removed_recordings = corpus.filter_corpus(
+            self.corpus.get_path(),
+            self.out_corpus.get_path(),
+            unknown_filter,
+            delete_empty_recordings=self.delete_empty_recordings,
+        )
 
         if self.delete_empty_recordings:
-            # Remove the recordings without segments due to the filtering.
-            _delete_empty_recordings(c, self.out_removed_recordings.get_path())
-
-        c.dump(self.out_corpus.get_path())
+            _write_removed_recordings(removed_recordings, self.out_removed_recordings.get_path())
 
 
 class FilterCorpusBySegmentDurationJob(Job):
@@ -386,12 +380,12 @@ class FilterCorpusBySegmentDurationJob(Job):
             else:
                 return l >= self.min_duration and l <= self.max_duration
 
-        c = corpus.Corpus()
-        c.load(self.bliss_corpus.get_path())
-        c.filter_segments(good_duration)
+        removed_recordings = corpus.filter_corpus(
+            self.bliss_corpus.get_path(),
+            self.out_corpus.get_path(),
+            good_duration,
+            delete_empty_recordings=self.delete_empty_recordings,
+        )
 
         if self.delete_empty_recordings:
-            # Remove the recordings without segments due to the filtering.
-            _delete_empty_recordings(c, self.out_removed_recordings.get_path())
-
-        c.dump(self.out_corpus.get_path())
+            _write_removed_recordings(removed_recordings, self.out_removed_recordings.get_path())
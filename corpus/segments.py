@@ -15,23 +15,134 @@ import os
 import random
 import re
 
+from typing import Dict, List, Optional
+
 import numpy as np
 
 from i6_core.util import MultiOutputPath
 from i6_core.lib import corpus
-from i6_core.util import chunks, uopen
+from i6_core.lib.audio import compute_rec_duration
+from i6_core.util import balanced_partition, chunks, uopen
 
 from sisyphus import *
 
 Path = setup_path(__package__)
 
 
+def _load_audio_durations(audio_durations_file: Optional[tk.Path]) -> Dict[str, float]:
+    """
+    :param audio_durations_file: audio/duration pairs separated by a tab, e.g. `out_audio_durations` of
+        :class:`i6_core.corpus.stats.DumpRecordingAudiosJob`
+    :return: duration in seconds per audio file
+    """
+    durations = {}
+    if audio_durations_file is not None:
+        with uopen(audio_durations_file, "rt") as f:
+            for line in f:
+                audio, duration = line.rstrip("\n").rsplit("\t", 1)
+                durations[audio] = float(duration)
+    return durations
+
+
+def _get_segment_durations(
+    c: corpus.Corpus,
+    audio_durations: Optional[Dict[str, float]] = None,
+    segments: Optional[List[str]] = None,
+) -> Dict[str, float]:
+    """
+    Durations of the segments of a corpus. For segments with an infinite end the duration of the recording is
+    taken from `audio_durations` and only computed from the audio file if it is missing there.
+    Each audio file is opened at most once.
+
+    :param c: corpus
+    :param audio_durations: duration per audio file, see :func:`_load_audio_durations`
+    :param segments: only return the durations of these segment names
+    :return: duration in seconds per segment full name, in corpus order
+    """
+    audio_durations = dict(audio_durations or {})
+    segment_set = set(segments) if segments is not None else None
+    durations = {}
+    for segment in c.segments():
+        name = segment.fullname()
+        if segment_set is not None and name not in segment_set:
+            continue
+        end = segment.end
+        if np.isinf(end):
+            audio = segment.recording.audio
+            if audio not in audio_durations:
+                audio_durations[audio] = compute_rec_duration(audio)
+            end = audio_durations[audio]
+        durations[name] = end - segment.start
+    return durations
+
+
+def _split_costs(
+    c: corpus.Corpus,
+    segments: List[str],
+    audio_durations_file: Optional[tk.Path],
+    orth_weight: float,
+) -> List[float]:
+    """
+    :return: audio duration plus `orth_weight` times the number of words for each of the segments
+    """
+    durations = _get_segment_durations(c, _load_audio_durations(audio_durations_file), segments)
+    missing = [s for s in segments if s not in durations]
+    assert not missing, "%d segments are not in the corpus, e.g. %s" % (len(missing), missing[0])
+    costs = dict(durations)
+    if orth_weight != 0.0:
+        for segment in c.segments():
+            name = segment.fullname()
+            if name in costs:
+                costs[name] += orth_weight * len((segment.orth or "").split())
+    return [costs[s] for s in segments]
+
+
+def _split_segments(segments: List, concurrent: int, costs: Optional[List[float]] = None) -> List[List]:
+    """
+    :param segments:
+    :param concurrent: number of parts
+    :param costs: if given, the parts are balanced by these costs instead of the number of segments
+    :return: concurrent lists of segments, each in the original order
+    """
+    if costs is None:
+        return list(chunks(segments, concurrent))
+    return [[segments[idx] for idx in part] for part in balanced_partition(costs, concurrent)]
+
+
 class SegmentCorpusJob(Job):
-    def __init__(self, bliss_corpus, num_segments):
+    """
+    Splits the segments of a corpus into `num_segments` segment files, e.g. for concurrent RASR tasks.
+
+    By default all parts have the same number of segments. With `balance_by_duration` the parts are balanced by the
+    total audio duration instead, which avoids waiting for a few tasks with much more audio on mixed-length data.
+    """
+
+    __sis_hash_exclude__ = {"balance_by_duration": False, "audio_durations": None, "orth_weight": 0.0}
+
+    def __init__(
+        self,
+        bliss_corpus,
+        num_segments,
+        balance_by_duration: bool = False,
+        audio_durations: Optional[tk.Path] = None,
+        orth_weight: float = 0.0,
+    ):
+        """
+        :param tk.Path bliss_corpus:
+        :param int num_segments: number of segment files
+        :param balance_by_duration: balance the total audio duration of the parts instead of the segment count
+        :param audio_durations: durations of the audio files as written by
+            :class:`i6_core.corpus.stats.DumpRecordingAudiosJob`, used for segments with an infinite end.
+            Recordings missing in this file are read to get the duration.
+        :param orth_weight: cost in seconds that is added per orth word when balancing the parts
+        """
         self.set_vis_name("Segment Corpus")
 
         self.bliss_corpus = bliss_corpus
         self.num_segments = num_segments
+        self.balance_by_duration = balance_by_duration
+        self.audio_durations = audio_durations
+        self.orth_weight = orth_weight
         self.out_single_segment_files = dict(
             (i, self.output_path("segments.%d" % i)) for i in range(1, num_segments + 1)
         )
@@ -44,12 +155,15 @@ class SegmentCorpusJob(Job):
         c = corpus.Corpus()
         c.load(self.bliss_corpus.get_path())
 
-        all_segments = list(c.segments())
+        all_segments = [segment.fullname() for segment in c.segments()]
+        costs = None
+        if self.balance_by_duration:
+            costs = _split_costs(c, all_segments, self.audio_durations, self.orth_weight)
 
-        for idx, segments in enumerate(chunks(all_segments, self.num_segments)):
+        for idx, segments in enumerate(_split_segments(all_segments, self.num_segments, costs)):
             with open(self.out_single_segment_files[idx + 1].get_path(), "wt") as segment_file:
                 for segment in segments:
-                    segment_file.write(segment.fullname() + "\n")
+                    segment_file.write(segment + "\n")
 
 
 class SegmentCorpusBySpeakerJob(Job):
@@ -213,9 +327,33 @@ class ShuffleAndSplitSegmentsJob(Job):
 
 
 class SplitSegmentFileJob(Job):
-    def __init__(self, segment_file, concurrent=1):
+    """
+    Splits a segment file into `concurrent` parts with the same number of segments, or with the same total audio
+    duration if a corpus is given.
+    """
+
+    __sis_hash_exclude__ = {"bliss_corpus": None, "audio_durations": None, "orth_weight": 0.0}
+
+    def __init__(
+        self,
+        segment_file,
+        concurrent=1,
+        bliss_corpus: Optional[tk.Path] = None,
+        audio_durations: Optional[tk.Path] = None,
+        orth_weight: float = 0.0,
+    ):
+        """
+        :param tk.Path segment_file:
+        :param int concurrent: number of parts
+        :param bliss_corpus: if given, the parts are balanced by the audio duration of the segments in this corpus
+        :param audio_durations: durations of the audio files, see :class:`SegmentCorpusJob`
+        :param orth_weight: cost in seconds that is added per orth word when balancing the parts
+        """
         self.segment_file = segment_file
         self.concurrent = concurrent
+        self.bliss_corpus = bliss_corpus
+        self.audio_durations = audio_durations
+        self.orth_weight = orth_weight
 
         self.out_single_segments = {i: self.output_path("segments.%d" % i) for i in range(1, self.concurrent + 1)}
         self.out_segment_path = MultiOutputPath(self, "segments.$(TASK)", self.out_single_segments, cached=True)
@@ -227,14 +365,15 @@ class SplitSegmentFileJob(Job):
         with open(self.segment_file.get_path(), "rt") as f:
             lines = [l for l in f.readlines() if len(l.strip()) > 0]
 
-        n = len(lines)
-        m = n % self.concurrent
-        end = 0
-        for i in range(1, self.concurrent + 1):
-            start = end
-            end += n // self.concurrent + (1 if i <= m else 0)
+        costs = None
+        if self.bliss_corpus is not None:
+            c = corpus.Corpus()
+            c.load(self.bliss_corpus.get_path())
+            costs = _split_costs(c, [l.strip() for l in lines], self.audio_durations, self.orth_weight)
+
+        for i, part in enumerate(_split_segments(lines, self.concurrent, costs), start=1):
             with open(self.out_single_segments[i].get_path(), "wt") as f:
-                f.writelines(lines[start:end])
+                f.writelines(part)
 
 
 class DynamicSplitSegmentFileJob(Job):
@@ -242,15 +381,31 @@ class DynamicSplitSegmentFileJob(Job):
     """
     Split the segments to concurrent many shares. It is a variant to the existing SplitSegmentFileJob.
     This requires a tk.Delayed variable (instead of int) for the argument concurrent.
+    If a corpus is given, the splits are balanced by audio duration instead of the number of segments.
     """
 
-    def __init__(self, segment_file, concurrent):
+    __sis_hash_exclude__ = {"bliss_corpus": None, "audio_durations": None, "orth_weight": 0.0}
+
+    def __init__(
+        self,
+        segment_file,
+        concurrent,
+        bliss_corpus: Optional[tk.Path] = None,
+        audio_durations: Optional[tk.Path] = None,
+        orth_weight: float = 0.0,
+    ):
         """
         :param tk.Path|str segment_file: segment file
         :param tk.Delayed concurrent: number of splits
+        :param bliss_corpus: if given, the splits are balanced by the audio duration of the segments in this corpus
+        :param audio_durations: durations of the audio files, see :class:`SegmentCorpusJob`
+        :param orth_weight: cost in seconds that is added per orth word when balancing the splits
         """
         self.segment_file = segment_file
         self.concurrent = concurrent
+        self.bliss_corpus = bliss_corpus
+        self.audio_durations = audio_durations
+        self.orth_weight = orth_weight
         self.out_split_dir = self.output_path("split", directory=True)
 
     def tasks(self):
@@ -260,30 +415,65 @@ class DynamicSplitSegmentFileJob(Job):
         with uopen(self.segment_file, "rt") as f:
             lines = [l for l in f.readlines() if len(l.strip()) > 0]
 
-        nb_seg = len(lines)
         self.concurrent = self.concurrent.get()
-        seg_per_split = nb_seg // self.concurrent
-        nb_rest_seg = nb_seg % self.concurrent
-        end = 0
-        for i in range(1, self.concurrent + 1):
-            start = end
+        costs = None
+        if self.bliss_corpus is not None:
+            c = corpus.Corpus()
+            c.load(self.bliss_corpus.get_path())
+            costs = _split_costs(c, [l.strip() for l in lines], self.audio_durations, self.orth_weight)
+
+        for i, part in enumerate(_split_segments(lines, self.concurrent, costs), start=1):
             fpath = "{}/segments.{}".format(self.out_split_dir, i)
-            end += seg_per_split + (1 if i <= nb_rest_seg else 0)
             with open(fpath, "wt") as f:
-                f.writelines(lines[start:end])
+                f.writelines(part)
 
 
 class SortSegmentsByLengthAndShuffleJob(Job):
-    def __init__(self, crp, shuffle_strength=1.0, shuffle_seed=0x3C5EA3E47D4E0077):
+    """
+    Orders segments randomly with a preference for short segments, e.g. for a curriculum in the first epochs.
+
+    Segment i is drawn without replacement with a probability proportional to exp(-shuffle_strength * length_i).
+
+    With `sampler="choice"` this is sampled with `numpy.random.choice`, which is quadratic in the number of segments
+    and fails if the probabilities of long segments underflow. Segments with an infinite end are only used
+    for .wav recordings.
+    With `sampler="exp_keys"` it is sampled in O(N log N) by sorting with exponential keys (Efraimidis-Spirakis),
+    which are computed in log-space as log(E_i) + shuffle_strength * length_i with E_i ~ Exp(1), so long segments
+    do not underflow. Segments with an infinite end are used for all audio formats. Both samplers draw from the same
+    distribution, but result in different orders for the same seed.
+    """
+
+    __sis_hash_exclude__ = {"bucket_size": None, "audio_durations": None, "sampler": "choice"}
+
+    def __init__(
+        self,
+        crp,
+        shuffle_strength=1.0,
+        shuffle_seed=0x3C5EA3E47D4E0077,
+        bucket_size: Optional[int] = None,
+        audio_durations: Optional[tk.Path] = None,
+        sampler: str = "choice",
+    ):
         """
         :param crp: rasr.crp.CommonRasrParameters
         :param shuffle_strength: float in [0,inf) determines how much the length should affect sorting
                                  0 -> completely random; inf -> strictly sorted
         :param shuffle_seed: random number seed
+        :param bucket_size: if set, the ordered segments are grouped into consecutive buckets of this many segments
+            and the order of the buckets is shuffled, so that batches of similar length appear in random order
+        :param audio_durations: durations of the audio files as written by
+            :class:`i6_core.corpus.stats.DumpRecordingAudiosJob`, used for segments with an infinite end,
+            only supported by the "exp_keys" sampler
+        :param sampler: "choice" or "exp_keys", see the class description
         """
+        assert sampler in ["choice", "exp_keys"], "unknown sampler %s" % sampler
+        assert audio_durations is None or sampler == "exp_keys", "audio_durations needs the exp_keys sampler"
         self.crp = crp
         self.shuffle_strength = shuffle_strength
         self.shuffle_seed = shuffle_seed
+        self.bucket_size = bucket_size
+        self.audio_durations = audio_durations
+        self.sampler = sampler
 
         self.out_segments = self.output_path("segments")
 
@@ -299,26 +489,56 @@ class SortSegmentsByLengthAndShuffleJob(Job):
         c.load(corpus_path)
         print(corpus_path)
 
-        segment_dict = {}
-        for segment in c.segments():
-            if segment.fullname() in segments:
-                if np.isinf(segment.end):
-                    if segment.recording.audio[-4:] == ".wav":
-                        import wave
-
-                        with wave.open(segment.recording.audio) as afile:
-                            segment_dict[segment.fullname() + "\n"] = afile.getnframes() / afile.getframerate()
-                else:
-                    segment_dict[segment.fullname() + "\n"] = segment.end - segment.start
+        if self.sampler == "exp_keys":
+            durations = _get_segment_durations(c, _load_audio_durations(self.audio_durations), segments)
+        else:
+            durations = self._get_wav_segment_durations(c, segments)
+        names = list(durations.keys())
+        lengths = np.fromiter(durations.values(), dtype=float, count=len(durations))
+
+        if self.sampler == "exp_keys":
+            rng = np.random.default_rng(self.shuffle_seed)
+        else:
+            # np.random.seed does not accept seeds with more than 32 bits (like the default seed)
+            rng = np.random.RandomState(self.shuffle_seed % 2**32)
+
+        if np.isinf(self.shuffle_strength):
+            order = np.argsort(lengths, kind="stable")
+        elif self.sampler == "exp_keys":
+            keys = np.log(rng.exponential(size=len(lengths))) + self.shuffle_strength * lengths
+            order = np.argsort(keys, kind="stable")
+        else:
+            probs = np.exp(-self.shuffle_strength * lengths)
+            probs /= np.sum(probs)
+            order = rng.choice(len(names), size=len(probs), replace=False, p=probs)
+
+        if self.bucket_size is not None:
+            buckets = [order[i : i + self.bucket_size] for i in range(0, len(order), self.bucket_size)]
+            order = np.concatenate([buckets[i] for i in rng.permutation(len(buckets))]) if buckets else order
 
-        probs = np.exp(-self.shuffle_strength * np.fromiter(segment_dict.values(), dtype=float))
-        probs /= np.sum(probs)
+        with open(self.out_segments.get_path(), "wt") as f:
+            f.writelines(names[i] + "\n" for i in order)
 
-        np.random.seed(self.shuffle_seed)
-        seglist = np.random.choice(list(segment_dict.keys()), size=len(probs), replace=False, p=probs)
+    @staticmethod
+    def _get_wav_segment_durations(c: corpus.Corpus, segments: List[str]) -> Dict[str, float]:
+        """
+        :return: duration per segment in corpus order, segments with an infinite end get the duration of their
+            recording if it is a .wav file and are skipped otherwise
+        """
+        import wave
 
-        with open(self.out_segments.get_path(), "wt") as f:
-            f.writelines(seglist)
+        segment_set = set(segments)
+        durations = {}
+        for segment in c.segments():
+            if segment.fullname() not in segment_set:
+                continue
+            if np.isinf(segment.end):
+                if segment.recording.audio[-4:] == ".wav":
+                    with wave.open(segment.recording.audio) as afile:
+                        durations[segment.fullname()] = afile.getnframes() / afile.getframerate()
+            else:
+                durations[segment.fullname()] = segment.end - segment.start
+        return durations
 
 
 class UpdateSegmentsWithSegmentMapJob(Job):
@@ -322,28 +322,42 @@ class MergeCorporaJob(Job):
         yield Task("run", mini_task=True)
 
     def run(self):
+        if self.merge_strategy == MergeStrategy.MERGE_RECURSIVE:
+            self._run_merge_recursive()
+            return
+
+        corpus_paths = [tk.uncached_path(corpus_path) for corpus_path in self.bliss_corpora]
+        speakers = {}
+        if self.merge_strategy in (MergeStrategy.FLAT, MergeStrategy.CONCATENATE):
+            # the speakers of all corpora are written into the header of the merged corpus
+            for corpus_path in corpus_paths:
+                speakers.update(corpus.load_corpus_header(corpus_path).speakers)
+
+        with corpus.CorpusWriter(self.out_merged_corpus.get_path(), self.name, speakers.values()) as writer:
+            for corpus_path in corpus_paths:
+                if self.merge_strategy == MergeStrategy.SUBCORPORA:
+                    corpus.stream_corpus(corpus_path, writer.out, root_element="subcorpus", indentation="  ")
+                elif self.merge_strategy == MergeStrategy.FLAT:
+                    corpus.stream_corpus(corpus_path, writer.out, root_element=None, subcorpora="flatten")
+                elif self.merge_strategy == MergeStrategy.CONCATENATE:
+                    corpus.stream_corpus(corpus_path, writer.out, root_element=None, subcorpora="skip")
+                else:
+                    assert False, "invalid merge strategy"
+            if self.merge_strategy == MergeStrategy.CONCATENATE:
+                # all recordings are written before the subcorpora, as in Corpus.dump
+                for corpus_path in corpus_paths:
+                    corpus.stream_corpus(corpus_path, writer.out, root_element=None, top_level_recordings=False)
+
+    def _run_merge_recursive(self):
+        """
+        Recordings and subcorpora with the same name are merged, so all corpora are loaded into memory
+        """
         merged_corpus = corpus.Corpus()
         merged_corpus.name = self.name
         for corpus_path in self.bliss_corpora:
             c = corpus.Corpus()
             c.load(tk.uncached_path(corpus_path))
-            if self.merge_strategy == MergeStrategy.SUBCORPORA:
-                merged_corpus.add_subcorpus(c)
-            elif self.merge_strategy == MergeStrategy.FLAT:
-                for rec in c.all_recordings():
-                    merged_corpus.add_recording(rec)
-                merged_corpus.speakers.update(c.speakers)
-            elif self.merge_strategy == MergeStrategy.CONCATENATE:
-                for subcorpus in c.top_level_subcorpora():
-                    merged_corpus.add_subcorpus(subcorpus)
-                for rec in c.top_level_recordings():
-                    merged_corpus.add_recording(rec)
-                for speaker in c.top_level_speakers():
-                    merged_corpus.add_speaker(speaker)
-            elif self.merge_strategy == MergeStrategy.MERGE_RECURSIVE:
-                merged_corpus = MergeCorporaJob.merge_corpora(merged_corpus, c)
-            else:
-                assert False, "invalid merge strategy"
+            merged_corpus = MergeCorporaJob.merge_corpora(merged_corpus, c)
 
         merged_corpus.dump(self.out_merged_corpus.get_path())
 
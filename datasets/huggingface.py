@@ -2,6 +2,7 @@
 https://huggingface.co/docs/datasets/
 """
 
+import os
 from typing import Optional, Any, Union
 from sisyphus import *
 from sisyphus.delayed_ops import DelayedBase
@@ -102,3 +103,72 @@ class DownloadAndPrepareHuggingFaceDatasetJob(Job):
             "token": kwargs["token"],
         }
         return super().hash(d)
+
+
+class HuggingFaceDatasetToParquetJob(Job):
+    """
+    Exports a dataset stored with ``save_to_disk`` (e.g. by :class:`DownloadAndPrepareHuggingFaceDatasetJob`)
+    as sharded Parquet files, which can be read by any Arrow based loader with column selection and filter pushdown,
+    e.g. with :func:`i6_core.lib.corpus_parquet.load_corpus_table`.
+
+    For a ``DatasetDict`` every split is written into its own sub folder.
+
+    pip install datasets
+    """
+
+    def __init__(
+        self,
+        dataset_dir: tk.Path,
+        *,
+        split: Optional[str] = None,
+        rows_per_file: int = 100000,
+        row_group_size: int = 1000,
+        time_rqmt: float = 4,
+        mem_rqmt: float = 4,
+    ):
+        """
+        :param dataset_dir: directory written by ``Dataset.save_to_disk``
+        :param split: only export this split of a ``DatasetDict``
+        :param rows_per_file: maximum number of rows per Parquet file
+        :param row_group_size: number of rows per row group
+        :param float time_rqmt:
+        :param float mem_rqmt:
+        """
+        self.dataset_dir = dataset_dir
+        self.split = split
+        self.rows_per_file = rows_per_file
+        self.row_group_size = row_group_size
+
+        self.rqmt = {"cpu": 1, "mem": mem_rqmt, "time": time_rqmt}
+
+        self.out_dir = self.output_path("dataset", directory=True)
+
+    def tasks(self):
+        yield Task("run", rqmt=self.rqmt)
+
+    def run(self):
+        from datasets import DatasetDict, load_from_disk
+
+        ds = load_from_disk(self.dataset_dir.get_path())
+        if isinstance(ds, DatasetDict):
+            splits = {self.split: ds[self.split]} if self.split is not None else dict(ds)
+        else:
+            assert self.split is None, "the dataset has no splits"
+            splits = {"": ds}
+
+        for split_name, split_ds in splits.items():
+            out_dir = os.path.join(self.out_dir.get_path(), split_name)
+            os.makedirs(out_dir, exist_ok=True)
+            num_shards = max(1, -(-len(split_ds) // self.rows_per_file))
+            for index in range(num_shards):
+                shard = split_ds.shard(num_shards, index, contiguous=True)
+                shard.to_parquet(os.path.join(out_dir, "part-%05d.parquet" % index), batch_size=self.row_group_size)
+            print("Exported %d rows of split %r in %d files" % (len(split_ds), split_name, num_shards))
+
+    @classmethod
+    def hash(cls, kwargs):
+        # the requirements do not influence the result
+        d = dict(kwargs)
+        d.pop("time_rqmt")
+        d.pop("mem_rqmt")
+        return super().hash(d)
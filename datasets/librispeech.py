@@ -120,7 +120,7 @@ class LibriSpeechCreateBlissCorpusJob(Job):
         self.out_corpus = self.output_path("corpus.xml.gz")
 
         self._speakers = {}  # dict(key: id, value: [sex, subset, min, name]
-        self._transcripts = []  # [dict(name, chapter, segment, orth, path)]
+        self._transcripts = []  # [(speaker_id, chapter, segment, orth, path)]
 
     def tasks(self):
         yield Task("run", mini_task=True)
@@ -129,38 +129,34 @@ class LibriSpeechCreateBlissCorpusJob(Job):
         self._get_speakers()
         self._get_transcripts()
 
-        c = corpus.Corpus()
-        c.name = os.path.basename(self.corpus_folder.get_path())
-
-        used_speaker_ids = set()  # store which speakers are used
-
-        for transcript in self._transcripts:
-            name = "{0}-{1}-{2:04d}".format(transcript["speaker_id"], transcript["chapter"], transcript["segment"])
-            recording = corpus.Recording()
-            recording.name = name
-            recording.speaker_name = transcript["speaker_id"]
-            recording.audio = "{}/{}.flac".format(transcript["path"], name)
-
-            used_speaker_ids.add(transcript["speaker_id"])
-
-            segment = corpus.Segment()
-            segment.name = name
-            segment.start = 0
-            segment.end = float("inf")
-            segment.orth = transcript["orth"].strip()
-
-            recording.segments.append(segment)
-            c.recordings.append(recording)
-
+        # the speakers are written first, so only the used speaker ids are collected before streaming the recordings
+        used_speaker_ids = set(transcript[0] for transcript in self._transcripts)
+        speakers = []
         for speaker_id, speaker_info in sorted(self._speakers.items()):
             if speaker_id not in used_speaker_ids:
                 continue
             speaker = corpus.Speaker()
             speaker.name = speaker_id
             speaker.attribs["gender"] = "male" if speaker_info[0] == "M" else "female"
-            c.add_speaker(speaker)
-
-        c.dump(self.out_corpus.get_path())
+            speakers.append(speaker)
+
+        name = os.path.basename(self.corpus_folder.get_path())
+        with corpus.CorpusWriter(self.out_corpus.get_path(), name, speakers) as writer:
+            for speaker_id, chapter, segment_id, orth, path in self._transcripts:
+                name = "{0}-{1}-{2:04d}".format(speaker_id, chapter, segment_id)
+                recording = corpus.Recording()
+                recording.name = name
+                recording.speaker_name = speaker_id
+                recording.audio = "{}/{}.flac".format(path, name)
+
+                segment = corpus.Segment()
+                segment.name = name
+                segment.start = 0
+                segment.end = float("inf")
+                segment.orth = orth
+
+                recording.segments.append(segment)
+                writer.write_recording(recording)
 
     def _get_speakers(self):
         """
@@ -188,14 +184,8 @@ class LibriSpeechCreateBlissCorpusJob(Job):
                     continue
                 with uopen(os.path.join(dirpath, file), "r") as transcription:
                     for line in transcription:
-                        line_t = list(map(str.strip, line.split(" ", 1)))
-                        orth = line_t[1]
-                        procline = line_t[0].split("-")
-                        transcript = {
-                            "speaker_id": int(procline[0]),
-                            "chapter": int(procline[1]),
-                            "segment": int(procline[2]),
-                            "orth": orth,
-                            "path": dirpath,
-                        }
-                        self._transcripts.append(transcript)
+                        seq_name, orth = line.split(" ", 1)
+                        speaker_id, chapter, segment_id = seq_name.strip().split("-")
+                        self._transcripts.append(
+                            (int(speaker_id), int(chapter), int(segment_id), orth.strip(), dirpath)
+                        )
@@ -58,31 +58,27 @@ class LJSpeechCreateBlissCorpusJob(Job):
         yield Task("run", rqmt={"time": 8, "mem": 2})
 
     def run(self):
-        c = corpus.Corpus()
-        c.name = self.name
-
-        with uopen(self.metadata, "rt") as metadata_file:
-            for line in metadata_file:
-                name, text, processed_text = line.split("|")
-                audio_file_path = os.path.join(self.audio_folder.get_path(), name + ".wav")
-                assert os.path.isfile(audio_file_path), "Audio file %s was not found in provided audio path %s" % (
-                    audio_file_path,
-                    self.audio_folder.get_path(),
-                )
-
-                recording = corpus.Recording()
-                recording.name = name
-                recording.audio = audio_file_path
-                segment = corpus.Segment()
-                segment.orth = processed_text.strip()
-                segment.name = name
-
-                wave_info = wave.open(audio_file_path)
-                segment.start = 0
-                segment.end = wave_info.getnframes() / wave_info.getframerate()
-                wave_info.close()
-
-                recording.add_segment(segment)
-                c.add_recording(recording)
-
-        c.dump(self.out_bliss_corpus.get_path())
+        with corpus.CorpusWriter(self.out_bliss_corpus.get_path(), self.name) as writer:
+            with uopen(self.metadata, "rt") as metadata_file:
+                for line in metadata_file:
+                    name, text, processed_text = line.split("|")
+                    audio_file_path = os.path.join(self.audio_folder.get_path(), name + ".wav")
+                    assert os.path.isfile(audio_file_path), "Audio file %s was not found in provided audio path %s" % (
+                        audio_file_path,
+                        self.audio_folder.get_path(),
+                    )
+
+                    recording = corpus.Recording()
+                    recording.name = name
+                    recording.audio = audio_file_path
+                    segment = corpus.Segment()
+                    segment.orth = processed_text.strip()
+                    segment.name = name
+
+                    wave_info = wave.open(audio_file_path)
+                    segment.start = 0
+                    segment.end = wave_info.getnframes() / wave_info.getframerate()
+                    wave_info.close()
+
+                    recording.add_segment(segment)
+                    writer.write_recording(recording)
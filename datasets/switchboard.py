@@ -20,6 +20,7 @@ import re
 from typing import List, DefaultDict
 
 from i6_core.lib import corpus
+from i6_core.lib.conversion import ConversionTask, run_parallel_conversions
 from i6_core.util import uopen
 from i6_core.tools.download import DownloadJob
 
@@ -233,9 +234,6 @@ class CreateSwitchboardBlissCorpusJob(Job):
         yield Task("run", mini_task=True)
 
     def run(self):
-        c = corpus.Corpus()
-        c.name = "switchboard-1"
-
         rec_to_segs = self._get_rec_to_segs_map()
 
         rec_to_speaker = {}
@@ -262,38 +260,38 @@ class CreateSwitchboardBlissCorpusJob(Job):
         if self.skip_empty_ldc_file:
             rec_to_segs.pop("sw02167B")
 
-        for rec_name, segs in sorted(rec_to_segs.items()):
-            recording = corpus.Recording()
-            recording.name = rec_name
-            recording.audio = os.path.join(self.audio_dir.get_path(), rec_name + ".wav")
-
-            assert os.path.exists(recording.audio), "recording {} does not exist?".format(recording.audio)
-
-            assert rec_name in rec_to_speaker, "recording {} does not have speaker id?".format(rec_name)
-            rec_speaker_id = rec_to_speaker[rec_name]["speaker_id"]
-
-            for seg in segs:
-                segment = corpus.Segment()
-                segment.name = seg[0]
-                segment.start = float(seg[1])
-                segment.end = float(seg[2])
-                segment.speaker_name = rec_speaker_id
-                segment.orth = self._filter_orth(seg[3])
-                if len(segment.orth) == 0:
-                    continue
-
-                recording.segments.append(segment)
-            c.recordings.append(recording)
-
-        # add speakers to corpus
+        # speakers are written before the recordings, duplicate speaker ids keep their first position
+        speakers = {}
         for speaker_info in rec_to_speaker.values():
             speaker = corpus.Speaker()
             speaker.name = speaker_info["speaker_id"]
             if speaker_info.get("gender", None):
                 speaker.attribs["gender"] = speaker_info["gender"]
-            c.add_speaker(speaker)
+            speakers[speaker.name] = speaker
+
+        with corpus.CorpusWriter(self.out_corpus.get_path(), "switchboard-1", speakers.values()) as writer:
+            for rec_name, segs in sorted(rec_to_segs.items()):
+                recording = corpus.Recording()
+                recording.name = rec_name
+                recording.audio = os.path.join(self.audio_dir.get_path(), rec_name + ".wav")
+
+                assert os.path.exists(recording.audio), "recording {} does not exist?".format(recording.audio)
+
+                assert rec_name in rec_to_speaker, "recording {} does not have speaker id?".format(rec_name)
+                rec_speaker_id = rec_to_speaker[rec_name]["speaker_id"]
+
+                for seg in segs:
+                    segment = corpus.Segment()
+                    segment.name = seg[0]
+                    segment.start = float(seg[1])
+                    segment.end = float(seg[2])
+                    segment.speaker_name = rec_speaker_id
+                    segment.orth = self._filter_orth(seg[3])
+                    if len(segment.orth) == 0:
+                        continue
 
-        c.dump(self.out_corpus.get_path())
+                    recording.segments.append(segment)
+                writer.write_recording(recording)
 
     def _filter_orth(self, orth):
         """
@@ -392,39 +390,62 @@ class SwitchboardSphereToWaveJob(Job):
     with mulaw encoding to single channel .wav files with s16le encoding
     """
 
-    def __init__(self, sph_audio_folder: tk.Path):
+    __sis_hash_exclude__ = {"num_workers": 1, "retries": 0}
+
+    def __init__(self, sph_audio_folder: tk.Path, num_workers: int = 1, retries: int = 0):
         """
         :param sph_audio_folder:
+        :param num_workers: number of parallel ffmpeg processes
+        :param retries: number of retries if the conversion of a file failed
         """
         self.sph_audio_folder = sph_audio_folder
+        self.num_workers = num_workers
+        self.retries = retries
 
         self.out_wave_audio_folder = self.output_path("wave_audio", directory=True)
 
-        self.rqmt = {"cpu": 1, "mem": 1, "time": 1.0}
+        self.rqmt = {"cpu": num_workers, "mem": 1, "time": 1.0}
 
     def tasks(self):
         yield Task("run", rqmt=self.rqmt)
 
     def run(self):
-        for sph_file in glob.glob(os.path.join(self.sph_audio_folder.get_path(), "**/*.sph"), recursive=True):
+        """
+        Converts the files in parallel, finished files are recorded in `progress.txt` and skipped when the task
+        is restarted, failed conversions are listed in `failed.txt`
+        """
+        conversions = []
+        for sph_file in sorted(glob.glob(os.path.join(self.sph_audio_folder.get_path(), "**/*.sph"), recursive=True)):
             sph_name, ext = os.path.splitext(os.path.basename(sph_file))
-            subprocess.call(
-                [
-                    "ffmpeg",
-                    "-i",
-                    sph_file,
-                    "-filter_complex",
-                    "[0:a]channelsplit=channel_layout=stereo[left][right]",
-                    "-c:a",
-                    "pcm_s16le",
-                    "-map",
-                    "[left]",
-                    os.path.join(self.out_wave_audio_folder.get_path(), f"{sph_name}A.wav"),
-                    "-map",
-                    "[right]",
-                    os.path.join(self.out_wave_audio_folder.get_path(), f"{sph_name}B.wav"),
-                ]
-            )
+            outputs = [
+                os.path.join(self.out_wave_audio_folder.get_path(), f"{sph_name}A.wav"),
+                os.path.join(self.out_wave_audio_folder.get_path(), f"{sph_name}B.wav"),
+            ]
+            command = [
+                "ffmpeg",
+                "-y",
+                "-i",
+                sph_file,
+                "-filter_complex",
+                "[0:a]channelsplit=channel_layout=stereo[left][right]",
+                "-c:a",
+                "pcm_s16le",
+                "-map",
+                "[left]",
+                outputs[0],
+                "-map",
+                "[right]",
+                outputs[1],
+            ]
+            conversions.append(ConversionTask(sph_file, command, outputs))
+
+        run_parallel_conversions(
+            conversions,
+            num_workers=self.num_workers,
+            retries=self.retries,
+            progress_file="progress.txt",
+            failed_file="failed.txt",
+        )
 
 
 #### Evaluation Corpus Helper ####
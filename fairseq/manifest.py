@@ -1,13 +1,15 @@
 from collections import defaultdict
+import concurrent.futures
 import glob
 import numpy as np
 import os
 import random
 import shutil
-import soundfile
-from typing import Sequence, Optional, Type
+import sqlite3
+import tempfile
+from typing import Dict, List, Sequence, Optional, Tuple, Type
 
-from sisyphus import Job, Task, tk
+from sisyphus import Job, Task, tk, gs
 
 
 class MergeAudioDirsJob(Job):
@@ -56,12 +58,26 @@ class CreateManifestJob(Job):
     relative_path_1 [tab] num_frames
     """
 
-    def __init__(self, audio_dir_paths: Sequence[Type[tk.Path]]):
+    def __init__(
+        self,
+        audio_dir_paths: Sequence[Type[tk.Path]],
+        num_threads: int = 8,
+        frames_cache: Optional[str] = None,
+    ):
         """
         :param [tk.Path] audio_dir_paths: List of paths to folder(s) containing raw audio files, the audio files
         from the same language should be in one directory
+        :param int num_threads: number of threads that read the audio file headers, the work is mostly waiting for
+            the file system
+        :param str|None frames_cache: sqlite database that stores the number of frames per audio file together with
+            its modification time and size, it can be shared by several jobs, so unchanged files are not read again.
+            The database is only opened as a copy on the local disk, since sqlite locking is unreliable on network
+            file systems, and the shared file is replaced atomically. Entries of jobs which update the cache at the
+            same time can get lost, the files of these entries are then read again by the next job.
         """
         self.audio_dir_paths = audio_dir_paths
+        self.num_threads = num_threads
+        self.frames_cache = frames_cache
         self.common_dir = os.path.commonpath(self.audio_dir_paths)
         self.concurrent = len(audio_dir_paths)
 
@@ -73,12 +89,26 @@ class CreateManifestJob(Job):
         yield Task("run", rqmt=self.rqmt, args=range(1, self.concurrent + 1))
         yield Task("merge", mini_task=True)
 
+    @classmethod
+    def hash(cls, parsed_args):
+        parsed_args = dict(parsed_args)
+        parsed_args.pop("num_threads")
+        parsed_args.pop("frames_cache")
+        return super().hash(parsed_args)
+
     def run(self, task_id):
+        import soundfile
+
+        paths = list(glob.iglob(self.audio_dir_paths[task_id - 1].get_path() + "/*", recursive=True))
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(self.num_threads, 1)) as executor:
+            if self.frames_cache is None:
+                frames = list(executor.map(lambda path: soundfile.info(path).frames, paths))
+            else:
+                frames = _get_frames_with_cache(paths, self.frames_cache, executor)
         with open("%d.tsv" % task_id, "w") as f:
-            for path in glob.iglob(self.audio_dir_paths[task_id - 1].get_path() + "/*", recursive=True):
-                frames = soundfile.info(path).frames
+            for path, num_frames in zip(paths, frames):
                 rel_path = os.path.relpath(path, self.common_dir)
-                f.write("{}\t{}\n".format(rel_path, frames))
+                f.write("{}\t{}\n".format(rel_path, num_frames))
 
     def merge(self):
         with open(self.out_tsv_file, "w") as f_out:
@@ -169,38 +199,139 @@ class BalanceMultiLingualDatatJob(Job):
                     rel_path_dir = os.path.dirname(rel_path)
                     all_train_data[rel_path_dir].append((rel_path, int(frames)))
 
-            num_corpora = len(all_train_data.keys())
-            corpora_lengths = [sum([frames for _, frames in train_data]) for train_data in all_train_data.values()]
-            sum_corpora_length = sum(corpora_lengths)
-
-            corpora_probs = [(l / sum_corpora_length) for l in corpora_lengths]
-            upsampling_proportions = [p**self.alpha for p in corpora_probs]
-            upsampling_factors = [upsampling_proportions[i] / corpora_probs[i] for i in range(num_corpora)]
-            upsampling_factors = [f / min(upsampling_factors) for f in upsampling_factors]
-
-            upsampled_train_data = []
-            for i, upsample in enumerate(upsampling_factors):
-                upsampled_train_data.append([])
-                while upsample >= 1:
-                    upsampled_train_data[i].extend(list(all_train_data.values())[i])
-                    upsample -= 1
-                if upsample > 0:
-                    added_length = 0
-                    random.shuffle(list(all_train_data.values())[i])
-                    j = 0
-                    while corpora_lengths[i] * upsample > added_length:
-                        upsampled_train_data[i].append(list(all_train_data.values())[i][j])
-                        added_length += list(all_train_data.values())[i][j][1]
-                        j += 1
+            corpora = list(all_train_data.values())
+            corpora_frames = [np.array([frames for _, frames in train_data], dtype=np.int64) for train_data in corpora]
+            corpora_lengths = np.array([frames.sum() for frames in corpora_frames], dtype=np.float64)
 
+            corpora_probs = corpora_lengths / corpora_lengths.sum()
+            upsampling_proportions = corpora_probs**self.alpha
+            upsampling_factors = upsampling_proportions / corpora_probs
+            upsampling_factors = upsampling_factors / upsampling_factors.min()
+
+            # per corpus: the number of full copies and the order and number of the additionally sampled files
+            upsampled_train_data: List[Tuple[List[Tuple[str, int]], int, np.ndarray]] = []
             upsampled_train_data_lengths = []
-            for train_data in upsampled_train_data:
-                upsampled_train_data_lengths.append(sum([frames for _, frames in train_data]))
+            for train_data, frames, length, upsample in zip(
+                corpora, corpora_frames, corpora_lengths, upsampling_factors
+            ):
+                num_copies = int(upsample)
+                upsample -= num_copies
+                order = np.zeros(0, dtype=np.int64)
+                if upsample > 0:
+                    order = np.arange(len(train_data))
+                    random.shuffle(order)
+                    # add shuffled files until the added length reaches the remaining fraction of the corpus length
+                    added_lengths = np.cumsum(frames[order])
+                    num_added = int(np.searchsorted(added_lengths, length * upsample, side="left")) + 1
+                    order = order[: min(num_added, len(order))]
+                upsampled_train_data.append((train_data, num_copies, order))
+                upsampled_train_data_lengths.append(num_copies * length + frames[order].sum())
+
             actual_upsampled_probabilities = np.array(upsampled_train_data_lengths) / sum(upsampled_train_data_lengths)
             # following test might fail if the input corpora are tiny
-            upsampled_probabilities = [p / sum(upsampling_proportions) for p in upsampling_proportions]
+            upsampled_probabilities = upsampling_proportions / upsampling_proportions.sum()
             np.testing.assert_allclose(upsampled_probabilities, actual_upsampled_probabilities, rtol=0.1)
 
-            for i, train_data in enumerate(upsampled_train_data):
-                for path, frames in train_data:
-                    f_out.write("{}\t{}\n".format(path, frames))
+            for train_data, num_copies, order in upsampled_train_data:
+                lines = "".join("{}\t{}\n".format(path, frames) for path, frames in train_data)
+                for _ in range(num_copies):
+                    f_out.write(lines)
+                for idx in order:
+                    f_out.write("{}\t{}\n".format(*train_data[idx]))
+
+
+def _get_frames_with_cache(paths: List[str], cache_file: str, executor: concurrent.futures.Executor) -> List[int]:
+    """
+    Number of frames of the audio files, taken from the cache if the modification time and size are unchanged.
+    The files that are not in the cache are read with the executor and added to the cache.
+
+    :param paths: audio files
+    :param cache_file: sqlite database, created if it does not exist
+    :param executor: runs the file system accesses
+    :return: number of frames of each file
+    """
+    import soundfile
+
+    abs_paths = [os.path.abspath(path) for path in paths]
+    stats = list(executor.map(os.stat, abs_paths))
+
+    with tempfile.TemporaryDirectory(prefix=gs.TMP_PREFIX) as tmp_dir:
+        cached = _read_frames_cache(cache_file, abs_paths, tmp_dir)
+
+        frames = [None] * len(abs_paths)
+        missing = []
+        for idx, (path, stat) in enumerate(zip(abs_paths, stats)):
+            entry = cached.get(path)
+            if entry is not None and entry[:2] == (stat.st_mtime_ns, stat.st_size):
+                frames[idx] = entry[2]
+            else:
+                missing.append(idx)
+
+        for idx, info in zip(missing, executor.map(soundfile.info, [abs_paths[idx] for idx in missing])):
+            frames[idx] = info.frames
+        if missing:
+            entries = [(abs_paths[idx], stats[idx].st_mtime_ns, stats[idx].st_size, frames[idx]) for idx in missing]
+            _update_frames_cache(cache_file, entries, tmp_dir)
+    return frames
+
+
+def _connect_frames_cache(db_file: str) -> sqlite3.Connection:
+    """
+    :param db_file: local copy of the frames cache
+    """
+    connection = sqlite3.connect(db_file)
+    with connection:
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS frames (path TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER, frames INTEGER)"
+        )
+    return connection
+
+
+def _read_frames_cache(cache_file: str, abs_paths: List[str], tmp_dir: str) -> Dict[str, Tuple[int, int, int]]:
+    """
+    :param cache_file: shared frames cache, it is copied to the local disk before it is opened
+    :param abs_paths: audio files
+    :param tmp_dir: local directory for the copy
+    :return: path -> modification time, size and number of frames of the audio files which are in the cache
+    """
+    if not os.path.exists(cache_file):
+        return {}
+    db_file = os.path.join(tmp_dir, "read.db")
+    shutil.copyfile(cache_file, db_file)
+    cached = {}
+    connection = _connect_frames_cache(db_file)
+    try:
+        batch_size = 500
+        for i in range(0, len(abs_paths), batch_size):
+            batch = abs_paths[i : i + batch_size]
+            query = "SELECT path, mtime_ns, size, frames FROM frames WHERE path IN (%s)" % ",".join("?" * len(batch))
+            for path, mtime_ns, size, frames in connection.execute(query, batch):
+                cached[path] = (mtime_ns, size, frames)
+    finally:
+        connection.close()
+    os.remove(db_file)
+    return cached
+
+
+def _update_frames_cache(cache_file: str, entries: List[Tuple[str, int, int, int]], tmp_dir: str):
+    """
+    Adds the entries to the latest version of the shared frames cache and replaces it atomically
+
+    :param cache_file: shared frames cache
+    :param entries: path, modification time, size and number of frames of the audio files
+    :param tmp_dir: local directory for the copy
+    """
+    db_file = os.path.join(tmp_dir, "update.db")
+    if os.path.exists(cache_file):
+        shutil.copyfile(cache_file, db_file)
+    connection = _connect_frames_cache(db_file)
+    try:
+        with connection:
+            connection.executemany("INSERT OR REPLACE INTO frames VALUES (?, ?, ?, ?)", entries)
+    finally:
+        connection.close()
+    tmp_cache_file = os.path.join(
+        os.path.dirname(cache_file) or ".", ".%s.%d.tmp" % (os.path.basename(cache_file), os.getpid())
+    )
+    shutil.copyfile(db_file, tmp_cache_file)
+    os.replace(tmp_cache_file, cache_file)
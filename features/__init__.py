@@ -4,6 +4,7 @@ from .extraction import *
 from .gammatone import *
 from .mfcc import *
 from .mrasta import *
+from .numpy_extraction import *
 from .normalization import *
 from .plp import *
 from .sil_norm import *
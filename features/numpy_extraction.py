@@ -0,0 +1,179 @@
+__all__ = ["NumpyFeatureExtractionJob"]
+
+import copy
+import math
+import multiprocessing
+from typing import Any, Dict, List, Optional, Tuple
+
+from sisyphus import *
+
+Path = setup_path(__package__)
+
+import i6_core.lib.corpus as corpus
+import i6_core.util as util
+
+
+class NumpyFeatureExtractionJob(Job):
+    """
+    Computes filterbank, MFCC or energy features of a bliss corpus in Python, without a RASR binary.
+
+    The features are computed with the vectorized functions of :mod:`i6_core.lib.feature_extraction`, which use the
+    same parameters as the RASR flows from :mod:`i6_core.features.common`. The segments are split into `concurrent`
+    parts that are processed by a local process pool, each part is written into its own RASR cache or HDF file.
+    This is meant for quick experiments and for validating the RASR feature extraction, DC detection is not applied.
+
+    The cache files can be accessed as bundle Path (`out_feature_bundle`) or as MultiOutputPath (`out_feature_path`),
+    HDF files via `out_hdf_files`.
+    """
+
+    FEATURE_NAMES = {"mfcc": "mfcc", "filterbank": "fb", "energy": "energy"}
+
+    def __init__(
+        self,
+        bliss_corpus: tk.Path,
+        feature_type: str,
+        feature_options: Optional[Dict[str, Any]] = None,
+        concurrent: int = 1,
+        output_format: str = "cache",
+        num_workers: int = 4,
+        time_rqmt: float = 4,
+        mem_rqmt: float = 4,
+    ):
+        """
+        :param bliss_corpus: corpus with the segments to extract
+        :param feature_type: "mfcc", "filterbank" or "energy"
+        :param feature_options: arguments to :func:`i6_core.lib.feature_extraction.extract_features`,
+            e.g. `{"fft_options": {"window_shift": 0.01}, "filter_width": 70, "derivatives": 1}`
+        :param concurrent: number of output files
+        :param output_format: "cache" for RASR feature caches or "hdf" for RETURNN HDF files
+        :param num_workers: number of processes that compute the features
+        :param time_rqmt:
+        :param mem_rqmt:
+        """
+        assert feature_type in self.FEATURE_NAMES, "unsupported feature type %s" % feature_type
+        assert output_format in ["cache", "hdf"], "unsupported output format %s" % output_format
+
+        self.bliss_corpus = bliss_corpus
+        self.feature_type = feature_type
+        self.feature_options = copy.deepcopy(feature_options) if feature_options is not None else {}
+        self.concurrent = concurrent
+        self.output_format = output_format
+        self.num_workers = num_workers
+
+        name = self.FEATURE_NAMES[feature_type]
+        if output_format == "cache":
+            self.out_single_feature_caches = dict(
+                (task_id, self.output_path("%s.cache.%d" % (name, task_id), cached=True))
+                for task_id in range(1, concurrent + 1)
+            )
+            self.out_feature_bundle = self.output_path("%s.cache.bundle" % name, cached=True)
+            self.out_feature_path = util.MultiOutputPath(
+                self,
+                "%s.cache.$(TASK)" % name,
+                self.out_single_feature_caches,
+                cached=True,
+            )
+        else:
+            self.out_hdf_files = dict(
+                (task_id, self.output_path("%s.hdf.%d" % (name, task_id))) for task_id in range(1, concurrent + 1)
+            )
+
+        self.rqmt = {"time": time_rqmt, "cpu": num_workers, "mem": mem_rqmt}
+
+    def tasks(self):
+        yield Task("run", rqmt=self.rqmt)
+
+    @classmethod
+    def hash(cls, kwargs):
+        kwargs = dict(kwargs)
+        for key in ["num_workers", "time_rqmt", "mem_rqmt"]:
+            kwargs.pop(key, None)
+        return super().hash(kwargs)
+
+    def run(self):
+        c = corpus.Corpus()
+        c.load(self.bliss_corpus.get_path())
+
+        segments = [
+            (seg.fullname(), rec.audio, seg.start, seg.end, seg.track)
+            for rec in c.all_recordings()
+            for seg in rec.segments
+        ]
+        # util.chunks always returns `concurrent` splits, some of them empty if there are fewer segments
+        splits = list(util.chunks(segments, self.concurrent))
+
+        if self.output_format == "cache":
+            out_files = self.out_single_feature_caches
+            util.write_paths_to_file(self.out_feature_bundle, self.out_single_feature_caches.values())
+            dim = None
+        else:
+            out_files = self.out_hdf_files
+            # every HDF file is created with the feature dimension, also for splits without segments
+            assert len(segments) > 0, "the corpus does not contain any segment"
+            dim = self._feature_dim(segments[0][1])
+
+        with multiprocessing.Pool(self.num_workers) as pool:
+            pool.starmap(
+                self._extract_split,
+                [(out_files[task_id].get_path(), splits[task_id - 1], dim) for task_id in sorted(out_files)],
+            )
+
+    def _feature_dim(self, audio: str) -> int:
+        """
+        :param audio: audio file with the sample rate of the corpus
+        :return: feature dimension, computed from one window of noise
+        """
+        import numpy as np
+        import soundfile
+
+        from i6_core.lib.feature_extraction import extract_features
+
+        sample_rate = soundfile.info(audio).samplerate
+        window_length = self.feature_options.get("fft_options", {}).get("window_length", 0.025)
+        samples = np.random.RandomState(0).uniform(-1000, 1000, int(math.ceil(window_length * sample_rate)) + 1)
+        features, _ = extract_features(samples, sample_rate, self.feature_type, **self.feature_options)
+        return features.shape[1]
+
+    def _extract_split(
+        self, out_file: str, segments: List[Tuple[str, str, float, float, Optional[int]]], dim: Optional[int]
+    ):
+        """
+        :param out_file: RASR cache or HDF file
+        :param segments: list of (segment name, audio file, start, end, track)
+        :param dim: feature dimension, needed for HDF files
+        """
+        import numpy as np
+        import soundfile
+
+        from i6_core.lib.feature_extraction import extract_features
+        from i6_core.lib.rasr_cache import FileArchive
+
+        if self.output_format == "cache":
+            util.delete_if_exists(out_file)
+            writer = FileArchive(out_file)
+        else:
+            from i6_core.lib.hdf import BufferedHDFWriter
+
+            writer = BufferedHDFWriter(out_file, dim=dim, ndim=2)
+
+        for name, audio, start, end, track in segments:
+            sample_rate = soundfile.info(audio).samplerate
+            stop = int(end * sample_rate) if end > start and math.isfinite(end) else None
+            samples, _ = soundfile.read(audio, start=int(start * sample_rate), stop=stop, dtype="int16", always_2d=True)
+            samples = samples[:, track or 0].astype(np.float32)
+
+            features, times = extract_features(samples, sample_rate, self.feature_type, **self.feature_options)
+            if self.output_format == "cache":
+                writer.addFeatureCache(name, features, times + start)
+            else:
+                assert features.shape[1] == dim, "feature dimension %d of %s, expected %d" % (
+                    features.shape[1],
+                    name,
+                    dim,
+                )
+                writer.insert(features, name)
+
+        if self.output_format == "cache":
+            writer.finalize()
+        else:
+            writer.close()
@@ -1,8 +1,13 @@
 __all__ = ["ApplyG2PModelJob"]
 
+import fcntl
+import hashlib
+import json
+import logging
 import os
 import subprocess as sp
 from tempfile import mkstemp
+from typing import Dict, Optional
 
 from sisyphus import *
 
@@ -14,6 +19,11 @@ Path = setup_path(__package__)
 class ApplyG2PModelJob(Job):
     """
     Apply a trained G2P on a word list file
+
+    By default the word list is split into `concurrent` parts which are translated by separate tasks.
+    With `num_workers` a single task translates the words with a local process pool instead: each worker loads the
+    model once and takes the next word from a queue which is ordered longest first. In this mode a persistent cache
+    of translated words per model can be used, so extending a lexicon only translates the new words.
     """
 
     __sis_hash_exclude__ = {"filter_empty_words": False}
@@ -28,6 +38,8 @@ class ApplyG2PModelJob(Job):
         g2p_python=None,
         filter_empty_words=False,
         concurrent=1,
+        num_workers: Optional[int] = None,
+        cache_dir: Optional[str] = None,
     ):
         """
         :param Path g2p_model:
@@ -38,6 +50,10 @@ class ApplyG2PModelJob(Job):
         :param Optional[Path] g2p_python:
         :param bool filter_empty_words: if True, creates a new lexicon file with no empty translated words
         :param int concurrent: split up word list file to parallelize job into this many instances
+        :param num_workers: if set, translate all words in a single task with this many local processes,
+            `concurrent` is ignored in this case
+        :param cache_dir: folder with the persistent translation caches, only used together with `num_workers`.
+            Defaults to `gs.G2P_CACHE_DIR` if it is set.
         """
         self.g2p_model = g2p_model
         self.g2p_path = get_g2p_path(g2p_path)
@@ -47,6 +63,8 @@ class ApplyG2PModelJob(Job):
         self.word_list = word_list_file
         self.filter_empty_words = filter_empty_words
         self.concurrent = concurrent
+        self.num_workers = num_workers
+        self.cache_dir = cache_dir if cache_dir is not None else getattr(gs, "G2P_CACHE_DIR", None)
 
         self.out_g2p_lexicon = self.output_path("g2p.lexicon")
         self.out_g2p_untranslated = self.output_path("g2p.untranslated")
@@ -54,9 +72,13 @@ class ApplyG2PModelJob(Job):
         self.rqmt = {"cpu": 1, "mem": 1, "time": 2}
 
     def tasks(self):
-        yield Task("split_word_list", mini_task=True)
-        yield Task("run", rqmt=self.rqmt, args=range(1, self.concurrent + 1))
-        yield Task("merge", mini_task=True)
+        if self.num_workers is not None:
+            rqmt = {"cpu": self.num_workers, "mem": self.rqmt["mem"] * self.num_workers, "time": self.rqmt["time"]}
+            yield Task("run_pool", rqmt=rqmt)
+        else:
+            yield Task("split_word_list", mini_task=True)
+            yield Task("run", rqmt=self.rqmt, args=range(1, self.concurrent + 1))
+            yield Task("merge", mini_task=True)
         if self.filter_empty_words:
             yield Task("filter", mini_task=True)
 
@@ -113,6 +135,85 @@ class ApplyG2PModelJob(Job):
                 stdout=f,
             )
 
+    def run_pool(self):
+        with uopen(self.word_list, "rt") as f:
+            words = [line.strip() for line in f]
+
+        cache_file = None
+        translations = {}  # word -> (output lines, error)
+        if self.cache_dir is not None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            cache_file = os.path.join(self.cache_dir, "%s.jsonl" % self._cache_key())
+            translations = self._load_cache(cache_file)
+
+        todo = sorted({w for w in words if w not in translations}, key=lambda w: (-len(w), w))
+        logging.info("%d words, %d unique, %d not in the cache", len(words), len(set(words)), len(todo))
+
+        if todo:
+            with open("words.todo", "wt", encoding="utf-8") as f:
+                f.writelines(w + "\n" for w in todo)
+            sp.check_call(
+                [
+                    self.g2p_python.get_path(),
+                    os.path.join(os.path.dirname(os.path.abspath(__file__)), "../lib/sequitur_apply.py"),
+                    "--g2p_path",
+                    self.g2p_path.get_path(),
+                    "--model",
+                    self.g2p_model.get_path(),
+                    "--words",
+                    "words.todo",
+                    "--output",
+                    "translations.jsonl",
+                    "--variants_mass",
+                    str(self.variants_mass),
+                    "--variants_number",
+                    str(self.variants_number),
+                    "--num_workers",
+                    str(self.num_workers),
+                ]
+            )
+            with open("translations.jsonl", "rt", encoding="utf-8") as f:
+                new_lines = f.readlines()
+            for line in new_lines:
+                entry = json.loads(line)
+                translations[entry["word"]] = (entry["lines"], entry["error"])
+            if cache_file is not None:
+                with open(cache_file, "at", encoding="utf-8") as f:
+                    fcntl.flock(f, fcntl.LOCK_EX)
+                    f.writelines(new_lines)
+
+        with uopen(self.out_g2p_lexicon, "wt") as out, uopen(self.out_g2p_untranslated, "wt") as err:
+            for word in words:
+                lines, error = translations[word]
+                out.writelines(lines)
+                if error is not None:
+                    err.write(error)
+
+    def _cache_key(self) -> str:
+        """
+        :return: identifier of the model file and the variant settings
+        """
+        h = hashlib.sha256()
+        with open(self.g2p_model.get_path(), "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+        h.update(("\0%r\0%r" % (float(self.variants_mass), int(self.variants_number))).encode("utf-8"))
+        return h.hexdigest()
+
+    @staticmethod
+    def _load_cache(cache_file: str) -> Dict[str, tuple]:
+        translations = {}
+        if os.path.exists(cache_file):
+            with open(cache_file, "rt", encoding="utf-8") as f:
+                fcntl.flock(f, fcntl.LOCK_SH)
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # incomplete line of an interrupted job
+                    translations[entry["word"]] = (entry["lines"], entry["error"])
+        return translations
+
     def filter(self):
         handle, tmp_path = mkstemp(dir=".", text=True)
         with uopen(self.out_g2p_lexicon, "rt") as lex, os.fdopen(handle, "wt") as fd_out:
@@ -128,4 +229,6 @@ class ApplyG2PModelJob(Job):
     def hash(cls, kwargs):
         kwargs_copy = dict(**kwargs)
         kwargs_copy.pop("concurrent", None)
+        kwargs_copy.pop("num_workers", None)
+        kwargs_copy.pop("cache_dir", None)
         return super().hash(kwargs_copy)
@@ -26,7 +26,16 @@ class EstimateScatterMatricesJob(rasr.RasrCommand, Job):
         extra_post_config_merge=None,
         extra_config_estimate=None,
         extra_post_config_estimate=None,
+        merge_cpu=None,
     ):
+        """
+        :param rasr.crp.CommonRasrParameters crp:
+        :param rasr.flow.FlowNetwork alignment_flow:
+        :param int combine_per_step: maximum number of accumulators per merge
+        :param bool keep_accumulators: keep the accumulators of the single tasks after the merge
+        :param int|None merge_cpu: number of merges that run at the same time, which is also the cpu requirement of
+            the merge task. By default up to 4, depending on the number of independent merges.
+        """
         self.set_vis_name("Estimate Scatter Matrices")
 
         kwargs = locals()
@@ -57,10 +66,10 @@ class EstimateScatterMatricesJob(rasr.RasrCommand, Job):
             nonlocal merge_count
             merge_count += 1
 
-        util.reduce_tree(
-            inc_merge_count,
-            util.partition_into_tree(list(range(self.concurrent)), combine_per_step),
-        )
+        merge_tree = util.partition_into_tree(list(range(self.concurrent)), combine_per_step)
+        util.reduce_tree(inc_merge_count, merge_tree)
+        if merge_cpu is None:
+            merge_cpu = min(4, max(sum(type(e) == list for e in merge_tree), 1))
 
         self.accumulate_log_file = self.log_file_output_path("accumulate", crp, True)
         self.merge_log_file = self.log_file_output_path("merge", crp, merge_count)
@@ -74,7 +83,7 @@ class EstimateScatterMatricesJob(rasr.RasrCommand, Job):
             "cpu": 1,
             "mem": 4,
         }
-        self.merge_rqmt = {"time": 0.5, "cpu": 1, "mem": 1}
+        self.merge_rqmt = {"time": 0.5, "cpu": merge_cpu, "mem": 1}
 
     def tasks(self):
         yield Task("create_files", mini_task=True)
@@ -98,13 +107,7 @@ class EstimateScatterMatricesJob(rasr.RasrCommand, Job):
         self.run_script(task_id, self.accumulate_log_file[task_id], "./accumulate.sh")
 
     def merge(self):
-        merge_num = 0
-        tmp_files_to_delete = []
-
-        def merge_helper(elements):
-            nonlocal merge_num
-            merge_num += 1
-
+        def merge_helper(elements, merge_num):
             (fd, tmp_merge_file) = tempfile.mkstemp(suffix=".acc")
             os.close(fd)
 
@@ -122,12 +125,14 @@ class EstimateScatterMatricesJob(rasr.RasrCommand, Job):
 
             return tmp_merge_file
 
-        final_accumulator = util.reduce_tree(
+        final_accumulator = util.reduce_tree_parallel(
             merge_helper,
             util.partition_into_tree(
                 ["scatter.acc.%d" % i for i in range(1, self.concurrent + 1)],
                 self.combine_per_step,
             ),
+            num_workers=self.merge_rqmt["cpu"],
+            cleanup=os.remove,
         )
 
         self.run_script(
@@ -140,8 +145,7 @@ class EstimateScatterMatricesJob(rasr.RasrCommand, Job):
         shutil.move("within_class_scatter.matrix", self.within_class_scatter_matrix.get_path())
         shutil.move("total_scatter.matrix", self.total_scatter_matrix.get_path())
 
-        for tmp_file in tmp_files_to_delete:
-            os.remove(tmp_file)
+        os.remove(final_accumulator)
         if not self.keep_accumulators:
             for i in range(1, self.concurrent + 1):
                 os.remove("scatter.acc.%d" % i)
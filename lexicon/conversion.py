@@ -4,7 +4,7 @@ import json
 import logging
 import os.path
 import re
-from typing import List, Optional, Tuple, Union
+from typing import Callable, List, Optional, Set, Tuple, Union
 import xml.dom.minidom
 import xml.etree.ElementTree as ET
 
@@ -29,10 +29,11 @@ class LexiconToWordListJob(Job):
         yield Task("run", mini_task=True)
 
     def run(self):
-        with uopen(self.bliss_lexicon.get_path(), "r") as lexicon_file:
-            lexicon = ET.fromstring(lexicon_file.read())
-            words = set()
-            for e in lexicon.findall("./lemma/orth"):
+        words = set()
+        for elem in lexicon.iterparse_lexicon(self.bliss_lexicon.get_path()):
+            if elem.tag != "lemma":
+                continue
+            for e in elem.findall("orth"):
                 if e.text is not None and len(e.text) > 0 and not (e.text.startswith("[") and self.apply_filter):
                     words.add(e.text)
 
@@ -71,31 +72,39 @@ class FilterLexiconByWordListJob(Job):
     def run(self):
         transform = (lambda s: s.lower()) if self.case_sensitive else (lambda s: s)
 
-        with uopen(tk.uncached_path(self.bliss_lexicon), "r") as lexicon_file:
-            old_lexicon = ET.fromstring(lexicon_file.read())
-
         with uopen(tk.uncached_path(self.word_list), "r") as words_file:
-            words = set([transform(w.strip()) for w in words_file.readlines()])
-
-        root = ET.Element("lexicon")
-        root.append(old_lexicon.find("phoneme-inventory"))
-        for lemma in old_lexicon.findall("lemma"):
-            all_synt_tok = lemma.findall("./synt/tok")
-            if any(
-                transform(orth.text) in words
-                or "special" in lemma.attrib
-                or (orth.text is not None and orth.text.startswith("["))
-                for orth in lemma.findall("orth")
-            ) or (
-                self.check_synt_tok
-                and len(all_synt_tok) > 0
-                and all([transform(tok.text) in words for tok in all_synt_tok])
-            ):
-                root.append(lemma)
-
-        with uopen(self.out_bliss_lexicon.get_path(), "wt") as lexicon_file:
-            lexicon_file.write('<?xml version="1.0" encoding="utf-8"?>\n')
-            lexicon_file.write(ET.tostring(root, "unicode"))
+            words = set([transform(w.strip()) for w in words_file])
+
+        # the phoneme inventory is written first, the lemmata are buffered until it was found
+        phoneme_inventory_written = False
+        lemmata = []
+        with lexicon.LexiconWriter(self.out_bliss_lexicon.get_path(), prettify=False) as writer:
+            for elem in lexicon.iterparse_lexicon(tk.uncached_path(self.bliss_lexicon)):
+                if elem.tag == "phoneme-inventory" and not phoneme_inventory_written:
+                    writer.write_element(elem)
+                    phoneme_inventory_written = True
+                    for lemma in lemmata:
+                        writer.write_element(lemma)
+                    lemmata = []
+                elif elem.tag == "lemma" and self._keep_lemma(elem, words, transform):
+                    if phoneme_inventory_written:
+                        writer.write_element(elem)
+                    else:
+                        lemmata.append(elem)
+            assert phoneme_inventory_written, "lexicon has no phoneme-inventory"
+
+    def _keep_lemma(self, lemma: ET.Element, words: Set[str], transform: Callable[[str], str]) -> bool:
+        all_synt_tok = lemma.findall("./synt/tok")
+        return any(
+            transform(orth.text) in words
+            or "special" in lemma.attrib
+            or (orth.text is not None and orth.text.startswith("["))
+            for orth in lemma.findall("orth")
+        ) or (
+            self.check_synt_tok
+            and len(all_synt_tok) > 0
+            and all([transform(tok.text) in words for tok in all_synt_tok])
+        )
 
 
 class LexiconUniqueOrthJob(Job):
@@ -133,40 +142,68 @@ class LexiconUniqueOrthJob(Job):
         yield Task("run", mini_task=True)
 
     def run(self):
-        lex = lexicon.Lexicon()
-        lex.load(self.bliss_lexicon.get_path())
-
-        orth2lemmata = collections.defaultdict(list)
-
-        for lemma in lex.lemmata:
-            if lemma.special:
+        # The lexicon is streamed three times, so that only the lemmata which are merged are held in memory:
+        # count the lemmata per orth, merge the duplicates and write each merged lemma at its first position.
+        path = self.bliss_lexicon.get_path()
+
+        phonemes = collections.OrderedDict()
+        orth_counts = collections.Counter()
+        for elem in lexicon.iterparse_lexicon(path):
+            if elem.tag == "phoneme-inventory":
+                for phoneme in elem.findall("phoneme"):
+                    variation = phoneme.find("variation")
+                    variation = variation.text.strip() if variation is not None else "context"
+                    phonemes[phoneme.find("symbol").text.strip()] = variation
+            orth = self._merge_key(elem)
+            if orth is not None:
+                orth_counts[orth] += 1
+
+        merged = {}  # orth -> (lemma, seen orths, seen phons, seen evals)
+        for elem in lexicon.iterparse_lexicon(path):
+            orth = self._merge_key(elem)
+            if orth is None or orth_counts[orth] < 2:
                 continue
-            num_orths = len(lemma.orth)
-            if num_orths < 1:
+            lemma = lexicon.Lemma.from_element(elem)
+            if orth not in merged:
+                merged[orth] = (lemma, set(lemma.orth), set(lemma.phon), set(map(tuple, lemma.eval)))
                 continue
-            if num_orths > 1 and not self.merge_multi_orths_lemmata:
-                continue
-            orth2lemmata[lemma.orth[0]].append(lemma)
-
-        for orth, lemmata in orth2lemmata.items():
-            if len(lemmata) < 2:
-                continue
-            final_lemma = lemmata[0]
-            for lemma in lemmata[1:]:
-                for orth in lemma.orth:
-                    if orth not in final_lemma.orth:
-                        final_lemma.orth.append(orth)
-                for phon in lemma.phon:
-                    if phon not in final_lemma.phon:
-                        final_lemma.phon.append(phon)
-                if final_lemma.synt is None and lemma.synt is not None:
-                    final_lemma.synt = lemma.synt
-                for eval in lemma.eval:
-                    if eval not in final_lemma.eval:
-                        final_lemma.eval.append(eval)
-                lex.lemmata.remove(lemma)
-
-        write_xml(self.out_bliss_lexicon, element_tree=lex.to_xml())
+            final_lemma, orths, phons, evals = merged[orth]
+            for o in lemma.orth:
+                if o not in orths:
+                    orths.add(o)
+                    final_lemma.orth.append(o)
+            for phon in lemma.phon:
+                if phon not in phons:
+                    phons.add(phon)
+                    final_lemma.phon.append(phon)
+            if final_lemma.synt is None and lemma.synt is not None:
+                final_lemma.synt = lemma.synt
+            for eval in lemma.eval:
+                if tuple(eval) not in evals:
+                    evals.add(tuple(eval))
+                    final_lemma.eval.append(eval)
+
+        with lexicon.LexiconWriter(self.out_bliss_lexicon.get_path()) as writer:
+            writer.write_phoneme_inventory(phonemes)
+            for elem in lexicon.iterparse_lexicon(path):
+                if elem.tag != "lemma":
+                    continue
+                orth = self._merge_key(elem)
+                if orth is None or orth_counts[orth] < 2:
+                    writer.write_lemma(lexicon.Lemma.from_element(elem))
+                elif orth in merged:
+                    writer.write_lemma(merged.pop(orth)[0])
+
+    def _merge_key(self, elem: ET.Element) -> Optional[str]:
+        """
+        :return: primary orth of a lemma that takes part in the merging, None otherwise
+        """
+        if elem.tag != "lemma" or elem.get("special"):
+            return None
+        orths = elem.findall(".//orth")
+        if len(orths) < 1 or (len(orths) > 1 and not self.merge_multi_orths_lemmata):
+            return None
+        return orths[0].text.strip() if orths[0].text is not None else ""
 
 
 class LexiconFromTextFileJob(Job):
@@ -5,8 +5,6 @@ import logging
 import subprocess as sp
 import tempfile
 
-import soundfile as sf
-
 
 def _compute_rec_duration_convert_to_wav(audio_file: str) -> float:
     """
@@ -70,5 +68,7 @@ def compute_rec_duration(audio_file: str) -> float:
             )
     else:
         # Wav or any format parseable by soundfile.
+        import soundfile as sf
+
         with sf.SoundFile(audio_file) as f:
             return f.frames / f.samplerate  # In seconds.
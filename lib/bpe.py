@@ -0,0 +1,192 @@
+"""
+In-process application of subword-nmt BPE codes.
+
+The segmentation itself is done by the `BPE` class of the given subword-nmt `apply_bpe.py`, so the output is identical
+to running the script. On top of it, the word segmentations are memoized in a bounded cache and large texts are
+processed in shards by a process pool while streaming (optionally gzipped) input and output.
+"""
+
+__all__ = ["BpeApplier", "apply_bpe_to_file"]
+
+import codecs
+import collections
+import importlib.util
+import io
+import multiprocessing
+import os
+from typing import BinaryIO, Iterator, List, Optional, Tuple, Union
+
+from i6_core.util import uopen
+
+
+class _LruCache(collections.OrderedDict):
+    """
+    Bounded replacement for the word cache dict of subword-nmt
+    """
+
+    def __init__(self, maxsize: int):
+        super().__init__()
+        self.maxsize = maxsize
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        self.move_to_end(key)
+        return value
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        if len(self) > self.maxsize:
+            self.popitem(last=False)
+
+
+class BpeApplier:
+    """
+    Loads the BPE codes (and vocabulary) once and applies them to lines of text
+    """
+
+    def __init__(
+        self,
+        apply_bpe_script: str,
+        codes_file: str,
+        vocab_file: Optional[str] = None,
+        vocab_threshold: Optional[int] = None,
+        cache_size: int = 1 << 20,
+    ):
+        """
+        :param apply_bpe_script: path to apply_bpe.py of a subword-nmt repository
+        :param codes_file: BPE codes
+        :param vocab_file: if given, merge operations that produce OOVs are reverted
+        :param vocab_threshold: minimum count of the vocabulary entries, as `--vocabulary-threshold` of the script
+        :param cache_size: maximum number of memoized word segmentations
+        """
+        spec = importlib.util.spec_from_file_location("_i6_core_apply_bpe", apply_bpe_script)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+
+        vocab = None
+        if vocab_file is not None:
+            with codecs.open(vocab_file, encoding="utf-8") as f:
+                vocab = module.read_vocabulary(f, vocab_threshold)
+        with codecs.open(codes_file, encoding="utf-8") as f:
+            self.bpe = module.BPE(f, separator="@@", vocab=vocab)
+        if hasattr(self.bpe, "cache"):
+            self.bpe.cache = _LruCache(cache_size)
+
+    def apply_line(self, line: str) -> str:
+        """
+        :param line: text line including the line break
+        :return: segmented line including the line break, exactly as written by apply_bpe.py
+        """
+        if hasattr(self.bpe, "process_line"):
+            return self.bpe.process_line(line)
+        return self.bpe.segment(line).strip() + "\n"  # older subword-nmt versions
+
+    def apply_lines(self, lines: List[str]) -> str:
+        """
+        :param lines: text lines including the line breaks
+        :return: concatenated segmented lines
+        """
+        return "".join(self.apply_line(line) for line in lines)
+
+
+_worker_applier = None  # type: Optional[BpeApplier]
+
+
+def _init_worker(*args):
+    global _worker_applier
+    _worker_applier = BpeApplier(*args)
+
+
+def _read_lines(f: BinaryIO) -> Iterator[str]:
+    """
+    Splits the input into lines like apply_bpe.py, which reads its input with `codecs.open`.
+    The codecs reader splits at all line boundaries of `str.splitlines` (e.g. also at \\x0b, \\x85 and \\u2028),
+    not only at \\n as iterating over a file opened in text mode.
+    """
+    return iter(codecs.getreader("utf-8")(f))
+
+
+def _apply_to_shard(shard: Union[Tuple[str, int, int], List[str]]) -> str:
+    if isinstance(shard, tuple):
+        path, start, end = shard
+        with open(path, "rb") as f:
+            f.seek(start)
+            shard = list(_read_lines(io.BytesIO(f.read(end - start))))
+    return _worker_applier.apply_lines(shard)
+
+
+def _byte_range_shards(path: str, shard_size: int) -> Iterator[Tuple[str, int, int]]:
+    """
+    Splits an uncompressed text file into byte ranges that end at \\n, which is a line boundary for all ranges
+    """
+    file_size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        start = 0
+        while start < file_size:
+            f.seek(min(start + shard_size, file_size))
+            f.readline()  # move to the end of the current line
+            end = min(f.tell(), file_size)
+            yield path, start, end
+            start = end
+
+
+def _line_shards(path: str, shard_lines: int) -> Iterator[List[str]]:
+    """
+    Reads (gzipped) text in blocks of lines, for input that can not be split by byte offsets
+    """
+    with uopen(path, "rb") as f:
+        shard = []
+        for line in _read_lines(f):
+            shard.append(line)
+            if len(shard) >= shard_lines:
+                yield shard
+                shard = []
+        if shard:
+            yield shard
+
+
+def apply_bpe_to_file(
+    apply_bpe_script: str,
+    codes_file: str,
+    input_file: str,
+    output_file: str,
+    vocab_file: Optional[str] = None,
+    num_workers: int = 1,
+    shard_size: int = 16 * 1024 * 1024,
+    cache_size: int = 1 << 20,
+):
+    """
+    Applies BPE codes to a text file. Uncompressed input is split into byte ranges that are read by the workers
+    themselves, gzipped input is streamed in blocks of lines. The output is written in input order while the
+    workers process the following shards.
+
+    :param apply_bpe_script: path to apply_bpe.py of a subword-nmt repository
+    :param codes_file: BPE codes
+    :param input_file: text file, can be gzipped
+    :param output_file: output text file, gzipped if it ends with .gz
+    :param vocab_file: if given, merge operations that produce OOVs are reverted
+    :param num_workers: number of worker processes
+    :param shard_size: approximate size of a shard in bytes
+    :param cache_size: maximum number of memoized word segmentations per worker
+    """
+    if input_file.endswith(".gz"):
+        shards = _line_shards(input_file, max(1, shard_size // 64))
+    else:
+        shards = _byte_range_shards(input_file, shard_size)
+    init_args = (apply_bpe_script, codes_file, vocab_file, None, cache_size)
+
+    with uopen(output_file, "wt", encoding="utf-8") as out:
+        if num_workers <= 1:
+            _init_worker(*init_args)
+            for shard in shards:
+                out.write(_apply_to_shard(shard))
+        else:
+            with multiprocessing.Pool(num_workers, initializer=_init_worker, initargs=init_args) as pool:
+                # bounded number of shards in flight, Pool.imap would read the whole input ahead
+                pending = collections.deque()
+                for shard in shards:
+                    pending.append(pool.apply_async(_apply_to_shard, (shard,)))
+                    if len(pending) >= 2 * num_workers:
+                        out.write(pending.popleft().get())
+                while pending:
+                    out.write(pending.popleft().get())
@@ -0,0 +1,183 @@
+"""
+Streaming averaging of PyTorch and Tensorflow checkpoints.
+
+The parameters are accumulated tensor by tensor into a single set of buffers, so only one model (plus the tensor
+that is currently read) is held in memory, independent of the number of checkpoints.
+This file has no dependencies on i6_core and is executed as script with the Python of the training environment,
+see :class:`i6_core.returnn.training.AverageTorchCheckpointsJob` and
+:class:`i6_core.returnn.training.AverageTFCheckpointsJob`.
+"""
+
+__all__ = ["get_average_weights", "average_torch_checkpoints", "average_tf_checkpoints"]
+
+import argparse
+import os
+from typing import List, Optional, Sequence
+
+
+def get_average_weights(
+    num_checkpoints: int,
+    weights: Optional[Sequence[float]] = None,
+    ema_decay: Optional[float] = None,
+) -> List[float]:
+    """
+    :param num_checkpoints: number of checkpoints, ordered from oldest to newest
+    :param weights: explicit (unnormalized) weight per checkpoint
+    :param ema_decay: weights of an exponential moving average over the checkpoints, which is initialized with the
+        oldest checkpoint, i.e. checkpoint i gets (1 - decay) * decay^(n-1-i) and the oldest one decay^(n-1)
+    :return: weights that sum up to one, uniform if neither `weights` nor `ema_decay` is given
+    """
+    assert num_checkpoints > 0, "no checkpoints given"
+    assert weights is None or ema_decay is None, "weights and ema_decay are mutually exclusive"
+    if ema_decay is not None:
+        assert 0.0 <= ema_decay < 1.0, "ema_decay must be in [0, 1)"
+        weights = [(1.0 - ema_decay) * ema_decay ** (num_checkpoints - 1 - i) for i in range(num_checkpoints)]
+        weights[0] = ema_decay ** (num_checkpoints - 1)
+    elif weights is None:
+        weights = [1.0] * num_checkpoints
+    assert len(weights) == num_checkpoints, "need exactly one weight per checkpoint"
+    assert all(w >= 0 for w in weights) and sum(weights) > 0, "weights must be non-negative and not all zero"
+    total = float(sum(weights))
+    return [w / total for w in weights]
+
+
+def average_torch_checkpoints(
+    checkpoints: Sequence[str],
+    output_path: str,
+    weights: Optional[Sequence[float]] = None,
+    mmap: bool = True,
+):
+    """
+    Averages the "model" entries of RETURNN PyTorch checkpoints. Floating point tensors are accumulated in (at
+    least) float32 and converted back to their original dtype, all other tensors and entries (epoch, step, ...)
+    are taken from the last checkpoint.
+
+    :param checkpoints: .pt files, ordered from oldest to newest
+    :param output_path: .pt file of the averaged model
+    :param weights: normalized weight per checkpoint, see :func:`get_average_weights`
+    :param mmap: memory-map the checkpoints, so that only the tensor which is currently accumulated is read
+    """
+    import torch
+
+    weights = get_average_weights(len(checkpoints)) if weights is None else weights
+    avg_model = None
+    dtypes = {}
+    last = None
+    for path, weight in zip(checkpoints, weights):
+        print("accumulate %s with weight %f" % (path, weight), flush=True)
+        last = _torch_load(path, mmap)
+        model = last["model"] if isinstance(last, dict) and "model" in last else last
+        if avg_model is None:
+            avg_model = {}
+            for name, tensor in model.items():
+                dtypes[name] = tensor.dtype
+                if tensor.is_floating_point():
+                    avg_model[name] = tensor.to(torch.promote_types(tensor.dtype, torch.float32), copy=True)
+                    avg_model[name].mul_(weight)
+            continue
+        assert model.keys() == dtypes.keys(), "checkpoint %s has different parameters" % path
+        for name, tensor in model.items():
+            if name in avg_model:
+                avg_model[name].add_(tensor.to(avg_model[name].dtype), alpha=weight)
+        del model
+
+    model = last["model"] if isinstance(last, dict) and "model" in last else last
+    for name, tensor in model.items():
+        avg_model[name] = avg_model[name].to(dtypes[name]) if name in avg_model else tensor.clone()
+    avg_model = {name: avg_model[name] for name in dtypes}  # keep the parameter order
+
+    if isinstance(last, dict) and "model" in last:
+        out = dict(last)
+        out["model"] = avg_model
+    else:
+        out = avg_model
+    tmp_path = output_path + ".tmp"
+    torch.save(out, tmp_path)
+    os.replace(tmp_path, output_path)
+
+
+def _torch_load(path: str, mmap: bool):
+    import torch
+
+    if mmap:
+        try:
+            return torch.load(path, map_location="cpu", mmap=True)
+        except (TypeError, RuntimeError):
+            pass  # torch < 2.1 or legacy (non-zip) checkpoint format
+    return torch.load(path, map_location="cpu")
+
+
+def average_tf_checkpoints(
+    checkpoints: Sequence[str],
+    output_path: str,
+    weights: Optional[Sequence[float]] = None,
+):
+    """
+    Averages all floating point variables of Tensorflow checkpoints, other variables (e.g. global_step) are taken
+    from the last checkpoint. The checkpoints are read with a checkpoint reader, which loads a single tensor per call.
+
+    :param checkpoints: checkpoint prefixes (without .index/.meta/...), ordered from oldest to newest
+    :param output_path: checkpoint prefix of the averaged model
+    :param weights: normalized weight per checkpoint, see :func:`get_average_weights`
+    """
+    import numpy as np
+    import tensorflow as tf
+
+    weights = get_average_weights(len(checkpoints)) if weights is None else weights
+    var_list = tf.train.list_variables(checkpoints[-1])
+    avg_values = {}
+    for path, weight in zip(checkpoints, weights):
+        print("accumulate %s with weight %f" % (path, weight), flush=True)
+        reader = tf.train.load_checkpoint(path)
+        for name, _ in var_list:
+            tensor = reader.get_tensor(name)
+            if not np.issubdtype(tensor.dtype, np.floating):
+                if path == checkpoints[-1]:
+                    avg_values[name] = tensor
+                continue
+            if name not in avg_values:
+                avg_values[name] = np.zeros(tensor.shape, dtype=np.promote_types(tensor.dtype, np.float32))
+            avg_values[name] += weight * tensor
+        del reader
+
+    tf.compat.v1.disable_eager_execution()
+    tf.compat.v1.reset_default_graph()
+    reader = tf.train.load_checkpoint(checkpoints[-1])
+    dtypes = reader.get_variable_to_dtype_map()
+    tf_vars = []
+    placeholders = []
+    assign_ops = []
+    for name, shape in var_list:
+        dtype = dtypes[name]
+        var = tf.compat.v1.get_variable(name, shape=shape, dtype=dtype)
+        placeholder = tf.compat.v1.placeholder(dtype, shape=shape)
+        tf_vars.append(var)
+        placeholders.append(placeholder)
+        assign_ops.append(tf.compat.v1.assign(var, placeholder))
+    saver = tf.compat.v1.train.Saver(tf_vars)
+    with tf.compat.v1.Session() as session:
+        for (name, _), placeholder, assign_op in zip(var_list, placeholders, assign_ops):
+            value = avg_values.pop(name)  # free the accumulator as soon as it is assigned
+            session.run(assign_op, {placeholder: value.astype(dtypes[name].as_numpy_dtype)})
+        saver.save(session, output_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--framework", choices=["torch", "tf"], required=True)
+    parser.add_argument("--checkpoints", nargs="+", required=True, help="ordered from oldest to newest")
+    parser.add_argument("--output_path", required=True)
+    parser.add_argument("--weights", nargs="+", type=float, default=None)
+    parser.add_argument("--ema_decay", type=float, default=None)
+    parser.add_argument("--no_mmap", action="store_true", help="do not memory-map .pt files")
+    args = parser.parse_args()
+
+    weights = get_average_weights(len(args.checkpoints), args.weights, args.ema_decay)
+    if args.framework == "torch":
+        average_torch_checkpoints(args.checkpoints, args.output_path, weights, mmap=not args.no_mmap)
+    else:
+        average_tf_checkpoints(args.checkpoints, args.output_path, weights)
+
+
+if __name__ == "__main__":
+    main()
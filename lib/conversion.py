@@ -0,0 +1,116 @@
+"""
+Runner for file conversions with external tools, e.g. the audio conversion of dataset preparation jobs
+"""
+
+__all__ = ["ConversionTask", "run_parallel_conversions"]
+
+import concurrent.futures
+import logging
+import os
+import subprocess
+import threading
+from typing import Iterable, List, NamedTuple, Optional
+
+
+class ConversionTask(NamedTuple):
+    """
+    A single conversion, identified by its name in the progress and failure files
+    """
+
+    name: str
+    command: List[str]
+    outputs: List[str]
+
+
+def _run_task(task: ConversionTask, retries: int) -> Optional[str]:
+    """
+    :return: error message of the last attempt if all attempts failed
+    """
+    error = None
+    for attempt in range(retries + 1):
+        result = subprocess.run(
+            task.command, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+        )
+        if result.returncode == 0:
+            return None
+        error = "exit code %d: %s" % (result.returncode, result.stderr.decode("utf-8", "replace").strip()[-1000:])
+        logging.warning("conversion of %s failed (attempt %d of %d), %s", task.name, attempt + 1, retries + 1, error)
+        for output in task.outputs:
+            if os.path.exists(output):
+                os.remove(output)
+    return error
+
+
+def run_parallel_conversions(
+    tasks: Iterable[ConversionTask],
+    num_workers: int = 1,
+    retries: int = 0,
+    progress_file: Optional[str] = None,
+    failed_file: Optional[str] = None,
+    error_threshold: int = 0,
+) -> List[str]:
+    """
+    Runs the conversion commands with at most `num_workers` processes at the same time.
+
+    The names of finished conversions are appended to `progress_file`. When the task is restarted with the same
+    progress file, these conversions are skipped, so an interrupted job resumes where it stopped.
+    A failed conversion is retried `retries` times, the outputs of failed attempts are deleted.
+
+    :param tasks: conversions to run, the names need to be unique
+    :param num_workers: number of conversions that run in parallel
+    :param retries: number of retries of a failed conversion
+    :param progress_file: file that keeps track of the finished conversions
+    :param failed_file: the names and errors of the failed conversions are written into this file
+    :param error_threshold: maximum number of failed conversions, otherwise an exception is raised
+    :return: names of the failed conversions
+    """
+    done = set()
+    if progress_file is not None and os.path.exists(progress_file):
+        with open(progress_file, "rt") as f:
+            done = set(line.rstrip("\n") for line in f)
+
+    failed = []
+    num_skipped = 0
+    lock = threading.Lock()
+    progress = open(progress_file, "at") if progress_file is not None else None
+
+    def run(task: ConversionTask):
+        error = _run_task(task, retries)
+        with lock:
+            if error is not None:
+                failed.append((task.name, error))
+            elif progress is not None:
+                progress.write(task.name + "\n")
+                progress.flush()
+
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=num_workers) as executor:
+            # the threads only wait for the subprocesses, submit lazily to bound the number of pending tasks
+            pending = set()
+            for task in tasks:
+                if task.name in done:
+                    num_skipped += 1
+                    continue
+                pending.add(executor.submit(run, task))
+                if len(pending) >= 2 * num_workers:
+                    finished, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                    for future in finished:
+                        future.result()
+            for future in concurrent.futures.as_completed(pending):
+                future.result()
+    finally:
+        if progress is not None:
+            progress.close()
+
+    if num_skipped > 0:
+        logging.info("skipped %d conversions that were finished before", num_skipped)
+    failed.sort()
+    if failed_file is not None:
+        with open(failed_file, "wt") as f:
+            for name, error in failed:
+                f.write("%s\t%s\n" % (name, error.replace("\n", " ")))
+    if len(failed) > error_threshold:
+        raise subprocess.SubprocessError(
+            "%d conversions failed, e.g. %s: %s" % (len(failed), failed[0][0], failed[0][1])
+        )
+    return [name for name, _ in failed]
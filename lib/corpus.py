@@ -4,10 +4,23 @@ Helper functions and classes for Bliss xml corpus loading and writing
 
 from __future__ import annotations
 
-__all__ = ["NamedEntity", "CorpusSection", "Corpus", "Recording", "Segment", "Speaker"]
+__all__ = [
+    "NamedEntity",
+    "CorpusSection",
+    "Corpus",
+    "Recording",
+    "Segment",
+    "Speaker",
+    "CorpusWriter",
+    "load_corpus_header",
+    "stream_corpus",
+    "filter_corpus",
+]
 
 import collections
+import functools
 import gzip
+import io
 import os
 import re
 from typing import Callable, Dict, Iterable, List, Optional, TextIO
@@ -16,6 +29,8 @@ import xml.sax as sax
 import xml.sax.saxutils as saxutils
 import xml.etree.ElementTree as ET
 
+from i6_core.lib.parallel_gzip import ParallelGzipWriter
+
 
 FilterFunction = Callable[["Corpus", "Recording", "Segment"], bool]
 
@@ -276,13 +291,13 @@ class Corpus(NamedEntity, CorpusSection):
             handler = CorpusParser(self, path)
             sax.parse(f, handler)
 
-    def dump(self, path: str):
+    def dump(self, path: str, compress_level: int = 9, num_threads: int = 1):
         """
         :param path: target .xml or .xml.gz path
+        :param compress_level: gzip compression level for .gz files
+        :param num_threads: compress .gz files in blocks with this many threads
         """
-        open_fun = gzip.open if path.endswith(".gz") else open
-
-        with open_fun(path, "wt") as f:
+        with _open_output(path, compress_level=compress_level, num_threads=num_threads) as f:
             f.write('<?xml version="1.0" encoding="utf-8"?>\n')
             self._dump_internal(f)
 
@@ -412,31 +427,69 @@ class Segment(NamedEntity):
         return self.recording.speaker(self.speaker_name)
 
     def dump(self, out: TextIO, indentation: str = ""):
-        has_child_element = self.orth is not None or self.speaker_name is not None
-        t = ' track="%d"' % self.track if self.track is not None else ""
-        new_line = "\n" if has_child_element else ""
-        out.write(
-            '%s<segment name="%s" start="%.4f" end="%.4f"%s>%s'
-            % (indentation, self.name, self.start, self.end, t, new_line)
+        track = self.track
+        speaker_name = self.speaker_name
+        orth = self.orth
+        left_context_orth = self.left_context_orth
+        right_context_orth = self.right_context_orth
+        template = _segment_template(
+            indentation,
+            track is not None,
+            speaker_name is not None,
+            orth is not None,
+            left_context_orth is not None,
+            right_context_orth is not None,
         )
-        if self.speaker_name is not None:
-            out.write('%s  <speaker name="%s"/>\n' % (indentation, self.speaker_name))
-        if self.orth is not None:
-            out.write("%s  <orth> %s </orth>\n" % (indentation, saxutils.escape(self.orth)))
-        if self.left_context_orth is not None:
-            out.write(
-                "%s  <left-context-orth> %s </left-context-orth>\n"
-                % (indentation, saxutils.escape(self.left_context_orth))
-            )
-        if self.right_context_orth is not None:
-            out.write(
-                "%s  <right-context-orth> %s </right-context-orth>\n"
-                % (indentation, saxutils.escape(self.right_context_orth))
-            )
-        if has_child_element:
-            out.write("%s</segment>\n" % indentation)
-        else:
-            out.write("</segment>\n")
+        args = [self.name, self.start, self.end]
+        if track is not None:
+            args.append(track)
+        if speaker_name is not None:
+            args.append(speaker_name)
+        if orth is not None:
+            args.append(_escape(orth))
+        if left_context_orth is not None:
+            args.append(_escape(left_context_orth))
+        if right_context_orth is not None:
+            args.append(_escape(right_context_orth))
+        out.write(template % tuple(args))
+
+
+@functools.lru_cache(maxsize=None)
+def _segment_template(
+    indentation: str,
+    has_track: bool,
+    has_speaker: bool,
+    has_orth: bool,
+    has_left_context_orth: bool,
+    has_right_context_orth: bool,
+) -> str:
+    """
+    :return: format string of a complete segment element with the given indentation and child elements
+    """
+    has_child_element = has_orth or has_speaker
+    template = indentation + '<segment name="%s" start="%.4f" end="%.4f"'
+    if has_track:
+        template += ' track="%d"'
+    template += ">\n" if has_child_element else ">"
+    if has_speaker:
+        template += indentation + '  <speaker name="%s"/>\n'
+    if has_orth:
+        template += indentation + "  <orth> %s </orth>\n"
+    if has_left_context_orth:
+        template += indentation + "  <left-context-orth> %s </left-context-orth>\n"
+    if has_right_context_orth:
+        template += indentation + "  <right-context-orth> %s </right-context-orth>\n"
+    template += (indentation + "</segment>\n") if has_child_element else "</segment>\n"
+    return template
+
+
+def _escape(data: str) -> str:
+    """
+    Same as `saxutils.escape`, but without any replacements for the common case of text without special characters
+    """
+    if "&" in data or "<" in data or ">" in data:
+        return saxutils.escape(data)
+    return data
 
 
 class Speaker(NamedEntity):
@@ -455,6 +508,350 @@ class Speaker(NamedEntity):
         out.write("%s</speaker-description>\n" % (indentation if len(self.attribs) > 0 else ""))
 
 
+def _open_output(path: str, compress_level: int = 9, num_threads: int = 1, buffer_size: int = 1024 * 1024) -> TextIO:
+    """
+    Opens a corpus file for writing. The text is encoded and collected in a buffer of `buffer_size` bytes,
+    so the (compressing) file object is only called once per buffer and not for every written line.
+
+    :param path: target .xml or .xml.gz path
+    :param compress_level: gzip compression level for .gz files
+    :param num_threads: compress .gz files with :class:`i6_core.lib.parallel_gzip.ParallelGzipWriter`
+        if larger than 1
+    :param buffer_size: size of the write buffer in bytes
+    """
+    if not path.endswith(".gz"):
+        raw = open(path, "wb", buffering=0)
+    elif num_threads > 1:
+        raw = ParallelGzipWriter(path, compress_level=compress_level, num_threads=num_threads)
+    else:
+        raw = gzip.open(path, "wb", compresslevel=compress_level)
+    return io.TextIOWrapper(io.BufferedWriter(raw, buffer_size=buffer_size), encoding="utf-8")
+
+
+class CorpusWriter:
+    """
+    Writes a bliss corpus recording by recording, so the recordings do not need to be kept in memory,
+    e.g. from a generator which creates the recordings one after another without building a :class:`Corpus`.
+    The output is identical to :meth:`Corpus.dump` of a corpus with the same content.
+    Speakers are written in the corpus header, so they need to be known before the first recording is written.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        name: str,
+        speakers: Iterable[Speaker] = (),
+        speaker_name: Optional[str] = None,
+        compress_level: int = 9,
+        num_threads: int = 1,
+    ):
+        """
+        :param path: target .xml or .xml.gz path
+        :param name: name of the corpus
+        :param speakers: speaker descriptions of the corpus
+        :param speaker_name: default speaker of the corpus
+        :param compress_level: gzip compression level for .gz files, lower levels are a lot faster
+        :param num_threads: compress .gz files in blocks with this many threads
+        """
+        self.out = _open_output(path, compress_level=compress_level, num_threads=num_threads)
+        self.out.write('<?xml version="1.0" encoding="utf-8"?>\n')
+        self.out.write('<corpus name="%s">\n' % name)
+        for s in speakers:
+            s.dump(self.out, "  ")
+        if speaker_name is not None:
+            self.out.write('  <speaker name="%s"/>\n' % speaker_name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def write_recording(self, recording: Recording):
+        """
+        :param recording: recording including its segments
+        """
+        recording.dump(self.out, "  ")
+
+    def write_recordings(self, recordings: Iterable[Recording]):
+        """
+        :param recordings:
+        """
+        for r in recordings:
+            r.dump(self.out, "  ")
+
+    def close(self):
+        if not self.out.closed:
+            self.out.write("</corpus>\n")
+            self.out.close()
+
+
+class _StopParsing(Exception):
+    pass
+
+
+class _CorpusHeaderParser(CorpusParser):
+    """
+    Stops at the first recording or subcorpus, so only the name and the speakers of the corpus are read
+    """
+
+    def startElement(self, name: str, attrs: Dict[str, str]):
+        if name in ("recording", "subcorpus"):
+            raise _StopParsing()
+        super().startElement(name, attrs)
+
+
+def load_corpus_header(path: str) -> Corpus:
+    """
+    Reads the name, the speakers and the default speaker of a corpus without its recordings and subcorpora.
+    Only the beginning of the file is parsed.
+
+    :param path: corpus .xml or .xml.gz
+    """
+    c = Corpus()
+    open_fun = gzip.open if path.endswith(".gz") else open
+    with open_fun(path, "rt") as f:
+        try:
+            sax.parse(f, _CorpusHeaderParser(c, path))
+        except _StopParsing:
+            pass
+    return c
+
+
+class _StreamingCorpusParser(CorpusParser):
+    """
+    Writes every recording as soon as it is parsed completely instead of adding it to the corpus, so only the open
+    corpus sections and the current recording are kept in memory. See :func:`stream_corpus` for the options.
+    """
+
+    def __init__(
+        self,
+        corpus: Corpus,
+        path: str,
+        out: TextIO,
+        segment_filter: Optional[FilterFunction],
+        delete_empty_recordings: bool,
+        root_element: Optional[str],
+        indentation: str,
+        subcorpora: str,
+        top_level_recordings: bool,
+    ):
+        super().__init__(corpus, path)
+        assert root_element in ("corpus", "subcorpus", None)
+        assert subcorpora in ("keep", "flatten", "skip")
+        self.root = corpus
+        self.out = out
+        self.segment_filter = segment_filter
+        self.delete_empty_recordings = delete_empty_recordings
+        self.root_element = root_element
+        self.indentation = indentation
+        self.subcorpora = subcorpora
+        self.top_level_recordings = top_level_recordings
+
+        self.removed_recordings: List[str] = []
+        self._opened_sections = set()  # ids of the sections whose opening tag and speakers were written
+        self._include_depth = 0
+        self._num_segments = 0  # segments of the current recording including the filtered ones
+
+    def _level(self, section: Corpus) -> int:
+        level = 0
+        while section is not self.root:
+            section = section.parent_corpus
+            level += 1
+        return level
+
+    def _writes_tags(self, section: Corpus) -> bool:
+        if section is self.root:
+            return self.root_element is not None
+        return self.subcorpora == "keep"
+
+    def _writes_recordings(self, section: Corpus) -> bool:
+        if section is self.root:
+            return self.top_level_recordings
+        return self.subcorpora != "skip"
+
+    def _section_indentation(self, section: Corpus) -> str:
+        return self.indentation + "  " * self._level(section)
+
+    def _open_section(self, section: Corpus):
+        if not self._writes_tags(section) or id(section) in self._opened_sections:
+            return
+        if section is not self.root:
+            self._open_section(section.parent_corpus)
+        indentation = self._section_indentation(section)
+        tag = self.root_element if section is self.root else "subcorpus"
+        self.out.write('%s<%s name="%s">\n' % (indentation, tag, section.name))
+        for s in section.speakers.values():
+            s.dump(self.out, indentation + "  ")
+        if section.speaker_name is not None:
+            self.out.write('%s  <speaker name="%s"/>\n' % (indentation, section.speaker_name))
+        self._opened_sections.add(id(section))
+
+    def _close_section(self, section: Corpus):
+        if not self._writes_tags(section):
+            return
+        self._open_section(section)
+        tag = self.root_element if section is self.root else "subcorpus"
+        self.out.write("%s</%s>\n" % (self._section_indentation(section), tag))
+        self._opened_sections.discard(id(section))
+
+    def startElement(self, name: str, attrs: Dict[str, str]):
+        e = self.elements[-1]
+        if name == "corpus":
+            if self._include_depth == 0:
+                assert len(self.elements) == 1, "<corpus> may only occur as the root element"
+                e.name = attrs["name"]
+            else:
+                if attrs["name"] != e.name:
+                    print(
+                        "Warning: included corpus (%s) has a different name than the current corpus (%s)"
+                        % (attrs["name"], e.name)
+                    )
+                # the content of the included corpus is added to the current section
+                self.elements.append(e)
+        elif name == "subcorpus":
+            assert isinstance(e, Corpus), "<subcorpus> may only occur within a <corpus> or <subcorpus> element"
+            subcorpus = Corpus()
+            subcorpus.name = attrs["name"]
+            subcorpus.parent_corpus = e
+            self.elements.append(subcorpus)
+        elif name == "include":
+            assert isinstance(e, Corpus), "<include> may only occur within a <corpus> or <subcorpus> element"
+            path = os.path.join(os.path.dirname(self.path), attrs["file"])
+            parent_path = self.path
+            self.path = path
+            self._include_depth += 1
+            open_fun = gzip.open if path.endswith(".gz") else open
+            with open_fun(path, "rt") as f:
+                sax.parse(f, self)
+            self._include_depth -= 1
+            self.path = parent_path
+        elif name == "recording":
+            assert isinstance(e, Corpus), "<recording> may only occur within a <corpus> or <subcorpus> element"
+            rec = Recording()
+            rec.name = attrs["name"]
+            rec.audio = attrs["audio"]
+            rec.corpus = e
+            self._num_segments = 0
+            self.elements.append(rec)
+        elif name == "segment":
+            assert isinstance(e, Recording), "<segment> may only occur within a <recording> element"
+            self._num_segments += 1
+            seg = Segment()
+            seg.name = attrs.get("name", str(self._num_segments))
+            seg.start = float(attrs.get("start", "0.0"))
+            seg.end = float(attrs.get("end", "0.0"))
+            seg.track = int(attrs["track"]) if "track" in attrs else None
+            e.add_segment(seg)
+            self.elements.append(seg)
+        else:
+            super().startElement(name, attrs)
+            if name == "speaker" and isinstance(e, Corpus) and id(e) in self._opened_sections:
+                # the header of the section was already written
+                self.out.write('%s  <speaker name="%s"/>\n' % (self._section_indentation(e), e.speaker_name))
+        self.chars = ""
+
+    def endElement(self, name: str):
+        e = self.elements[-1]
+        if name == "corpus" and self._include_depth > 0:
+            pass
+        elif name in ("corpus", "subcorpus"):
+            self._close_section(e)
+        elif name == "recording":
+            section = e.corpus
+            if self._writes_recordings(section):
+                if self.delete_empty_recordings and not e.segments:
+                    self.removed_recordings.append(e.fullname())
+                else:
+                    self._open_section(section)
+                    if self.subcorpora == "flatten":
+                        e.dump(self.out, self.indentation + "  ")
+                    else:
+                        e.dump(self.out, self._section_indentation(section) + "  ")
+        elif name == "segment":
+            rec = e.recording
+            if self.segment_filter is not None and not self.segment_filter(rec.corpus, rec, e):
+                rec.segments.pop()
+        elif name == "speaker-description":
+            section = self.elements[-2]
+            if isinstance(section, Corpus) and id(section) in self._opened_sections and e.name is not None:
+                # the header of the section was already written
+                super().endElement(name)
+                e.dump(self.out, self._section_indentation(section) + "  ")
+                return
+        super().endElement(name)
+
+
+def stream_corpus(
+    path: str,
+    out: TextIO,
+    segment_filter: Optional[FilterFunction] = None,
+    delete_empty_recordings: bool = False,
+    root_element: Optional[str] = "corpus",
+    indentation: str = "",
+    subcorpora: str = "keep",
+    top_level_recordings: bool = True,
+) -> List[str]:
+    """
+    Copies a corpus from a file into an output stream while it is parsed, so the memory usage does not depend on the
+    size of the corpus. The segments are filtered as soon as they are parsed and every recording is written once it
+    is complete. Elements are written in the order of the input, for corpora written by :meth:`Corpus.dump`
+    the output is the same as loading, filtering and dumping the corpus.
+
+    :param path: corpus .xml or .xml.gz
+    :param out: output stream, e.g. :attr:`CorpusWriter.out`
+    :param segment_filter: takes arguments corpus, recording and segment, returns True if segment should be kept
+    :param delete_empty_recordings: do not write recordings without segments (after the filtering)
+    :param root_element: write the corpus as "corpus" or as "subcorpus" element,
+        if None only the content of the corpus is written, but not the name and speakers of the root corpus
+    :param indentation: indentation of the root element
+    :param subcorpora: "keep" the subcorpora, "flatten" them by writing their recordings as top-level recordings
+        or "skip" them
+    :param top_level_recordings: whether to write the recordings of the root corpus
+    :return: full names of the recordings that were not written because they were empty
+    """
+    open_fun = gzip.open if path.endswith(".gz") else open
+    handler = _StreamingCorpusParser(
+        Corpus(),
+        path,
+        out,
+        segment_filter=segment_filter,
+        delete_empty_recordings=delete_empty_recordings,
+        root_element=root_element,
+        indentation=indentation,
+        subcorpora=subcorpora,
+        top_level_recordings=top_level_recordings,
+    )
+    with open_fun(path, "rt") as f:
+        sax.parse(f, handler)
+    return handler.removed_recordings
+
+
+def filter_corpus(
+    path: str,
+    out_path: str,
+    segment_filter: FilterFunction,
+    delete_empty_recordings: bool = False,
+    compress_level: int = 9,
+    num_threads: int = 1,
+) -> List[str]:
+    """
+    Filters the segments of a corpus file with :func:`stream_corpus`,
+    equivalent to :meth:`Corpus.filter_segments` and :meth:`Corpus.dump`.
+
+    :param path: corpus .xml or .xml.gz
+    :param out_path: target .xml or .xml.gz path
+    :param segment_filter: takes arguments corpus, recording and segment, returns True if segment should be kept
+    :param delete_empty_recordings: remove recordings without segments (after the filtering)
+    :param compress_level: gzip compression level for .gz files
+    :param num_threads: compress .gz files in blocks with this many threads
+    :return: full names of the removed recordings
+    """
+    with _open_output(out_path, compress_level=compress_level, num_threads=num_threads) as out:
+        out.write('<?xml version="1.0" encoding="utf-8"?>\n')
+        return stream_corpus(path, out, segment_filter, delete_empty_recordings)
+
+
 class SegmentMap(object):
     def __init__(self):
         self.map_entries: List[SegmentMapItem] = []
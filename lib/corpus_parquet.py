@@ -0,0 +1,300 @@
+"""
+Columnar representation of bliss corpora as Parquet dataset, with one row per segment.
+
+The rows contain the segment metadata, the orthography and the speaker of the segment, optionally also the audio file
+content. Everything that is needed to write back the bliss corpus (name, subcorpora, speaker descriptions) is stored
+as JSON in the schema metadata. The dataset can be read with any Arrow based loader, :func:`load_corpus_table`
+reads only the requested columns and pushes filters down to the Parquet row groups.
+"""
+
+__all__ = ["SEGMENT_SCHEMA", "bliss_to_parquet", "load_corpus_table", "parquet_to_bliss"]
+
+import glob
+import json
+import logging
+import math
+import os
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from i6_core.lib import corpus
+from i6_core.lib.audio import compute_rec_duration
+
+SEGMENT_SCHEMA = pa.schema(
+    [
+        ("subcorpus", pa.string()),
+        ("recording", pa.string()),
+        ("audio", pa.string()),
+        ("recording_speaker", pa.string()),
+        ("segment", pa.string()),
+        ("start", pa.float64()),
+        ("end", pa.float64()),
+        ("duration", pa.float64()),
+        ("track", pa.int32()),
+        ("orth", pa.string()),
+        ("left_context_orth", pa.string()),
+        ("right_context_orth", pa.string()),
+        ("segment_speaker", pa.string()),
+        ("speaker", pa.string()),
+        ("gender", pa.string()),
+    ]
+)
+
+_METADATA_KEY = b"i6_core.bliss"
+
+Filters = Union[List[Tuple[str, str, Any]], List[List[Tuple[str, str, Any]]], ds.Expression]
+
+
+def _section_path(c: corpus.Corpus) -> str:
+    """
+    :return: path of a subcorpus below the root corpus, empty for the root corpus
+    """
+    if c.parent_corpus is None:
+        return ""
+    parent = _section_path(c.parent_corpus)
+    return parent + "/" + c.name if parent else c.name
+
+
+def _iter_sections(c: corpus.Corpus) -> Iterator[corpus.Corpus]:
+    yield c
+    for sc in c.subcorpora:
+        yield from _iter_sections(sc)
+
+
+def _speakers_to_json(section: corpus.CorpusSection) -> List[Dict[str, Any]]:
+    return [{"name": s.name, "attribs": s.attribs} for s in section.speakers.values()]
+
+
+def _corpus_metadata(c: corpus.Corpus) -> Dict[str, Any]:
+    sections = []
+    recording_speakers = {}
+    for sc in _iter_sections(c):
+        sections.append({"path": _section_path(sc), "speaker_name": sc.speaker_name, "speakers": _speakers_to_json(sc)})
+        for r in sc.recordings:
+            if r.speakers:
+                recording_speakers[r.fullname()] = _speakers_to_json(r)
+    return {"name": c.name, "sections": sections, "recording_speakers": recording_speakers}
+
+
+def _segment_duration(s: corpus.Segment, audio_durations: Dict[str, Optional[float]]) -> Optional[float]:
+    """
+    :param s: segment
+    :param audio_durations: cache of the recording durations per audio file
+    :return: duration of the segment, for segments with an infinite end up to the end of the audio file,
+        None if the audio file of such a segment does not exist
+    """
+    if not math.isinf(s.end):
+        return s.end - s.start
+    audio = s.recording.audio
+    if audio not in audio_durations:
+        if os.path.exists(audio):
+            audio_durations[audio] = compute_rec_duration(audio)
+        else:
+            logging.warning("audio file %s does not exist, storing null as duration of %s", audio, s.fullname())
+            audio_durations[audio] = None
+    if audio_durations[audio] is None:
+        return None
+    return audio_durations[audio] - s.start
+
+
+def _iter_rows(c: corpus.Corpus, include_audio: bool) -> Iterator[Dict[str, Any]]:
+    audio_durations = {}
+    for sc in _iter_sections(c):
+        path = _section_path(sc)
+        audio_bytes = None
+        for r in sc.recordings:
+            if include_audio:
+                assert len(r.segments) <= 1, "audio can only be included with a single segment per recording: %s" % (
+                    r.fullname()
+                )
+                with open(r.audio, "rb") as f:
+                    audio_bytes = f.read()
+            for s in r.segments:
+                speaker_name = s.speaker_name or r.speaker_name
+                section = sc
+                while speaker_name is None and section is not None:
+                    speaker_name = section.speaker_name
+                    section = section.parent_corpus
+                speaker = r.speaker(s.speaker_name)
+                row = {
+                    "subcorpus": path,
+                    "recording": r.name,
+                    "audio": r.audio,
+                    "recording_speaker": r.speaker_name,
+                    "segment": s.name,
+                    "start": s.start,
+                    "end": s.end,
+                    "duration": _segment_duration(s, audio_durations),
+                    "track": s.track,
+                    "orth": s.orth,
+                    "left_context_orth": s.left_context_orth,
+                    "right_context_orth": s.right_context_orth,
+                    "segment_speaker": s.speaker_name,
+                    "speaker": speaker_name,
+                    "gender": speaker.attribs.get("gender") if speaker is not None else None,
+                }
+                if include_audio:
+                    row["audio_bytes"] = audio_bytes
+                yield row
+
+
+def bliss_to_parquet(
+    bliss_corpus: str,
+    output_dir: str,
+    include_audio: bool = False,
+    rows_per_file: int = 1000000,
+    row_group_size: int = 10000,
+    compression: str = "zstd",
+):
+    """
+    Converts a bliss corpus into a Parquet dataset, consisting of the files `part-<index>.parquet` in the output
+    folder. Each file contains up to `rows_per_file` segments, split into row groups of `row_group_size` segments.
+    The row groups keep min/max statistics, so filters on columns that are sorted or clustered
+    in the corpus (e.g. recording, speaker) skip most of the data.
+
+    The `duration` of segments with an infinite end (e.g. a single segment per recording) is read from the header of
+    the audio file. If the audio file does not exist, the duration is null and the segment does not match
+    any filter on the duration.
+
+    :param bliss_corpus: bliss corpus .xml or .xml.gz file
+    :param output_dir: folder for the Parquet files
+    :param include_audio: store the content of the audio file of each recording in the binary column `audio_bytes`,
+        only possible for corpora with a single segment per recording
+    :param rows_per_file: maximum number of segments per file
+    :param row_group_size: number of segments per row group
+    :param compression: Parquet compression codec
+    """
+    c = corpus.Corpus()
+    c.load(bliss_corpus)
+
+    schema = SEGMENT_SCHEMA
+    if include_audio:
+        schema = schema.append(pa.field("audio_bytes", pa.binary()))
+    schema = schema.with_metadata({_METADATA_KEY: json.dumps(_corpus_metadata(c)).encode("utf-8")})
+
+    os.makedirs(output_dir, exist_ok=True)
+    writer = None
+    num_files = 0
+    rows_in_file = 0
+    batch = []
+
+    def flush():
+        nonlocal batch, rows_in_file
+        if batch:
+            writer.write_table(pa.Table.from_pylist(batch, schema=schema), row_group_size=row_group_size)
+            rows_in_file += len(batch)
+            batch = []
+
+    try:
+        for row in _iter_rows(c, include_audio):
+            if writer is None:
+                path = os.path.join(output_dir, "part-%05d.parquet" % num_files)
+                writer = pq.ParquetWriter(path, schema, compression=compression)
+                num_files += 1
+            batch.append(row)
+            if len(batch) >= row_group_size or rows_in_file + len(batch) >= rows_per_file:
+                flush()
+            if rows_in_file >= rows_per_file:
+                writer.close()
+                writer = None
+                rows_in_file = 0
+        if writer is None and num_files == 0:
+            # an empty corpus is still stored as a single file with the metadata
+            writer = pq.ParquetWriter(os.path.join(output_dir, "part-00000.parquet"), schema, compression=compression)
+        if writer is not None:
+            flush()
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def _parquet_files(path: str) -> List[str]:
+    if os.path.isdir(path):
+        return sorted(glob.glob(os.path.join(path, "*.parquet")))
+    return [path]
+
+
+def load_corpus_table(
+    path: str, columns: Optional[Sequence[str]] = None, filters: Optional[Filters] = None
+) -> pa.Table:
+    """
+    Loads the segments of a corpus Parquet dataset. Only the given columns are read, and the filters are evaluated
+    while scanning the files, so row groups whose statistics do not match the filters are not read at all.
+
+    Example: `load_corpus_table(path, ["segment", "duration"], [("duration", "<=", 20.0), ("speaker", "in", spks)])`
+
+    :param path: folder written by :func:`bliss_to_parquet` or a single Parquet file
+    :param columns: columns to read, all if None
+    :param filters: filters in the disjunctive normal form of :func:`pyarrow.parquet.read_table`
+        or a :class:`pyarrow.dataset.Expression`
+    :return: table with one row per segment in corpus order
+    """
+    dataset = ds.dataset(_parquet_files(path), format="parquet")
+    if filters is not None and not isinstance(filters, ds.Expression):
+        filters = pq.filters_to_expression(filters)
+    return dataset.to_table(columns=list(columns) if columns is not None else None, filter=filters)
+
+
+def parquet_to_bliss(path: str, output_path: str, filters: Optional[Filters] = None):
+    """
+    Writes a corpus Parquet dataset back as bliss corpus. Without filters the output is identical to
+    :meth:`i6_core.lib.corpus.Corpus.dump` of the original corpus, except for recordings without segments,
+    which are not stored in the dataset.
+
+    :param path: folder written by :func:`bliss_to_parquet` or a single Parquet file
+    :param output_path: bliss corpus .xml or .xml.gz file
+    :param filters: only keep the segments matching these filters, see :func:`load_corpus_table`
+    """
+    files = _parquet_files(path)
+    metadata = json.loads(pq.read_schema(files[0]).metadata[_METADATA_KEY].decode("utf-8"))
+    columns = [name for name in SEGMENT_SCHEMA.names if name not in ("duration", "speaker", "gender")]
+    table = load_corpus_table(path, columns, filters)
+
+    def make_speakers(section: corpus.CorpusSection, speakers: List[Dict[str, Any]]):
+        for info in speakers:
+            speaker = corpus.Speaker()
+            speaker.name = info["name"]
+            speaker.attribs = info["attribs"]
+            section.speakers[speaker.name] = speaker
+
+    c = corpus.Corpus()
+    sections = {}
+    for info in metadata["sections"]:
+        if info["path"] == "":
+            section = c
+            c.name = metadata["name"]
+        else:
+            parent_path, _, name = info["path"].rpartition("/")
+            section = corpus.Corpus()
+            section.name = name
+            sections[parent_path].add_subcorpus(section)
+        section.speaker_name = info["speaker_name"]
+        make_speakers(section, info["speakers"])
+        sections[info["path"]] = section
+
+    recording = None
+    for row in table.to_pylist():
+        section = sections[row["subcorpus"]]
+        if recording is None or recording.corpus is not section or recording.name != row["recording"]:
+            recording = corpus.Recording()
+            recording.name = row["recording"]
+            recording.audio = row["audio"]
+            recording.speaker_name = row["recording_speaker"]
+            section.add_recording(recording)
+            make_speakers(recording, metadata["recording_speakers"].get(recording.fullname(), []))
+        segment = corpus.Segment(
+            start=row["start"],
+            end=row["end"],
+            track=row["track"],
+            orth=row["orth"],
+            left_context_orth=row["left_context_orth"],
+            right_context_orth=row["right_context_orth"],
+            speaker_name=row["segment_speaker"],
+        )
+        segment.name = row["segment"]
+        recording.add_segment(segment)
+
+    c.dump(output_path)
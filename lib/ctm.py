@@ -0,0 +1,221 @@
+"""
+Helper functions and classes for writing CTM files from search outputs
+"""
+
+__all__ = ["SegmentTimingIndex", "CtmWriter"]
+
+import xml.sax as sax
+from typing import Dict, Iterable, List, TextIO, Tuple, Union
+
+from i6_core.lib.corpus import Corpus
+from i6_core.util import uopen
+
+SegmentTiming = Tuple[str, float, float]  # (recording name, start, end)
+
+
+class _IncludeFound(Exception):
+    pass
+
+
+class _SegmentTimingParser(sax.handler.ContentHandler):
+    """
+    Collects only the segment names and times of a bliss corpus, without building the corpus object graph.
+    The segment order is the same as in :meth:`i6_core.lib.corpus.Corpus.segments`, i.e. the recordings of a
+    (sub-)corpus come before its subcorpora.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.names: List[str] = []  # stack of corpus and recording names
+        self.own_segments: List[List[Tuple[str, SegmentTiming]]] = []
+        self.sub_segments: List[List[Tuple[str, SegmentTiming]]] = []
+        self.num_segments = 0
+        self.segments: List[Tuple[str, SegmentTiming]] = []
+
+    def startElement(self, name: str, attrs: Dict[str, str]):
+        if name in ["corpus", "subcorpus"]:
+            self.names.append(attrs["name"])
+            self.own_segments.append([])
+            self.sub_segments.append([])
+        elif name == "include":
+            raise _IncludeFound()
+        elif name == "recording":
+            self.names.append(attrs["name"])
+            self.num_segments = 0
+        elif name == "segment":
+            self.num_segments += 1
+            seg_name = attrs.get("name", str(self.num_segments))
+            timing = (self.names[-1], float(attrs.get("start", "0.0")), float(attrs.get("end", "0.0")))
+            self.own_segments[-1].append(("/".join(self.names + [seg_name]), timing))
+
+    def endElement(self, name: str):
+        if name in ["corpus", "subcorpus"]:
+            self.names.pop()
+            segments = self.own_segments.pop() + self.sub_segments.pop()
+            if self.sub_segments:
+                self.sub_segments[-1].extend(segments)
+            else:
+                self.segments = segments
+        elif name == "recording":
+            self.names.pop()
+
+
+class SegmentTimingIndex:
+    """
+    Compact mapping from segment full names to (recording name, start, end), in corpus order.
+    Use :meth:`from_bliss` to build it, which only collects the segment names and times from the corpus.
+    """
+
+    def __init__(self, segments: Iterable[Tuple[str, SegmentTiming]]):
+        """
+        :param segments: (segment full name, (recording name, start, end)) in corpus order
+        """
+        self.timings: Dict[str, SegmentTiming] = dict(segments)
+
+    def __len__(self):
+        return len(self.timings)
+
+    def __contains__(self, item: str):
+        return item in self.timings
+
+    def __getitem__(self, item: str) -> SegmentTiming:
+        return self.timings[item]
+
+    def __iter__(self):
+        return iter(self.timings)
+
+    @classmethod
+    def from_bliss(cls, corpus_file: str) -> "SegmentTimingIndex":
+        """
+        :param corpus_file: bliss corpus .xml or .xml.gz
+        """
+        handler = _SegmentTimingParser()
+        try:
+            with uopen(corpus_file, "rt") as f:
+                sax.parse(f, handler)
+            return cls(handler.segments)
+        except _IncludeFound:
+            # included corpora follow some special naming rules, use the full parser for them
+            c = Corpus()
+            c.load(corpus_file)
+            return cls((seg.fullname(), (seg.recording.name, seg.start, seg.end)) for seg in c.segments())
+
+
+class CtmWriter:
+    """
+    Writes search results into a CTM file. Lines are collected and written in large blocks.
+
+    Word times are linearly interpolated within the segment as search outputs without time stamps are converted.
+    Empty hypotheses are replaced by "<empty-sequence>", as sclite cannot handle empty sequences.
+    """
+
+    def __init__(
+        self,
+        out: Union[str, TextIO],
+        filter_tags: bool = True,
+        n_best: int = 1,
+        buffer_size: int = 1 << 20,
+    ):
+        """
+        :param out: output file name or file object
+        :param filter_tags: if set to True, tags such as [noise] will be filtered out
+        :param n_best: if > 1, up to n_best hypotheses per segment are written and their rank is added
+            as additional column
+        :param buffer_size: number of characters collected before writing
+        """
+        self._own_file = isinstance(out, str)
+        self.out = uopen(out, "wt") if self._own_file else out
+        self.filter_tags = filter_tags
+        self.n_best = n_best
+        self.buffer_size = buffer_size
+        self._buffer: List[str] = []
+        self._buffered = 0
+
+        # Do not print optional [n-best] header for single-best output, some downstream evaluation pipelines
+        # use the number of headers for validation.
+        #
+        # See https://github.com/rwth-i6/i6_core/pull/542.
+        if n_best > 1:
+            self._write(";; <name> <track> <start> <duration> <word> <confidence> <n-best>\n")
+        else:
+            self._write(";; <name> <track> <start> <duration> <word> <confidence>\n")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def add_segment(
+        self,
+        seg_fullname: str,
+        recording_name: str,
+        seg_start: float,
+        seg_end: float,
+        hypotheses: Union[str, List[Tuple[float, str]]],
+        spread_words: bool = False,
+    ):
+        """
+        :param seg_fullname: name of the segment, only used in the comment line
+        :param recording_name: written as name of each word
+        :param seg_start:
+        :param seg_end:
+        :param hypotheses: single hypothesis or n-best list as [(score, text), ...]
+        :param spread_words: if True, the word starts are spread over the full segment length, otherwise the words
+            are placed directly after each other with a duration of 0.9 * segment length / number of words
+        """
+        self._write(";; %s (%f-%f)\n" % (seg_fullname, seg_start, seg_end))
+        if isinstance(hypotheses, str):
+            hypotheses = [(0.0, hypotheses)]
+        else:
+            hypotheses = sorted(hypotheses, key=lambda h: h[0], reverse=True)
+        for rank, (_, text) in enumerate(hypotheses[: self.n_best], start=1):
+            self._add_hypothesis(recording_name, seg_start, seg_end, text, spread_words, rank)
+
+    def _add_hypothesis(
+        self,
+        recording_name: str,
+        seg_start: float,
+        seg_end: float,
+        text: str,
+        spread_words: bool,
+        rank: int,
+    ):
+        words = text.split()
+        if spread_words:
+            word_step = (seg_end - seg_start) / max(len(words), 1)
+            avg_dur = word_step * 0.9
+        else:
+            avg_dur = (seg_end - seg_start) * 0.9 / max(len(words), 1)
+            word_step = avg_dur
+        suffix = " %d\n" % rank if self.n_best > 1 else "\n"
+        lines = [
+            "%s 1 %f %f %s 0.99%s" % (recording_name, seg_start + word_step * i, avg_dur, word, suffix)
+            for i, word in enumerate(words)
+            if not (self.filter_tags and word.startswith("[") and word.endswith("]"))
+        ]
+        if not lines:
+            # sclite cannot handle empty sequences, and would stop with an error like:
+            #   hyp file '4515-11057-0054' and ref file '4515-11057-0053' not synchronized
+            #   sclite: Alignment failed.  Exiting
+            # So we make sure it is never empty.
+            # For the WER, it should not matter, assuming the reference sequence is non-empty,
+            # you will anyway get a WER of 100% for this sequence.
+            lines = ["%s 1 %f %f %s 0.99%s" % (recording_name, seg_start, avg_dur, "<empty-sequence>", suffix)]
+        self._write("".join(lines))
+
+    def _write(self, s: str):
+        self._buffer.append(s)
+        self._buffered += len(s)
+        if self._buffered >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        self.out.write("".join(self._buffer))
+        self._buffer = []
+        self._buffered = 0
+
+    def close(self):
+        self.flush()
+        if self._own_file:
+            self.out.close()
@@ -0,0 +1,253 @@
+"""
+Exact mean, variance and histogram statistics over the features of a RETURNN dataset.
+
+The frames are accumulated chunk-wise in float64 with the parallel variant of Welford's algorithm (Chan et al.),
+so partial statistics of dataset shards computed by separate worker processes are merged without loss of precision.
+This file has no dependencies on i6_core and is executed as script with the RETURNN Python,
+see :class:`i6_core.returnn.dataset.ExtractDatasetMeanStddevJob`.
+"""
+
+__all__ = ["FeatureStatistics", "compute_dataset_statistics"]
+
+import argparse
+import multiprocessing
+import os
+import sys
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+class FeatureStatistics:
+    """
+    Count, mean, sum of squared deviations, minimum, maximum and optionally a histogram per feature dimension
+    """
+
+    def __init__(self, dim: int, histogram_range: Optional[Tuple[float, float]] = None, histogram_bins: int = 1000):
+        """
+        :param dim: feature dimension
+        :param histogram_range: lower and upper edge of the histograms, values outside are counted in the outer bins,
+            no histograms if None
+        :param histogram_bins: number of bins per histogram
+        """
+        self.dim = dim
+        self.count = 0
+        self.mean = np.zeros(dim, dtype=np.float64)
+        self.m2 = np.zeros(dim, dtype=np.float64)
+        self.min = np.full(dim, np.inf)
+        self.max = np.full(dim, -np.inf)
+        self.histogram_range = histogram_range
+        self.histogram_edges = None
+        self.histogram = None
+        if histogram_range is not None:
+            self.histogram_edges = np.linspace(histogram_range[0], histogram_range[1], histogram_bins + 1)
+            self.histogram = np.zeros((dim, histogram_bins), dtype=np.int64)
+
+    def add(self, frames: np.ndarray):
+        """
+        :param frames: shape (time, dim)
+        """
+        frames = np.asarray(frames, dtype=np.float64).reshape(-1, self.dim)
+        if frames.shape[0] == 0:
+            return
+        chunk = FeatureStatistics(self.dim)
+        chunk.count = frames.shape[0]
+        chunk.mean = frames.mean(axis=0)
+        chunk.m2 = ((frames - chunk.mean) ** 2).sum(axis=0)
+        chunk.min = frames.min(axis=0)
+        chunk.max = frames.max(axis=0)
+        self.merge(chunk)
+        if self.histogram is not None:
+            num_bins = self.histogram.shape[1]
+            lower, upper = self.histogram_range
+            bins = np.floor((frames - lower) * (num_bins / (upper - lower))).astype(np.int64)
+            np.clip(bins, 0, num_bins - 1, out=bins)
+            # one bincount over all dimensions by offsetting the bin indices per dimension
+            bins += np.arange(self.dim) * num_bins
+            self.histogram += np.bincount(bins.ravel(), minlength=self.dim * num_bins).reshape(self.dim, num_bins)
+
+    def merge(self, other: "FeatureStatistics"):
+        """
+        Adds the statistics of other frames, the result is the same as if all frames were added to this object
+
+        :param other:
+        """
+        if other.count == 0:
+            return
+        total = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean = self.mean + delta * (other.count / total)
+        self.m2 = self.m2 + other.m2 + delta**2 * (self.count * other.count / total)
+        self.count = total
+        self.min = np.minimum(self.min, other.min)
+        self.max = np.maximum(self.max, other.max)
+        if self.histogram is not None and other.histogram is not None:
+            self.histogram += other.histogram
+
+    @property
+    def variance(self) -> np.ndarray:
+        return self.m2 / max(self.count, 1)
+
+    @property
+    def std_dev(self) -> np.ndarray:
+        return np.sqrt(self.variance)
+
+    def total_mean_and_std_dev(self) -> Tuple[float, float]:
+        """
+        :return: mean and standard deviation over all frames and all dimensions
+        """
+        total_mean = float(self.mean.mean())
+        total_m2 = self.m2.sum() + self.count * ((self.mean - total_mean) ** 2).sum()
+        return total_mean, float(np.sqrt(total_m2 / max(self.count * self.dim, 1)))
+
+    def percentiles(self, qs: Sequence[float]) -> np.ndarray:
+        """
+        :param qs: percentiles in [0, 100]
+        :return: shape (dim, len(qs)), interpolated linearly within the histogram bins, nan for empty histograms
+        """
+        assert self.histogram is not None, "percentiles need histograms"
+        qs = np.asarray(qs, dtype=np.float64) / 100.0
+        cdf = np.cumsum(self.histogram, axis=1) / np.maximum(self.histogram.sum(axis=1, keepdims=True), 1)
+        cdf = np.concatenate([np.zeros((self.dim, 1)), cdf], axis=1)
+        edges = self.histogram_edges
+        result = np.full((self.dim, len(qs)), np.nan)
+        for d in range(self.dim):
+            if cdf[d, -1] == 0:
+                continue
+            # upper edge of the first bin which reaches the quantile, empty bins at the borders are skipped
+            first_nonempty = np.searchsorted(cdf[d], 0.0, side="right")
+            idx = np.maximum(np.searchsorted(cdf[d], qs, side="left"), first_nonempty)
+            idx = np.minimum(idx, len(edges) - 1)
+            lower_cdf, upper_cdf = cdf[d, idx - 1], cdf[d, idx]
+            fraction = np.clip((qs - lower_cdf) / (upper_cdf - lower_cdf), 0.0, 1.0)
+            result[d] = edges[idx - 1] + fraction * (edges[idx] - edges[idx - 1])
+        return result
+
+
+def _init_returnn(returnn_root: Optional[str], config_file: str):
+    if returnn_root:
+        sys.path.insert(0, returnn_root)
+    from returnn.config import Config, set_global_config
+    from returnn.log import log
+
+    log.initialize(verbosity=[2])
+    config = Config()
+    config.load_file(config_file)
+    set_global_config(config)
+    return config
+
+
+def _shard_statistics(args) -> FeatureStatistics:
+    """
+    Statistics over the blocks of `block_size` sequences with index `block_index % num_shards == shard`
+    """
+    returnn_root, config_file, dataset_name, key, shard, num_shards, block_size, histogram_range, bins = args
+    config = _init_returnn(returnn_root, config_file)
+    from returnn.datasets import init_dataset
+
+    dataset = init_dataset(config.typed_value(dataset_name))
+    dataset.init_seq_order(epoch=1)
+
+    stats = None
+    buffer = []
+    buffered_frames = 0
+    seq_idx = 0
+    while dataset.is_less_than_num_seqs(seq_idx):
+        if (seq_idx // block_size) % num_shards != shard:
+            seq_idx += 1
+            continue
+        dataset.load_seqs(seq_idx, seq_idx + 1)
+        data = dataset.get_data(seq_idx, key)
+        data = data.reshape(data.shape[0], -1)
+        if stats is None:
+            stats = FeatureStatistics(data.shape[1], histogram_range, bins)
+        buffer.append(data)
+        buffered_frames += data.shape[0]
+        if buffered_frames >= 100000:
+            stats.add(np.concatenate(buffer))
+            buffer, buffered_frames = [], 0
+        seq_idx += 1
+    if buffer:
+        stats.add(np.concatenate(buffer))
+    return stats
+
+
+def compute_dataset_statistics(
+    returnn_root: Optional[str],
+    config_file: str,
+    dataset_name: str = "train",
+    key: str = "data",
+    num_workers: int = 1,
+    block_size: int = 100,
+    histogram_range: Optional[Tuple[float, float]] = None,
+    histogram_bins: int = 1000,
+) -> FeatureStatistics:
+    """
+    :param returnn_root: RETURNN repository, if RETURNN is not installed
+    :param config_file: RETURNN config which defines the dataset
+    :param dataset_name: config entry of the dataset
+    :param key: data key of the features
+    :param num_workers: number of processes, each one loads the dataset and processes every `num_workers`-th
+        block of sequences
+    :param block_size: number of consecutive sequences that are processed by the same worker
+    :param histogram_range: lower and upper edge of the histograms, no histograms if None
+    :param histogram_bins: number of bins per histogram
+    :return: statistics over all frames of the dataset
+    """
+    shard_args = [
+        (returnn_root, config_file, dataset_name, key, shard, num_workers, block_size, histogram_range, histogram_bins)
+        for shard in range(num_workers)
+    ]
+    if num_workers <= 1:
+        shards = [_shard_statistics(shard_args[0])]
+    else:
+        with multiprocessing.get_context("spawn").Pool(num_workers) as pool:
+            shards = pool.map(_shard_statistics, shard_args)
+
+    shards = [s for s in shards if s is not None]
+    assert shards, "the dataset does not contain any sequence"
+    stats = shards[0]
+    for shard in shards[1:]:
+        stats.merge(shard)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("config", help="RETURNN config")
+    parser.add_argument("--returnn_root", default=None)
+    parser.add_argument("--dataset", default="train", help="config entry of the dataset")
+    parser.add_argument("--key", default="data")
+    parser.add_argument("--num_workers", type=int, default=1)
+    parser.add_argument("--histogram_range", type=float, nargs=2, default=None)
+    parser.add_argument("--histogram_bins", type=int, default=1000)
+    parser.add_argument("--percentiles", type=float, nargs="*", default=[1, 5, 25, 50, 75, 95, 99])
+    parser.add_argument("--output_prefix", default="stats", help="writes <prefix>.{mean,std_dev,...}.txt")
+    args = parser.parse_args()
+
+    stats = compute_dataset_statistics(
+        args.returnn_root,
+        os.path.abspath(args.config),
+        dataset_name=args.dataset,
+        key=args.key,
+        num_workers=args.num_workers,
+        histogram_range=tuple(args.histogram_range) if args.histogram_range else None,
+        histogram_bins=args.histogram_bins,
+    )
+    prefix = args.output_prefix
+    np.savetxt(prefix + ".mean.txt", stats.mean)
+    np.savetxt(prefix + ".std_dev.txt", stats.std_dev)
+    np.savetxt(prefix + ".min.txt", stats.min)
+    np.savetxt(prefix + ".max.txt", stats.max)
+    total_mean, total_std_dev = stats.total_mean_and_std_dev()
+    with open(prefix + ".total.txt", "wt") as f:
+        f.write("%d %r %r\n" % (stats.count, total_mean, total_std_dev))
+    if stats.histogram is not None:
+        np.savez(prefix + ".histogram.npz", edges=stats.histogram_edges, counts=stats.histogram)
+        header = "percentiles " + " ".join("%g" % q for q in args.percentiles)
+        np.savetxt(prefix + ".percentiles.txt", stats.percentiles(args.percentiles), header=header)
+    print("frames: %d, total mean: %f, total std-dev: %f" % (stats.count, total_mean, total_std_dev))
+
+
+if __name__ == "__main__":
+    main()
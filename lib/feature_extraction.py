@@ -0,0 +1,281 @@
+"""
+Vectorized NumPy implementation of the basic RASR feature extraction flows, see :mod:`i6_core.features.common`.
+
+The functions follow the parameters of :func:`i6_core.features.common.fft_flow`,
+:func:`i6_core.features.common.cepstrum_flow`, :func:`i6_core.features.common.add_derivatives` and
+:func:`i6_core.features.common.normalize_features`, so that features for quick experiments can be computed
+without a RASR binary and compared against the RASR output.
+Not covered are the dc-detection of the samples flow and sliding (non-infinite) normalization windows.
+"""
+
+__all__ = [
+    "frame_signal",
+    "amplitude_spectrum",
+    "warped_filterbank",
+    "apply_filterbank",
+    "cepstrum",
+    "add_derivatives",
+    "normalize_features",
+    "frame_energy",
+    "extract_features",
+]
+
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+WARPING_FUNCTIONS = {
+    "mel": lambda f: 2595.0 * np.log10(1.0 + f / 700.0),
+    "bark": lambda f: 6.0 * np.arcsinh(f / 600.0),
+}
+
+
+def frame_signal(samples: np.ndarray, sample_rate: int, window_shift: float, window_length: float) -> np.ndarray:
+    """
+    Splits the signal into overlapping frames without copying the samples.
+    Only complete windows are returned.
+
+    :param samples: 1D signal
+    :param sample_rate: in Hz
+    :param window_shift: in seconds
+    :param window_length: in seconds
+    :return: read-only view of shape (num_frames, window_length * sample_rate)
+    """
+    shift = int(round(window_shift * sample_rate))
+    length = int(round(window_length * sample_rate))
+    num_frames = 1 + (len(samples) - length) // shift if len(samples) >= length else 0
+    stride = samples.strides[0]
+    return np.lib.stride_tricks.as_strided(
+        samples, shape=(num_frames, length), strides=(shift * stride, stride), writeable=False
+    )
+
+
+def amplitude_spectrum(
+    samples: np.ndarray,
+    sample_rate: int,
+    preemphasis: float = 1.0,
+    window_type: str = "hamming",
+    window_shift: float = 0.01,
+    window_length: float = 0.025,
+) -> np.ndarray:
+    """
+    Equivalent of :func:`i6_core.features.common.fft_flow`
+
+    :param samples: 1D signal, as in RASR the samples are expected in the 16-bit integer range
+    :param sample_rate: in Hz
+    :param preemphasis: preemphasis factor alpha, y[n] = x[n] - alpha * x[n-1]
+    :param window_type: "hamming", "hanning" or "rectangular"
+    :param window_shift: in seconds
+    :param window_length: in seconds
+    :return: amplitude spectrum of shape (num_frames, fft_length // 2 + 1)
+    """
+    samples = np.asarray(samples, dtype=np.float32)
+    if preemphasis:
+        samples = np.concatenate([samples[:1], samples[1:] - preemphasis * samples[:-1]])
+    frames = frame_signal(samples, sample_rate, window_shift, window_length)
+    length = frames.shape[1]
+
+    if window_type == "hamming":
+        window = np.hamming(length)
+    elif window_type == "hanning":
+        window = np.hanning(length)
+    elif window_type == "rectangular":
+        window = np.ones(length)
+    else:
+        raise NotImplementedError("window type %s is not supported" % window_type)
+
+    fft_length = 1 << max(0, int(np.ceil(np.log2(length))))
+    spectrum = np.fft.rfft(frames * window.astype(np.float32), n=fft_length, axis=1)
+    return np.abs(spectrum).astype(np.float32)
+
+
+def warped_filterbank(
+    num_bins: int,
+    sample_rate: int,
+    filter_width: float,
+    warping_function: str = "mel",
+    f_min: float = 0.0,
+    f_max: Optional[float] = None,
+) -> np.ndarray:
+    """
+    Triangular filters of constant width on the warped frequency axis, placed with 50% overlap such that they
+    cover the range [f_min, f_max], see also :func:`i6_core.features.filterbank.filter_width_from_channels`
+
+    :param num_bins: number of spectrum bins, i.e. fft_length // 2 + 1
+    :param sample_rate: in Hz
+    :param filter_width: filter width on the warped axis
+    :param warping_function: "mel" or "bark"
+    :param f_min: in Hz
+    :param f_max: in Hz, defaults to half the sample rate
+    :return: matrix of shape (num_bins, num_filters)
+    """
+    warp = WARPING_FUNCTIONS[warping_function]
+    if f_max is None:
+        f_max = sample_rate / 2.0
+    w_min, w_max = warp(f_min), warp(f_max)
+    spacing = filter_width / 2.0
+    num_filters = int((w_max - w_min - filter_width) / spacing) + 1
+    assert num_filters > 0, "filter width %f is too large" % filter_width
+    # stretch the spacing so that the filters cover the whole range
+    spacing = (w_max - w_min - filter_width) / max(num_filters - 1, 1) if num_filters > 1 else spacing
+
+    bin_freqs = warp(np.arange(num_bins) * (sample_rate / 2.0) / (num_bins - 1))
+    starts = w_min + spacing * np.arange(num_filters)
+    centers = starts + filter_width / 2.0
+    rising = (bin_freqs[:, None] - starts[None, :]) / (filter_width / 2.0)
+    falling = (starts[None, :] + filter_width - bin_freqs[:, None]) / (filter_width / 2.0)
+    weights = np.maximum(0.0, np.where(bin_freqs[:, None] <= centers[None, :], rising, falling))
+    return weights.astype(np.float32)
+
+
+def apply_filterbank(spectrum: np.ndarray, filterbank: np.ndarray) -> np.ndarray:
+    """
+    :param spectrum: (num_frames, num_bins)
+    :param filterbank: (num_bins, num_filters)
+    :return: (num_frames, num_filters)
+    """
+    return spectrum @ filterbank
+
+
+def cepstrum(
+    features: np.ndarray, normalize: bool = True, outputs: int = 16, add_epsilon: bool = False, epsilon=1.175494e-38
+) -> np.ndarray:
+    """
+    Equivalent of :func:`i6_core.features.common.cepstrum_flow`: logarithm followed by a cosine transform (DCT-II)
+
+    :param features: (num_frames, num_filters)
+    :param normalize: subtract the mean over the whole segment
+    :param outputs: number of cepstral coefficients
+    :param add_epsilon: add epsilon before the logarithm
+    :param epsilon:
+    :return: (num_frames, outputs)
+    """
+    log_features = np.log(features + epsilon if add_epsilon else features)
+    n = features.shape[1]
+    basis = np.cos(np.pi / n * np.outer(np.arange(n) + 0.5, np.arange(outputs))).astype(np.float32)
+    result = log_features @ basis
+    if normalize:
+        result = normalize_features(result, norm_type="mean")
+    return result
+
+
+def add_derivatives(features: np.ndarray, derivatives: int = 1) -> np.ndarray:
+    """
+    Equivalent of :func:`i6_core.features.common.add_derivatives`: first (and second) order regression over a
+    context of +-2 frames. At the segment boundaries the first/last frame is repeated.
+
+    :param features: (num_frames, dim)
+    :param derivatives: 0, 1 or 2
+    :return: (num_frames, dim * (derivatives + 1))
+    """
+    assert derivatives in [0, 1, 2]
+    if derivatives == 0 or len(features) == 0:
+        return np.concatenate([features] * (derivatives + 1), axis=1)
+    padded = np.pad(features, ((2, 2), (0, 0)), mode="edge")
+    num_frames = len(features)
+    context = np.stack([padded[2 + k : 2 + k + num_frames] for k in range(-2, 3)])  # (5, T, D)
+    ks = np.arange(-2, 3, dtype=np.float32)
+    out = [features, np.tensordot(ks / np.sum(ks**2), context, axes=1)]
+    if derivatives == 2:
+        quadratic = ks**2 - np.mean(ks**2)
+        out.append(np.tensordot(2.0 * quadratic / np.sum(quadratic**2), context, axes=1))
+    return np.concatenate(out, axis=1).astype(np.float32)
+
+
+def normalize_features(features: np.ndarray, norm_type: str = "mean-and-variance") -> np.ndarray:
+    """
+    Equivalent of :func:`i6_core.features.common.normalize_features` with an infinite window
+
+    :param features: (num_frames, dim)
+    :param norm_type: "mean", "mean-and-variance", "divide-by-mean" or "level"
+    """
+    if len(features) == 0:
+        return features
+    mean = features.mean(axis=0, keepdims=True, dtype=np.float64)
+    if norm_type in ["mean", "mean-norm"]:
+        result = features - mean
+    elif norm_type == "mean-and-variance":
+        std = features.std(axis=0, keepdims=True, dtype=np.float64)
+        result = (features - mean) / np.where(std > 0, std, 1.0)
+    elif norm_type == "divide-by-mean":
+        result = features / np.where(mean != 0, mean, 1.0)
+    elif norm_type == "level":
+        result = features - features.max(axis=0, keepdims=True)
+    else:
+        raise NotImplementedError("normalization type %s is not supported" % norm_type)
+    return result.astype(np.float32)
+
+
+def frame_energy(spectrum: np.ndarray, normalization_type: Optional[str] = "divide-by-mean") -> np.ndarray:
+    """
+    Equivalent of :func:`i6_core.features.energy.energy_flow`: L1 norm of the amplitude spectrum
+
+    :param spectrum: (num_frames, num_bins)
+    :param normalization_type: see :func:`normalize_features`
+    :return: (num_frames, 1)
+    """
+    energy = np.sum(np.abs(spectrum), axis=1, keepdims=True, dtype=np.float32)
+    if normalization_type is not None:
+        energy = normalize_features(energy, norm_type=normalization_type)
+    return energy
+
+
+def extract_features(
+    samples: np.ndarray,
+    sample_rate: int,
+    feature_type: str,
+    fft_options: Optional[Dict[str, Any]] = None,
+    warping_function: str = "mel",
+    filter_width: Optional[float] = None,
+    apply_log: bool = True,
+    add_epsilon: bool = False,
+    cepstrum_options: Optional[Dict[str, Any]] = None,
+    derivatives: int = 0,
+    normalize: bool = True,
+    normalization_type: str = "mean-and-variance",
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Computes the features of a single segment
+
+    :param samples: 1D signal in the 16-bit integer range
+    :param sample_rate: in Hz
+    :param feature_type: "mfcc", "filterbank" or "energy"
+    :param fft_options: arguments to :func:`amplitude_spectrum`
+    :param warping_function: warping function of the filterbank
+    :param filter_width: filter width on the warped axis, defaults to the RASR defaults of the flows
+    :param apply_log: apply the logarithm to the filterbank output, only used for "filterbank"
+    :param add_epsilon: add a small epsilon before the logarithm, only used for "filterbank"
+    :param cepstrum_options: arguments to :func:`cepstrum`, only used for "mfcc"
+    :param derivatives: number of derivatives appended after the normalization, see :func:`add_derivatives`
+    :param normalize: normalize the features over the whole segment
+    :param normalization_type: type of the final normalization, see :func:`normalize_features`
+    :return: features of shape (num_frames, dim) and the relative (start, end) times of shape (num_frames, 2)
+    """
+    fft_options = dict(fft_options or {})
+    spectrum = amplitude_spectrum(samples, sample_rate, **fft_options)
+
+    if feature_type == "energy":
+        features = frame_energy(spectrum, normalization_type if normalize else None)
+    elif feature_type in ["mfcc", "filterbank"]:
+        if filter_width is None:
+            filter_width = 268.258 if feature_type == "mfcc" else 70
+        fb = warped_filterbank(spectrum.shape[1], sample_rate, filter_width, warping_function)
+        features = apply_filterbank(spectrum, fb)
+        if feature_type == "mfcc":
+            cepstrum_options = dict(cepstrum_options or {})
+            if normalize:
+                cepstrum_options.setdefault("normalize", False)
+            features = cepstrum(features, **cepstrum_options)
+        elif apply_log:
+            features = np.log(features + 1.175494e-38 if add_epsilon else features)
+        if normalize:
+            features = normalize_features(features, norm_type=normalization_type)
+        features = add_derivatives(features, derivatives)
+    else:
+        raise NotImplementedError("feature type %s is not supported" % feature_type)
+
+    shift = fft_options.get("window_shift", 0.01)
+    length = fft_options.get("window_length", 0.025)
+    starts = np.arange(len(features), dtype=np.float64) * shift
+    times = np.stack([starts, starts + length], axis=1)
+    return features.astype(np.float32), times
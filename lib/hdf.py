@@ -1,10 +1,15 @@
-import h5py
 import numpy as np
-from typing import Dict, Optional
+import os
+import shutil
+import tempfile
+from typing import Dict, List, Optional, Sequence, Tuple, Union, TYPE_CHECKING
 import sys
 
+if TYPE_CHECKING:
+    import h5py
 
-def get_input_dict_from_returnn_hdf(hdf_file: h5py.File) -> Dict[str, np.ndarray]:
+
+def get_input_dict_from_returnn_hdf(hdf_file: "h5py.File") -> Dict[str, np.ndarray]:
     """
     Generate dictionary containing the "data" value as ndarray indexed by the sequence tag
 
@@ -35,3 +40,201 @@ def get_returnn_simple_hdf_writer(returnn_root: Optional[str]):
     from returnn.datasets.hdf import SimpleHDFWriter
 
     return SimpleHDFWriter
+
+
+class BufferedHDFWriter:
+    """
+    Writes sequences into an HDF file in the format of the RETURNN `SimpleHDFWriter`,
+    which can be read by the RETURNN `HDFDataset`. Besides the main data, each sequence can have extra data streams
+    with their own lengths, which are declared in advance via `extra_type`.
+
+    `SimpleHDFWriter` resizes and writes every dataset once per sequence. Here the sequences are collected in memory
+    and written with a single resize and write per dataset once `buffer_size` bytes are buffered.
+    As with `SimpleHDFWriter`, the file is created in the local temp directory and copied to its destination on close.
+    """
+
+    def __init__(
+        self,
+        filename: Union[str, os.PathLike],
+        dim: Optional[int],
+        ndim: Optional[int] = None,
+        buffer_size: int = 64 * 1024 * 1024,
+        chunk_size: Optional[int] = None,
+        compression: Optional[str] = None,
+        compression_opts: Optional[int] = None,
+        extra_type: Optional[Dict[str, Tuple[int, int, str]]] = None,
+    ):
+        """
+        :param filename: target HDF file
+        :param dim: feature dimension for dense data or number of classes for sparse data
+        :param ndim: 1 for sparse data with shape (time,), 2 for dense data with shape (time, dim),
+            derived from dim by default as in `SimpleHDFWriter`
+        :param buffer_size: number of bytes of sequence data that are buffered before writing
+        :param chunk_size: number of time frames per HDF5 chunk, automatic if None
+        :param compression: HDF5 compression filter for the data, e.g. "gzip" or "lzf"
+        :param compression_opts: options for the compression filter, e.g. the gzip level
+        :param extra_type: data key -> (dim, ndim, dtype) of the extra data streams, as in `SimpleHDFWriter`
+        """
+        if ndim is None:
+            ndim = 1 if dim is None else 2
+        assert ndim in [1, 2], "only sparse (ndim=1) or dense (ndim=2) sequences are supported"
+        self.filename = os.fspath(filename)
+        self.dim = dim
+        self.ndim = ndim
+        self.buffer_size = buffer_size
+        self.chunk_size = chunk_size
+        self.compression = compression
+        self.compression_opts = compression_opts
+
+        self.extra_type = dict(extra_type or {})
+
+        self._buffer: List[np.ndarray] = []
+        self._buffer_tags: List[str] = []
+        self._buffer_extra: Dict[str, List[np.ndarray]] = {key: [] for key in self.extra_type}
+        self._buffer_bytes = 0
+
+        import h5py
+
+        tmp_fd, self._tmp_filename = tempfile.mkstemp(suffix=".hdf")
+        os.close(tmp_fd)
+        self._file = h5py.File(self._tmp_filename, "w")
+        self._file.attrs["numTimesteps"] = 0
+        self._file.attrs["inputPattSize"] = dim or 1
+        self._file.attrs["numDims"] = 1
+        self._file.attrs["numLabels"] = dim or 1
+        self._file.attrs["numSeqs"] = 0
+        self._file.create_dataset("labels", (0,), dtype="S5")
+        self._seq_lengths = self._file.create_dataset(
+            "seqLengths", (0, 1 + max(len(self.extra_type), 1)), dtype="i", maxshape=(None, None)
+        )
+        self._seq_tags = self._file.create_dataset(
+            "seqTags", (0,), dtype=h5py.special_dtype(vlen=str), maxshape=(None,)
+        )
+        self._inputs = None
+        # the column of an extra data stream in seqLengths is 1 + its index in the sorted keys
+        self._extra_keys = sorted(self.extra_type)
+        self._extra_data = {}
+        if self.extra_type:
+            for group in ["targets/data", "targets/size", "targets/labels"]:
+                self._file.create_group(group)
+            for key in self._extra_keys:
+                extra_dim, extra_ndim, extra_dtype = self.extra_type[key]
+                assert extra_ndim in [1, 2], "only sparse or dense extra data is supported"
+                self._file["targets/labels"].create_dataset(key, data=np.array([b"dummy-label"]), dtype="S11")
+                shape = (0,) if extra_ndim == 1 else (0, extra_dim)
+                maxshape = (None,) if extra_ndim == 1 else (None, extra_dim)
+                self._extra_data[key] = self._file["targets/data"].create_dataset(
+                    key,
+                    shape,
+                    dtype=extra_dtype,
+                    maxshape=maxshape,
+                    compression=self.compression,
+                    compression_opts=self.compression_opts,
+                )
+                self._file["targets/size"].attrs[key] = [extra_dim or 1, extra_ndim]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def insert(self, data: np.ndarray, seq_tag: str, extra: Optional[Dict[str, np.ndarray]] = None):
+        """
+        :param data: a single sequence, shape (time,) for sparse or (time, dim) for dense data
+        :param seq_tag:
+        :param extra: data of the sequence for every key of `extra_type`, each with its own length
+        """
+        data = np.asarray(data)
+        assert data.ndim == self.ndim, "expected %d dims, got shape %r" % (self.ndim, data.shape)
+        if self.ndim == 2 and self.dim:
+            assert data.shape[1] == self.dim, "expected dim %d, got shape %r" % (self.dim, data.shape)
+        extra = extra or {}
+        assert set(extra) == set(self.extra_type), "expected extra data %r, got %r" % (self._extra_keys, list(extra))
+        for key, extra_data in extra.items():
+            extra_data = np.asarray(extra_data)
+            assert extra_data.ndim == self.extra_type[key][1], "extra %r has shape %r" % (key, extra_data.shape)
+            self._buffer_extra[key].append(extra_data)
+            self._buffer_bytes += extra_data.nbytes
+        self._buffer.append(data)
+        self._buffer_tags.append(seq_tag)
+        self._buffer_bytes += data.nbytes
+        if self._buffer_bytes >= self.buffer_size:
+            self.flush()
+
+    def insert_batch(self, inputs: np.ndarray, seq_len: Sequence[int], seq_tag: Sequence[str]):
+        """
+        Same interface as `SimpleHDFWriter.insert_batch` for a single dynamic axis
+
+        :param inputs: padded sequences, shape (batch, time) for sparse or (batch, time, dim) for dense data
+        :param seq_len: length of each sequence
+        :param seq_tag: tag of each sequence
+        """
+        assert len(seq_len) == len(seq_tag) == inputs.shape[0]
+        for data, length, tag in zip(inputs, seq_len, seq_tag):
+            self.insert(data[:length], tag)
+
+    def flush(self):
+        """
+        Writes the buffered sequences to the file
+        """
+        if not self._buffer:
+            return
+        data = np.concatenate(self._buffer, axis=0)
+        num_seqs = len(self._buffer)
+        lengths = np.zeros((num_seqs, self._seq_lengths.shape[1]), dtype="int32")
+        lengths[:, 0] = [len(seq) for seq in self._buffer]
+        for i, key in enumerate(self._extra_keys):
+            lengths[:, 1 + i] = [len(seq) for seq in self._buffer_extra[key]]
+            extra_data = np.concatenate(self._buffer_extra[key], axis=0)
+            extra_offset = self._extra_data[key].shape[0]
+            self._extra_data[key].resize(extra_offset + extra_data.shape[0], axis=0)
+            self._extra_data[key][extra_offset:] = extra_data
+
+        offset = int(self._file.attrs["numTimesteps"])
+        if self._inputs is None:
+            chunks = None
+            if self.chunk_size is not None:
+                chunks = (self.chunk_size,) + data.shape[1:]
+            self._inputs = self._file.create_dataset(
+                "inputs",
+                data.shape,
+                data.dtype,
+                maxshape=tuple(None for _ in data.shape),
+                chunks=chunks,
+                compression=self.compression,
+                compression_opts=self.compression_opts,
+            )
+        else:
+            self._inputs.resize(offset + data.shape[0], axis=0)
+        self._inputs[offset:] = data
+
+        seq_offset = self._seq_lengths.shape[0]
+        self._seq_lengths.resize(seq_offset + num_seqs, axis=0)
+        self._seq_lengths[seq_offset:] = lengths
+        self._seq_tags.resize(seq_offset + num_seqs, axis=0)
+        self._seq_tags[seq_offset:] = np.array(self._buffer_tags, dtype=object)
+
+        self._file.attrs["numTimesteps"] = offset + data.shape[0]
+        self._file.attrs["numSeqs"] = seq_offset + num_seqs
+
+        self._buffer = []
+        self._buffer_tags = []
+        self._buffer_extra = {key: [] for key in self.extra_type}
+        self._buffer_bytes = 0
+
+    def close(self):
+        """
+        Writes the remaining sequences and copies the file to its destination
+        """
+        if self._file is None:
+            return
+        self.flush()
+        self._file.close()
+        self._file = None
+        tmp_dest_filename = os.path.join(
+            os.path.dirname(self.filename) or ".", ".%s.copying" % os.path.basename(self.filename)
+        )
+        shutil.copyfile(self._tmp_filename, tmp_dest_filename)
+        shutil.move(tmp_dest_filename, self.filename)
+        os.remove(self._tmp_filename)
@@ -3,10 +3,10 @@ Library for the RASR Lexicon files
 
 For format details visit: `https://www-i6.informatik.rwth-aachen.de/rwth-asr/manual/index.php/Lexicon`_
 """
-__all__ = ["Lemma", "Lexicon"]
+__all__ = ["Lemma", "Lexicon", "iterparse_lexicon", "LexiconWriter"]
 
 from collections import OrderedDict
-from typing import Optional, List
+from typing import Dict, Iterator, Optional, List, TextIO
 import xml.etree.ElementTree as ET
 
 from i6_core.util import uopen
@@ -173,3 +173,121 @@ class Lexicon:
             root.append(l.to_xml())
 
         return root
+
+
+def iterparse_lexicon(path: str) -> Iterator[ET.Element]:
+    """
+    Streams the top-level elements (phoneme-inventory, lemma, ...) of a bliss lexicon.
+    Each element is complete including its tail and is removed from the tree after it was yielded,
+    so the memory usage does not grow with the size of the lexicon.
+
+    :param path: bliss lexicon .xml or .xml.gz file
+    """
+    with uopen(path, "rb") as f:
+        root = None
+        depth = 0
+        pending = None
+        for event, elem in ET.iterparse(f, events=("start", "end")):
+            if event == "start":
+                if root is None:
+                    root = elem
+                depth += 1
+                continue
+            depth -= 1
+            if depth != 1:
+                continue
+            # the tail of an element is only complete once the next element was started, so yield with a delay
+            if pending is not None:
+                yield pending
+                root.remove(pending)
+            pending = elem
+        if pending is not None:
+            yield pending
+
+
+def _escape(data: str) -> str:
+    return data.replace("&", "&amp;").replace("<", "&lt;").replace('"', "&quot;").replace(">", "&gt;")
+
+
+class LexiconWriter:
+    """
+    Writes a bliss lexicon element by element.
+
+    With `prettify` the output is identical to :func:`i6_core.util.write_xml` of the complete lexicon element,
+    otherwise the elements are serialized as they are (including their whitespace).
+    """
+
+    def __init__(self, path: str, prettify: bool = True):
+        """
+        :param path: output .xml or .xml.gz file
+        :param prettify: indent the elements like :func:`i6_core.util.write_xml`
+        """
+        self.prettify = prettify
+        self.out: TextIO = uopen(path, "wt")
+        if prettify:
+            self.out.write('<?xml version="1.0" ?>\n<lexicon>\n')
+        else:
+            self.out.write('<?xml version="1.0" encoding="utf-8"?>\n<lexicon>')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def write_phoneme_inventory(self, phonemes: Dict[str, str]):
+        """
+        :param phonemes: symbol => variation, as in :attr:`Lexicon.phonemes`
+        """
+        pi = ET.Element("phoneme-inventory")
+        for symbol, variation in phonemes.items():
+            p = ET.SubElement(pi, "phoneme")
+            s = ET.SubElement(p, "symbol")
+            s.text = symbol
+            v = ET.SubElement(p, "variation")
+            v.text = variation
+        self.write_element(pi)
+
+    def write_lemma(self, lemma: Lemma):
+        """
+        :param lemma:
+        """
+        self.write_element(lemma.to_xml())
+
+    def write_element(self, elem: ET.Element):
+        """
+        :param elem: a top-level element of the lexicon
+        """
+        if not self.prettify:
+            self.out.write(ET.tostring(elem, encoding="unicode"))
+        else:
+            self._write_pretty(elem, "  ")
+
+    def _write_pretty(self, elem: ET.Element, indent: str):
+        """
+        Same output as `xml.dom.minidom` pretty printing in write_xml, whitespace-only text is dropped
+        """
+        self.out.write("%s<%s" % (indent, elem.tag))
+        for name, value in elem.attrib.items():
+            self.out.write(' %s="%s"' % (name, _escape(value)))
+        # text nodes as seen by minidom: text and tails which are not whitespace-only
+        text = elem.text if elem.text and elem.text.strip() else None
+        children = [(child, child.tail if child.tail and child.tail.strip() else None) for child in elem]
+        if text is None and not children:
+            self.out.write("/>\n")
+        elif not children:
+            self.out.write(">%s</%s>\n" % (_escape(text), elem.tag))
+        else:
+            self.out.write(">\n")
+            child_indent = indent + "  "
+            if text is not None:
+                self.out.write("%s%s\n" % (child_indent, _escape(text)))
+            for child, tail in children:
+                self._write_pretty(child, child_indent)
+                if tail is not None:
+                    self.out.write("%s%s\n" % (child_indent, _escape(tail)))
+            self.out.write("%s</%s>\n" % (indent, elem.tag))
+
+    def close(self):
+        self.out.write("</lexicon>\n" if self.prettify else "</lexicon>")
+        self.out.close()
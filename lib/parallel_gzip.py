@@ -0,0 +1,82 @@
+"""
+Block-parallel gzip compression for large output files
+"""
+
+__all__ = ["ParallelGzipWriter"]
+
+import collections
+import concurrent.futures
+import io
+import zlib
+from typing import BinaryIO, Deque
+
+
+def _compress_block(data: bytes, level: int) -> bytes:
+    """
+    :return: data as a complete gzip member, zlib releases the GIL while compressing
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+class ParallelGzipWriter(io.RawIOBase):
+    """
+    Binary raw file object that compresses the written data in blocks of `block_size` bytes with several threads.
+
+    Each block is written as a separate gzip member. A concatenation of gzip members is a valid gzip file,
+    which is read as one stream by `gzip`, `zcat` and zlib's `gzread`. The compression ratio is slightly worse
+    than for a single stream, because the blocks do not share the deflate window.
+
+    Wrap it into an :class:`io.BufferedWriter` or :class:`io.TextIOWrapper` for small writes.
+    """
+
+    def __init__(self, path: str, compress_level: int = 9, num_threads: int = 4, block_size: int = 4 * 1024 * 1024):
+        """
+        :param path: output .gz file
+        :param compress_level: gzip compression level, 1 (fastest) to 9 (smallest)
+        :param num_threads: number of blocks that are compressed at the same time
+        :param block_size: uncompressed size of a block in bytes
+        """
+        super().__init__()
+        self.compress_level = compress_level
+        self.block_size = block_size
+        self.num_threads = num_threads
+        self._file: BinaryIO = open(path, "wb")
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=num_threads)
+        self._pending: Deque[concurrent.futures.Future] = collections.deque()
+        self._buffer = bytearray()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data: bytes) -> int:
+        """
+        :param data:
+        :return: number of written bytes
+        """
+        self._buffer += data
+        while len(self._buffer) >= self.block_size:
+            self._submit(bytes(self._buffer[: self.block_size]))
+            del self._buffer[: self.block_size]
+        return len(data)
+
+    def _submit(self, block: bytes):
+        self._pending.append(self._executor.submit(_compress_block, block, self.compress_level))
+        # the blocks are written in order, limit the number of blocks that are kept in memory
+        while len(self._pending) > 2 * self.num_threads:
+            self._file.write(self._pending.popleft().result())
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            if self._buffer or (not self._pending and self._file.tell() == 0):
+                # an empty input is still written as one (empty) gzip member
+                self._submit(bytes(self._buffer))
+                self._buffer = bytearray()
+            while self._pending:
+                self._file.write(self._pending.popleft().result())
+        finally:
+            self._executor.shutdown()
+            self._file.close()
+            super().close()
@@ -9,13 +9,38 @@ This module is about reading (maybe later also writing) the Rasr archive format.
 from __future__ import print_function
 
 import array
+import hashlib
 import logging
 import mmap
 import numpy
 import os
+import threading
 from typing import Dict, List, Optional, Tuple
 import zlib
-from struct import pack, unpack
+from struct import pack, unpack, unpack_from
+
+
+def split_emission_idxs(emission_idxs, num_allophones):
+    """
+    Splits the emission indices of an alignment (allophone index + state * 2^26) into allophone indices and states,
+    like :func:`FileArchive.getState` for a whole array.
+
+    :param numpy.ndarray|list[int] emission_idxs:
+    :param int num_allophones:
+    :return: allophone indices and states, int64 arrays of the same shape
+    :rtype: (numpy.ndarray,numpy.ndarray)
+    """
+    max_states = 6
+    allo_idxs = numpy.array(emission_idxs, dtype=numpy.int64)
+    states = numpy.zeros(allo_idxs.shape, dtype=numpy.int64)
+    for state in range(max_states):
+        above = allo_idxs >= num_allophones
+        if not above.any():
+            break
+        allo_idxs[above] -= 1 << 26
+        states[above] = min(state + 1, max_states - 1)
+    assert (allo_idxs >= 0).all()
+    return allo_idxs, states
 
 
 class FileInfo:
@@ -72,6 +97,9 @@ class FileArchive:
             self.write_str(self.RasrCacheHeader)
             self.write_char(1)
 
+        # the reads seek in the shared file object, so they are serialized
+        self._read_lock = threading.Lock()
+
         self._short_seg_names = {os.path.basename(n): n for n in self.ft.keys()}
         if len(self._short_seg_names) < len(self.ft):
             # We don't have a unique mapping, so we cannot use this.
@@ -311,14 +339,17 @@ class FileArchive:
     def _raw_read(self, size, typ):
         """
         :param int|None size: needed for typ == "str"
-        :param str typ: "str", "feat" or "align"
+        :param str typ: "str", "feat", "feat_array", "align" or "align_array"
         :return: depending on typ, "str" -> string, "feat" -> (time, data), "align" -> align,
+          "feat_array" -> (times, features), "align_array" -> (times, allophones, states),
           where string is a str,
           time is list of time-stamp tuples (start-time,end-time) in millisecs,
             data is a list of features, each a numpy vector,
           align is a list of (time, allophone, state), time is an int from 0 to len of align,
-            allophone is some int, state is e.g. in [0,1,2].
-        :rtype: str|(list[numpy.ndarray],list[numpy.ndarray])|list[(int,int,int)]
+            allophone is some int, state is e.g. in [0,1,2],
+          times, allophones and states are int64 arrays with one entry per frame of align,
+          for "feat_array" times is a float64 array of shape (T, 2) and features a float32 array of shape (T, dim).
+        :rtype: str|(list[numpy.ndarray],list[numpy.ndarray])|list[(int,int,int)]|tuple[numpy.ndarray,...]
         """
 
         if typ == "str":
@@ -343,7 +374,9 @@ class FileArchive:
                     data[i] = self.read_v("f", 1)  # 1 x f32
                     time_[i] = self.read_v("d", 2)  # 2 x f64
             return time_, data
-        elif typ in ["align", "align_raw"]:
+        elif typ == "feat_array":
+            return self._read_feature_array()
+        elif typ in ["align", "align_raw", "align_array"]:
             type_len = self.read_U32()
             file_typ = self.read_str(type_len)
             assert file_typ == "flow-alignment"
@@ -353,7 +386,9 @@ class FileArchive:
                 # In case of AALPHRLE, after the alignment, we include the alphabet of the used labels.
                 # We ignore this at the moment.
                 size = self.read_U32()
-                if size < (1 << 31):
+                if size < (1 << 31) and typ == "align_array":
+                    return self._read_rle_alignment_array(size)
+                elif size < (1 << 31):
                     # RLE scheme
                     time = 0
                     alignment = []
@@ -410,12 +445,78 @@ class FileArchive:
                             nItems -= 1
                             alignment.append((t, mix, state, weight))
                         t += 1
+                    if typ == "align_array":
+                        return tuple(numpy.array([a[i] for a in alignment], dtype=numpy.int64) for i in range(3))
                     return alignment
             else:
                 raise Exception("No valid alignment header found (found: %r). Wrong cache?" % typ)
         else:
             raise NotImplementedError(f"Archive type '{typ}' is not yet implemented")
 
+    def _read_feature_array(self):
+        """
+        Reads all frames of a feature entry at once, the frames are stored as (dim, data, start-time, end-time) records.
+
+        :return: times of shape (T, 2) and features of shape (T, dim)
+        :rtype: (numpy.ndarray,numpy.ndarray)
+        """
+        type_len = self.read_U32()
+        typ = self.read_str(type_len)
+        assert typ in {"vector-f32", "f32"}
+        count = self.read_U32()
+        if count == 0:
+            return numpy.zeros((0, 2), dtype=numpy.float64), numpy.zeros((0, 0), dtype=numpy.float32)
+        if typ == "vector-f32":
+            pos = self.f.tell()
+            dim = self.read_U32()
+            self.f.seek(pos)
+            record = numpy.dtype([("dim", "u4"), ("data", "f4", (dim,)), ("time", "f8", (2,))])
+        else:
+            record = numpy.dtype([("data", "f4", (1,)), ("time", "f8", (2,))])
+        frames = numpy.frombuffer(self.f.read(count * record.itemsize), dtype=record)
+        if typ == "vector-f32":
+            assert (frames["dim"] == dim).all(), "features of different dimensions in one entry"
+        return numpy.ascontiguousarray(frames["time"]), numpy.ascontiguousarray(frames["data"])
+
+    def _read_rle_alignment_array(self, size):
+        """
+        Reads a run-length encoded alignment run by run instead of frame by frame.
+
+        :param int size: number of frames
+        :return: times, allophone indices and states, each as int64 array of shape (size,)
+        :rtype: (numpy.ndarray,numpy.ndarray,numpy.ndarray)
+        """
+        values = []
+        lengths = []
+        starts = []
+        num_frames = 0
+        time = 0
+        while num_frames < size:
+            n = self.read_char()
+            if n > 0:
+                values.append(numpy.frombuffer(self.f.read(4 * n), dtype=numpy.int32))
+                lengths.append(numpy.ones(n, dtype=numpy.int64))
+                starts.append(numpy.arange(time, time + n, dtype=numpy.int64))
+            elif n < 0:
+                n = -n
+                values.append(numpy.array([self.read_u32()], dtype=numpy.int32))
+                lengths.append(numpy.array([n], dtype=numpy.int64))
+                starts.append(numpy.array([time], dtype=numpy.int64))
+            else:
+                time = self.read_u32()
+                continue
+            time += n
+            num_frames += n
+        if num_frames == 0:
+            empty = numpy.zeros(0, dtype=numpy.int64)
+            return empty, empty.copy(), empty.copy()
+        lengths = numpy.concatenate(lengths)
+        run_offsets = numpy.cumsum(lengths) - lengths
+        times = numpy.repeat(numpy.concatenate(starts), lengths)
+        times += numpy.arange(num_frames, dtype=numpy.int64) - numpy.repeat(run_offsets, lengths)
+        mixes, states = self.getStates(numpy.repeat(numpy.concatenate(values).astype(numpy.int64), lengths))
+        return times, mixes, states
+
     def has_entry(self, filename):
         """
         :param str filename: argument for self.read()
@@ -426,46 +527,50 @@ class FileArchive:
     def read(self, filename, typ):
         """
         :param str filename: the entry-name in the archive
-        :param str typ: "str", "feat" or "align"
+        :param str typ: "str", "feat", "feat_array", "align" or "align_array"
         :return: depending on typ, "str" -> string, "feat" -> (time, data), "align" -> align,
+          "feat_array" -> (times, features), "align_array" -> (times, allophones, states),
           where string is a str,
           time is list of time-stamp tuples (start-time,end-time) in millisecs,
             data is a list of features, each a numpy vector,
           align is a list of (time, allophone, state), time is an int from 0 to len of align,
-            allophone is some int, state is e.g. in [0,1,2].
-        :rtype: str|(list[numpy.ndarray],list[numpy.ndarray])|list[(int,int,int)]
-        """
-
-        if filename not in self.ft:
-            if filename in self._short_seg_names:
-                filename = self._short_seg_names[filename]
-
-        fi = self.ft[filename]
-        self.f.seek(fi.pos)
-        size = self.read_U32()
-        comp = self.read_U32()
-        self.read_U32()  # chk
-        if size == 0:
-            return None
-
-        if comp > 0:
-            # read compressed bytes into memory as 'bytearray'
-            a = array.array("b")
-            a.fromfile(self.f, comp)
-            # unpack
-            b = zlib.decompress(a.tobytes(), 15 + 32)
-            # substitute self.f by an anonymous memmap file object
-            # restore original file handle after we're done
-            backup_f = self.f
-            self.f = mmap.mmap(-1, len(b))
-            self.f.write(b)
-            self.f.seek(0)
-            try:
-                return self._raw_read(size=fi.size, typ=typ)
-            finally:
-                self.f = backup_f
-
-        return self._raw_read(size=fi.size, typ=typ)
+            allophone is some int, state is e.g. in [0,1,2],
+          times, allophones and states are int64 arrays with one entry per frame of align,
+          for "feat_array" times is a float64 array of shape (T, 2) and features a float32 array of shape (T, dim).
+        :rtype: str|(list[numpy.ndarray],list[numpy.ndarray])|list[(int,int,int)]|tuple[numpy.ndarray,...]
+        """
+
+        with self._read_lock:
+            if filename not in self.ft:
+                if filename in self._short_seg_names:
+                    filename = self._short_seg_names[filename]
+
+            fi = self.ft[filename]
+            self.f.seek(fi.pos)
+            size = self.read_U32()
+            comp = self.read_U32()
+            self.read_U32()  # chk
+            if size == 0:
+                return None
+
+            if comp > 0:
+                # read compressed bytes into memory as 'bytearray'
+                a = array.array("b")
+                a.fromfile(self.f, comp)
+                # unpack
+                b = zlib.decompress(a.tobytes(), 15 + 32)
+                # substitute self.f by an anonymous memmap file object
+                # restore original file handle after we're done
+                backup_f = self.f
+                self.f = mmap.mmap(-1, len(b))
+                self.f.write(b)
+                self.f.seek(0)
+                try:
+                    return self._raw_read(size=fi.size, typ=typ)
+                finally:
+                    self.f = backup_f
+
+            return self._raw_read(size=fi.size, typ=typ)
 
     def getState(self, mix):
         """
@@ -485,6 +590,17 @@ class FileArchive:
         assert mix >= 0
         return mix, state
 
+    def getStates(self, mixes):
+        """
+        Vectorized version of :func:`getState`.
+
+        :param numpy.ndarray mixes: emission indices as stored in the alignment
+        :return: allophone indices and states
+        :rtype: (numpy.ndarray,numpy.ndarray)
+        """
+        assert self.allophones
+        return split_emission_idxs(mixes, len(self.allophones))
+
     def setAllophones(self, f):
         """
         :param str f: allophone filename. line-separated. will ignore lines starting with "#"
@@ -522,18 +638,68 @@ class FileArchive:
         self.write_str("vector-f32")
         assert len(features) == len(times)
         self.write_u32(len(features))
-        for f, t in zip(features, times):
-            self.write_u32(len(f))
-            for x in f.flat:
-                self.write_f32(x)
-            self.write_f64(t[0])
-            self.write_f64(t[1])
+        # all frames are written at once as packed (dim, data, start-time, end-time) records
+        frames = numpy.empty(len(features), dtype=[("dim", "i4"), ("data", "f4", (dim,)), ("time", "f8", (2,))])
+        frames["dim"] = dim
+        if len(features) > 0:
+            frames["data"] = numpy.asarray(features, dtype=numpy.float32).reshape(len(features), dim)
+            frames["time"] = numpy.asarray(times, dtype=numpy.float64).reshape(len(times), 2)
+        self.f.write(frames.tobytes())
 
         self.ft[filename] = FileInfo(filename, pos, size, 0, len(self.ft))
         self.write_U32(self.end_recovery_tag)
 
         self.addAttributes(filename, dim, duration)
 
+    def addAlignmentCache(self, filename, alignment):
+        """
+        Writes a run-length encoded alignment, which can be read with the types "align" and "align_array".
+
+        :param str filename:
+        :param list[(int,int,int)] alignment: (time, allophone, state) per frame, like read(filename, "align")
+            without the weights
+        """
+        # runs of frames with the same emission index and consecutive times, at most 127 frames per run
+        body = bytearray()
+        time = 0
+        pos = 0
+        while pos < len(alignment):
+            t, allophone, state = alignment[pos][:3]
+            if t != time:
+                body += pack("b", 0) + pack("i", t)
+                time = t
+            emission = allophone + (state << 26)
+            n = 1
+            while (
+                pos + n < len(alignment)
+                and n < 127
+                and alignment[pos + n][0] == time + n
+                and alignment[pos + n][1] + (alignment[pos + n][2] << 26) == emission
+            ):
+                n += 1
+            body += pack("b", -n if n > 1 else 1) + pack("i", emission)
+            time += n
+            pos += n
+
+        self.write_U32(self.start_recovery_tag)
+        self.write_u32(len(filename.encode(self.encoding)))
+        self.write_str(filename, self.encoding)
+        pos = self.f.tell()
+        size = 4 + 14 + 4 + 8 + 4 + len(body)
+        self.write_u32(size)
+        self.write_u32(0)
+        self.write_u32(0)
+
+        self.write_u32(14)
+        self.write_str("flow-alignment")
+        self.write_u32(0)
+        self.write_str("ALIGNRLE")
+        self.write_U32(len(alignment))
+        self.f.write(bytes(body))
+
+        self.ft[filename] = FileInfo(filename, pos, size, 0, len(self.ft))
+        self.write_U32(self.end_recovery_tag)
+
     def addAttributes(self, filename, dim, duration):
         """
         :param str filename:
@@ -600,14 +766,17 @@ class FileArchiveBundle:
     def read(self, filename, typ):
         """
         :param str filename: the entry-name in the archive
-        :param str typ: "str", "feat" or "align"
+        :param str typ: "str", "feat", "feat_array", "align" or "align_array"
         :return: depending on typ, "str" -> string, "feat" -> (time, data), "align" -> align,
+          "feat_array" -> (times, features), "align_array" -> (times, allophones, states),
           where string is a str,
           time is list of time-stamp tuples (start-time,end-time) in millisecs,
             data is a list of features, each a numpy vector,
           align is a list of (time, allophone, state), time is an int from 0 to len of align,
-            allophone is some int, state is e.g. in [0,1,2].
-        :rtype: str|(list[numpy.ndarray],list[numpy.ndarray])|list[(int,int,int)]
+            allophone is some int, state is e.g. in [0,1,2],
+          times, allophones and states are int64 arrays with one entry per frame of align,
+          for "feat_array" times is a float64 array of shape (T, 2) and features a float32 array of shape (T, dim).
+        :rtype: str|(list[numpy.ndarray],list[numpy.ndarray])|list[(int,int,int)]|tuple[numpy.ndarray,...]
 
         Uses FileArchive.read().
         """
@@ -659,6 +828,9 @@ def is_rasr_cache_file(filename):
 class AllophoneLabeling(object):
     """
     Allophone labeling.
+
+    The labels of all allophone states are kept in the dense table `label_table` of shape
+    (num_allophones, num_states), entries without label are -1. The batch methods map whole alignments to labels.
     """
 
     def __init__(
@@ -668,6 +840,7 @@ class AllophoneLabeling(object):
         phoneme_file=None,
         state_tying_file=None,
         verbose_out=None,
+        cache_label_table=False,
     ):
         """
         :param str silence_phone: e.g. "si"
@@ -675,6 +848,8 @@ class AllophoneLabeling(object):
         :param str|None phoneme_file: list of phonemes
         :param str|None state_tying_file: allophone state tying (e.g. via CART). maps each allophone state to a class label
         :param file verbose_out: stream to dump log messages
+        :param bool cache_label_table: store the label table of the state tying as .npy file next to the state tying
+            file and load it from there if it exists, the file name contains a checksum of the allophones
         """
         assert phoneme_file or state_tying_file
         self.allophone_file = allophone_file
@@ -693,12 +868,18 @@ class AllophoneLabeling(object):
         self.state_tying = None
         self.state_tying_by_allo_state_idx = None
         self.num_allo_states = None
+        self.label_table = None
         if phoneme_file:
             self.phonemes = open(phoneme_file).read().splitlines()
             self.phoneme_idxs = {p: i for i, p in enumerate(self.phonemes)}
             if not state_tying_file:
                 self.sil_label_idx = self.phoneme_idxs[silence_phone]
                 self.num_labels = len(self.phonemes)
+                # the label only depends on the phone, so it is the same for all states
+                phone_labels = [
+                    self.phoneme_idxs.get(a[: a.index("{")], -1) if "{" in a else -1 for a in self.allophones
+                ]
+                self.label_table = numpy.repeat(numpy.array(phone_labels, dtype=numpy.int32)[:, None], 6, axis=1)
                 if verbose_out:
                     print(
                         "AllophoneLabeling: %i phones = labels." % self.num_labels,
@@ -708,12 +889,11 @@ class AllophoneLabeling(object):
             self.state_tying = {k: int(v) for l in open(state_tying_file).read().splitlines() for (k, v) in [l.split()]}
             self.sil_label_idx = self.state_tying[silence_phone + "{#+#}@i@f.0"]
             self.num_allo_states = self._get_num_allo_states()
-            self.state_tying_by_allo_state_idx = {
-                a + s * (1 << 26): self.state_tying["%s.%i" % (a_s, s)]
-                for (a, a_s) in enumerate(self.allophones)
-                for s in range(self.num_allo_states)
-                if ("%s.%i" % (a_s, s)) in self.state_tying
-            }
+            self.label_table = self._get_state_tying_label_table(state_tying_file, cache_label_table)
+            allo_idxs, state_idxs = numpy.nonzero(self.label_table >= 0)
+            self.state_tying_by_allo_state_idx = dict(
+                zip((allo_idxs + state_idxs * (1 << 26)).tolist(), self.label_table[allo_idxs, state_idxs].tolist())
+            )
             self.num_labels = max(self.state_tying.values()) + 1
             if verbose_out:
                 print(
@@ -727,24 +907,48 @@ class AllophoneLabeling(object):
         assert self.state_tying
         return max([int(s.split(".")[-1]) for s in self.state_tying.keys()]) + 1
 
+    def _get_state_tying_label_table(self, state_tying_file, cache_label_table):
+        """
+        :param str state_tying_file:
+        :param bool cache_label_table: see __init__
+        :return: labels of shape (num_allophones, num_allo_states)
+        :rtype: numpy.ndarray
+        """
+        cache_file = None
+        if cache_label_table:
+            checksum = hashlib.sha256("\n".join(self.allophones).encode("utf8")).hexdigest()[:16]
+            cache_file = "%s.labels.%s.npy" % (state_tying_file, checksum)
+            if os.path.exists(cache_file) and os.path.getmtime(cache_file) >= os.path.getmtime(state_tying_file):
+                table = numpy.load(cache_file)
+                if table.shape == (len(self.allophones), self.num_allo_states):
+                    return table
+
+        table = numpy.full((len(self.allophones), self.num_allo_states), -1, dtype=numpy.int32)
+        allo_idxs, state_idxs, labels = [], [], []
+        for allo_state, label in self.state_tying.items():
+            allo_str, _, state = allo_state.rpartition(".")
+            allo_idx = self.allophones_idx.get(allo_str)
+            if allo_idx is not None:
+                allo_idxs.append(allo_idx)
+                state_idxs.append(int(state))
+                labels.append(label)
+        table[allo_idxs, state_idxs] = labels
+
+        if cache_file is not None:
+            try:
+                tmp_file = "%s.%d.tmp.npy" % (cache_file[: -len(".npy")], os.getpid())
+                numpy.save(tmp_file, table)
+                os.replace(tmp_file, cache_file)
+            except OSError as exc:
+                logging.warning("could not store the label table in %s: %s", cache_file, exc)
+        return table
+
     def get_label_idx_by_allo_state_idx(self, allo_state_idx):
         """
         :param int allo_state_idx:
         :rtype: int
         """
-        if self.state_tying_by_allo_state_idx:
-            return self.state_tying_by_allo_state_idx[allo_state_idx]
-        # See getState above().
-        max_states = 6
-        allo_idx = allo_state_idx
-        state_idx = 0
-        for state_idx in range(max_states):
-            if allo_idx >= len(self.allophones):
-                allo_idx -= 1 << 26
-            else:
-                break
-        assert allo_idx >= 0
-        return self.get_label_idx(allo_idx, state_idx)
+        return int(self.get_label_idxs_by_allo_state_idxs(numpy.array([allo_state_idx]))[0])
 
     def get_label_idx(self, allo_idx, state_idx):
         """
@@ -752,18 +956,39 @@ class AllophoneLabeling(object):
         :param int state_idx:
         :rtype: int
         """
-        if self.state_tying_by_allo_state_idx:
-            try:
-                return self.state_tying_by_allo_state_idx[allo_idx + state_idx * (1 << 26)]
-            except KeyError:
-                allo_str = self.allophones[allo_idx]
+        return int(self.get_label_idxs(numpy.array([allo_idx]), numpy.array([state_idx]))[0])
+
+    def get_label_idxs_by_allo_state_idxs(self, allo_state_idxs):
+        """
+        :param numpy.ndarray allo_state_idxs: emission indices as stored in alignments, allophone index + state * 2^26
+        :return: labels, int32 array of the same shape
+        :rtype: numpy.ndarray
+        """
+        allo_idxs, state_idxs = split_emission_idxs(allo_state_idxs, len(self.allophones))
+        return self.get_label_idxs(allo_idxs, state_idxs)
+
+    def get_label_idxs(self, allo_idxs, state_idxs):
+        """
+        :param numpy.ndarray allo_idxs:
+        :param numpy.ndarray state_idxs:
+        :return: labels, int32 array of the same shape
+        :rtype: numpy.ndarray
+        """
+        allo_idxs = numpy.asarray(allo_idxs)
+        state_idxs = numpy.asarray(state_idxs)
+        valid = state_idxs < self.label_table.shape[1]
+        labels = self.label_table[allo_idxs, numpy.where(valid, state_idxs, 0)]
+        missing = (labels < 0) | ~valid
+        if missing.any():
+            allo_idx, state_idx = int(allo_idxs[missing].flat[0]), int(state_idxs[missing].flat[0])
+            allo_str = self.allophones[allo_idx]
+            if self.state_tying is not None:
                 r = self.state_tying.get("%s.%i" % (allo_str, state_idx))
                 raise KeyError(
                     "allo idx %i (%r), state idx %i not found; entry: %r" % (allo_idx, allo_str, state_idx, r)
                 )
-        allo_str = self.allophones[allo_idx]
-        phone = allo_str[: allo_str.index("{")]
-        return self.phoneme_idxs[phone]
+            raise KeyError(allo_str[: allo_str.index("{")] if "{" in allo_str else allo_str)
+        return labels
 
 
 ###############################################################################
@@ -772,217 +997,203 @@ class AllophoneLabeling(object):
 class MixtureSet:
     """
     Mixture set.
-    """
-
-    # read routines
-    def read_u32(self):
-        """
-        :rtype: int
-        """
-        return int(unpack("i", self.f.read(4))[0])
 
-    # noinspection PyPep8Naming
-    def read_U32(self):
-        """
-        :rtype: int
-        """
-        return int(unpack("I", self.f.read(4))[0])
-
-    def read_u64(self):
-        """
-        :rtype: int
-        """
-        return int(unpack("q", self.f.read(8))[0])
-
-    def read_char(self):
-        """
-        :rtype: int
-        """
-        return unpack("b", self.f.read(1))[0]
+    The file is read completely in the constructor and closed, so there is no attribute `f` anymore,
+    and the record-wise helpers `read_*` and `write_*` were removed, use :meth:`write` to write the mixture set.
+    The mixtures are stored as arrays, :attr:`mixtures` is a read-only copy, use :meth:`setMixtures` to change them.
+    """
 
-    def read_str(self, l, enc="ascii"):
+    _removed_attributes = {
+        "f",
+        "read_u32",
+        "read_U32",
+        "read_u64",
+        "read_char",
+        "read_str",
+        "read_f32",
+        "read_f64",
+        "read_v",
+        "write_str",
+        "write_char",
+        "write_u32",
+        "write_U32",
+        "write_u64",
+        "write_f32",
+        "write_f64",
+    }
+
+    def __init__(self, filename=None):
+        """
+        :param str|None filename: mixture set file, an empty mixture set is created if None
         """
-        :param int l:
-        :param str enc:
-        :rtype: str
-        """
-        a = array.array("b")
-        a.fromfile(self.f, l)
-        return a.tobytes().decode(enc)
+        self.header = "MIXSET\0"
+        self.version = 1
+        self.dim = 0
+        self.means = numpy.zeros((0, 0), dtype=numpy.float64)
+        self.mean_weights = numpy.zeros(0, dtype=numpy.float64)
+        self.covs = numpy.zeros((0, 0), dtype=numpy.float64)
+        self.cov_weights = numpy.zeros(0, dtype=numpy.float64)
+        self.densities = numpy.zeros((0, 2), dtype=numpy.int32)
+        # mixtures in CSR format, the densities of mixture n are
+        # mixture_density_idxs[mixture_offsets[n]:mixture_offsets[n + 1]] with the weights at the same positions
+        self.mixture_offsets = numpy.zeros(1, dtype=numpy.int64)
+        self.mixture_density_idxs = numpy.zeros(0, dtype=numpy.int32)
+        self.mixture_density_weights = numpy.zeros(0, dtype=numpy.float64)
+        if filename is not None:
+            with open(filename, "rb") as f:
+                self._read(f)
+
+    def __getattr__(self, name):
+        if name in MixtureSet._removed_attributes:
+            raise AttributeError(
+                "MixtureSet.%s was removed, the file is read in the constructor and written with MixtureSet.write"
+                % name
+            )
+        raise AttributeError("'MixtureSet' object has no attribute %r" % name)
 
-    def read_f32(self):
+    def _vector_dtype(self):
         """
-        :rtype: float
+        :return: record of a mean or covariance vector: size, values and weight
+        :rtype: numpy.dtype
         """
-        return float(unpack("f", self.f.read(4))[0])
+        return numpy.dtype([("size", numpy.int32), ("values", numpy.float64, (self.dim,)), ("weight", numpy.float64)])
 
-    def read_f64(self):
-        """
-        :rtype: float
+    def _read(self, f):
         """
-        return float(unpack("d", self.f.read(8))[0])
-
-    def read_v(self, size, a):
+        :param typing.BinaryIO f:
         """
-        :param int size:
-        :param array.array a:
-        :rtype: array.array
+        header = f.read(8).decode("ascii")
+        assert header[:7] == self.header
+        self.version, self.dim = numpy.frombuffer(f.read(8), dtype=numpy.int32).tolist()
+
+        for vectors_name, weights_name in [("means", "mean_weights"), ("covs", "cov_weights")]:
+            (num,) = numpy.frombuffer(f.read(4), dtype=numpy.int32).tolist()
+            records = numpy.fromfile(f, dtype=self._vector_dtype(), count=num)
+            assert len(records) == num, "mixture set file is truncated"
+            assert (records["size"] == self.dim).all()
+            setattr(self, vectors_name, numpy.ascontiguousarray(records["values"]).reshape(num, self.dim))
+            setattr(self, weights_name, numpy.ascontiguousarray(records["weight"]))
+
+        (num_densities,) = numpy.frombuffer(f.read(4), dtype=numpy.int32).tolist()
+        self.densities = numpy.fromfile(f, dtype=numpy.int32, count=2 * num_densities).reshape(num_densities, 2)
+
+        # each mixture is stored as number of densities followed by (density index, weight) records of 12 bytes,
+        # only the numbers of densities are read one by one, the records are gathered at once
+        (num_mixtures,) = numpy.frombuffer(f.read(4), dtype=numpy.int32).tolist()
+        buffer = numpy.frombuffer(f.read(), dtype=numpy.uint8)
+        counts = numpy.zeros(num_mixtures, dtype=numpy.int64)
+        pos = 0
+        for n in range(num_mixtures):
+            counts[n] = unpack_from("i", buffer, pos)[0]
+            pos += 4 + 12 * int(counts[n])
+        self.mixture_offsets = numpy.zeros(num_mixtures + 1, dtype=numpy.int64)
+        numpy.cumsum(counts, out=self.mixture_offsets[1:])
+        record_pos = self._mixture_record_positions()
+        self.mixture_density_idxs = buffer[record_pos[:, None] + numpy.arange(4)].view(numpy.int32).reshape(-1)
+        self.mixture_density_weights = buffer[record_pos[:, None] + numpy.arange(4, 12)].view(numpy.float64).reshape(-1)
+
+    def _mixture_record_positions(self):
+        """
+        :return: byte position of each (density index, weight) record in the mixture section,
+          after the numbers of densities of all preceding and the current mixture and all preceding records
+        :rtype: numpy.ndarray
         """
-        a.fromfile(self.f, size)
-        return a
+        counts = numpy.diff(self.mixture_offsets)
+        mixture_of_record = numpy.repeat(numpy.arange(self.num_mixtures, dtype=numpy.int64), counts)
+        return 4 * (mixture_of_record + 1) + 12 * numpy.arange(self.mixture_offsets[-1], dtype=numpy.int64)
 
-    # write routines
-    def write_str(self, s, enc="ascii"):
+    @property
+    def num_means(self):
         """
-        :param str s:
-        :param str enc:
         :rtype: int
         """
-        return self.f.write(pack("%ds" % len(s), s.encode(enc)))
+        return self.means.shape[0]
 
-    def write_char(self, i):
+    @property
+    def num_covs(self):
         """
-        :param int i:
         :rtype: int
         """
-        return self.f.write(pack("b", i))
+        return self.covs.shape[0]
 
-    def write_u32(self, i):
+    @property
+    def num_densities(self):
         """
-        :param int i:
         :rtype: int
         """
-        return self.f.write(pack("i", i))
-
-        # noinspection PyPep8Naming
+        return self.densities.shape[0]
 
-    def write_U32(self, i):
+    @property
+    def num_mixtures(self):
         """
-        :param int i:
         :rtype: int
         """
-        return self.f.write(pack("I", i))
+        return len(self.mixture_offsets) - 1
 
-    def write_u64(self, i):
-        """
-        :param int i:
-        :rtype: int
+    @property
+    def mixtures(self):
         """
-        return self.f.write(pack("q", i))
+        Copy of the mixtures as immutable tuples, changes have to be made with :meth:`setMixtures`
 
-    def write_f32(self, i):
-        """
-        :param float i:
-        :rtype: int
+        :return: density indices and weights per mixture
+        :rtype: tuple[(tuple[int],tuple[float])]
         """
-        return self.f.write(pack("f", i))
+        return tuple(
+            (
+                tuple(self.mixture_density_idxs[start:end].tolist()),
+                tuple(self.mixture_density_weights[start:end].tolist()),
+            )
+            for start, end in zip(self.mixture_offsets[:-1], self.mixture_offsets[1:])
+        )
 
-    def write_f64(self, i):
+    def setMixtures(self, mixtures):
         """
-        :param float i:
-        :rtype: int
+        :param list[(list[int],list[float])] mixtures: density indices and weights per mixture
         """
-        return self.f.write(pack("d", i))
+        self.mixture_offsets = numpy.zeros(len(mixtures) + 1, dtype=numpy.int64)
+        numpy.cumsum([len(idxs) for idxs, _ in mixtures], out=self.mixture_offsets[1:])
+        self.mixture_density_idxs = numpy.array([i for idxs, _ in mixtures for i in idxs], dtype=numpy.int32)
+        self.mixture_density_weights = numpy.array([w for _, weights in mixtures for w in weights], dtype=numpy.float64)
 
-    def __init__(self, filename):
+    def getMixtureDensities(self, idx):
         """
-        :param str filename:
+        :param int idx: mixture index
+        :return: density indices and weights of the mixture
+        :rtype: (numpy.ndarray,numpy.ndarray)
         """
-        self.header = "MIXSET\0"
-        self.f = open(filename, "rb")
-        header = self.read_str(8)
-        assert header[:7] == self.header
-        self.version = self.read_u32()
-        self.dim = self.read_u32()
-
-        self.num_means = self.read_u32()
-        self.means = numpy.zeros([self.num_means, self.dim], dtype=numpy.float64)
-        self.mean_weights = numpy.zeros(self.num_means, dtype=numpy.float64)
-
-        for n in range(self.num_means):
-            size = self.read_u32()
-            assert size == self.dim
-            arr_f = array.array("d")
-            arr_f.fromfile(self.f, self.dim)
-            self.means[n, :] = numpy.array(arr_f)
-            self.mean_weights[n] = self.read_f64()
-
-        self.num_covs = self.read_u32()
-        self.covs = numpy.zeros([self.num_covs, self.dim], dtype=numpy.float64)
-        self.cov_weights = numpy.zeros(self.num_covs, dtype=numpy.float64)
+        start, end = self.mixture_offsets[idx], self.mixture_offsets[idx + 1]
+        return self.mixture_density_idxs[start:end], self.mixture_density_weights[start:end]
 
-        for n in range(self.num_covs):
-            size = self.read_u32()
-            assert size == self.dim
-            arr_f = array.array("d")
-            arr_f.fromfile(self.f, self.dim)
-            self.covs[n, :] = numpy.array(arr_f)
-            self.cov_weights[n] = self.read_f64()
-
-        self.num_densities = self.read_u32()
-        self.densities = numpy.zeros((self.num_densities, 2), dtype=numpy.int32)
-        for n in range(self.num_densities):
-            mean_idx = self.read_u32()
-            cov_idx = self.read_u32()
-            self.densities[n, 0] = mean_idx
-            self.densities[n, 1] = cov_idx
-
-        self.num_mixtures = self.read_u32()
-        self.mixtures: List[Optional[Tuple[List[int], List[float]]]] = [None] * self.num_mixtures
-        for n in range(self.num_mixtures):
-            num_densities = self.read_u32()
-            dns_idx = []
-            dns_weight = []
-            for i in range(num_densities):
-                dns_idx.append(self.read_u32())
-                dns_weight.append(self.read_f64())
-            self.mixtures[n] = (dns_idx, dns_weight)
-
-    # TODO?
-    # noinspection PyUnresolvedReferences
     def write(self, filename):
         """
         :param str filename:
         """
-        self.f.close()
-        self.f = open(filename, "wb")
-        self.write_str(self.header + "t")
-        self.write_u32(self.version)
-        self.write_u32(self.dim)
-
-        self.write_u32(self.num_means)
-
-        for n in range(self.num_means):
-            self.write_u32(self.dim)
-            arr_f = array.array("d")
-            arr_f.fromlist(list(self.means[n, :]))
-            arr_f.tofile(self.f)
-            self.write_f64(self.mean_weights[n])
-
-        self.write_u32(self.num_covs)
-
-        for n in range(self.num_covs):
-            self.write_u32(self.dim)
-            arr_f = array.array("d")
-            arr_f.fromlist(list(self.covs[n, :]))
-            arr_f.tofile(self.f)
-            self.write_f64(self.cov_weights[n])
-
-        self.write_u32(self.num_densities)
-        for n in range(self.num_densities):
-            self.write_u32(int(self.densities[n, 0]))
-            self.write_u32(int(self.densities[n, 1]))
-
-        self.write_u32(self.num_mixtures)
-        for n in range(self.num_mixtures):
-            num_densities = len(self.mixtures[n][0])
-            self.write_u32(num_densities)
-            for i in range(num_densities):
-                self.write_u32(self.mixtures[n][0][i])
-                self.write_f64(self.mixtures[n][1][i])
-
-    def __del__(self):
-        self.f.close()
+        with open(filename, "wb") as f:
+            f.write((self.header + "t").encode("ascii"))
+            numpy.array([self.version, self.dim], dtype=numpy.int32).tofile(f)
+
+            for vectors, weights in [(self.means, self.mean_weights), (self.covs, self.cov_weights)]:
+                numpy.array([len(vectors)], dtype=numpy.int32).tofile(f)
+                records = numpy.empty(len(vectors), dtype=self._vector_dtype())
+                records["size"] = self.dim
+                records["values"] = vectors
+                records["weight"] = weights
+                records.tofile(f)
+
+            numpy.array([self.num_densities], dtype=numpy.int32).tofile(f)
+            numpy.ascontiguousarray(self.densities, dtype=numpy.int32).tofile(f)
+
+            numpy.array([self.num_mixtures], dtype=numpy.int32).tofile(f)
+            counts = numpy.diff(self.mixture_offsets)
+            buffer = numpy.empty(4 * self.num_mixtures + 12 * self.mixture_offsets[-1], dtype=numpy.uint8)
+            count_pos = 4 * numpy.arange(self.num_mixtures, dtype=numpy.int64) + 12 * self.mixture_offsets[:-1]
+            buffer[count_pos[:, None] + numpy.arange(4)] = counts.astype(numpy.int32).view(numpy.uint8).reshape(-1, 4)
+            record_pos = self._mixture_record_positions()
+            idxs = numpy.ascontiguousarray(self.mixture_density_idxs, dtype=numpy.int32)
+            weights = numpy.ascontiguousarray(self.mixture_density_weights, dtype=numpy.float64)
+            buffer[record_pos[:, None] + numpy.arange(4)] = idxs.view(numpy.uint8).reshape(-1, 4)
+            buffer[record_pos[:, None] + numpy.arange(4, 12)] = weights.view(numpy.uint8).reshape(-1, 8)
+            buffer.tofile(f)
 
     def getMeanByIdx(self, idx):
         """
@@ -1005,6 +1216,67 @@ class MixtureSet:
         return self.num_mixtures
 
 
+def merge_mixture_sets(mixture_sets):
+    """
+    Merges accumulated mixture sets of the same topology, e.g. the accumulators of the parallel tasks of
+    a mixture estimation, by summing all statistics.
+
+    :param list[MixtureSet|str] mixture_sets: mixture sets or their filenames
+    :return: mixture set with the summed means, covariances, weights and mixture weights
+    :rtype: MixtureSet
+    """
+    assert len(mixture_sets) > 0
+    mixture_sets = [MixtureSet(m) if isinstance(m, str) else m for m in mixture_sets]
+    first = mixture_sets[0]
+    merged = MixtureSet()
+    merged.version = first.version
+    merged.dim = first.dim
+    merged.densities = first.densities.copy()
+    merged.mixture_offsets = first.mixture_offsets.copy()
+    merged.mixture_density_idxs = first.mixture_density_idxs.copy()
+    for name in ["means", "mean_weights", "covs", "cov_weights", "mixture_density_weights"]:
+        setattr(merged, name, getattr(first, name).copy())
+    for other in mixture_sets[1:]:
+        assert other.dim == first.dim, "dimension mismatch: %d != %d" % (other.dim, first.dim)
+        assert other.means.shape == first.means.shape and other.covs.shape == first.covs.shape
+        assert numpy.array_equal(other.densities, first.densities), "the densities differ"
+        assert numpy.array_equal(other.mixture_offsets, first.mixture_offsets), "the mixtures differ"
+        assert numpy.array_equal(other.mixture_density_idxs, first.mixture_density_idxs), "the mixtures differ"
+        merged.means += other.means
+        merged.mean_weights += other.mean_weights
+        merged.covs += other.covs
+        merged.cov_weights += other.cov_weights
+        merged.mixture_density_weights += other.mixture_density_weights
+    return merged
+
+
+def mixture_statistics(mixture_set):
+    """
+    Statistics per mixture, computed over the densities of the mixture:
+    number of densities, sum of the mixture weights, sum of the weights of the means (the observation count for
+    accumulated mixture sets) and the smallest variance of any dimension.
+
+    :param MixtureSet mixture_set:
+    :return: name -> array of shape (num_mixtures,)
+    :rtype: dict[str,numpy.ndarray]
+    """
+    m = mixture_set
+    counts = numpy.diff(m.mixture_offsets)
+    mixture_of_record = numpy.repeat(numpy.arange(m.num_mixtures), counts)
+    density_means = m.densities[m.mixture_density_idxs, 0]
+    density_covs = m.densities[m.mixture_density_idxs, 1]
+    variances = m.covs / m.cov_weights[:, None]
+    min_variance = numpy.full(m.num_mixtures, numpy.inf)
+    if m.dim > 0:
+        numpy.minimum.at(min_variance, mixture_of_record, variances[density_covs].min(axis=1))
+    return {
+        "num_densities": counts,
+        "weight": numpy.bincount(mixture_of_record, m.mixture_density_weights, minlength=m.num_mixtures),
+        "count": numpy.bincount(mixture_of_record, m.mean_weights[density_means], minlength=m.num_mixtures),
+        "min_variance": min_variance,
+    }
+
+
 class WordBoundaries:
     """
     Word boundaries.
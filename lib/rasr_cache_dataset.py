@@ -0,0 +1,307 @@
+"""
+Batched access to the segments of several RASR feature and alignment caches, e.g. to use RASR features in Python
+training or analysis code without converting them to HDF first.
+"""
+
+__all__ = ["RasrCacheBatch", "RasrCacheDatasetCounters", "RasrCacheDataset"]
+
+import collections
+import concurrent.futures
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Deque, Dict, Iterator, List, Optional, Sequence, Union
+
+import numpy as np
+
+from i6_core.lib.rasr_cache import (
+    AllophoneLabeling,
+    FileArchive,
+    FileArchiveBundle,
+    FileInfo,
+    open_file_archive,
+)
+
+
+@dataclass
+class RasrCacheBatch:
+    """
+    Padded data of a batch of segments
+    """
+
+    segment_names: List[str]
+    # stream name -> padded data of shape (batch, time, dim) for features and (batch, time) for alignments
+    data: Dict[str, np.ndarray]
+    # stream name -> int32 array of shape (batch,) with the number of frames of each segment
+    lengths: Dict[str, np.ndarray]
+
+
+@dataclass
+class RasrCacheDatasetCounters:
+    """
+    Throughput counters of :meth:`RasrCacheDataset.iterate_batches`, the times are in seconds
+    """
+
+    num_batches: int = 0
+    num_segments: int = 0
+    # number of frames of the first feature stream, without padding
+    num_frames: int = 0
+    # time of the prefetch threads for reading and padding
+    read_time: float = 0.0
+    # time the consumer waited for batches that were not prefetched yet
+    wait_time: float = 0.0
+    # time since the start of the iteration
+    elapsed_time: float = 0.0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    @property
+    def segments_per_second(self) -> float:
+        return self.num_segments / self.elapsed_time if self.elapsed_time > 0 else 0.0
+
+    @property
+    def frames_per_second(self) -> float:
+        return self.num_frames / self.elapsed_time if self.elapsed_time > 0 else 0.0
+
+
+def _get_file_info(archive: Union[FileArchive, FileArchiveBundle], name: str) -> FileInfo:
+    if isinstance(archive, FileArchiveBundle):
+        return archive.files[name].ft[name]
+    return archive.ft[name]
+
+
+class RasrCacheDataset:
+    """
+    Joins feature and alignment caches (single caches or bundles) by segment name.
+
+    Each segment has one entry per stream: the features as float32 array of shape (time, dim) and the alignments
+    either as labels of the given allophone labeling (int32) or as RASR emission indices,
+    i.e. allophone index + (state << 26) (int64).
+
+    :meth:`iterate_batches` sorts the segments by length within windows of shuffled segments,
+    so the batches contain segments of similar length, and reads the batches with background threads.
+    The segment lengths for the bucketing are computed from the entry sizes of the first feature stream,
+    so the data does not need to be read for this.
+
+    Example::
+
+        dataset = RasrCacheDataset(
+            {"features": "gt.cache.bundle"}, {"classes": "alignment.cache.bundle"}, allophone_file="allophones"
+        )
+        for batch in dataset.iterate_batches(max_frames=20000, num_workers=4):
+            feats, lengths = batch.data["features"], batch.lengths["features"]
+    """
+
+    def __init__(
+        self,
+        feature_caches: Dict[str, str],
+        alignment_caches: Optional[Dict[str, str]] = None,
+        allophone_file: Optional[str] = None,
+        allophone_labeling: Optional[AllophoneLabeling] = None,
+        segments: Optional[Sequence[str]] = None,
+        encoding: str = "ascii",
+    ):
+        """
+        :param feature_caches: stream name -> feature cache or bundle
+        :param alignment_caches: stream name -> alignment cache or bundle
+        :param allophone_file: allophones of the alignments, needed for alignment streams
+        :param allophone_labeling: if given, the alignments are mapped to the labels of this state tying
+        :param segments: segments to use in this order, by default all segments of the first feature cache
+            which are contained in all caches
+        :param encoding: encoding of the segment names in the caches
+        """
+        assert len(feature_caches) > 0, "at least one feature stream is needed"
+        alignment_caches = alignment_caches or {}
+        assert not alignment_caches or allophone_file is not None, "alignment streams need the allophone file"
+        assert not set(feature_caches) & set(alignment_caches), "stream names have to be unique"
+        self.allophone_labeling = allophone_labeling
+
+        self.feature_archives = {
+            name: open_file_archive(path, encoding=encoding) for name, path in feature_caches.items()
+        }
+        self.alignment_archives = {
+            name: open_file_archive(path, encoding=encoding) for name, path in alignment_caches.items()
+        }
+        for archive in self.alignment_archives.values():
+            archive.setAllophones(allophone_file)
+
+        first_archive = next(iter(self.feature_archives.values()))
+        if segments is None:
+            segments = [name for name in first_archive.file_list() if not name.endswith(".attribs")]
+        archives = list(self.feature_archives.values()) + list(self.alignment_archives.values())
+        self.segment_names = [name for name in segments if all(a.has_entry(name) for a in archives)]
+        if len(self.segment_names) < len(segments):
+            logging.warning(
+                "%d of %d segments are not contained in all caches and are skipped",
+                len(segments) - len(self.segment_names),
+                len(segments),
+            )
+
+        self.lengths = self._get_lengths(first_archive)
+        self.counters = RasrCacheDatasetCounters()
+
+    def __len__(self) -> int:
+        return len(self.segment_names)
+
+    def _get_lengths(self, archive: Union[FileArchive, FileArchiveBundle]) -> np.ndarray:
+        """
+        A feature entry consists of the type name, the number of frames and one record per frame,
+        the type and the size of the records are derived from the size of the first entry.
+
+        :return: number of frames of each segment
+        """
+        if len(self.segment_names) == 0:
+            return np.zeros(0, dtype=np.int64)
+        sizes = np.array([_get_file_info(archive, name).size for name in self.segment_names], dtype=np.int64)
+        times, features = archive.read(self.segment_names[0], "feat_array")
+        if len(features) == 0:
+            # no frame to derive the record size, the lengths are only used for the bucketing
+            return sizes
+        dim = features.shape[1]
+        # (dim, data, start-time, end-time) records for "vector-f32", (data, start-time, end-time) for "f32"
+        for typ, record_size in [("vector-f32", 4 + 4 * dim + 2 * 8), ("f32", 4 + 2 * 8)]:
+            header_size = 4 + len(typ) + 4
+            if (typ == "vector-f32" or dim == 1) and header_size + len(features) * record_size == sizes[0]:
+                return (sizes - header_size) // record_size
+        logging.warning("cannot derive the segment lengths from the entry sizes, using the entry sizes instead")
+        return sizes
+
+    def get_segment(self, segment_name: str) -> Dict[str, np.ndarray]:
+        """
+        :param segment_name:
+        :return: stream name -> features of shape (time, dim) or alignment of shape (time,)
+        """
+        data = {}
+        for name, archive in self.feature_archives.items():
+            data[name] = archive.read(segment_name, "feat_array")[1]
+        for name, archive in self.alignment_archives.items():
+            _, allophones, states = archive.read(segment_name, "align_array")
+            if self.allophone_labeling is not None:
+                data[name] = self.allophone_labeling.get_label_idxs(allophones, states)
+            else:
+                data[name] = allophones + (states << 26)
+        return data
+
+    def get_batch(self, indices: Sequence[int]) -> RasrCacheBatch:
+        """
+        :param indices: indices of the segments in :attr:`segment_names`
+        :return: padded batch, padded frames are 0
+        """
+        segment_names = [self.segment_names[idx] for idx in indices]
+        sequences = [self.get_segment(name) for name in segment_names]
+        data = {}
+        lengths = {}
+        for name in list(self.feature_archives) + list(self.alignment_archives):
+            seqs = [seq[name] for seq in sequences]
+            seq_lengths = np.array([len(seq) for seq in seqs], dtype=np.int32)
+            dims = [seq.shape[1:] for seq in seqs if len(seq) > 0]
+            shape = (len(seqs), int(seq_lengths.max(initial=0))) + (dims[0] if dims else seqs[0].shape[1:])
+            padded = np.zeros(shape, dtype=seqs[0].dtype)
+            for i, seq in enumerate(seqs):
+                padded[i, : len(seq)] = seq
+            data[name] = padded
+            lengths[name] = seq_lengths
+        return RasrCacheBatch(segment_names=segment_names, data=data, lengths=lengths)
+
+    def get_batch_indices(
+        self,
+        max_seqs: int = 32,
+        max_frames: Optional[int] = None,
+        shuffle: bool = True,
+        seed: int = 0,
+        sort_window: int = 1000,
+    ) -> List[np.ndarray]:
+        """
+        Splits the segments into batches. With shuffling, the segments are shuffled, sorted by length within windows
+        of `sort_window` segments and split into batches, then the order of the batches is shuffled.
+
+        :param max_seqs: maximum number of segments per batch
+        :param max_frames: maximum number of frames per batch including padding, a longer segment is a batch alone
+        :param shuffle: without shuffling the segments are batched in the original order
+        :param seed: seed of the shuffling
+        :param sort_window: number of segments that are sorted by length, 1 disables the bucketing
+        :return: indices of the segments of each batch
+        """
+        rng = np.random.RandomState(seed)
+        order = rng.permutation(len(self)) if shuffle else np.arange(len(self))
+        if shuffle and sort_window > 1:
+            windows = [order[i : i + sort_window] for i in range(0, len(order), sort_window)]
+            order = np.concatenate(
+                [window[np.argsort(self.lengths[window], kind="stable")] for window in windows] or [order]
+            )
+
+        batches = []
+        start = 0
+        max_len = 0
+        for pos, idx in enumerate(order):
+            max_len_with_seq = max(max_len, self.lengths[idx])
+            num_seqs = pos - start + 1
+            if num_seqs > 1 and (
+                num_seqs > max_seqs or (max_frames is not None and max_len_with_seq * num_seqs > max_frames)
+            ):
+                batches.append(order[start:pos])
+                start = pos
+                max_len_with_seq = self.lengths[idx]
+            max_len = max_len_with_seq
+        if start < len(order):
+            batches.append(order[start:])
+
+        if shuffle:
+            rng.shuffle(batches)
+        return batches
+
+    def _load_batch(self, indices: np.ndarray) -> RasrCacheBatch:
+        start = time.monotonic()
+        batch = self.get_batch(indices)
+        with self.counters._lock:
+            self.counters.read_time += time.monotonic() - start
+        return batch
+
+    def iterate_batches(
+        self,
+        max_seqs: int = 32,
+        max_frames: Optional[int] = None,
+        shuffle: bool = True,
+        seed: int = 0,
+        sort_window: int = 1000,
+        num_workers: int = 2,
+        prefetch: int = 4,
+    ) -> Iterator[RasrCacheBatch]:
+        """
+        Reads the batches of :meth:`get_batch_indices` in background threads and updates :attr:`counters`.
+        The reads of one cache file are serialized, so several workers are mostly useful for bundles.
+
+        :param max_seqs: see :meth:`get_batch_indices`
+        :param max_frames: see :meth:`get_batch_indices`
+        :param shuffle: see :meth:`get_batch_indices`
+        :param seed: see :meth:`get_batch_indices`
+        :param sort_window: see :meth:`get_batch_indices`
+        :param num_workers: number of threads which read and pad the batches
+        :param prefetch: number of batches that are read ahead
+        """
+        batches = self.get_batch_indices(
+            max_seqs=max_seqs, max_frames=max_frames, shuffle=shuffle, seed=seed, sort_window=sort_window
+        )
+        self.counters = RasrCacheDatasetCounters()
+        first_stream = next(iter(self.feature_archives))
+        start = time.monotonic()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(num_workers, 1)) as executor:
+            pending: Deque[concurrent.futures.Future] = collections.deque()
+            next_batch = 0
+            try:
+                while next_batch < len(batches) or pending:
+                    while next_batch < len(batches) and len(pending) < max(prefetch, 1):
+                        pending.append(executor.submit(self._load_batch, batches[next_batch]))
+                        next_batch += 1
+                    wait_start = time.monotonic()
+                    batch = pending.popleft().result()
+                    with self.counters._lock:
+                        self.counters.wait_time += time.monotonic() - wait_start
+                        self.counters.num_batches += 1
+                        self.counters.num_segments += len(batch.segment_names)
+                        self.counters.num_frames += int(batch.lengths[first_stream].sum())
+                        self.counters.elapsed_time = time.monotonic() - start
+                    yield batch
+            finally:
+                for future in pending:
+                    future.cancel()
@@ -0,0 +1,93 @@
+"""
+Parallel application of a Sequitur G2P model.
+
+Every worker process loads the model once, the words are distributed one by one over a dynamic work queue in the
+given order, so sorting the words longest first avoids that a few long words delay the end of the job.
+The pronunciation variants are produced in the same way and format as by `g2p.py --apply` with variants.
+
+This file has no dependencies on i6_core and is executed as script with the G2P Python,
+see :class:`i6_core.g2p.apply.ApplyG2PModelJob`.
+"""
+
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import pickle
+import sys
+
+_translator = None
+
+
+def _init_worker(g2p_path, model_file):
+    global _translator
+    sys.path.insert(0, os.path.dirname(os.path.abspath(g2p_path)))
+    from sequitur import Translator
+
+    with open(model_file, "rb") as f:
+        model = pickle.load(f)
+    _translator = Translator(model)
+
+
+def translate(args):
+    """
+    :param tuple[str,float,int] args: word, variants mass and variants number
+    :return: word, output lines and the error message if the translation failed
+    :rtype: tuple[str,list[str],str|None]
+    """
+    from sequitur import Translator
+
+    word, variants_mass, variants_number = args
+    lines = []
+    try:
+        n_best = _translator.nBestInit(tuple(word))
+        total_posterior = 0.0
+        num_variants = 0
+        while total_posterior < variants_mass and num_variants < variants_number:
+            try:
+                log_lik, result = _translator.nBestNext(n_best)
+            except StopIteration:
+                break
+            posterior = math.exp(log_lik - n_best.logLikTotal)
+            lines.append("%s\t%d\t%f\t%s\n" % (word, num_variants, posterior, " ".join(result)))
+            total_posterior += posterior
+            num_variants += 1
+    except Translator.TranslationFailure as exc:
+        return word, lines, 'failed to convert "%s": %s\n' % (word, exc)
+    return word, lines, None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--g2p_path", required=True, help="g2p.py of the sequitur installation")
+    parser.add_argument("--model", required=True)
+    parser.add_argument("--words", required=True, help="utf-8 word list, one word per line, processed in this order")
+    parser.add_argument("--output", required=True, help="json lines with word, output lines and error")
+    parser.add_argument("--variants_mass", type=float, default=1.0)
+    parser.add_argument("--variants_number", type=int, default=1)
+    parser.add_argument("--num_workers", type=int, default=1)
+    args = parser.parse_args()
+
+    with open(args.words, "rt", encoding="utf-8") as f:
+        words = [line.strip() for line in f]
+    tasks = [(word, args.variants_mass, args.variants_number) for word in words]
+
+    with open(args.output, "wt", encoding="utf-8") as out:
+        if args.num_workers <= 1:
+            _init_worker(args.g2p_path, args.model)
+            _write_results(map(translate, tasks), out)
+        else:
+            init_args = (args.g2p_path, args.model)
+            with multiprocessing.Pool(args.num_workers, initializer=_init_worker, initargs=init_args) as pool:
+                _write_results(pool.imap_unordered(translate, tasks, chunksize=1), out)
+
+
+def _write_results(results, out):
+    for word, lines, error in results:
+        out.write(json.dumps({"word": word, "lines": lines, "error": error}) + "\n")
+        out.flush()
+
+
+if __name__ == "__main__":
+    main()
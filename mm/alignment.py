@@ -137,7 +137,7 @@ class AlignmentJob(rasr.RasrCommand, Job):
         self.write_run_script(self.exe, "alignment.config", extra_code=extra_code)
 
     def run(self, task_id):
-        self.run_script(task_id, self.out_log_file[task_id])
+        self.run_script(task_id, self.out_log_file[task_id], cached_inputs=self._cached_inputs())
         shutil.move(
             "alignment.cache.%d" % task_id,
             self.out_single_alignment_caches[task_id].get_path(),
@@ -148,6 +148,19 @@ class AlignmentJob(rasr.RasrCommand, Job):
                 self.out_single_word_boundary_caches[task_id].get_path(),
             )
 
+    def _cached_inputs(self):
+        """
+        :return: the mixtures of a GMM feature scorer are read by every task, see :meth:`RasrCommand.run_script`
+        :rtype: dict[str, tk.Path]
+        """
+        if not isinstance(self.feature_scorer, rasr.GMMFeatureScorer):
+            return {}
+        return {
+            "acoustic-model-trainer.aligning-feature-extractor.feature-extraction.%s."
+            "model-combination.acoustic-model.mixture-set.file" % node: self.feature_scorer.config["file"]
+            for node in self.alignment_flow.get_node_names_by_filter("speech-alignment")
+        }
+
     def plot(self):
         import numpy as np
         import matplotlib
@@ -1,10 +1,10 @@
-from typing import Tuple, Optional, Dict
-import itertools
+from typing import Tuple, Optional, Dict, List, Union
+import multiprocessing
 from dataclasses import dataclass
 
 import numpy as np
 
-from i6_core.lib.hdf import get_returnn_simple_hdf_writer
+from i6_core.lib.hdf import BufferedHDFWriter
 from i6_core.lib.rasr_cache import FileArchive
 from sisyphus import Job, Task, tk
 
@@ -60,6 +60,8 @@ class DenseLabelInfo:
 
 
 class GetPhonemeLabelsFromNoTyingDense(Job):
+    __sis_hash_exclude__ = {"multi_stream": False}
+
     def __init__(
         self,
         alignment_cache_path: tk.Path,
@@ -68,6 +70,8 @@ class GetPhonemeLabelsFromNoTyingDense(Job):
         dense_label_info: DenseLabelInfo,
         sparse: bool = False,
         returnn_root: Optional[tk.Path] = None,
+        multi_stream: bool = False,
+        num_workers: int = 1,
     ):
         """
         Get past/center/future context label of alignment by calculating back labels from dense tying and write the
@@ -75,12 +79,16 @@ class GetPhonemeLabelsFromNoTyingDense(Job):
         (C.f. NoStateTyingDense in rasr
         https://github.com/rwth-i6/rasr/blob/a942e3940c30eeba900c873f3bfb3f48d5b39ddb/src/Am/ClassicStateTying.cc#L272)
 
-        :param alignment_cache_path: path to alginment cache
+        :param alignment_cache_path: path to alginment cache or to a bundle file of alignment caches
         :param allophone_path: path to allohone
         :param dense_tying_path: path to dense tying file
         :param dense_label_info: the dense label information
         :param sparse: writes the data to hdf in sparse format
-        :param returnn_root: path to returnn root
+        :param returnn_root: not used anymore, the HDF files are written with :class:`i6_core.lib.hdf.BufferedHDFWriter`
+        :param multi_stream: write all contexts into the single HDF file `out_hdf_contexts`, with the center context
+            as main data and the past and future context as extra data "left_context" and "right_context",
+            instead of one HDF file per context
+        :param num_workers: number of processes that read the alignment caches of a bundle in parallel
         """
         self.alignment_cache_path = alignment_cache_path
         self.allophone_path = allophone_path
@@ -91,16 +99,30 @@ class GetPhonemeLabelsFromNoTyingDense(Job):
         self.dense_label_info = dense_label_info
         self.sparse = sparse
         self.returnn_root = returnn_root
+        self.multi_stream = multi_stream
+        self.num_workers = num_workers
+
+        if multi_stream:
+            self.out_hdf_contexts = self.output_path("contexts.hdf")
+            self.out_hdf_left_context = None
+            self.out_hdf_right_context = None
+            self.out_hdf_center_context = None
+        else:
+            self.out_hdf_left_context = self.output_path("left_context.hdf")
+            self.out_hdf_right_context = self.output_path("right_context.hdf")
+            self.out_hdf_center_context = self.output_path("center_context.hdf")
 
-        self.out_hdf_left_context = self.output_path("left_context.hdf")
-        self.out_hdf_right_context = self.output_path("right_context.hdf")
-        self.out_hdf_center_context = self.output_path("center_context.hdf")
-
-        self.rqmt = {"cpu": 1, "mem": 8, "time": 0.5}
+        self.rqmt = {"cpu": num_workers, "mem": 8, "time": 0.5}
 
     def tasks(self):
         yield Task("run", resume="run", rqmt=self.rqmt)
 
+    @classmethod
+    def hash(cls, parsed_args):
+        parsed_args = dict(parsed_args)
+        parsed_args.pop("num_workers")
+        return super().hash(parsed_args)
+
     @classmethod
     def get_tying(cls, dense_tying_path: tk.Path) -> Dict[str, int]:
         """
@@ -116,26 +138,27 @@ class GetPhonemeLabelsFromNoTyingDense(Job):
         return state_tying
 
     @classmethod
-    def get_target_labels_from_dense(cls, dense_label: int, dense_label_info: DenseLabelInfo) -> Tuple[int, int, int]:
+    def get_target_labels_from_dense(
+        cls, dense_label: Union[int, np.ndarray], dense_label_info: DenseLabelInfo
+    ) -> Tuple[Union[int, np.ndarray], Union[int, np.ndarray], Union[int, np.ndarray]]:
+        """
+        :param dense_label: a single dense label or an array of dense labels, e.g. a whole alignment
+        :param dense_label_info:
+        :return: future, center and past label, with the same shape as dense_label
+        """
         num_boundary_classes = 4
         num_word_end_classes = 2
 
-        future_label = dense_label % dense_label_info.n_contexts
-        pop_future_label = dense_label // dense_label_info.n_contexts
-
-        past_label = pop_future_label % dense_label_info.n_contexts
-        center_state = pop_future_label // dense_label_info.n_contexts
+        pop_future_label, future_label = divmod(dense_label, dense_label_info.n_contexts)
+        center_state, past_label = divmod(pop_future_label, dense_label_info.n_contexts)
 
         if dense_label_info.use_word_end_classes:
-            word_end_class = center_state % num_word_end_classes
-            center_state = center_state // num_word_end_classes
+            center_state, word_end_class = divmod(center_state, num_word_end_classes)
 
         if dense_label_info.use_boundary_classes:
-            boundary_class = center_state % num_boundary_classes
-            center_state = center_state // num_boundary_classes
+            center_state, boundary_class = divmod(center_state, num_boundary_classes)
 
-        hmm_state_class = center_state % dense_label_info.num_hmm_states_per_phon
-        center_label = center_state // dense_label_info.num_hmm_states_per_phon
+        center_label, hmm_state_class = divmod(center_state, dense_label_info.num_hmm_states_per_phon)
 
         return future_label, center_label, past_label
 
@@ -166,81 +189,140 @@ class GetPhonemeLabelsFromNoTyingDense(Job):
 
         assert expected_max_class_idx == max_class_index, "something is set wrong in dense tying label info!"
 
-    def run(self):
-        returnn_root = None if self.returnn_root is None else self.returnn_root.get_path()
-        SimpleHDFWriter = get_returnn_simple_hdf_writer(returnn_root)
-        out_hdf_left_context = SimpleHDFWriter(
-            filename=self.out_hdf_left_context,
-            dim=self.dense_label_info.n_contexts if self.sparse else 1,
-            ndim=1 if self.sparse else 2,
-        )
-        out_hdf_right_context = SimpleHDFWriter(
-            filename=self.out_hdf_right_context,
-            dim=self.dense_label_info.n_contexts if self.sparse else 1,
-            ndim=1 if self.sparse else 2,
-        )
-        out_hdf_center_context = SimpleHDFWriter(
-            filename=self.out_hdf_center_context,
-            dim=self.dense_label_info.n_contexts if self.sparse else 1,
-            ndim=1 if self.sparse else 2,
-        )
+    @classmethod
+    def get_dense_tying_table(cls, dense_tying: Dict[str, int], allophones: List[str]) -> np.ndarray:
+        """
+        :param dense_tying: state repr -> state idx, see :func:`get_tying`
+        :param allophones: allophones in the order of the allophone file
+        :return: dense label of each allophone state, shape (num_allophones, num_states), -1 if not in the tying
+        """
+        allophone_idxs = {allophone: idx for idx, allophone in enumerate(allophones)}
+        entries = []
+        for allophone_state, label in dense_tying.items():
+            allophone, _, state = allophone_state.rpartition(".")
+            if allophone in allophone_idxs:
+                entries.append((allophone_idxs[allophone], int(state), label))
+        num_states = max((state for _, state, _ in entries), default=0) + 1
+        table = np.full((len(allophones), num_states), -1, dtype=np.int64)
+        if entries:
+            allophone_idxs, states, labels = zip(*entries)
+            table[list(allophone_idxs), list(states)] = labels
+        return table
 
+    def run(self):
         dense_tying = self.get_tying(self.dense_tying_path)
         max_class_index = max(dense_tying.values())
         self.sanity_check(max_class_index, self.dense_label_info)
 
-        alignment_cache = FileArchive(self.alignment_cache_path)
-        alignment_cache.setAllophones(self.allophone_path)
-
-        for file in alignment_cache.ft:
-            info = alignment_cache.ft[file]
-            if info.name.endswith(".attribs"):
-                continue
+        alignment_cache_path = self.alignment_cache_path.get_path()
+        if alignment_cache_path.endswith(".bundle"):
+            with open(alignment_cache_path, "rt") as bundle_file:
+                alignment_caches = [line.strip() for line in bundle_file if line.strip()]
+        else:
+            alignment_caches = [alignment_cache_path]
+
+        with open(self.allophone_path.get_path(), "rt") as allophone_file:
+            # same as FileArchive.setAllophones
+            allophones = [line.strip() for line in allophone_file if not line.strip().startswith("#")]
+        dense_tying_table = self.get_dense_tying_table(dense_tying, allophones)
+
+        dim = self.dense_label_info.n_contexts if self.sparse else 1
+        ndim = 1 if self.sparse else 2
+        if self.multi_stream:
+            out_hdf_contexts = BufferedHDFWriter(
+                filename=self.out_hdf_contexts,
+                dim=dim,
+                ndim=ndim,
+                extra_type={"left_context": (dim, ndim, "int64"), "right_context": (dim, ndim, "int64")},
+            )
+            out_hdfs = [out_hdf_contexts]
+        else:
+            out_hdf_left_context = BufferedHDFWriter(filename=self.out_hdf_left_context, dim=dim, ndim=ndim)
+            out_hdf_right_context = BufferedHDFWriter(filename=self.out_hdf_right_context, dim=dim, ndim=ndim)
+            out_hdf_center_context = BufferedHDFWriter(filename=self.out_hdf_center_context, dim=dim, ndim=ndim)
+            out_hdfs = [out_hdf_left_context, out_hdf_right_context, out_hdf_center_context]
+
+        def write_labels(results):
+            for cache_labels in results:
+                for seq_tag, past_labels, center_labels, future_labels in cache_labels:
+                    if not self.sparse:
+                        past_labels = past_labels.reshape(-1, 1)
+                        center_labels = center_labels.reshape(-1, 1)
+                        future_labels = future_labels.reshape(-1, 1)
+                    if self.multi_stream:
+                        out_hdf_contexts.insert(
+                            center_labels,
+                            seq_tag,
+                            extra={"left_context": past_labels, "right_context": future_labels},
+                        )
+                    else:
+                        out_hdf_left_context.insert(past_labels, seq_tag)
+                        out_hdf_center_context.insert(center_labels, seq_tag)
+                        out_hdf_right_context.insert(future_labels, seq_tag)
+
+        worker_args = (self.allophone_path.get_path(), dense_tying_table, self.dense_label_info)
+        if self.num_workers > 1 and len(alignment_caches) > 1:
+            # the arguments are passed to each worker once, independent of the start method of the processes
+            with multiprocessing.Pool(
+                min(self.num_workers, len(alignment_caches)),
+                initializer=_init_context_label_worker,
+                initargs=worker_args,
+            ) as pool:
+                write_labels(pool.imap(_get_context_labels, alignment_caches))
+        else:
+            _init_context_label_worker(*worker_args)
+            write_labels(map(_get_context_labels, alignment_caches))
 
-            alignment = alignment_cache.read(file, "align")
-            if not len(alignment):
-                continue
+        for out_hdf in out_hdfs:
+            out_hdf.close()
 
-            aligned_allophones = ["%s.%d" % (alignment_cache.allophones[t[1]], t[2]) for t in alignment]
-            dense_targets = [dense_tying[allo] for allo in aligned_allophones]
 
-            # optimize the calculation by grouping
-            past_label_strings = []
-            center_state_strings = []
-            future_label_strings = []
+_context_label_worker_args = None
 
-            for k, g in itertools.groupby(dense_targets):
-                seg_len = len(list(g))
-                f, c, l = self.get_target_labels_from_dense(k, self.dense_label_info)
 
-                past_label_strings = past_label_strings + [l] * seg_len
-                center_state_strings = center_state_strings + [c] * seg_len
-                future_label_strings = future_label_strings + [f] * seg_len
+def _init_context_label_worker(allophone_path: str, dense_tying_table: np.ndarray, dense_label_info: DenseLabelInfo):
+    """
+    Sets the arguments of :func:`_get_context_labels` in the worker process
 
-            out_hdf_left_context.insert_batch(
-                inputs=np.array(past_label_strings).reshape(1, -1)
-                if self.sparse
-                else np.array(past_label_strings).reshape(1, -1, 1),
-                seq_len=[len(past_label_strings)],
-                seq_tag=[f"{info.name}"],
-            )
+    :param allophone_path:
+    :param dense_tying_table: see :func:`GetPhonemeLabelsFromNoTyingDense.get_dense_tying_table`
+    :param dense_label_info:
+    """
+    global _context_label_worker_args
+    _context_label_worker_args = (allophone_path, dense_tying_table, dense_label_info)
 
-            out_hdf_center_context.insert_batch(
-                inputs=np.array(center_state_strings).reshape(1, -1)
-                if self.sparse
-                else np.array(center_state_strings).reshape(1, -1, 1),
-                seq_len=[len(center_state_strings)],
-                seq_tag=[f"{info.name}"],
-            )
 
-            out_hdf_right_context.insert_batch(
-                inputs=np.array(future_label_strings).reshape(1, -1)
-                if self.sparse
-                else np.array(future_label_strings).reshape(1, -1, 1),
-                seq_len=[len(center_state_strings)],
-                seq_tag=[f"{info.name}"],
-            )
+def _get_context_labels(alignment_cache_path: str) -> List[Tuple[str, np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    The arguments besides the cache are set by :func:`_init_context_label_worker`.
 
-        out_hdf_left_context.close()
-        out_hdf_right_context.close()
-        out_hdf_center_context.close()
+    :param alignment_cache_path: single alignment cache
+    :return: segment name, past, center and future labels of every alignment in the cache
+    """
+    allophone_path, dense_tying_table, dense_label_info = _context_label_worker_args
+    alignment_cache = FileArchive(alignment_cache_path)
+    alignment_cache.setAllophones(allophone_path)
+
+    cache_labels = []
+    for file in alignment_cache.ft:
+        info = alignment_cache.ft[file]
+        if info.name.endswith(".attribs"):
+            continue
+
+        alignment = alignment_cache.read(file, "align_array")
+        if alignment is None or not len(alignment[0]):
+            continue
+
+        _, allophones, states = alignment
+        in_table = states < dense_tying_table.shape[1]
+        dense_targets = dense_tying_table[allophones, np.where(in_table, states, 0)]
+        missing = (dense_targets < 0) | ~in_table
+        if missing.any():
+            idx = np.argmax(missing)
+            raise KeyError("%s.%d" % (alignment_cache.allophones[allophones[idx]], states[idx]))
+
+        future_labels, center_labels, past_labels = GetPhonemeLabelsFromNoTyingDense.get_target_labels_from_dense(
+            dense_targets, dense_label_info
+        )
+        cache_labels.append((info.name, past_labels, center_labels, future_labels))
+    return cache_labels
@@ -34,7 +34,18 @@ class MergeMixturesJob(rasr.RasrCommand, Job):
         estimator="maximum-likelihood",
         extra_config=None,
         extra_post_config=None,
+        merge_cpu=None,
     ):
+        """
+        :param rasr.crp.CommonRasrParameters crp:
+        :param list[tk.Path]|dict[int,tk.Path] mixtures_to_combine: mixture sets or accumulators to merge
+        :param int combine_per_step: maximum number of files per merge
+        :param str estimator: estimator type of the mixture set trainer
+        :param rasr.config.RasrConfig|None extra_config:
+        :param rasr.config.RasrConfig|None extra_post_config:
+        :param int|None merge_cpu: number of merges that run at the same time, which is also the cpu requirement of
+            the merge task. By default up to 4, depending on the number of independent merges.
+        """
         (
             self.config_merge,
             self.post_config_merge,
@@ -56,15 +67,15 @@ class MergeMixturesJob(rasr.RasrCommand, Job):
             nonlocal merge_count
             merge_count += 1
 
-        util.reduce_tree(
-            inc_merge_count,
-            util.partition_into_tree(mixtures_to_combine, combine_per_step),
-        )
+        merge_tree = util.partition_into_tree(mixtures_to_combine, combine_per_step)
+        util.reduce_tree(inc_merge_count, merge_tree)
+        if merge_cpu is None:
+            merge_cpu = min(4, max(sum(type(e) == list for e in merge_tree), 1))
 
         self.out_merge_log_file = self.log_file_output_path("merge", crp, merge_count)
         self.out_mixtures = self.output_path("am.mix", cached=True)
 
-        self.merge_rqmt = {"time": max(merge_count / 15, 0.5), "cpu": 1, "mem": 1}
+        self.merge_rqmt = {"time": max(merge_count / 15, 0.5), "cpu": merge_cpu, "mem": 1}
 
     def tasks(self):
         yield Task("create_merge_mixtures_config", mini_task=True)
@@ -76,19 +87,11 @@ class MergeMixturesJob(rasr.RasrCommand, Job):
             f.write(repr(self.config_merge))
 
     def merge_mixtures(self):
-        merge_num = 0
-        tmp_files = set()
-
-        def merge_helper(elements):
-            nonlocal merge_num
-            merge_num += 1
-
+        def merge_helper(elements, merge_num):
             (fd, tmp_merge_file) = tempfile.mkstemp(suffix=".mix")
             os.close(fd)
             logging.info("merge %d, %r -> %s", merge_num, elements, tmp_merge_file)
 
-            tmp_files.add(tmp_merge_file)
-
             self.run_cmd(
                 self.merge_exe,
                 [
@@ -104,17 +107,17 @@ class MergeMixturesJob(rasr.RasrCommand, Job):
                 self.out_merge_log_file[merge_num].get_path(),
             )
 
-            for e in elements:
-                if e in tmp_files:
-                    logging.info("unlink %s" % e)
-                    os.unlink(e)
-                    tmp_files.remove(e)
-
             return tmp_merge_file
 
-        mixtures = util.reduce_tree(
+        def remove_tmp_file(tmp_file):
+            logging.info("unlink %s" % tmp_file)
+            os.unlink(tmp_file)
+
+        mixtures = util.reduce_tree_parallel(
             merge_helper,
             util.partition_into_tree(self.mixtures_to_combine, self.combine_per_step),
+            num_workers=self.merge_rqmt["cpu"],
+            cleanup=remove_tmp_file,
         )
         shutil.move(mixtures, self.out_mixtures.get_path())
 
@@ -1,15 +1,17 @@
 __all__ = ["ViterbiTdpTuningJob", "TdpFromAlignmentJob"]
 
-import numpy as np
 import json
-import os
-import subprocess
+import logging
+import multiprocessing
+
+import numpy as np
 
 from sisyphus import *
 
 Path = setup_path(__package__)
 
 from .alignment import AlignmentJob
+import i6_core.lib.rasr_cache as rasr_cache
 import i6_core.util as util
 
 
@@ -77,12 +79,26 @@ class TdpFromAlignmentJob(Job):
     time=  10  emission=  134235148  allophone=  w{#+iy}@i  index=  17420  state=  2
     time=  11  emission=  134235148  allophone=  w{#+iy}@i  index=  17420  state=  2
     state are extracted and loops, forward and skip transitions are counted
+
+    The alignment caches are read directly, frames of allophones containing "#" are counted as "si", all others
+    as "phon". Within a segment the state sequence of each class is compared frame by frame,
+    starting from state 0: the same state is a loop, the next state a forward and the state after that a skip.
     """
 
-    def __init__(self, crp, alignment, allophones):
+    __sis_hash_exclude__ = {"num_workers": None}
+
+    def __init__(self, crp, alignment, allophones, num_workers=None):
+        """
+        :param rasr.crp.CommonRasrParameters crp: the segment path of this crp defines the segments per cache
+        :param AlignmentJob alignment: job with the alignment caches
+        :param tk.Path allophones: allophone file of the alignment
+        :param int|None num_workers: if set, all caches are processed in a single task by this number of processes
+            instead of one task per cache
+        """
         self.crp = crp
         self.alignment = alignment
         self.allophones = allophones
+        self.num_workers = num_workers
         self.concurrent = crp.concurrent
         self.rqmt = {"time": 1, "cpu": 1, "gpu": 0, "mem": 1}
 
@@ -92,72 +108,30 @@ class TdpFromAlignmentJob(Job):
         self.am_args = self.output_var("am_args")
 
     def tasks(self):
-        yield Task("run", resume="run", rqmt=self.rqmt, args=range(1, self.concurrent + 1))
+        if self.num_workers is None:
+            yield Task("run", resume="run", rqmt=self.rqmt, args=range(1, self.concurrent + 1))
+        else:
+            rqmt = dict(self.rqmt, cpu=self.num_workers)
+            yield Task("run_all", resume="run_all", rqmt=rqmt)
         yield Task("prob", resume="prob", mini_task=True)
 
-    def run(self, task_id):
-        alignment_path = self.alignment.out_single_alignment_caches[task_id].get_path()
-        segment_path = self.crp.segment_path.hidden_paths[task_id].get_path()
-        exe = os.path.join(
-            gs.RASR_ROOT,
-            "arch",
-            gs.RASR_ARCH,
-            "%s.%s" % ("archiver", gs.RASR_ARCH),
+    def _count_args(self, task_id):
+        return (
+            task_id,
+            self.alignment.out_single_alignment_caches[task_id].get_path(),
+            self.crp.segment_path.hidden_paths[task_id].get_path(),
+            self.allophones.get_path(),
+            self.transition_count.get_path() + ".{}".format(task_id),
         )
 
-        trans_dict = {"phon": {0: 0, 1: 0, 2: 0}, "si": {0: 0, 1: 0, 2: 0}}
-
-        with open(segment_path, "r") as segment_file:
-            for seg in segment_file:
-                seg = seg.strip("\n")
-                args = [
-                    exe,
-                    "--allophone-file",
-                    self.allophones.get_path(),
-                    "--mode",
-                    "show",
-                    "--type",
-                    "align",
-                    alignment_path,
-                    seg,
-                ]
-                res = subprocess.run(args, stdout=subprocess.PIPE)
-                lines = res.stdout.decode("utf-8").split("\n")
-
-                transistions = {"phon": [], "si": []}
-
-                for l in lines:
-                    if "<" in l:
-                        continue
-                    l.replace("\n", "")
-                    parts = l.split("\t")
-                    if len(parts) < 10:
-                        continue
-                    state = int(parts[-1])
-                    allophone = parts[5]
-                    if "#" in allophone:
-                        transistions["si"].append(state)
-                    else:
-                        transistions["phon"].append(state)
-
-                trans_mapping = np.asarray([[0, 1, 2], [2, 0, 1], [1, 2, 0]])
-
-                for phon, states in transistions.items():
-                    prev = 0
-                    lsf = []
-                    if len(states) > 0:
-                        for t in states:
-                            n = trans_mapping[prev, t]
-                            lsf.append(n)
-                            prev = t
-
-                    unique, counts = np.unique(lsf, return_counts=True)
-                    r = dict(zip(unique.astype(np.float), counts.astype(np.float)))
-                    for trans, count in r.items():
-                        trans_dict[phon][trans] += count
+    def run(self, task_id):
+        _count_transitions(self._count_args(task_id))
 
-        with open(self.transition_count.get_path() + ".{}".format(task_id), "w") as out_file:
-            out_file.write(json.dumps(trans_dict))
+    def run_all(self):
+        args = [self._count_args(task_id) for task_id in range(1, self.concurrent + 1)]
+        with multiprocessing.Pool(self.num_workers) as pool:
+            for task_id in pool.imap_unordered(_count_transitions, args):
+                logging.info("counted transitions of alignment cache %d", task_id)
 
     def prob(self):
         trans_dict = {"phon": {"0": 0, "1": 0, "2": 0}, "si": {"0": 0, "1": 0, "2": 0}}
@@ -195,3 +169,45 @@ class TdpFromAlignmentJob(Job):
 
         with open(self.transition_prob.get_path(), "w") as out_file:
             out_file.write(json.dumps(trans_dict))
+
+
+_TRANS_MAPPING = np.asarray([[0, 1, 2], [2, 0, 1], [1, 2, 0]])
+
+
+def _count_transitions(args):
+    """
+    Counts the loop (0), forward (1) and skip (2) transitions of one alignment cache and writes them as json
+
+    :param tuple[int,str,str,str,str] args: task id, alignment cache, segment list, allophone file and output file
+    :return: task id
+    :rtype: int
+    """
+    task_id, alignment_path, segment_path, allophone_path, out_path = args
+    archive = rasr_cache.FileArchive(alignment_path, must_exists=True)
+    archive.setAllophones(allophone_path)
+    is_silence = np.asarray(["#" in allophone for allophone in archive.allophones], dtype=bool)
+
+    counts = {"phon": np.zeros(3, dtype=np.int64), "si": np.zeros(3, dtype=np.int64)}
+    with open(segment_path, "r") as segment_file:
+        for seg in segment_file:
+            seg = seg.strip("\n")
+            try:
+                alignment = archive.read(seg, "align_array")
+            except KeyError:
+                # segment not in this cache
+                continue
+            if alignment is None:
+                continue
+            _, allophones, states = alignment
+            silence = is_silence[allophones]
+            for phon, mask in (("phon", ~silence), ("si", silence)):
+                class_states = states[mask]
+                if len(class_states) == 0:
+                    continue
+                prev_states = np.concatenate([[0], class_states[:-1]])
+                counts[phon] += np.bincount(_TRANS_MAPPING[prev_states, class_states], minlength=3)
+
+    trans_dict = {phon: {i: float(c) for i, c in enumerate(count)} for phon, count in counts.items()}
+    with open(out_path, "w") as out_file:
+        out_file.write(json.dumps(trans_dict))
+    return task_id
@@ -2,5 +2,7 @@ from .command import *
 from .config import *
 from .feature_scorer import *
 from .flow import *
+from .resources import *
+from .staging import *
 from .util import *
 from .crp import *
@@ -1,12 +1,13 @@
 __all__ = ["RasrCommand"]
 
+import contextlib
 import logging
 import shutil
 import subprocess as sp
 import tempfile
 import time
 
-from typing import List, Optional, Union
+from typing import Dict, List, Optional, Union
 
 from sisyphus import *
 
@@ -14,6 +15,9 @@ Path = setup_path(__package__)
 
 from i6_core.util import *
 
+from .resources import run_and_measure, write_resource_usage
+from .staging import STAGING_TMP_MARKER, NodeLocalCache, atomic_move, parallel_copy
+
 
 class RasrCommand:
     """
@@ -22,6 +26,12 @@ class RasrCommand:
 
     RETRY_WAIT_TIME = 5.0
     NO_RETRY_AFTER_TIME = 10.0 * 60.0  # do not retry job after it ran for 10 minutes
+    RESOURCE_METRICS_SUFFIX = ".resources.json"  # set to None to disable writing resource metrics
+    STAGING_COPY_WORKERS = 8  # number of threads used to copy files into the temp dir
+    STAGING_OUTPUTS_PREFIX = ".staging_outputs."  # lists the files a task moved from its temp dir to the work dir
+    # node-local cache for the cached_inputs of run_script, by default gs.NODE_LOCAL_CACHE_DIR, disabled if unset
+    NODE_LOCAL_CACHE_DIR = None
+    NODE_LOCAL_CACHE_MAX_SIZE = None  # in bytes, by default gs.NODE_LOCAL_CACHE_MAX_SIZE, unlimited if unset
 
     def log_file_output_path(self, name, crp, parallel):
         """
@@ -131,36 +141,98 @@ fi
         retries: int = 2,
         use_tmp_dir: bool = False,
         copy_tmp_ls: Optional[List] = None,
+        cached_inputs: Optional[Dict[str, Union[str, tk.Path]]] = None,
     ):
+        """
+        :param task_id:
+        :param log_file:
+        :param cmd: script to run, will be called with the task id, the log file name and `args`
+        :param args: additional arguments for the script
+        :param retries:
+        :param use_tmp_dir: run the script in a task specific temp dir and move the created files back afterwards
+        :param copy_tmp_ls: files that are copied into the temp dir, by default all files of the work dir except
+            the files created by the tasks of this job
+        :param cached_inputs: mapping from a RASR config parameter to a large read-only input file, the file is copied
+            to a node-local cache (shared between tasks on the same node) and the parameter is set to the local copy.
+            Only used if a cache dir is configured via `gs.NODE_LOCAL_CACHE_DIR`, otherwise the original files are read
+        """
         args = [] if args is None else args
         tmp_log_file = remove_suffix(os.path.basename(tk.uncached_path(log_file)), ".gz")
 
+        cache_dir = self.NODE_LOCAL_CACHE_DIR or getattr(gs, "NODE_LOCAL_CACHE_DIR", None)
+        with contextlib.ExitStack() as stack:
+            if cached_inputs and cache_dir is not None:
+                max_size = self.NODE_LOCAL_CACHE_MAX_SIZE or getattr(gs, "NODE_LOCAL_CACHE_MAX_SIZE", None)
+                # the cache entries are locked until the command finished
+                cache = stack.enter_context(NodeLocalCache(cache_dir, max_size=max_size))
+                args = args + [
+                    "--%s=%s" % (param, cache.get(tk.uncached_path(path)))
+                    for param, path in sorted(cached_inputs.items())
+                ]
+            self._run_script(task_id, tmp_log_file, cmd, args, retries, use_tmp_dir, copy_tmp_ls)
+
+        zmove(tmp_log_file, tk.uncached_path(log_file))
+
+    def _run_script(
+        self,
+        task_id: int,
+        tmp_log_file: str,
+        cmd: str,
+        args: List,
+        retries: int,
+        use_tmp_dir: bool,
+        copy_tmp_ls: Optional[List],
+    ):
         work_dir = os.path.abspath(os.curdir)
-        if use_tmp_dir:
-            date_time_cur = time.strftime("%y%m%d-%H%M%S", time.localtime())
-            with tempfile.TemporaryDirectory(prefix=gs.TMP_PREFIX) as tmp_dir:
-                print("using temp-dir: %s" % tmp_dir)
-                try:
-                    if copy_tmp_ls is None:
-                        assert task_id == 1, "Concurrent Jobs need a list of files to copy due to race conditions"
-                        copy_file_names = os.listdir(work_dir)
-                    else:
-                        copy_file_names = copy_tmp_ls
-                    for fn in copy_file_names:
-                        shutil.copy(os.path.join(work_dir, fn), "%s/%s" % (tmp_dir, fn))
-                    self.run_cmd(cmd, [task_id, tmp_log_file] + args, retries, tmp_dir)
-                    move_file_names = os.listdir(tmp_dir)
-                    for fn in move_file_names:
-                        if fn not in copy_file_names:
-                            shutil.move("%s/%s" % (tmp_dir, fn), fn)
-                except Exception as e:
-                    print("'%s' crashed - copy temporary work folder as 'crash_dir'" % cmd)
-                    shutil.copytree(tmp_dir, "crash_dir_" + str(task_id) + "_" + date_time_cur)
-                    raise e
+        metrics_file = (
+            os.path.join(work_dir, tmp_log_file + self.RESOURCE_METRICS_SUFFIX)
+            if self.RESOURCE_METRICS_SUFFIX is not None
+            else None
+        )
+        if not use_tmp_dir:
+            self.run_cmd(cmd, [task_id, tmp_log_file] + args, retries, metrics_file=metrics_file)
+            return
+
+        if copy_tmp_ls is None:
+            # the work dir also contains the (large) outputs of the other tasks, which are listed in their manifests
+            task_outputs = set()
+            for fn in os.listdir(work_dir):
+                if fn.startswith(self.STAGING_OUTPUTS_PREFIX):
+                    with open(os.path.join(work_dir, fn), "rt") as f:
+                        task_outputs.update(f.read().splitlines())
+            copy_file_names = [
+                fn
+                for fn in os.listdir(work_dir)
+                if STAGING_TMP_MARKER not in fn
+                and not fn.startswith(self.STAGING_OUTPUTS_PREFIX)
+                and fn not in task_outputs
+                and (self.RESOURCE_METRICS_SUFFIX is None or not fn.endswith(self.RESOURCE_METRICS_SUFFIX))
+                and os.path.isfile(os.path.join(work_dir, fn))
+            ]
         else:
-            self.run_cmd(cmd, [task_id, tmp_log_file] + args, retries)
+            copy_file_names = copy_tmp_ls
 
-        zmove(tmp_log_file, tk.uncached_path(log_file))
+        date_time_cur = time.strftime("%y%m%d-%H%M%S", time.localtime())
+        with tempfile.TemporaryDirectory(prefix="%stask%d_" % (gs.TMP_PREFIX, task_id)) as tmp_dir:
+            print("using temp-dir: %s" % tmp_dir)
+            try:
+                parallel_copy(
+                    ((os.path.join(work_dir, fn), os.path.join(tmp_dir, fn)) for fn in copy_file_names),
+                    self.STAGING_COPY_WORKERS,
+                )
+                self.run_cmd(cmd, [task_id, tmp_log_file] + args, retries, tmp_dir, metrics_file)
+                move_file_names = [fn for fn in os.listdir(tmp_dir) if fn not in copy_file_names]
+                # the outputs are listed before they appear in the work dir, so other tasks never copy them
+                manifest = os.path.join(work_dir, "%s%d" % (self.STAGING_OUTPUTS_PREFIX, task_id))
+                with open(manifest + STAGING_TMP_MARKER + str(os.getpid()), "wt") as f:
+                    f.write("".join(fn + "\n" for fn in move_file_names))
+                os.replace(manifest + STAGING_TMP_MARKER + str(os.getpid()), manifest)
+                for fn in move_file_names:
+                    atomic_move(os.path.join(tmp_dir, fn), os.path.join(work_dir, fn))
+            except Exception as e:
+                print("'%s' crashed - copy temporary work folder as 'crash_dir'" % cmd)
+                shutil.copytree(tmp_dir, "crash_dir_" + str(task_id) + "_" + date_time_cur)
+                raise e
 
     def run_cmd(
         self,
@@ -168,12 +240,15 @@ fi
         args: Optional[List[str]] = None,
         retries: int = 2,
         cwd: Optional[str] = None,
+        metrics_file: Optional[str] = None,
     ):
         """
         :param cmd:
         :param args:
         :param retries:
         :param cwd: execute cmd in this dir
+        :param metrics_file: if set, the resource usage (peak RSS, cpu and wall time) of every attempt is appended
+            to this json file, see :func:`i6_core.rasr.resources.recommend_rqmt`
         """
         args = [] if args is None else args
         retries = max(0, retries)
@@ -183,7 +258,16 @@ fi
         for t in range(retries + 1):
             try:
                 self.cleanup_before_run(cmd, t, *args)
-                sp.check_call([cmd] + [str(arg) for arg in args], cwd=cwd)
+                full_cmd = [cmd] + [str(arg) for arg in args]
+                returncode, usage = run_and_measure(full_cmd, cwd=cwd)
+                logging.info(
+                    "cmd %s finished: wall time %.1fs, cpu time %.1fs, peak rss %.1f MB"
+                    % (cmd, usage.wall_time, usage.cpu_time, usage.peak_rss / 1024**2)
+                )
+                if metrics_file is not None:
+                    write_resource_usage(metrics_file, usage)
+                if returncode != 0:
+                    raise sp.CalledProcessError(returncode, full_cmd)
                 break
             except sp.CalledProcessError as e:
                 logging.warning("cmd %s (args: %s) failed with exit code %d" % (cmd, str(args), e.returncode))
@@ -0,0 +1,171 @@
+__all__ = [
+    "ResourceUsage",
+    "run_and_measure",
+    "write_resource_usage",
+    "load_resource_usages",
+    "find_resource_metric_files",
+    "recommend_rqmt",
+]
+
+import glob
+import json
+import math
+import os
+import socket
+import subprocess as sp
+import time
+from dataclasses import asdict, dataclass
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+
+@dataclass
+class ResourceUsage:
+    """
+    Resource usage of a single (RASR) child process invocation.
+
+    Attributes:
+        cmd: the executed command including its arguments
+        returncode: exit code of the process, negative values denote the terminating signal
+        start_time: unix timestamp of the process start
+        wall_time: elapsed wall clock time in seconds
+        user_time: user cpu time in seconds, including all waited-for descendants
+        system_time: system cpu time in seconds, including all waited-for descendants
+        peak_rss: maximum resident set size in bytes of the largest process in the process tree
+        hostname: name of the node the process was executed on
+    """
+
+    cmd: List[str]
+    returncode: int
+    start_time: float
+    wall_time: float
+    user_time: float
+    system_time: float
+    peak_rss: int
+    hostname: str
+
+    @property
+    def cpu_time(self) -> float:
+        return self.user_time + self.system_time
+
+
+def run_and_measure(args: List[str], cwd: Optional[str] = None) -> Tuple[int, ResourceUsage]:
+    """
+    Runs a command and collects its resource usage via `wait4`, which reports the rusage of the child
+    together with all of its descendants (e.g. the RASR binary started by a run.sh script).
+
+    :param args: command and arguments
+    :param cwd: execute the command in this dir
+    :return: returncode and the measured resource usage
+    """
+    start_time = time.time()
+    start = time.monotonic()
+    p = sp.Popen(args, cwd=cwd)
+    try:
+        _, status, rusage = os.wait4(p.pid, 0)
+    except BaseException:
+        p.kill()
+        p.wait()
+        raise
+    wall_time = time.monotonic() - start
+
+    returncode = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+    p.returncode = returncode  # the process is already reaped, keep Popen consistent
+
+    usage = ResourceUsage(
+        cmd=list(args),
+        returncode=returncode,
+        start_time=start_time,
+        wall_time=wall_time,
+        user_time=rusage.ru_utime,
+        system_time=rusage.ru_stime,
+        peak_rss=rusage.ru_maxrss * 1024,  # ru_maxrss is given in KiB on Linux
+        hostname=socket.gethostname(),
+    )
+    return returncode, usage
+
+
+def write_resource_usage(filename: str, usage: ResourceUsage):
+    """
+    Appends a measurement to a json metrics file, so that retries of the same task are kept as well
+
+    :param filename: path of the metrics file
+    :param usage: measurement to add
+    """
+    usages = load_resource_usages(filename) if os.path.exists(filename) else []
+    usages.append(usage)
+    tmp_filename = filename + ".tmp"
+    with open(tmp_filename, "wt") as f:
+        json.dump([asdict(u) for u in usages], f, indent=2)
+    os.replace(tmp_filename, filename)
+
+
+def load_resource_usages(filename: str) -> List[ResourceUsage]:
+    """
+    :param filename: path of a metrics file written by :func:`write_resource_usage`
+    """
+    with open(filename, "rt") as f:
+        return [ResourceUsage(**d) for d in json.load(f)]
+
+
+def find_resource_metric_files(job_dirs: Iterable[str], pattern: str = "*.resources.json") -> List[str]:
+    """
+    Collects the metrics files written by :class:`RasrCommand` in the work folders of finished jobs
+
+    :param job_dirs: job folders (e.g. `work/mm/alignment/AlignmentJob.xyz`) of equivalent jobs
+    :param pattern: glob pattern of the metrics files inside the work folder of each job
+    """
+    files = []
+    for job_dir in job_dirs:
+        files += sorted(glob.glob(os.path.join(job_dir, "work", pattern)))
+    return files
+
+
+def recommend_rqmt(
+    metric_files: Iterable[Union[str, List[ResourceUsage]]],
+    time_margin: float = 1.5,
+    mem_margin: float = 1.25,
+    min_time: float = 0.5,
+    min_mem: int = 1,
+    time_granularity: float = 0.25,
+) -> Optional[Dict[str, Union[int, float]]]:
+    """
+    Derives `rqmt` values from the measured resource usage of equivalent (historical) jobs.
+
+    Only successful invocations are taken into account. The maximum over all tasks is used, scaled by the
+    given safety margins, so that the recommendation covers the slowest task of the array job.
+
+    :param metric_files: metrics files or already loaded lists of measurements
+    :param time_margin: factor applied to the maximum wall time
+    :param mem_margin: factor applied to the maximum peak memory
+    :param min_time: lower bound for the time in hours
+    :param min_mem: lower bound for the memory in GB
+    :param time_granularity: the time is rounded up to multiples of this value (in hours)
+    :return: dict with "time" (hours), "mem" (GB) and "cpu", or None if no successful measurement was found
+    """
+    max_wall_time = 0.0
+    max_peak_rss = 0
+    max_cpu_ratio = 0.0
+    found = False
+    for metrics in metric_files:
+        usages = load_resource_usages(metrics) if isinstance(metrics, str) else metrics
+        for usage in usages:
+            if usage.returncode != 0:
+                continue
+            found = True
+            max_wall_time = max(max_wall_time, usage.wall_time)
+            max_peak_rss = max(max_peak_rss, usage.peak_rss)
+            if usage.wall_time > 0:
+                max_cpu_ratio = max(max_cpu_ratio, usage.cpu_time / usage.wall_time)
+
+    if not found:
+        return None
+
+    hours = max_wall_time * time_margin / 3600.0
+    hours = math.ceil(hours / time_granularity) * time_granularity
+    mem = math.ceil(max_peak_rss * mem_margin / 1024**3)
+
+    return {
+        "time": max(hours, min_time),
+        "cpu": max(1, int(math.ceil(max_cpu_ratio - 0.1))),
+        "mem": max(mem, min_mem),
+    }
@@ -0,0 +1,177 @@
+__all__ = ["NodeLocalCache", "parallel_copy", "atomic_move"]
+
+import errno
+import fcntl
+import hashlib
+import logging
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Optional, TextIO, Tuple
+
+STAGING_TMP_MARKER = ".staging."
+
+
+def parallel_copy(file_pairs: Iterable[Tuple[str, str]], num_workers: int = 8):
+    """
+    Copies files concurrently, which hides most of the latency of network file systems
+
+    :param file_pairs: (source, destination) pairs
+    :param num_workers: number of concurrent copy threads
+    """
+    with ThreadPoolExecutor(max_workers=max(1, num_workers)) as pool:
+        # consume the iterator to re-raise exceptions of the copy threads
+        list(pool.map(lambda p: shutil.copy(*p), file_pairs))
+
+
+def atomic_move(src: str, dst: str):
+    """
+    Moves a file such that `dst` never exists in a partially written state, even when moving across file systems.
+    This makes it safe for concurrent tasks to list the destination folder while results are moved.
+
+    :param src: source file
+    :param dst: destination file
+    """
+    if os.path.isdir(src):
+        shutil.move(src, dst)
+        return
+    try:
+        os.replace(src, dst)
+        return
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+    dst_dir, dst_name = os.path.split(os.path.abspath(dst))
+    tmp_dst = os.path.join(dst_dir, ".%s%s%d" % (dst_name, STAGING_TMP_MARKER, os.getpid()))
+    shutil.copy2(src, tmp_dst)
+    os.replace(tmp_dst, dst)
+    os.unlink(src)
+
+
+class NodeLocalCache:
+    """
+    Cache for large read-only inputs (feature caches, LM images, mixture files, ...) on the local disk of a node.
+
+    Entries are addressed by the identity of the source file (resolved path, size and modification time), so a
+    changed input automatically results in a new entry. Multiple tasks on the same node can share an entry, the
+    first one copies the file while the others wait on a file lock.
+
+    Every entry returned by :meth:`get` is protected by a shared file lock until :meth:`release` is called
+    (or the context manager is left), eviction only removes entries which nobody holds::
+
+        with NodeLocalCache(cache_dir, max_size) as cache:
+            local_path = cache.get(path)
+            ...  # run the task
+    """
+
+    def __init__(self, cache_dir: str, max_size: Optional[int] = None, min_unused_time: float = 3600.0):
+        """
+        :param cache_dir: local folder that holds the cache entries
+        :param max_size: maximum total size of the cache in bytes, least recently used entries are evicted
+        :param min_unused_time: entries used within this time (in seconds) are never evicted
+        """
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.min_unused_time = min_unused_time
+        self._held_locks: Dict[str, TextIO] = {}  # entry folder -> locked file
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def __enter__(self) -> "NodeLocalCache":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+    def get(self, path: str) -> str:
+        """
+        :param path: input file on the (network) file system
+        :return: path to the local copy of the input, valid until :meth:`release` is called
+        """
+        key = self._key(path)
+        entry_dir = os.path.join(self.cache_dir, key)
+        local_path = os.path.join(entry_dir, os.path.basename(path))
+        if entry_dir in self._held_locks:
+            return local_path
+
+        # the lock files are never deleted, so all processes always lock the same inode
+        lock = open(entry_dir + ".lock", "a")
+        try:
+            while True:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                if not os.path.exists(local_path):
+                    logging.info("node cache: copy %s -> %s", path, local_path)
+                    os.makedirs(entry_dir, exist_ok=True)
+                    tmp_path = local_path + STAGING_TMP_MARKER + str(os.getpid())
+                    shutil.copyfile(path, tmp_path)
+                    os.replace(tmp_path, local_path)
+                else:
+                    logging.info("node cache: reuse %s for %s", local_path, path)
+                os.utime(entry_dir)  # marks the entry as recently used
+                # converting the lock is not atomic, an eviction in between is noticed by the existence check
+                fcntl.flock(lock, fcntl.LOCK_SH)
+                if os.path.exists(local_path):
+                    break
+        except BaseException:
+            lock.close()
+            raise
+        self._held_locks[entry_dir] = lock
+
+        if self.max_size is not None:
+            self.evict(self.max_size)
+        return local_path
+
+    def release(self):
+        """
+        Releases the entries returned by :meth:`get`, they can be evicted afterwards
+        """
+        for lock in self._held_locks.values():
+            lock.close()  # closing the file releases the lock
+        self._held_locks = {}
+
+    def evict(self, max_size: int):
+        """
+        Removes least recently used entries until the total size of the cache is at most `max_size` bytes.
+        Entries which are in use by any task are skipped.
+
+        :param max_size: size in bytes
+        """
+        entries = []
+        total_size = 0
+        for name in os.listdir(self.cache_dir):
+            entry_dir = os.path.join(self.cache_dir, name)
+            try:
+                if not os.path.isdir(entry_dir):
+                    continue
+                size = sum(os.path.getsize(os.path.join(entry_dir, f)) for f in os.listdir(entry_dir))
+                last_used = os.stat(entry_dir).st_mtime
+            except FileNotFoundError:
+                continue  # evicted or populated concurrently
+            entries.append((last_used, size, entry_dir))
+            total_size += size
+
+        for _, size, entry_dir in sorted(entries):
+            if total_size <= max_size:
+                break
+            with open(entry_dir + ".lock", "a") as lock:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue  # entry is in use or currently being populated
+                try:
+                    last_used = os.stat(entry_dir).st_mtime
+                except FileNotFoundError:
+                    total_size -= size
+                    continue
+                if time.time() - last_used < self.min_unused_time:
+                    continue
+                logging.info("node cache: evict %s", entry_dir)
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                total_size -= size
+
+    @staticmethod
+    def _key(path: str) -> str:
+        real_path = os.path.realpath(path)
+        st = os.stat(real_path)
+        identity = "%s\0%d\0%d" % (real_path, st.st_size, st.st_mtime_ns)
+        return hashlib.sha256(identity.encode("utf-8")).hexdigest()
@@ -2,16 +2,18 @@ __all__ = ["ExtractDatasetMeanStddevJob", "SpeakerLabelHDFFromBlissJob", "Extrac
 
 from sisyphus import *
 
+import json
+import os
 import pickle
 import shutil
 import subprocess
-from typing import Optional, Any, Dict
+from typing import Any, Dict, List, Optional, Tuple
 
 import numpy
 
 from i6_core.returnn.config import ReturnnConfig
 from i6_core.lib import corpus
-from i6_core.lib.hdf import get_returnn_simple_hdf_writer
+from i6_core.lib.hdf import BufferedHDFWriter
 from i6_core.util import (
     create_executable,
     get_returnn_python_exe,
@@ -22,8 +24,9 @@ from i6_core.util import (
 
 class ExtractDatasetMeanStddevJob(Job):
     """
-    Runs the RETURNN tool dump-dataset with statistic extraction.
-    Collects mean and std-var for each feature as file and in total as sisyphus var.
+    Computes the mean and std-dev of each feature dimension over all frames of the "train" dataset of a RETURNN config.
+    The statistics are accumulated exactly in float64 by :mod:`i6_core.lib.dataset_statistics`, which runs with the
+    RETURNN Python and can process the dataset with several worker processes.
 
     Outputs:
 
@@ -32,30 +35,52 @@ class ExtractDatasetMeanStddevJob(Job):
 
     Path out_mean_file: a text file with #feature entries for the mean
     Path out_std_dev_file: a text file with #features entries for the standard deviation
+    Path out_histogram: (if histogram_range is set) npz file with the histogram "edges" and per feature "counts"
+    Path out_percentiles: (if histogram_range is set) text file with the percentiles of each feature
     """
 
-    __sis_hash_exclude__ = {"data_key": "data"}
+    __sis_hash_exclude__ = {"data_key": "data", "histogram_range": None, "histogram_bins": 1000}
 
-    def __init__(self, returnn_config, data_key="data", returnn_python_exe=None, returnn_root=None):
+    def __init__(
+        self,
+        returnn_config,
+        data_key="data",
+        returnn_python_exe=None,
+        returnn_root=None,
+        num_workers=1,
+        histogram_range=None,
+        histogram_bins=1000,
+    ):
         """
 
         :param ReturnnConfig returnn_config:
         :param str data_key: the data key to extract the mean and std-dev from
         :param Optional[Path] returnn_python_exe:
         :param Optional[Path] returnn_root:
+        :param int num_workers: number of processes that compute the statistics of a part of the dataset each,
+            every worker loads the dataset, so this is most useful for datasets with random access (e.g. HDF)
+        :param Optional[tuple[float,float]] histogram_range: if given, per feature histograms over this range
+            are computed, values outside the range are counted in the outer bins
+        :param int histogram_bins: number of histogram bins
         """
 
         self.returnn_config = returnn_config
         self.data_key = data_key
         self.returnn_python_exe = get_returnn_python_exe(returnn_python_exe)
         self.returnn_root = get_returnn_root(returnn_root)
+        self.num_workers = num_workers
+        self.histogram_range = histogram_range
+        self.histogram_bins = histogram_bins
 
         self.out_mean = self.output_var("mean_var")
         self.out_std_dev = self.output_var("std_dev_var")
         self.out_mean_file = self.output_path("mean")
         self.out_std_dev_file = self.output_path("std_dev")
+        if histogram_range is not None:
+            self.out_histogram = self.output_path("histogram.npz")
+            self.out_percentiles = self.output_path("percentiles")
 
-        self.rqmt = {"cpu": 2, "mem": 4, "time": 8}
+        self.rqmt = {"cpu": max(2, num_workers), "mem": 4 + 2 * (num_workers - 1), "time": 8}
 
     def tasks(self):
         yield Task("run", rqmt=self.rqmt)
@@ -65,41 +90,40 @@ class ExtractDatasetMeanStddevJob(Job):
 
         command = [
             self.returnn_python_exe.get_path(),
-            self.returnn_root.join_right("tools/dump-dataset.py").get_path(),
+            os.path.join(os.path.dirname(os.path.abspath(__file__)), "../lib/dataset_statistics.py"),
             "returnn.config",
-            "--endseq",
-            "-1",
-            "--type",
-            "null",
-            "--stats",
-            "--dump_stats",
-            "stats",
+            "--returnn_root",
+            self.returnn_root.get_path(),
             "--key",
             self.data_key,
+            "--num_workers",
+            str(self.num_workers),
+            "--output_prefix",
+            "stats",
         ]
+        if self.histogram_range is not None:
+            command += ["--histogram_range", *[str(v) for v in self.histogram_range]]
+            command += ["--histogram_bins", str(self.histogram_bins)]
 
         create_executable("rnn.sh", command)
         subprocess.check_call(["./rnn.sh"])
 
         shutil.move("stats.mean.txt", self.out_mean_file.get_path())
         shutil.move("stats.std_dev.txt", self.out_std_dev_file.get_path())
+        if self.histogram_range is not None:
+            shutil.move("stats.histogram.npz", self.out_histogram.get_path())
+            shutil.move("stats.percentiles.txt", self.out_percentiles.get_path())
 
-        total_mean = 0
-        total_var = 0
-
-        with open(self.out_mean_file.get_path()) as mean_file, open(self.out_std_dev_file.get_path()) as std_dev_file:
+        with open("stats.total.txt", "rt") as f:
+            _, total_mean, total_std_dev = f.read().split()
+        self.out_mean.set(float(total_mean))
+        self.out_std_dev.set(float(total_std_dev))
 
-            # compute the total mean and std-dev in an iterative way
-            for i, (mean, std_dev) in enumerate(zip(mean_file, std_dev_file)):
-                mean = float(mean)
-                var = float(std_dev.strip()) ** 2
-                mean_variance = (total_mean - mean) ** 2
-                adjusted_mean_variance = mean_variance * i / (i + 1)
-                total_var = (total_var * i + var + adjusted_mean_variance) / (i + 1)
-                total_mean = (total_mean * i + mean) / (i + 1)
-
-            self.out_mean.set(total_mean)
-            self.out_std_dev.set(numpy.sqrt(total_var))
+    @classmethod
+    def hash(cls, kwargs):
+        d = dict(kwargs)
+        d.pop("num_workers")
+        return super().hash(d)
 
 
 class SpeakerLabelHDFFromBlissJob(Job):
@@ -111,7 +135,7 @@ class SpeakerLabelHDFFromBlissJob(Job):
     def __init__(self, bliss_corpus: tk.Path, returnn_root: Optional[tk.Path] = None):
         """
         :param bliss_corpus: bliss XML corpus where the speakers and segments are taken from
-        :param returnn_root: used to import SimpleHDFWriter from a specific path if not installed in the worker env
+        :param returnn_root: not used anymore, the HDF file is written with :class:`i6_core.lib.hdf.BufferedHDFWriter`
         """
         self.bliss_corpus = bliss_corpus
         self.returnn_root = returnn_root
@@ -136,17 +160,14 @@ class SpeakerLabelHDFFromBlissJob(Job):
 
         pickle.dump(speaker_by_index, uopen(self.out_speaker_dict, "wb"))
 
-        SimpleHDFWriter = get_returnn_simple_hdf_writer(
-            returnn_root=self.returnn_root.get_path() if self.returnn_root else None
-        )
-        hdf_writer = SimpleHDFWriter(self.out_speaker_hdf.get_path(), dim=num_speakers, ndim=1)
+        hdf_writer = BufferedHDFWriter(self.out_speaker_hdf.get_path(), dim=num_speakers, ndim=1)
 
         for recording in bliss.all_recordings():
             for segment in recording.segments:
                 speaker_name = segment.speaker_name or recording.speaker_name
                 speaker_index = index_by_speaker[speaker_name]
                 segment_name = segment.fullname()
-                hdf_writer.insert_batch(numpy.asarray([[speaker_index]], dtype="int32"), [1], [segment_name])
+                hdf_writer.insert(numpy.asarray([speaker_index], dtype="int32"), segment_name)
 
         hdf_writer.close()
 
@@ -154,6 +175,9 @@ class SpeakerLabelHDFFromBlissJob(Job):
 class ExtractSeqLensJob(Job):
     """
     Extracts sequence lengths from a dataset for one specific key.
+
+    For a plain :class:`HDFDataset` the lengths are read from the HDF metadata. All other datasets are loaded
+    sequence by sequence, optionally with several worker processes, and the progress is stored in chunks.
     """
 
     def __init__(
@@ -165,6 +189,8 @@ class ExtractSeqLensJob(Job):
         output_format: str,
         returnn_config: Optional[ReturnnConfig] = None,
         returnn_root: Optional[tk.Path] = None,
+        num_workers: int = 1,
+        chunk_size: int = 1000,
     ):
         """
         :param dataset: dict for :func:`returnn.datasets.init_dataset`
@@ -177,6 +203,9 @@ class ExtractSeqLensJob(Job):
             This is optional and only needed if you use any custom functions (e.g. audio pre_process)
             which expect some configuration in the global config.
         :param returnn_root: inserted to ``sys.path`` for the RETURNN import.
+        :param num_workers: number of processes which load the dataset, each one processes every n-th chunk
+        :param chunk_size: number of consecutive sequences that are loaded and stored as one chunk,
+            finished chunks are kept when the task is restarted
         """
         super().__init__()
         self.dataset = dataset
@@ -186,23 +215,27 @@ class ExtractSeqLensJob(Job):
         self.output_format = output_format
         self.returnn_config = returnn_config
         self.returnn_root = returnn_root
+        self.num_workers = num_workers
+        self.chunk_size = chunk_size
 
         self.out_returnn_config_file = self.output_path("returnn.config")
         self.out_file = self.output_path(f"seq_lens.{output_format}")
 
-        self.rqmt = {"gpu": 0, "cpu": 1, "mem": 4, "time": 1}
+        self.rqmt = {"gpu": 0, "cpu": num_workers, "mem": 4 * num_workers, "time": 1}
 
     @classmethod
     def hash(cls, parsed_args):
         """hash"""
         parsed_args = parsed_args.copy()
         parsed_args.pop("post_dataset")
+        parsed_args.pop("num_workers")
+        parsed_args.pop("chunk_size")
         return super().hash(parsed_args)
 
     def tasks(self):
         """tasks"""
         yield Task("create_files", mini_task=True)
-        yield Task("run", rqmt=self.rqmt)
+        yield Task("run", resume="run", rqmt=self.rqmt)
 
     def create_files(self):
         """create files"""
@@ -226,7 +259,6 @@ class ExtractSeqLensJob(Job):
             sys.path.insert(0, self.returnn_root.get_path())
 
         from returnn.config import set_global_config, Config
-        from returnn.datasets import init_dataset
         from returnn.log import log
 
         config = Config()
@@ -239,30 +271,174 @@ class ExtractSeqLensJob(Job):
 
         dataset_dict = config.typed_value("dataset")
         assert isinstance(dataset_dict, dict)
-        dataset = init_dataset(dataset_dict)
-        dataset.init_seq_order(epoch=1)
+
+        seq_lens = _get_hdf_seq_lens(dataset_dict, self.key)
+        if seq_lens is None:
+            seq_lens = self._load_seq_lens(dataset_dict)
+        else:
+            print(f"Read {len(seq_lens)} sequence lengths from the HDF metadata")
 
         with tempfile.NamedTemporaryFile("w") as tmp_file:
             if self.output_format == "py":
                 tmp_file.write("{\n")
 
-            seq_idx = 0
-            while dataset.is_less_than_num_seqs(seq_idx):
-                dataset.load_seqs(seq_idx, seq_idx + 1)
-                seq_tag = dataset.get_tag(seq_idx)
-                seq_len = dataset.get_seq_length(seq_idx)
-                assert self.key in seq_len.keys()
-                seq_len_ = seq_len[self.key]
+            for seq_tag, seq_len_ in seq_lens:
                 if self.output_format == "py":
                     tmp_file.write(f"{seq_tag!r}: {seq_len_},\n")
                 elif self.output_format == "txt":
                     tmp_file.write(f"{seq_len_}\n")
                 else:
                     raise ValueError(f"{self}: invalid output_format {self.output_format!r}")
-                seq_idx += 1
 
             if self.output_format == "py":
                 tmp_file.write("}\n")
             tmp_file.flush()
 
             shutil.copyfile(tmp_file.name, self.out_file.get_path())
+
+    def _load_seq_lens(self, dataset_dict: Dict[str, Any]) -> List[Tuple[str, int]]:
+        """
+        Loads every sequence of the dataset. The sequences are processed in chunks of `chunk_size` consecutive
+        sequences which are distributed over the workers, each finished chunk is stored in the work dir,
+        so a restarted task only loads the missing chunks.
+        """
+        import glob
+        import multiprocessing
+
+        # the chunk indices depend on the chunk size, which is not hashed, so chunks of another size are discarded
+        chunk_size_file = f"{_SEQ_LENS_CHUNK_DIR}/chunk_size"
+        if os.path.exists(chunk_size_file):
+            with open(chunk_size_file, "rt") as f:
+                if int(f.read()) != self.chunk_size:
+                    print("Discarding the chunks of the previous run, which used another chunk size")
+                    shutil.rmtree(_SEQ_LENS_CHUNK_DIR)
+        elif os.path.exists(_SEQ_LENS_CHUNK_DIR):
+            shutil.rmtree(_SEQ_LENS_CHUNK_DIR)
+        if not os.path.exists(_SEQ_LENS_CHUNK_DIR):
+            os.makedirs(_SEQ_LENS_CHUNK_DIR)
+            with open(chunk_size_file + ".tmp", "wt") as f:
+                f.write(f"{self.chunk_size}\n")
+            os.rename(chunk_size_file + ".tmp", chunk_size_file)
+
+        done_chunks = {int(os.path.basename(path).split(".")[0]) for path in glob.glob(f"{_SEQ_LENS_CHUNK_DIR}/*.json")}
+        if done_chunks:
+            print(f"Resuming, {len(done_chunks)} chunks were finished before")
+
+        worker_args = (dataset_dict, self.key, self.chunk_size, self.num_workers, done_chunks)
+        if self.num_workers <= 1:
+            _init_seq_lens_worker(*worker_args)
+            num_seqs = [_extract_seq_lens_shard(0)]
+        else:
+            # forked workers inherit the global RETURNN config and do not need to pickle the dataset dict,
+            # which might contain functions
+            ctx = multiprocessing.get_context("fork")
+            with ctx.Pool(self.num_workers, initializer=_init_seq_lens_worker, initargs=worker_args) as pool:
+                num_seqs = pool.map(_extract_seq_lens_shard, range(self.num_workers))
+        num_seqs = max(num_seqs)
+
+        seq_lens = []
+        for chunk in range((num_seqs + self.chunk_size - 1) // self.chunk_size):
+            with open(f"{_SEQ_LENS_CHUNK_DIR}/{chunk:08d}.json", "rt") as f:
+                seq_lens += [tuple(entry) for entry in json.load(f)]
+        assert len(seq_lens) == num_seqs, f"expected {num_seqs} sequences, found {len(seq_lens)} in the chunk files"
+        return seq_lens
+
+
+_SEQ_LENS_CHUNK_DIR = "seq_lens_chunks"
+_seq_lens_worker_args = None
+
+
+def _init_seq_lens_worker(*args):
+    """
+    Sets the arguments of :func:`_extract_seq_lens_shard` in the worker process
+    """
+    global _seq_lens_worker_args
+    _seq_lens_worker_args = args
+
+
+def _extract_seq_lens_shard(shard: int) -> int:
+    """
+    Stores the lengths of all chunks with `chunk_index % num_shards == shard` which are not done yet.
+    The arguments are set by :func:`_init_seq_lens_worker`.
+
+    :return: number of sequences in the dataset
+    """
+    from returnn.datasets import init_dataset
+
+    dataset_dict, key, chunk_size, num_shards, done_chunks = _seq_lens_worker_args
+    dataset = init_dataset(dataset_dict)
+    dataset.init_seq_order(epoch=1)
+
+    seq_idx = 0
+    while dataset.is_less_than_num_seqs(seq_idx):
+        chunk = seq_idx // chunk_size
+        if chunk % num_shards != shard or chunk in done_chunks:
+            seq_idx = (chunk + 1) * chunk_size
+            continue
+        entries = []
+        while seq_idx < (chunk + 1) * chunk_size and dataset.is_less_than_num_seqs(seq_idx):
+            dataset.load_seqs(seq_idx, seq_idx + 1)
+            seq_len = dataset.get_seq_length(seq_idx)
+            assert key in seq_len.keys()
+            entries.append((dataset.get_tag(seq_idx), int(seq_len[key])))
+            seq_idx += 1
+        tmp_path = f"{_SEQ_LENS_CHUNK_DIR}/{chunk:08d}.json.tmp"
+        with open(tmp_path, "wt") as f:
+            json.dump(entries, f)
+        os.rename(tmp_path, f"{_SEQ_LENS_CHUNK_DIR}/{chunk:08d}.json")
+
+    # the end of the dataset is only known after the last chunk, which might belong to another shard
+    while seq_idx > 0 and not dataset.is_less_than_num_seqs(seq_idx - 1):
+        seq_idx -= 1
+    return seq_idx
+
+
+def _get_hdf_seq_lens(dataset_dict: Dict[str, Any], key: str) -> Optional[List[Tuple[str, int]]]:
+    """
+    Reads the sequence lengths of an :class:`HDFDataset` in default order directly from the `seqLengths` of the files,
+    without loading any data.
+
+    :return: list of (seq_tag, seq_len), or None if the dataset is not such a HDFDataset
+    """
+    import h5py
+
+    supported_options = {"class", "files", "use_cache_manager", "cache_byte_size", "seq_ordering", "partition_epoch"}
+    if dataset_dict.get("class") != "HDFDataset" or not set(dataset_dict.keys()).issubset(supported_options):
+        return None
+    if dataset_dict.get("seq_ordering", "default") != "default" or dataset_dict.get("partition_epoch", 1) != 1:
+        return None
+    files = dataset_dict.get("files") or []
+    if isinstance(files, str):
+        files = [files]
+
+    seq_lens = []
+    target_keys = None
+    for file in files:
+        with h5py.File(file, "r") as f:
+            lengths = f["seqLengths"][...]
+            if lengths.ndim != 2:
+                return None
+            num_input_keys = 1 if "inputs" in f else 0
+            # same column layout as in HDFDataset._load_file, which takes the target keys from targets/data and
+            # targets/size, older RETURNN versions (and the writers of that time) also from targets/labels
+            file_target_keys = ["classes"]
+            if "targets" in f:
+                keys = set(f["targets/data"].keys()) | set(f["targets/size"].attrs.keys())
+                labels_keys = set(f["targets/labels"].keys()) if "targets/labels" in f else set()
+                candidates = [sorted(keys | labels_keys), sorted(keys)]
+                candidates = [c for c in candidates if num_input_keys + len(c) == lengths.shape[1]]
+                if not candidates:
+                    return None
+                file_target_keys = candidates[0]
+            if target_keys is not None and file_target_keys != target_keys:
+                return None
+            target_keys = file_target_keys
+            if key == "data" and num_input_keys == 1:
+                column = 0
+            elif key != "data" and "targets" in f and key in target_keys:
+                column = num_input_keys + target_keys.index(key)
+            else:
+                return None
+            tags = [tag if isinstance(tag, str) else tag.decode("utf8") for tag in f["seqTags"][...].tolist()]
+            seq_lens += zip(tags, lengths[:, column].tolist())
+    return seq_lens
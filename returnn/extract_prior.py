@@ -7,7 +7,6 @@ __all__ = [
 ]
 
 import copy
-import h5py
 import math
 import numpy as np
 import os
@@ -55,6 +54,8 @@ class ExtractPriorFromHDF5Job(Job):
         yield Task("run", resume="run", mini_task=True)
 
     def run(self):
+        import h5py
+
         model = h5py.File(tk.uncached_path(self.returnn_model), "r")
         priors_set = model["%s/priors" % self.layer]
 
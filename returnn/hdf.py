@@ -4,18 +4,16 @@ from dataclasses import dataclass
 from enum import Enum, auto
 import glob
 import math
-import librosa
 import numpy as np
 import os
 import shutil
-import soundfile as sf
 import subprocess as sp
 import tempfile
 from typing import List, Optional
 
 from .rasr_training import ReturnnRasrTrainingJob
 from i6_core.lib import corpus
-from i6_core.lib.hdf import get_returnn_simple_hdf_writer
+from i6_core.lib.hdf import BufferedHDFWriter
 from i6_core.lib.rasr_cache import FileArchive
 import i6_core.rasr as rasr
 from i6_core.util import instanciate_delayed, uopen, write_paths_to_file
@@ -254,7 +252,8 @@ class BlissToPcmHDFJob(Job):
             Currently implemented are:
             BaseStrategy(): no handling, assume only one channel
             PickNth(n): Takes audio from n-th channel
-        :param returnn_root: RETURNN repository
+        :param returnn_root: RETURNN repository, not used anymore as the HDF file is written with
+            :class:`i6_core.lib.hdf.BufferedHDFWriter`
         :param rounding: defines how timestamps should be rounded if they do not exactly fall onto a sample:
             start_and_duration will round down the start time and the duration of the segment
             rasr_compatible will round up the start time and round down the end time
@@ -281,8 +280,8 @@ class BlissToPcmHDFJob(Job):
         yield Task("run", rqmt=self.rqmt)
 
     def run(self):
-        returnn_root = None if self.returnn_root is None else self.returnn_root.get_path()
-        SimpleHDFWriter = get_returnn_simple_hdf_writer(returnn_root)
+        import librosa
+        import soundfile as sf
 
         c = corpus.Corpus()
         c.load(self.bliss_corpus.get_path())
@@ -293,7 +292,7 @@ class BlissToPcmHDFJob(Job):
         else:
             segments_whitelist = None
 
-        out_hdf = SimpleHDFWriter(filename=self.out_hdf, dim=1)
+        out_hdf = BufferedHDFWriter(filename=self.out_hdf, dim=1)
 
         for recording in c.all_recordings():
             audio_file = recording.audio
@@ -335,11 +334,7 @@ class BlissToPcmHDFJob(Job):
                     ).astype(self.output_dtype)
 
                 # add audio to hdf
-                out_hdf.insert_batch(
-                    inputs=data.reshape(1, -1, 1),
-                    seq_len=[data.shape[0]],
-                    seq_tag=[segment.fullname()],
-                )
+                out_hdf.insert(data.reshape(-1, 1), segment.fullname())
 
             audio.close()
 
@@ -369,7 +364,8 @@ class RasrAlignmentDumpHDFJob(Job):
         :param allophone_file: e.g. output of a StoreAllophonesJob
         :param state_tying_file: e.g. output of a DumpStateTyingJob
         :param data_type: type that is used to store the data
-        :param returnn_root: file path to the RETURNN repository root folder
+        :param returnn_root: file path to the RETURNN repository root folder, not used anymore as the HDF file
+            is written with :class:`i6_core.lib.hdf.BufferedHDFWriter`
         :param encoding: encoding of the segment names in the cache
         :param filter_list_keep: list of segment names to dump
         :param sparse: writes the data to hdf in sparse format
@@ -416,9 +412,7 @@ class RasrAlignmentDumpHDFJob(Job):
         else:
             keep_segments = None
 
-        returnn_root = None if self.returnn_root is None else self.returnn_root.get_path()
-        SimpleHDFWriter = get_returnn_simple_hdf_writer(returnn_root)
-        out_hdf = SimpleHDFWriter(
+        out_hdf = BufferedHDFWriter(
             filename=self.out_hdf_files[task_id - 1],
             dim=num_classes if self.sparse else 1,
             ndim=1 if self.sparse else 2,
@@ -447,11 +441,7 @@ class RasrAlignmentDumpHDFJob(Job):
                 targets.append(state_tying[allophone])
 
             data = np.array(targets).astype(np.dtype(self.data_type))
-            out_hdf.insert_batch(
-                inputs=data.reshape(1, -1) if self.sparse else data.reshape(1, -1, 1),
-                seq_len=[data.shape[0]],
-                seq_tag=[seq_name],
-            )
+            out_hdf.insert(data if self.sparse else data.reshape(-1, 1), seq_name)
 
         out_hdf.close()
 
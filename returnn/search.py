@@ -23,7 +23,7 @@ from typing import Any, Optional, Union, Sequence, Set, Dict, Tuple
 from sisyphus import *
 
 from i6_core.deprecated.returnn_search import ReturnnSearchJob as _ReturnnSearchJob
-from i6_core.lib.corpus import Corpus
+from i6_core.lib.ctm import CtmWriter, SegmentTimingIndex
 import i6_core.util as util
 
 from i6_core.returnn.config import ReturnnConfig
@@ -425,18 +425,23 @@ class SearchOutputRawReplaceJob(Job):
 
 class SearchWordsToCTMJob(Job):
     """
-    Convert RETURNN search output file into CTM format file (does not support n-best lists yet)
+    Convert RETURNN search output file into CTM format file
     """
 
-    def __init__(self, recog_words_file, bliss_corpus, filter_tags=True):
+    __sis_hash_exclude__ = {"n_best": 1}
+
+    def __init__(self, recog_words_file, bliss_corpus, filter_tags=True, n_best=1):
         """
         :param Path recog_words_file: search output file from RETURNN
         :param Path bliss_corpus: bliss xml corpus
         :param bool filter_tags: if set to True, tags such as [noise] will be filtered out
+        :param int n_best: number of hypotheses written per segment for n-best search outputs.
+            For n_best > 1 the rank is added as additional column, for n_best == 1 only the best hypothesis is used.
         """
         self.recog_words_file = recog_words_file
         self.bliss_corpus = bliss_corpus
         self.filter_tags = filter_tags
+        self.n_best = n_best
 
         self.out_ctm_file = self.output_path("search.ctm")
 
@@ -444,68 +449,29 @@ class SearchWordsToCTMJob(Job):
         yield Task("run", mini_task=True)
 
     def run(self):
-        corpus = Corpus()
-        corpus.load(self.bliss_corpus.get_path())
-        d = eval(util.uopen(self.recog_words_file.get_path(), "rt").read())
+        segment_index = SegmentTimingIndex.from_bliss(self.bliss_corpus.get_path())
+        d = eval(util.uopen(self.recog_words_file.get_path(), "rt").read(), {"nan": float("nan"), "inf": float("inf")})
         assert isinstance(d, dict), "only search output file with dict format is supported"
-        with util.uopen(self.out_ctm_file.get_path(), "wt") as out:
-            # Do not print optional [n-best] header, some downstream evaluation pipelines
-            # use the number of headers for validation. Since we do not print n-best-list
-            # information this validation fails and discards the entire search outputs.
-            #
-            # See https://github.com/rwth-i6/i6_core/pull/542.
-            out.write(";; <name> <track> <start> <duration> <word> <confidence>\n")
-            for seg in corpus.segments():
-                seg_start = 0.0 if seg.start == float("inf") else seg.start
-                seg_end = 0.0 if seg.end == float("inf") else seg.end
-                seg_fullname = seg.fullname()
+        with CtmWriter(self.out_ctm_file.get_path(), filter_tags=self.filter_tags, n_best=self.n_best) as ctm:
+            for seg_fullname in segment_index:
                 assert seg_fullname in d, "can not find {} in search output".format(seg_fullname)
-                out.write(";; %s (%f-%f)\n" % (seg_fullname, seg_start, seg_end))
-                assert isinstance(d[seg_fullname], str), "no support for n-best lists yet"
-                words = d[seg_fullname].split()
-                # Just linearly interpolate the start/end of each word as time stamps are not given
-                avg_dur = (seg_end - seg_start) * 0.9 / max(len(words), 1)
-                count = 0
-                for i in range(len(words)):
-                    if self.filter_tags and words[i].startswith("[") and words[i].endswith("]"):
-                        continue
-                    out.write(
-                        "%s 1 %f %f %s 0.99\n"
-                        % (
-                            seg.recording.name,
-                            seg_start + avg_dur * i,
-                            avg_dur,
-                            words[i],
-                        )
-                    )
-                    count += 1
-                if count == 0:
-                    # sclite cannot handle empty sequences, and would stop with an error like:
-                    #   hyp file '4515-11057-0054' and ref file '4515-11057-0053' not synchronized
-                    #   sclite: Alignment failed.  Exiting
-                    # So we make sure it is never empty.
-                    # For the WER, it should not matter, assuming the reference sequence is non-empty,
-                    # you will anyway get a WER of 100% for this sequence.
-                    out.write(
-                        "%s 1 %f %f %s 0.99\n"
-                        % (
-                            seg.recording.name,
-                            seg_start,
-                            avg_dur,
-                            "<empty-sequence>",
-                        )
-                    )
+                recording_name, seg_start, seg_end = segment_index[seg_fullname]
+                seg_start = 0.0 if seg_start == float("inf") else seg_start
+                seg_end = 0.0 if seg_end == float("inf") else seg_end
+                ctm.add_segment(seg_fullname, recording_name, seg_start, seg_end, d[seg_fullname])
 
 
 class SearchWordsDummyTimesToCTMJob(Job):
     """
-    Convert RETURNN search output file into CTM format file (does not support n-best lists yet).
+    Convert RETURNN search output file into CTM format file.
     Like :class:`SearchWordsToCTMJob` but does not use the Bliss XML corpus for recording names and segment times.
     Instead, this will just use dummy times.
 
     When creating the corresponding STM files, make sure it uses the same dummy times.
     """
 
+    __sis_hash_exclude__ = {"n_best": 1}
+
     def __init__(
         self,
         recog_words_file: Path,
@@ -513,6 +479,7 @@ class SearchWordsDummyTimesToCTMJob(Job):
         seq_order_file: Optional[Path] = None,
         filter_tags: bool = True,
         seg_length_time: float = 1.0,
+        n_best: int = 1,
     ):
         """
         :param recog_words_file: search output file from RETURNN
@@ -524,11 +491,14 @@ class SearchWordsDummyTimesToCTMJob(Job):
             This file can be another text-dict format, e.g. via :class:`CorpusToTextDictJob`.
         :param filter_tags: if set to True, tags such as [noise] will be filtered out
         :param seg_length_time: dummy segment length time, in seconds
+        :param n_best: number of hypotheses written per segment for n-best search outputs,
+            see :class:`SearchWordsToCTMJob`
         """
         self.recog_words_file = recog_words_file
         self.seq_order_file = seq_order_file
         self.filter_tags = filter_tags
         self.seg_length_time = seg_length_time
+        self.n_best = n_best
 
         self.out_ctm_file = self.output_path("search.ctm")
 
@@ -536,8 +506,6 @@ class SearchWordsDummyTimesToCTMJob(Job):
         yield Task("run", mini_task=True)
 
     def run(self):
-        # nan/inf should not be needed, but avoids errors at this point and will print an error below,
-        # that we don't expect an N-best list here.
         d = eval(util.uopen(self.recog_words_file, "rt").read(), {"nan": float("nan"), "inf": float("inf")})
         assert isinstance(d, dict), "only search output file with dict format is supported"
         if self.seq_order_file is not None:
@@ -545,55 +513,16 @@ class SearchWordsDummyTimesToCTMJob(Job):
             assert isinstance(seq_order, (dict, list, tuple))
         else:
             seq_order = d.keys()
-        with util.uopen(self.out_ctm_file.get_path(), "wt") as out:
-            # Do not print optional [n-best] header, some downstream evaluation pipelines
-            # use the number of headers for validation. Since we do not print n-best-list
-            # information this validation fails and discards the entire search outputs.
-            #
-            # See https://github.com/rwth-i6/i6_core/pull/542.
-            out.write(";; <name> <track> <start> <duration> <word> <confidence>\n")
+        with CtmWriter(self.out_ctm_file.get_path(), filter_tags=self.filter_tags, n_best=self.n_best) as ctm:
             for seg_fullname in seq_order:
                 assert isinstance(
                     seg_fullname, str
                 ), f"invalid seq_order entry {seg_fullname!r} (type {type(seg_fullname).__name__})"
                 assert seg_fullname in d, f"seq_order entry {seg_fullname!r} not found in recog_words_file"
-                text = d[seg_fullname]
-                seg_start = 0.0
-                seg_end = self.seg_length_time
-                out.write(";; %s (%f-%f)\n" % (seg_fullname, seg_start, seg_end))
-                words = text.split()
-                time_step_per_word = (seg_end - seg_start) / max(len(words), 1)
-                avg_dur = time_step_per_word * 0.9
-                count = 0
-                for i in range(len(words)):
-                    if self.filter_tags and words[i].startswith("[") and words[i].endswith("]"):
-                        continue
-                    out.write(
-                        "%s 1 %f %f %s 0.99\n"
-                        % (
-                            seg_fullname,  # originally the recording name, but treat each segment as a recording
-                            seg_start + time_step_per_word * i,
-                            avg_dur,
-                            words[i],
-                        )
-                    )
-                    count += 1
-                if count == 0:
-                    # sclite cannot handle empty sequences, and would stop with an error like:
-                    #   hyp file '4515-11057-0054' and ref file '4515-11057-0053' not synchronized
-                    #   sclite: Alignment failed.  Exiting
-                    # So we make sure it is never empty.
-                    # For the WER, it should not matter, assuming the reference sequence is non-empty,
-                    # you will anyway get a WER of 100% for this sequence.
-                    out.write(
-                        "%s 1 %f %f %s 0.99\n"
-                        % (
-                            seg_fullname,
-                            seg_start,
-                            avg_dur,
-                            "<empty-sequence>",
-                        )
-                    )
+                # treat each segment as a recording
+                ctm.add_segment(
+                    seg_fullname, seg_fullname, 0.0, self.seg_length_time, d[seg_fullname], spread_words=True
+                )
 
 
 class ReturnnComputeWERJob(Job):
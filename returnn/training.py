@@ -865,38 +865,62 @@ class GetBestPtCheckpointJob(GetBestEpochJob):
 
 class AverageTFCheckpointsJob(Job):
     """
-    Compute the average of multiple specified Tensorflow checkpoints using the tf_avg_checkpoints script from Returnn
+    Compute the (weighted) average of multiple specified Tensorflow checkpoints.
+
+    The variables are accumulated tensor by tensor with :mod:`i6_core.lib.checkpoint_averaging`, which is executed
+    with the given RETURNN Python, so the memory usage is close to the size of a single model.
     """
 
+    __sis_hash_exclude__ = {"weights": None, "ema_decay": None}
+
     def __init__(
         self,
         model_dir: tk.Path,
         epochs: List[Union[int, tk.Variable]],
         returnn_python_exe: tk.Path,
-        returnn_root: tk.Path,
+        returnn_root: Optional[tk.Path] = None,
+        weights: Optional[List[float]] = None,
+        ema_decay: Optional[float] = None,
+        mem_rqmt: float = 4,
     ):
         """
 
         :param model_dir: model dir from `ReturnnTrainingJob`
         :param epochs: manually specified epochs or `out_epoch` from `GetBestEpochJob`
         :param returnn_python_exe: file path to the executable for running returnn (python binary or .sh)
-        :param returnn_root: file path to the RETURNN repository root folder
+        :param returnn_root: ignored, the averaging does not use RETURNN, only kept for the hash of existing setups
+        :param weights: weight per epoch (in the order of `epochs`), uniform if not given
+        :param ema_decay: use the weights of an exponential moving average over the sorted epochs instead,
+            see :func:`i6_core.lib.checkpoint_averaging.get_average_weights`
+        :param mem_rqmt: memory requirement in GB, about twice the size of one model is needed, not hashed
         """
+        assert weights is None or len(weights) == len(epochs), "need exactly one weight per epoch"
+        assert weights is None or ema_decay is None, "weights and ema_decay are mutually exclusive"
         self.model_dir = model_dir
         self.epochs = epochs
         self.returnn_python_exe = returnn_python_exe
         self.returnn_root = returnn_root
+        self.weights = weights
+        self.ema_decay = ema_decay
 
         self._out_model_dir = self.output_path("model", directory=True)
         self.out_checkpoint = Checkpoint(self.output_path("model/average.index"))
 
-        self.rqmt = {"cpu": 1, "time": 0.5, "mem": 2 * len(epochs)}
+        self.rqmt = {"cpu": 1, "time": 0.5, "mem": mem_rqmt}
 
     def tasks(self):
         yield Task("run", rqmt=self.rqmt)
 
+    @classmethod
+    def hash(cls, kwargs):
+        d = dict(kwargs)
+        d.pop("mem_rqmt")
+        return super().hash(d)
+
     def run(self):
         epochs = util.instanciate_delayed(self.epochs)
+        weights = self.weights if self.weights is not None else [1.0] * len(epochs)
+        epochs, weights = zip(*sorted(zip(epochs, weights)))
         max_epoch = max(epochs)
 
         # we are writing a checkpoint with the maximum epoch index in the file name because Returnn
@@ -904,14 +928,15 @@ class AverageTFCheckpointsJob(Job):
         out_path = os.path.join(self._out_model_dir.get_path(), "epoch.%03d" % max_epoch)
         args = [
             self.returnn_python_exe.get_path(),
-            os.path.join(self.returnn_root.get_path(), "tools/tf_avg_checkpoints.py"),
+            _checkpoint_averaging_script(),
+            "--framework",
+            "tf",
             "--checkpoints",
-            ",".join(["%03d" % epoch for epoch in epochs]),
-            "--prefix",
-            self.model_dir.get_path() + "/epoch.",
+            *["%s/epoch.%03d" % (self.model_dir.get_path(), epoch) for epoch in epochs],
             "--output_path",
             out_path,
         ]
+        args += _averaging_weight_args(weights if self.weights is not None else None, self.ema_decay)
         os.symlink(out_path + ".index", self.out_checkpoint.index_path.get_path())
         os.symlink(out_path + ".meta", self.out_checkpoint.ckpt_path + ".meta")
         os.symlink(
@@ -926,39 +951,82 @@ class AverageTFCheckpointsJob(Job):
 class AverageTorchCheckpointsJob(Job):
     """
     average Torch model checkpoints
+
+    The parameters are accumulated tensor by tensor with :mod:`i6_core.lib.checkpoint_averaging`, which is executed
+    with the given RETURNN Python. The checkpoints are memory-mapped, so only a single model is held in memory.
     """
 
+    __sis_hash_exclude__ = {"weights": None, "ema_decay": None, "mmap": True}
+
     def __init__(
         self,
         *,
         checkpoints: Sequence[Union[tk.Path, PtCheckpoint]],
         returnn_python_exe: tk.Path,
-        returnn_root: tk.Path,
+        returnn_root: Optional[tk.Path] = None,
+        weights: Optional[List[float]] = None,
+        ema_decay: Optional[float] = None,
+        mmap: bool = True,
+        mem_rqmt: float = 5,
     ):
         """
-        :param checkpoints: input checkpoints
+        :param checkpoints: input checkpoints, ordered from oldest to newest
         :param returnn_python_exe: file path to the executable for running returnn (python binary or .sh)
-        :param returnn_root: file path to the RETURNN repository root folder
+        :param returnn_root: ignored, the averaging does not use RETURNN, only kept for the hash of existing setups
+        :param weights: weight per checkpoint, uniform if not given
+        :param ema_decay: use the weights of an exponential moving average over the checkpoints instead,
+            see :func:`i6_core.lib.checkpoint_averaging.get_average_weights`
+        :param mmap: memory-map the checkpoints while reading, needs torch >= 2.1
+        :param mem_rqmt: memory requirement in GB, without mmap all checkpoints are loaded at once, not hashed
         """
+        assert weights is None or len(weights) == len(checkpoints), "need exactly one weight per checkpoint"
+        assert weights is None or ema_decay is None, "weights and ema_decay are mutually exclusive"
         self.checkpoints = [ckpt if isinstance(ckpt, PtCheckpoint) else PtCheckpoint(ckpt) for ckpt in checkpoints]
         self.returnn_python_exe = returnn_python_exe
         self.returnn_root = returnn_root
+        self.weights = weights
+        self.ema_decay = ema_decay
+        self.mmap = mmap
 
         self.out_checkpoint = PtCheckpoint(self.output_path("model/average.pt"))
 
-        self.rqmt = {"cpu": 1, "time": 0.5, "mem": 5}
+        self.rqmt = {"cpu": 1, "time": 0.5, "mem": mem_rqmt}
 
     def tasks(self):
         yield Task("run", rqmt=self.rqmt)
 
+    @classmethod
+    def hash(cls, kwargs):
+        d = dict(kwargs)
+        d.pop("mem_rqmt")
+        return super().hash(d)
+
     def run(self):
         os.makedirs(os.path.dirname(self.out_checkpoint.path.get_path()), exist_ok=True)
         args = [
             self.returnn_python_exe.get_path(),
-            os.path.join(self.returnn_root.get_path(), "tools/torch_avg_checkpoints.py"),
+            _checkpoint_averaging_script(),
+            "--framework",
+            "torch",
             "--checkpoints",
             *[ckpt.path.get_path() for ckpt in self.checkpoints],
             "--output_path",
             self.out_checkpoint.path.get_path(),
         ]
+        args += _averaging_weight_args(self.weights, self.ema_decay)
+        if not self.mmap:
+            args.append("--no_mmap")
         sp.check_call(args)
+
+
+def _checkpoint_averaging_script() -> str:
+    return os.path.abspath(os.path.join(os.path.dirname(__file__), "../lib/checkpoint_averaging.py"))
+
+
+def _averaging_weight_args(weights: Optional[Sequence[float]], ema_decay: Optional[float]) -> List[str]:
+    args = []
+    if weights is not None:
+        args += ["--weights", *[str(w) for w in weights]]
+    if ema_decay is not None:
+        args += ["--ema_decay", str(ema_decay)]
+    return args
@@ -10,7 +10,6 @@ from dataclasses import fields
 from inspect import isfunction
 from typing import List, Optional, Tuple, TYPE_CHECKING
 
-import torch
 from sisyphus.delayed_ops import DelayedBase
 
 if TYPE_CHECKING:
@@ -34,6 +33,7 @@ def build_i6_models_config_constructor_serializers(
     :param unhashed_package_root: Will be passed to all generated Import objects.
     :return: Call object and list of necessary imports.
     """
+    import torch
     from i6_models.config import ModelConfiguration, ModuleFactoryV1
 
     # Import the class of <cfg>
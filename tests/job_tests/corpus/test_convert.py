@@ -1,9 +1,10 @@
 import filecmp
 import os
 import tempfile
+import wave
 from sisyphus import setup_path
 
-from i6_core.corpus.convert import CorpusToStmJob
+from i6_core.corpus.convert import CorpusToParquetJob, CorpusToStmJob, ParquetToCorpusJob
 
 Path = setup_path(__package__)
 
@@ -101,3 +102,66 @@ def test_corpus_to_stm_none():
         bliss_to_stm_job.run()
 
         assert filecmp.cmp(bliss_to_stm_job.out_stm_path.get_path(), stm_ref.get_path(), shallow=False)
+
+
+def test_corpus_parquet_round_trip():
+    import i6_core.lib.corpus as libcorpus
+    from i6_core.lib.corpus_parquet import load_corpus_table
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        c = libcorpus.Corpus()
+        c.load(Path("files/test_job.corpus.xml").get_path())
+        sub = libcorpus.Corpus()
+        sub.name = "sub"
+        sub.speaker_name = "spk"
+        speaker = libcorpus.Speaker()
+        speaker.name = "spk"
+        speaker.attribs["gender"] = "female"
+        sub.add_speaker(speaker)
+        for idx, (start, end) in enumerate([(0.0, 2.5), (2.5, 30.0)]):
+            recording = libcorpus.Recording()
+            recording.name = "rec%d" % idx
+            recording.audio = "rec%d.wav" % idx
+            recording.add_segment(libcorpus.Segment(start=start, end=end, track=idx, orth="a <b> & c"))
+            recording.segments[0].name = "seg"
+            sub.add_recording(recording)
+        # segments with an infinite end take the duration from the audio file, which is unknown for missing files
+        audio = os.path.join(tmpdir, "rec2.wav")
+        with wave.open(audio, "wb") as f:
+            f.setnchannels(1)
+            f.setsampwidth(2)
+            f.setframerate(16000)
+            f.writeframes(b"\0\0" * 24000)
+        for idx, audio in [(2, audio), (3, "rec3.wav")]:
+            recording = libcorpus.Recording()
+            recording.name = "rec%d" % idx
+            recording.audio = audio
+            recording.add_segment(libcorpus.Segment(start=0.5, end=float("inf"), orth="d"))
+            recording.segments[0].name = "seg"
+            sub.add_recording(recording)
+        c.add_subcorpus(sub)
+        corpus_file = os.path.join(tmpdir, "corpus.xml")
+        c.dump(corpus_file)
+
+        to_parquet_job = CorpusToParquetJob(Path(corpus_file), rows_per_file=2, row_group_size=1)
+        to_parquet_job.out_dataset = Path(os.path.join(tmpdir, "dataset"))
+        to_parquet_job.run()
+
+        table = load_corpus_table(
+            to_parquet_job.out_dataset.get_path(), ["recording", "speaker", "gender"], [("duration", "<", 20.0)]
+        )
+        assert table.to_pylist() == [
+            {"recording": "116-288045-0000", "speaker": "116", "gender": "male"},
+            {"recording": "rec0", "speaker": "spk", "gender": "female"},
+            {"recording": "rec2", "speaker": "spk", "gender": "female"},
+        ]
+        table = load_corpus_table(to_parquet_job.out_dataset.get_path(), ["recording", "duration"])
+        assert table.to_pylist()[-2:] == [
+            {"recording": "rec2", "duration": 1.0},
+            {"recording": "rec3", "duration": None},
+        ]
+
+        to_corpus_job = ParquetToCorpusJob(to_parquet_job.out_dataset)
+        to_corpus_job.out_corpus = Path(os.path.join(tmpdir, "round_trip.xml"))
+        to_corpus_job.run()
+        assert filecmp.cmp(to_corpus_job.out_corpus.get_path(), corpus_file, shallow=False)
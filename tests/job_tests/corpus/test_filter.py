@@ -0,0 +1,52 @@
+import os
+import tempfile
+
+from sisyphus import setup_path
+
+from i6_core.corpus.filter import FilterCorpusBySegmentsJob
+import i6_core.lib.corpus as libcorpus
+
+Path = setup_path(__package__)
+
+
+def _create_test_corpus(path: str):
+    c = libcorpus.Corpus()
+    c.name = "corpus"
+    subcorpus = libcorpus.Corpus()
+    subcorpus.name = "sub"
+    c.add_subcorpus(subcorpus)
+    for section, rec_name in [(c, "rec1"), (c, "rec2"), (subcorpus, "rec3")]:
+        recording = libcorpus.Recording()
+        recording.name = rec_name
+        recording.audio = rec_name + ".wav"
+        for i in range(3):
+            segment = libcorpus.Segment(start=i, end=i + 1, orth="text %d" % i)
+            segment.name = "seg%d" % i
+            recording.add_segment(segment)
+        section.add_recording(recording)
+    c.dump(path)
+
+
+def test_filter_corpus_by_segments():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        corpus_path = os.path.join(tmpdir, "corpus.xml.gz")
+        _create_test_corpus(corpus_path)
+        segment_file = os.path.join(tmpdir, "segments")
+        with open(segment_file, "wt") as f:
+            f.write("corpus/rec1/seg0\ncorpus/sub/rec3/seg2\ncorpus/rec1/seg2\n")
+
+        job = FilterCorpusBySegmentsJob(Path(corpus_path), Path(segment_file), delete_empty_recordings=True)
+        job.out_corpus = Path(os.path.join(tmpdir, "filtered.xml"))
+        job.out_removed_recordings = Path(os.path.join(tmpdir, "removed_recordings.log"))
+        job.run()
+
+        c = libcorpus.Corpus()
+        c.load(job.out_corpus.get_path())
+        assert [s.fullname() for s in c.segments()] == [
+            "corpus/rec1/seg0",
+            "corpus/rec1/seg2",
+            "corpus/sub/rec3/seg2",
+        ]
+        assert [r.fullname() for r in c.all_recordings()] == ["corpus/rec1", "corpus/sub/rec3"]
+        with open(job.out_removed_recordings.get_path()) as f:
+            assert f.read() == "corpus/rec2"
@@ -0,0 +1,104 @@
+import os
+import tempfile
+import types
+
+import numpy as np
+from sisyphus import setup_path
+
+from i6_core.corpus.segments import SegmentCorpusJob, SortSegmentsByLengthAndShuffleJob, SplitSegmentFileJob
+import i6_core.lib.corpus as libcorpus
+
+Path = setup_path(__package__)
+
+
+def _write_corpus(path, durations):
+    c = libcorpus.Corpus()
+    c.name = "test"
+    for idx, duration in enumerate(durations):
+        recording = libcorpus.Recording()
+        recording.name = "rec%d" % idx
+        recording.audio = "rec%d.wav" % idx
+        segment = libcorpus.Segment()
+        segment.name = "seg"
+        segment.start = 0.0
+        segment.end = duration
+        segment.orth = "a b"
+        recording.add_segment(segment)
+        c.add_recording(recording)
+    c.dump(path)
+
+
+def _read_parts(files):
+    return [open(f.get_path(), "rt").read().split() for f in files]
+
+
+def test_segment_corpus_balanced():
+    durations = [1.0, 1.0, 1.0, 6.0, 1.0, 1.0, 1.0]
+    with tempfile.TemporaryDirectory() as tmpdir:
+        corpus_file = os.path.join(tmpdir, "corpus.xml")
+        _write_corpus(corpus_file, durations)
+
+        job = SegmentCorpusJob(Path(corpus_file), 2, balance_by_duration=True)
+        job.out_single_segment_files = {i: Path(os.path.join(tmpdir, "segments.%d" % i)) for i in [1, 2]}
+        job.run()
+
+        parts = _read_parts(job.out_single_segment_files.values())
+        assert sorted(sum(parts, [])) == sorted("test/rec%d/seg" % i for i in range(len(durations)))
+        assert sorted(len(p) for p in parts) == [1, 6]
+        for part in parts:
+            assert part == sorted(part)  # corpus order is kept within a part
+
+
+def test_split_segment_file_balanced():
+    durations = [5.0, 1.0, 1.0, 1.0, 1.0, 1.0, 4.0]
+    with tempfile.TemporaryDirectory() as tmpdir:
+        corpus_file = os.path.join(tmpdir, "corpus.xml")
+        _write_corpus(corpus_file, durations)
+        segment_file = os.path.join(tmpdir, "segments")
+        with open(segment_file, "wt") as f:
+            f.write("\n".join("test/rec%d/seg" % i for i in range(len(durations))) + "\n")
+
+        job = SplitSegmentFileJob(Path(segment_file), concurrent=2, bliss_corpus=Path(corpus_file))
+        job.out_single_segments = {i: Path(os.path.join(tmpdir, "segments.%d" % i)) for i in [1, 2]}
+        job.run()
+
+        parts = _read_parts(job.out_single_segments.values())
+        totals = sorted(sum(durations[int(s.split("/")[1][3:])] for s in part) for part in parts)
+        assert totals == [7.0, 7.0]
+
+
+def test_sort_segments_by_length_and_shuffle():
+    durations = [float(d) for d in [7, 3, 9, 1, 5, 2, 8, 4, 6, 10]]
+    names = ["test/rec%d/seg" % i for i in range(len(durations))]
+    with tempfile.TemporaryDirectory() as tmpdir:
+        corpus_file = os.path.join(tmpdir, "corpus.xml")
+        _write_corpus(corpus_file, durations)
+        segment_file = os.path.join(tmpdir, "segments")
+        with open(segment_file, "wt") as f:
+            f.write("\n".join(names[1:]) + "\n")
+        crp = types.SimpleNamespace(
+            segment_path=Path(segment_file), corpus_config=types.SimpleNamespace(file=Path(corpus_file))
+        )
+
+        job = SortSegmentsByLengthAndShuffleJob(crp, shuffle_strength=float("inf"))
+        job.out_segments = Path(os.path.join(tmpdir, "sorted"))
+        job.run()
+        result = open(job.out_segments.get_path(), "rt").read().split()
+        assert result == sorted(names[1:], key=lambda n: durations[names.index(n)])
+
+        for sampler in ["choice", "exp_keys"]:
+            job = SortSegmentsByLengthAndShuffleJob(crp, shuffle_strength=1.0, bucket_size=3, sampler=sampler)
+            job.out_segments = Path(os.path.join(tmpdir, "bucketed.%s" % sampler))
+            job.run()
+            result = open(job.out_segments.get_path(), "rt").read().split()
+            assert sorted(result) == sorted(names[1:])
+
+        # the default sampler keeps the order of numpy.random.choice with a global seed
+        job = SortSegmentsByLengthAndShuffleJob(crp, shuffle_strength=0.5, shuffle_seed=42)
+        job.out_segments = Path(os.path.join(tmpdir, "shuffled"))
+        job.run()
+        result = open(job.out_segments.get_path(), "rt").read().split()
+        probs = np.exp(-0.5 * np.array(durations[1:]))
+        probs /= np.sum(probs)
+        np.random.seed(42)
+        assert result == list(np.random.choice(names[1:], size=len(probs), replace=False, p=probs))
@@ -0,0 +1,142 @@
+import concurrent.futures
+import os
+import random
+import sqlite3
+import tempfile
+
+import numpy as np
+import soundfile
+from sisyphus import setup_path
+
+from i6_core.fairseq.manifest import BalanceMultiLingualDatatJob, CreateManifestJob, _get_frames_with_cache
+
+Path = setup_path(__package__)
+
+
+def _write_audio(path, num_frames):
+    soundfile.write(path, np.zeros(num_frames, dtype=np.int16), 16000)
+
+
+def test_get_frames_with_cache():
+    rng = np.random.RandomState(0)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        paths = [os.path.join(tmpdir, "audio%d.wav" % i) for i in range(20)]
+        num_frames = rng.randint(1, 16000, len(paths)).tolist()
+        for path, n in zip(paths, num_frames):
+            _write_audio(path, n)
+        cache_dir = os.path.join(tmpdir, "cache")
+        os.mkdir(cache_dir)
+        cache_file = os.path.join(cache_dir, "frames.db")
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+            assert _get_frames_with_cache(paths, cache_file, executor) == num_frames
+            with sqlite3.connect(cache_file) as connection:
+                rows = connection.execute("SELECT path, size, frames FROM frames ORDER BY path").fetchall()
+            connection.close()
+            assert sorted(rows) == sorted((path, os.path.getsize(path), n) for path, n in zip(paths, num_frames))
+
+            # the cached numbers of unchanged files are used, here a modified entry to see that it is not read again
+            with sqlite3.connect(cache_file) as connection:
+                connection.execute("UPDATE frames SET frames = 1 WHERE path = ?", (paths[0],))
+            connection.close()
+            assert _get_frames_with_cache(paths, cache_file, executor) == [1] + num_frames[1:]
+
+            # changed files are read again and updated in the cache
+            _write_audio(paths[0], 100)
+            os.utime(paths[0], ns=(10**9, 10**9))
+            num_frames[0] = 100
+            new_path = os.path.join(tmpdir, "new.wav")
+            _write_audio(new_path, 200)
+            assert _get_frames_with_cache(paths + [new_path], cache_file, executor) == num_frames + [200]
+            with sqlite3.connect(cache_file) as connection:
+                assert connection.execute("SELECT COUNT(*) FROM frames").fetchone() == (21,)
+                assert connection.execute("SELECT frames FROM frames WHERE path = ?", (paths[0],)).fetchone() == (100,)
+            connection.close()
+
+        # the database is only opened on the local disk, no journal or temporary files next to the cache
+        assert os.listdir(cache_dir) == ["frames.db"]
+
+
+def test_create_manifest():
+    rng = np.random.RandomState(1)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        audio_dirs = []
+        expected = []
+        for lang in ["de", "en"]:
+            audio_dirs.append(os.path.join(tmpdir, "audio", lang))
+            os.makedirs(audio_dirs[-1])
+            for i in range(10):
+                n = rng.randint(1, 16000)
+                _write_audio(os.path.join(audio_dirs[-1], "%d.wav" % i), n)
+                expected.append("%s/%d.wav\t%d\n" % (lang, i, n))
+
+        cwd = os.getcwd()
+        try:
+            for frames_cache in [None, os.path.join(tmpdir, "frames.db"), os.path.join(tmpdir, "frames.db")]:
+                work_dir = tempfile.mkdtemp(dir=tmpdir)
+                os.chdir(work_dir)
+                job = CreateManifestJob([Path(d) for d in audio_dirs], num_threads=3, frames_cache=frames_cache)
+                job.out_tsv_file = Path(os.path.join(work_dir, "data.tsv"))
+                for task_id in range(1, job.concurrent + 1):
+                    job.run(task_id)
+                job.merge()
+                with open(job.out_tsv_file.get_path()) as f:
+                    lines = f.readlines()
+                assert lines[0] == os.path.join(tmpdir, "audio") + "\n"
+                assert sorted(lines[1:]) == sorted(expected)
+        finally:
+            os.chdir(cwd)
+
+
+def _balance_per_file(lines, alpha):
+    """
+    Balancing file by file, as it was done before the vectorization
+    """
+    all_train_data = {}
+    for line in lines:
+        rel_path, frames = line.strip().split("\t")
+        all_train_data.setdefault(os.path.dirname(rel_path), []).append((rel_path, int(frames)))
+    corpora = list(all_train_data.values())
+    corpora_lengths = [sum(frames for _, frames in train_data) for train_data in corpora]
+    corpora_probs = [length / sum(corpora_lengths) for length in corpora_lengths]
+    upsampling_factors = [p**alpha / p for p in corpora_probs]
+    upsampling_factors = [f / min(upsampling_factors) for f in upsampling_factors]
+
+    out = []
+    for train_data, length, upsample in zip(corpora, corpora_lengths, upsampling_factors):
+        while upsample >= 1:
+            out.extend(train_data)
+            upsample -= 1
+        if upsample > 0:
+            added_length = 0
+            random.shuffle(train_data)
+            j = 0
+            while length * upsample > added_length:
+                out.append(train_data[j])
+                added_length += train_data[j][1]
+                j += 1
+    return ["%s\t%d\n" % entry for entry in out]
+
+
+def test_balance_multilingual_data():
+    rng = np.random.RandomState(2)
+    lines = []
+    for lang, num_files in [("de", 300), ("en", 60), ("fr", 15)]:
+        lines += ["%s/%d.wav\t%d\n" % (lang, i, rng.randint(16000, 320000)) for i in range(num_files)]
+    with tempfile.TemporaryDirectory() as tmpdir:
+        train_tsv = os.path.join(tmpdir, "train.tsv")
+        with open(train_tsv, "wt") as f:
+            f.write("/data/audio\n" + "".join(lines))
+        job = BalanceMultiLingualDatatJob(Path(train_tsv), alpha=0.5)
+        job.out_tsv_file = Path(os.path.join(tmpdir, "balanced.tsv"))
+        random.seed(3)
+        job.run()
+        with open(job.out_tsv_file.get_path()) as f:
+            balanced = f.readlines()
+
+    random.seed(3)
+    assert balanced == ["/data/audio\n"] + _balance_per_file(lines, alpha=0.5)
+    # the largest corpus is not up-sampled, the others are at least copied once
+    for lang, num_files in [("de", 300), ("en", 60), ("fr", 15)]:
+        num_lines = sum(line.startswith(lang + "/") for line in balanced)
+        assert num_lines == num_files if lang == "de" else num_lines > num_files
@@ -0,0 +1,133 @@
+import math
+import os
+import tempfile
+
+import h5py
+import numpy as np
+import soundfile
+from sisyphus import setup_path
+
+import i6_core.lib.corpus as corpus
+from i6_core.features.filterbank import filter_width_from_channels
+from i6_core.features.numpy_extraction import NumpyFeatureExtractionJob
+from i6_core.lib.feature_extraction import (
+    add_derivatives,
+    amplitude_spectrum,
+    cepstrum,
+    frame_signal,
+    normalize_features,
+    warped_filterbank,
+    WARPING_FUNCTIONS,
+)
+
+Path = setup_path(__package__)
+
+
+def test_frame_signal():
+    frames = frame_signal(np.arange(10, dtype=np.float32), 1000, window_shift=0.003, window_length=0.004)
+    assert frames.tolist() == [[0, 1, 2, 3], [3, 4, 5, 6], [6, 7, 8, 9]]
+    assert frame_signal(np.arange(3, dtype=np.float32), 1000, 0.003, 0.004).shape == (0, 4)
+
+
+def test_amplitude_spectrum():
+    # 500 Hz is bin 8 of a 256 point FFT at 16 kHz, the amplitude of the bin is amplitude * fft_length / 2
+    t = np.arange(1600) / 16000
+    samples = 1000.0 * np.sin(2 * np.pi * 500 * t)
+    spectrum = amplitude_spectrum(
+        samples, 16000, preemphasis=0.0, window_type="rectangular", window_shift=0.01, window_length=0.016
+    )
+    assert spectrum.shape == (9, 129)
+    np.testing.assert_allclose(spectrum[:, 8], 128000.0, rtol=1e-4)
+    assert spectrum[:, np.arange(129) != 8].max() < 1.0
+
+    # with preemphasis 1 a constant signal becomes an impulse at the first sample
+    spectrum = amplitude_spectrum(np.full(800, 5.0), 16000, window_type="rectangular", window_length=0.016)
+    np.testing.assert_allclose(spectrum[0], 5.0, rtol=1e-6)
+    np.testing.assert_allclose(spectrum[1:], 0.0, atol=1e-6)
+
+
+def test_warping_functions():
+    np.testing.assert_allclose(
+        WARPING_FUNCTIONS["mel"](np.array([0.0, 700.0, 1000.0])), [0.0, 781.1728, 999.9855], rtol=1e-6
+    )
+    np.testing.assert_allclose(WARPING_FUNCTIONS["bark"](np.array([0.0, 600.0])), [0.0, 6.0 * math.asinh(1.0)])
+
+
+def test_warped_filterbank():
+    # the default filter width of the RASR MFCC flow results in 20 filters at 16 kHz
+    assert warped_filterbank(257, 16000, 268.258).shape == (257, 20)
+    for channels in [20, 40]:
+        fb = warped_filterbank(257, 16000, filter_width_from_channels(channels))
+        assert fb.shape == (257, channels)
+        assert fb.min() >= 0.0 and fb.max() <= 1.0
+        # triangles with 50% overlap sum up to one between the center frequencies of the first and the last filter
+        peaks = fb.argmax(axis=0)
+        assert (np.diff(peaks) > 0).all()
+        np.testing.assert_allclose(fb.sum(axis=1)[peaks[0] + 1 : peaks[-1]], 1.0, rtol=1e-5)
+
+
+def test_cepstrum():
+    rng = np.random.RandomState(0)
+    features = np.exp(rng.randn(3, 8)).astype(np.float32)
+    result = cepstrum(features, normalize=False, outputs=4)
+    log_features = np.log(features.astype(np.float64))
+    # DCT-II: c[k] = sum_n x[n] * cos(pi / N * (n + 0.5) * k)
+    reference = [
+        [sum(frame[n] * math.cos(math.pi / 8 * (n + 0.5) * k) for n in range(8)) for k in range(4)]
+        for frame in log_features
+    ]
+    np.testing.assert_allclose(result, reference, rtol=1e-5, atol=1e-5)
+    np.testing.assert_allclose(cepstrum(features, normalize=True, outputs=4).mean(axis=0), 0.0, atol=1e-5)
+
+
+def test_add_derivatives():
+    t = np.arange(10, dtype=np.float32)[:, None]
+    result = add_derivatives(np.concatenate([t, t**2], axis=1), derivatives=2)
+    assert result.shape == (10, 6)
+    np.testing.assert_allclose(result[:, :2], np.concatenate([t, t**2], axis=1))
+    # away from the boundaries the regression is exact for polynomials of degree 2
+    np.testing.assert_allclose(result[2:-2, 2], 1.0, rtol=1e-6)
+    np.testing.assert_allclose(result[2:-2, 3], 2 * t[2:-2, 0], rtol=1e-6)
+    np.testing.assert_allclose(result[2:-2, 4], 0.0, atol=1e-5)
+    np.testing.assert_allclose(result[2:-2, 5], 2.0, rtol=1e-5)
+    # the first frame is repeated at the boundary: (-2 * 0 - 1 * 0 + 1 * 1 + 2 * 2) / 10
+    np.testing.assert_allclose(result[0, 2], 0.5)
+
+
+def test_normalize_features():
+    features = np.array([[1.0, 2.0], [3.0, 2.0], [5.0, 8.0]], dtype=np.float32)
+    result = normalize_features(features, "mean-and-variance")
+    np.testing.assert_allclose(result.mean(axis=0), 0.0, atol=1e-6)
+    np.testing.assert_allclose(result.std(axis=0), 1.0, rtol=1e-6)
+    np.testing.assert_allclose(normalize_features(features, "mean"), [[-2, -2], [0, -2], [2, 4]])
+    np.testing.assert_allclose(normalize_features(features, "divide-by-mean"), [[1 / 3, 0.5], [1, 0.5], [5 / 3, 2]])
+    np.testing.assert_allclose(normalize_features(features, "level"), [[-4, -6], [-2, -6], [0, 0]])
+
+
+def test_numpy_feature_extraction_job_more_outputs_than_segments():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        audio = os.path.join(tmpdir, "audio.wav")
+        soundfile.write(audio, np.random.RandomState(0).randint(-1000, 1000, 16000).astype(np.int16), 16000)
+        c = corpus.Corpus()
+        c.name = "corpus"
+        recording = corpus.Recording()
+        recording.name = "rec"
+        recording.audio = audio
+        for i in range(2):
+            segment = corpus.Segment(start=0.5 * i, end=0.5 * i + 0.5)
+            segment.name = "seg%d" % i
+            recording.add_segment(segment)
+        c.add_recording(recording)
+        corpus_path = os.path.join(tmpdir, "corpus.xml")
+        c.dump(corpus_path)
+
+        job = NumpyFeatureExtractionJob(Path(corpus_path), "mfcc", concurrent=3, output_format="hdf", num_workers=2)
+        job.out_hdf_files = {i: Path(os.path.join(tmpdir, "mfcc.hdf.%d" % i)) for i in range(1, 4)}
+        job.run()
+
+        num_seqs = []
+        for i in range(1, 4):
+            with h5py.File(job.out_hdf_files[i].get_path(), "r") as f:
+                assert f.attrs["inputPattSize"] == 16
+                num_seqs.append(len(f["seqTags"]))
+        assert num_seqs == [1, 1, 0]
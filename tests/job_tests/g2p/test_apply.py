@@ -0,0 +1,149 @@
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+
+from sisyphus import setup_path
+
+from i6_core.g2p.apply import ApplyG2PModelJob
+
+Path = setup_path(__package__)
+
+# minimal stand-in for the sequitur module: two variants per word, words with digits can not be translated
+FAKE_SEQUITUR = """
+import math
+
+
+class Translator:
+    class TranslationFailure(Exception):
+        pass
+
+    class NBest:
+        def __init__(self, variants):
+            self.variants = list(variants)
+            self.logLikTotal = 0.0
+
+    def __init__(self, model):
+        self.model = model
+
+    def nBestInit(self, word):
+        if any(c.isdigit() for c in word):
+            raise self.TranslationFailure("no pronunciation")
+        phonemes = [c.lower() for c in word]
+        return self.NBest(
+            [(math.log(self.model["first"]), phonemes), (math.log(1 - self.model["first"]), phonemes + phonemes[-1:])]
+        )
+
+    def nBestNext(self, n_best):
+        if not n_best.variants:
+            raise StopIteration
+        return n_best.variants.pop(0)
+"""
+
+# stand-in for g2p.py --apply, which writes the variants in the same format as sequitur
+FAKE_G2P = """
+import argparse
+import math
+import pickle
+import sys
+
+from sequitur import Translator
+
+parser = argparse.ArgumentParser()
+parser.add_argument("-e")
+parser.add_argument("-V", type=float)
+parser.add_argument("--variants-number", type=int)
+parser.add_argument("-m")
+parser.add_argument("-a")
+args = parser.parse_args()
+
+with open(args.m, "rb") as f:
+    translator = Translator(pickle.load(f))
+for word in open(args.a, encoding="utf-8").read().split():
+    try:
+        n_best = translator.nBestInit(tuple(word))
+    except Translator.TranslationFailure as exc:
+        sys.stderr.write('failed to convert "%s": %s\\n' % (word, exc))
+        continue
+    total, num = 0.0, 0
+    while total < args.V and num < args.variants_number:
+        try:
+            log_lik, result = translator.nBestNext(n_best)
+        except StopIteration:
+            break
+        posterior = math.exp(log_lik - n_best.logLikTotal)
+        print("%s\\t%d\\t%f\\t%s" % (word, num, posterior, " ".join(result)))
+        total += posterior
+        num += 1
+"""
+
+WORDS = ["HELLO", "A", "WORLD", "R2D2", "HELLO", "SEQUITUR", "AB", "C3PO", "ZEBRA"]
+
+
+def _read(path):
+    with open(path, "rt", encoding="utf-8") as f:
+        return f.read()
+
+
+def _run_job(job, tmpdir, name, steps):
+    work_dir = os.path.join(tmpdir, name)
+    os.makedirs(work_dir)
+    job.out_g2p_lexicon = Path(os.path.join(work_dir, "g2p.lexicon"))
+    job.out_g2p_untranslated = Path(os.path.join(work_dir, "g2p.untranslated"))
+    cwd = os.getcwd()
+    os.chdir(work_dir)
+    try:
+        for step in steps:
+            step()
+    finally:
+        os.chdir(cwd)
+    return _read(job.out_g2p_lexicon.get_path()), _read(job.out_g2p_untranslated.get_path())
+
+
+def test_apply_g2p_pool_and_cache():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        g2p_dir = os.path.join(tmpdir, "sequitur")
+        os.makedirs(g2p_dir)
+        with open(os.path.join(g2p_dir, "sequitur.py"), "wt") as f:
+            f.write(FAKE_SEQUITUR)
+        with open(os.path.join(g2p_dir, "g2p.py"), "wt") as f:
+            f.write(FAKE_G2P)
+        model = os.path.join(tmpdir, "model")
+        with open(model, "wb") as f:
+            pickle.dump({"first": 0.75}, f)
+        word_list = os.path.join(tmpdir, "words")
+        with open(word_list, "wt") as f:
+            f.write("\n".join(WORDS) + "\n")
+
+        # both g2p.py and lib/sequitur_apply.py import sequitur from the folder of g2p.py
+        kwargs = dict(
+            g2p_model=Path(model),
+            word_list_file=Path(word_list),
+            variants_mass=0.9,
+            variants_number=2,
+            g2p_path=Path(os.path.join(g2p_dir, "g2p.py")),
+            g2p_python=Path(sys.executable),
+        )
+        job = ApplyG2PModelJob(concurrent=2, **kwargs)
+        sequential = _run_job(
+            job, tmpdir, "sequential", [job.split_word_list, lambda: job.run(1), lambda: job.run(2), job.merge]
+        )
+        assert sequential[0].count("\n") == 2 * (len(WORDS) - 2)
+        assert sequential[1].count("failed to convert") == 2
+
+        cache_dir = os.path.join(tmpdir, "cache")
+        job = ApplyG2PModelJob(num_workers=3, cache_dir=cache_dir, **kwargs)
+        assert _run_job(job, tmpdir, "pool", [job.run_pool]) == sequential
+        assert len(os.listdir(cache_dir)) == 1
+
+        # all words are served from the cache, the translation would fail without the sequitur module
+        os.remove(os.path.join(g2p_dir, "sequitur.py"))
+        shutil.rmtree(os.path.join(g2p_dir, "__pycache__"), ignore_errors=True)
+        job = ApplyG2PModelJob(num_workers=3, cache_dir=cache_dir, **kwargs)
+        assert _run_job(job, tmpdir, "cached", [job.run_pool]) == sequential
+        assert not os.path.exists(os.path.join(tmpdir, "cached", "words.todo"))
+
+        # a different variant setting uses another cache
+        job = ApplyG2PModelJob(num_workers=3, cache_dir=cache_dir, **dict(kwargs, variants_number=1))
+        assert job._cache_key() + ".jsonl" not in os.listdir(cache_dir)
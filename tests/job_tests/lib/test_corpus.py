@@ -0,0 +1,119 @@
+import gzip
+import os
+import tempfile
+
+import pytest
+
+from i6_core.lib import corpus
+
+
+def _build_corpus():
+    """
+    Corpus with speakers, a default speaker and segments with all combinations of the optional fields
+    """
+    c = corpus.Corpus()
+    c.name = "test"
+    for name, attribs in [("spk1", {"gender": "female"}), ("spk2", {})]:
+        speaker = corpus.Speaker()
+        speaker.name = name
+        speaker.attribs = attribs
+        c.add_speaker(speaker)
+    c.speaker_name = "spk1"
+    for r in range(3):
+        recording = corpus.Recording()
+        recording.name = "rec%d" % r
+        recording.audio = "/data/rec%d.wav" % r
+        if r == 1:
+            recording.speaker_name = "spk2"
+        for s in range(32):
+            segment = corpus.Segment(
+                start=0.5 * s,
+                end=0.5 * s + 0.4321,
+                track=s if s & 1 else None,
+                speaker_name="spk2" if s & 2 else None,
+                orth="a <b> & 'c' %d" % s if s & 4 else None,
+                left_context_orth="left & %d" % s if s & 8 else None,
+                right_context_orth="right < %d" % s if s & 16 else None,
+            )
+            segment.name = "seg%d" % s
+            recording.add_segment(segment)
+        c.add_recording(recording)
+    return c
+
+
+def _read_bytes(path):
+    open_fun = gzip.open if path.endswith(".gz") else open
+    with open_fun(path, "rb") as f:
+        return f.read()
+
+
+def test_corpus_dump_format():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "corpus.xml")
+        _build_corpus().dump(path)
+        with open(path, "rt") as f:
+            lines = f.readlines()
+
+    assert lines[:13] == [
+        '<?xml version="1.0" encoding="utf-8"?>\n',
+        '<corpus name="test">\n',
+        '  <speaker-description name="spk1">\n',
+        "    <gender>female</gender>\n",
+        "  </speaker-description>\n",
+        '  <speaker-description name="spk2"></speaker-description>\n',
+        '  <speaker name="spk1"/>\n',
+        '  <recording name="rec0" audio="/data/rec0.wav">\n',
+        '    <segment name="seg0" start="0.0000" end="0.4321"></segment>\n',
+        '    <segment name="seg1" start="0.5000" end="0.9321" track="1"></segment>\n',
+        '    <segment name="seg2" start="1.0000" end="1.4321">\n',
+        '      <speaker name="spk2"/>\n',
+        "    </segment>\n",
+    ]
+    assert lines[26:32] == [
+        '    <segment name="seg7" start="3.5000" end="3.9321" track="7">\n',
+        '      <speaker name="spk2"/>\n',
+        "      <orth> a &lt;b&gt; &amp; 'c' 7 </orth>\n",
+        "    </segment>\n",
+        '    <segment name="seg8" start="4.0000" end="4.4321">'
+        "      <left-context-orth> left &amp; 8 </left-context-orth>\n",
+        "</segment>\n",
+    ]
+    assert lines[-1] == "</corpus>\n"
+
+
+@pytest.mark.parametrize("extension,num_threads", [("xml", 1), ("xml.gz", 1), ("xml.gz", 3)])
+def test_corpus_writer(extension, num_threads):
+    c = _build_corpus()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        dump_path = os.path.join(tmpdir, "dump." + extension)
+        c.dump(dump_path, num_threads=num_threads)
+
+        writer_path = os.path.join(tmpdir, "writer." + extension)
+        with corpus.CorpusWriter(
+            writer_path, c.name, c.speakers.values(), speaker_name=c.speaker_name, num_threads=num_threads
+        ) as writer:
+            writer.write_recording(c.recordings[0])
+            writer.write_recordings(iter(c.recordings[1:]))
+        assert writer.out.closed
+        writer.close()
+
+        # byte-identical for plain files, the decompressed content for .gz files
+        assert _read_bytes(writer_path) == _read_bytes(dump_path)
+        # the corpus is read back unchanged
+        c_read = corpus.Corpus()
+        c_read.load(writer_path)
+        read_path = os.path.join(tmpdir, "read.xml")
+        c_read.dump(read_path)
+        assert _read_bytes(read_path) == _read_bytes(dump_path)
+
+
+def test_corpus_writer_empty():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "corpus.xml.gz")
+        with corpus.CorpusWriter(path, "empty", num_threads=2):
+            pass
+        c = corpus.Corpus()
+        c.name = "empty"
+        dump_path = os.path.join(tmpdir, "dump.xml")
+        c.dump(dump_path)
+        assert _read_bytes(path) == _read_bytes(dump_path)
@@ -0,0 +1,57 @@
+import gzip
+import io
+import os
+import tempfile
+import zlib
+
+import numpy as np
+import pytest
+
+from i6_core.lib.parallel_gzip import ParallelGzipWriter
+
+BLOCK_SIZE = 64
+
+
+@pytest.mark.parametrize(
+    "size",
+    [0, 1, BLOCK_SIZE - 1, BLOCK_SIZE, BLOCK_SIZE + 1, 3 * BLOCK_SIZE, 20 * BLOCK_SIZE, 20 * BLOCK_SIZE + 7],
+)
+@pytest.mark.parametrize("write_size", [1, 10, BLOCK_SIZE, 5 * BLOCK_SIZE])
+def test_parallel_gzip_writer(size, write_size):
+    data = np.random.RandomState(size).randint(0, 4, size, dtype=np.uint8).tobytes()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "out.gz")
+        # more blocks than the writer keeps in memory with two threads
+        writer = ParallelGzipWriter(path, compress_level=6, num_threads=2, block_size=BLOCK_SIZE)
+        for pos in range(0, size, write_size):
+            assert writer.write(data[pos : pos + write_size]) == len(data[pos : pos + write_size])
+        writer.close()
+        assert writer.closed
+        writer.close()
+
+        with gzip.open(path, "rb") as f:
+            assert f.read() == data
+        with open(path, "rb") as f:
+            compressed = f.read()
+
+    # one gzip member per started block, an empty input is one empty member and not an empty file
+    num_members = 0
+    while compressed:
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        decompressor.decompress(compressed)
+        assert decompressor.eof
+        compressed = decompressor.unused_data
+        num_members += 1
+    assert num_members == max((size + BLOCK_SIZE - 1) // BLOCK_SIZE, 1)
+
+
+def test_parallel_gzip_writer_text():
+    lines = ["line %d äöü\n" % i for i in range(1000)]
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "out.txt.gz")
+        raw = ParallelGzipWriter(path, num_threads=3, block_size=1000)
+        with io.TextIOWrapper(io.BufferedWriter(raw, buffer_size=333), encoding="utf-8") as f:
+            f.writelines(lines)
+        assert raw.closed
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            assert f.readlines() == lines
@@ -0,0 +1,319 @@
+import os
+import struct
+import tempfile
+
+import numpy as np
+import pytest
+
+from i6_core.lib.rasr_cache import (
+    AllophoneLabeling,
+    FileArchive,
+    FileInfo,
+    MixtureSet,
+    merge_mixture_sets,
+    mixture_statistics,
+    split_emission_idxs,
+)
+
+
+def _mixture_set_bytes(dim, means, covs, densities, mixtures):
+    """
+    Mixture set file written record by record like RASR
+
+    :param int dim:
+    :param list[(list[float],float)] means: accumulated values and weight per mean
+    :param list[(list[float],float)] covs: accumulated values and weight per covariance
+    :param list[(int,int)] densities: mean and covariance index per density
+    :param list[(list[int],list[float])] mixtures: density indices and weights per mixture
+    :rtype: bytes
+    """
+    data = b"MIXSET\0t" + struct.pack("ii", 1, dim)
+    for vectors in [means, covs]:
+        data += struct.pack("i", len(vectors))
+        for values, weight in vectors:
+            data += struct.pack("i", dim) + struct.pack("%dd" % dim, *values) + struct.pack("d", weight)
+    data += struct.pack("i", len(densities))
+    for mean_idx, cov_idx in densities:
+        data += struct.pack("ii", mean_idx, cov_idx)
+    data += struct.pack("i", len(mixtures))
+    for idxs, weights in mixtures:
+        data += struct.pack("i", len(idxs))
+        for idx, weight in zip(idxs, weights):
+            data += struct.pack("=id", idx, weight)
+    return data
+
+
+def _accumulated_mixture_set(scale):
+    """
+    Three mixtures with one, zero and three densities, the statistics are multiplied by `scale`
+    """
+    means = [([1.0 * scale, 2.0 * scale], 2.0 * scale), ([-3.0 * scale, 0.5 * scale], 1.0 * scale)]
+    means.append(([0.25 * scale, 4.0 * scale], 4.0 * scale))
+    covs = [([4.0 * scale, 1.0 * scale], 2.0 * scale), ([9.0 * scale, 0.125 * scale], 1.0 * scale)]
+    densities = [(0, 0), (1, 1), (2, 1), (1, 0)]
+    mixtures = [([0], [1.0 * scale]), ([], []), ([1, 2, 3], [0.5 * scale, 0.25 * scale, 0.25 * scale])]
+    return _mixture_set_bytes(2, means, covs, densities, mixtures)
+
+
+def test_mixture_set_read_write():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "mixtures")
+        with open(path, "wb") as f:
+            f.write(_accumulated_mixture_set(1.0))
+
+        m = MixtureSet(path)
+        assert (m.version, m.dim) == (1, 2)
+        assert (m.num_means, m.num_covs, m.num_densities, m.getNumberMixtures()) == (3, 2, 4, 3)
+        np.testing.assert_array_equal(m.getMeanByIdx(1), [-3.0, 0.5])
+        np.testing.assert_array_equal(m.getCovByIdx(0), [2.0, 0.5])
+        np.testing.assert_array_equal(m.densities, [[0, 0], [1, 1], [2, 1], [1, 0]])
+        assert m.mixtures == (((0,), (1.0,)), ((), ()), ((1, 2, 3), (0.5, 0.25, 0.25)))
+        # the mixtures cannot be changed through the copy
+        with pytest.raises(TypeError):
+            m.mixtures[0] = ([1], [1.0])
+        with pytest.raises(AttributeError):
+            m.mixtures = []
+        with pytest.raises(AttributeError, match="MixtureSet.write"):
+            m.write_u32(0)
+        idxs, weights = m.getMixtureDensities(2)
+        assert idxs.tolist() == [1, 2, 3] and weights.tolist() == [0.5, 0.25, 0.25]
+
+        out_path = os.path.join(tmpdir, "mixtures.out")
+        m.write(out_path)
+        with open(out_path, "rb") as f:
+            assert f.read() == _accumulated_mixture_set(1.0)
+
+        # the mixtures set as lists are written in the same layout
+        m.setMixtures([([0], [1.0]), ([], []), ([1, 2, 3], [0.5, 0.25, 0.25])])
+        m.write(out_path)
+        with open(out_path, "rb") as f:
+            assert f.read() == _accumulated_mixture_set(1.0)
+
+        empty_path = os.path.join(tmpdir, "empty")
+        MixtureSet().write(empty_path)
+        with open(empty_path, "rb") as f:
+            assert f.read() == _mixture_set_bytes(0, [], [], [], [])
+        assert MixtureSet(empty_path).num_mixtures == 0
+
+
+def test_merge_mixture_sets():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        paths = []
+        for scale in [1.0, 2.0, 0.5]:
+            paths.append(os.path.join(tmpdir, "mixtures.%g" % scale))
+            with open(paths[-1], "wb") as f:
+                f.write(_accumulated_mixture_set(scale))
+
+        # summed accumulators are the accumulators scaled by the sum of the scales
+        merged = merge_mixture_sets([paths[0], MixtureSet(paths[1]), paths[2]])
+        merged_path = os.path.join(tmpdir, "merged")
+        merged.write(merged_path)
+        with open(merged_path, "rb") as f:
+            assert f.read() == _accumulated_mixture_set(3.5)
+        # the inputs are not modified
+        assert MixtureSet(paths[0]).means.tolist() == [[1.0, 2.0], [-3.0, 0.5], [0.25, 4.0]]
+
+        stats = mixture_statistics(merged)
+        assert stats["num_densities"].tolist() == [1, 0, 3]
+        np.testing.assert_allclose(stats["weight"], [3.5, 0.0, 3.5])
+        # observation counts: mean weights of the densities of each mixture
+        np.testing.assert_allclose(stats["count"], [7.0, 0.0, 3.5 + 14.0 + 3.5])
+        # variances: [2.0, 0.5] and [9.0, 0.125]
+        np.testing.assert_allclose(stats["min_variance"], [0.5, np.inf, 0.125])
+
+        other = MixtureSet(paths[0])
+        other.setMixtures([([0], [1.0]), ([1], [1.0]), ([1, 2, 3], [0.5, 0.25, 0.25])])
+        with pytest.raises(AssertionError, match="the mixtures differ"):
+            merge_mixture_sets([paths[0], other])
+
+
+def _add_rle_entry(archive, name, num_frames, body):
+    """
+    Writes an alignment entry with the given run-length encoded body, like FileArchive.addAlignmentCache
+    """
+    archive.write_U32(archive.start_recovery_tag)
+    archive.write_u32(len(name))
+    archive.write_str(name)
+    pos = archive.f.tell()
+    size = 4 + 14 + 4 + 8 + 4 + len(body)
+    archive.write_u32(size)
+    archive.write_u32(0)
+    archive.write_u32(0)
+    archive.write_u32(14)
+    archive.write_str("flow-alignment")
+    archive.write_u32(0)
+    archive.write_str("ALIGNRLE")
+    archive.write_U32(num_frames)
+    archive.f.write(body)
+    archive.ft[name] = FileInfo(name, pos, size, 0, len(archive.ft))
+    archive.write_U32(archive.end_recovery_tag)
+
+
+def test_rle_alignment_array():
+    num_allophones = 5
+    rng = np.random.RandomState(42)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "alignment.cache")
+        allophone_file = os.path.join(tmpdir, "allophones")
+        with open(allophone_file, "wt") as f:
+            f.write("# allophones\n" + "\n".join("a%d{#+#}" % i for i in range(num_allophones)) + "\n")
+
+        archive = FileArchive(path, must_exists=False)
+        alignments = {}
+        for i in range(5):
+            # long runs of the same emission and time jumps
+            num_frames = rng.randint(1, 400)
+            times = np.cumsum(rng.choice([1, 1, 1, 1, 3], num_frames))
+            allophones = np.repeat(rng.randint(0, num_allophones, num_frames), rng.randint(1, 300, num_frames))
+            states = np.repeat(rng.randint(0, 6, num_frames), rng.randint(1, 50, num_frames))
+            alignments["seg%d" % i] = list(zip(times, allophones[:num_frames], states[:num_frames]))
+        alignments["empty"] = []
+        for name, alignment in alignments.items():
+            archive.addAlignmentCache(name, alignment)
+        # blocks of single emissions and runs, as written by RASR, with a time jump in between
+        body = struct.pack("=biii", 3, 1, 2 + (1 << 26), 3) + struct.pack("=bi", -4, 4 + (5 << 26))
+        body += struct.pack("=bi", 0, 20) + struct.pack("=bii", 2, 0 + (2 << 26), 1)
+        _add_rle_entry(archive, "blocks", 9, body)
+        alignments["blocks"] = [(0, 1, 0), (1, 2, 1), (2, 3, 0)] + [(t, 4, 5) for t in range(3, 7)]
+        alignments["blocks"] += [(20, 0, 2), (21, 1, 0)]
+        archive.finalize()
+        archive.f.close()
+
+        archive = FileArchive(path)
+        archive.setAllophones(allophone_file)
+        for name, alignment in alignments.items():
+            times, allophones, states = archive.read(name, "align_array")
+            assert times.dtype == allophones.dtype == states.dtype == np.int64
+            assert list(zip(times, allophones, states)) == [tuple(a) for a in alignment]
+            assert [(t, a, s) for t, a, s, _ in archive.read(name, "align")] == list(zip(times, allophones, states))
+
+
+def test_split_emission_idxs():
+    num_allophones = 7
+    rng = np.random.RandomState(0)
+    emission_idxs = rng.randint(0, num_allophones, 1000) + (rng.randint(0, 6, 1000) << 26)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        archive = FileArchive(os.path.join(tmpdir, "alignment.cache"), must_exists=False)
+        archive.allophones = ["a%d" % i for i in range(num_allophones)]
+        allophones, states = split_emission_idxs(emission_idxs, num_allophones)
+        assert list(zip(allophones, states)) == [archive.getState(int(idx)) for idx in emission_idxs]
+        archive.f.close()
+    allophones, states = split_emission_idxs(emission_idxs.reshape(10, 100), num_allophones)
+    assert allophones.shape == states.shape == (10, 100)
+    assert split_emission_idxs([], num_allophones)[0].shape == (0,)
+
+
+def _write_labeling_files(tmpdir, allophones, state_tying):
+    allophone_file = os.path.join(tmpdir, "allophones")
+    with open(allophone_file, "wt") as f:
+        f.write("# allophones\n" + "\n".join(allophones) + "\n")
+    state_tying_file = os.path.join(tmpdir, "state-tying")
+    with open(state_tying_file, "wt") as f:
+        f.write("".join("%s %d\n" % (k, v) for k, v in state_tying.items()))
+    return allophone_file, state_tying_file
+
+
+def _random_state_tying(rng, allophones, num_states=3):
+    state_tying = {"si{#+#}@i@f.0": 0}
+    for allo in allophones[1:]:
+        for state in range(num_states):
+            # some allophone states have no label
+            if rng.rand() < 0.8:
+                state_tying["%s.%d" % (allo, state)] = rng.randint(1, 20)
+    # entries of allophones which are not in the allophone file are ignored
+    state_tying["x{a+b}.0"] = 20
+    return state_tying
+
+
+def test_allophone_labeling():
+    rng = np.random.RandomState(3)
+    allophones = ["si{#+#}@i@f"] + ["%s{%s+%s}" % (c, l, r) for c in "abc" for l in "#abc" for r in "#abc"]
+    state_tying = _random_state_tying(rng, allophones)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        allophone_file, state_tying_file = _write_labeling_files(tmpdir, allophones, state_tying)
+        labeling = AllophoneLabeling("si", allophone_file, state_tying_file=state_tying_file)
+
+    assert labeling.num_labels == 21 and labeling.num_allo_states == 3
+    assert labeling.label_table.shape == (len(allophones), 3)
+    for allo_idx, allo in enumerate(allophones):
+        for state in range(3):
+            assert labeling.label_table[allo_idx, state] == state_tying.get("%s.%d" % (allo, state), -1)
+
+    # the batch lookup gives the labels of the per-label lookup
+    allo_idxs, state_idxs = np.nonzero(labeling.label_table >= 0)
+    order = rng.permutation(len(allo_idxs))
+    allo_idxs, state_idxs = allo_idxs[order], state_idxs[order]
+    labels = labeling.get_label_idxs(allo_idxs, state_idxs)
+    assert labels.tolist() == [state_tying["%s.%d" % (allophones[a], s)] for a, s in zip(allo_idxs, state_idxs)]
+    assert labels.tolist() == [labeling.get_label_idx(int(a), int(s)) for a, s in zip(allo_idxs, state_idxs)]
+    emission_idxs = allo_idxs + (state_idxs << 26)
+    assert (
+        labeling.get_label_idxs_by_allo_state_idxs(emission_idxs.reshape(-1, 1)).reshape(-1).tolist() == labels.tolist()
+    )
+    assert labels.tolist() == [labeling.get_label_idx_by_allo_state_idx(int(idx)) for idx in emission_idxs]
+    assert labeling.state_tying_by_allo_state_idx == dict(zip(emission_idxs.tolist(), labels.tolist()))
+
+    missing_allo, missing_state = np.argwhere(labeling.label_table < 0)[0]
+    with pytest.raises(KeyError, match="state idx %d not found" % missing_state):
+        labeling.get_label_idxs(np.append(allo_idxs, missing_allo), np.append(state_idxs, missing_state))
+    with pytest.raises(KeyError, match="state idx 5 not found"):
+        labeling.get_label_idx(1, 5)
+
+
+def test_allophone_labeling_phonemes():
+    allophones = ["si{#+#}@i@f", "a{#+b}@i", "b{a+#}@f", "c{b+a}"]
+    with tempfile.TemporaryDirectory() as tmpdir:
+        allophone_file = os.path.join(tmpdir, "allophones")
+        with open(allophone_file, "wt") as f:
+            f.write("\n".join(allophones) + "\n")
+        phoneme_file = os.path.join(tmpdir, "phonemes")
+        with open(phoneme_file, "wt") as f:
+            f.write("si\nb\na\n")
+        labeling = AllophoneLabeling("si", allophone_file, phoneme_file=phoneme_file)
+
+    assert labeling.num_labels == 3 and labeling.sil_label_idx == 0
+    assert labeling.get_label_idxs(np.array([0, 1, 2, 1]), np.array([0, 2, 1, 5])).tolist() == [0, 2, 1, 2]
+    with pytest.raises(KeyError, match="c"):
+        labeling.get_label_idx(3, 0)
+
+
+def test_allophone_labeling_cache():
+    rng = np.random.RandomState(4)
+    allophones = ["si{#+#}@i@f", "a{#+b}", "b{a+#}", "a{b+a}"]
+    state_tying = _random_state_tying(rng, allophones)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        allophone_file, state_tying_file = _write_labeling_files(tmpdir, allophones, state_tying)
+        os.utime(state_tying_file, (1000, 1000))
+        table = AllophoneLabeling("si", allophone_file, state_tying_file=state_tying_file).label_table
+        assert [f for f in os.listdir(tmpdir) if f.endswith(".npy")] == []
+
+        labeling = AllophoneLabeling("si", allophone_file, state_tying_file=state_tying_file, cache_label_table=True)
+        np.testing.assert_array_equal(labeling.label_table, table)
+        (cache_file,) = [os.path.join(tmpdir, f) for f in os.listdir(tmpdir) if f.endswith(".npy")]
+        assert os.path.basename(cache_file).startswith("state-tying.labels.")
+        np.testing.assert_array_equal(np.load(cache_file), table)
+
+        # a newer cache file is reused, here a modified one to see that it is not rebuilt
+        np.save(cache_file, table + 100)
+        labeling = AllophoneLabeling("si", allophone_file, state_tying_file=state_tying_file, cache_label_table=True)
+        np.testing.assert_array_equal(labeling.label_table, table + 100)
+
+        # a cache file older than the state tying is rebuilt
+        os.utime(cache_file, (500, 500))
+        labeling = AllophoneLabeling("si", allophone_file, state_tying_file=state_tying_file, cache_label_table=True)
+        np.testing.assert_array_equal(labeling.label_table, table)
+        np.testing.assert_array_equal(np.load(cache_file), table)
+
+        # a cache file of the wrong shape is rebuilt
+        np.save(cache_file, table[:2])
+        labeling = AllophoneLabeling("si", allophone_file, state_tying_file=state_tying_file, cache_label_table=True)
+        np.testing.assert_array_equal(labeling.label_table, table)
+
+        # other allophones use another cache file
+        with open(allophone_file, "wt") as f:
+            f.write("\n".join(allophones[::-1]) + "\n")
+        labeling = AllophoneLabeling("si", allophone_file, state_tying_file=state_tying_file, cache_label_table=True)
+        np.testing.assert_array_equal(labeling.label_table, table[::-1])
+        cache_files = sorted(f for f in os.listdir(tmpdir) if f.endswith(".npy"))
+        assert len(cache_files) == 2 and os.path.basename(cache_file) in cache_files
+        assert [f for f in os.listdir(tmpdir) if ".tmp" in f] == []
@@ -0,0 +1,119 @@
+import os
+import tempfile
+
+import numpy as np
+import pytest
+
+from i6_core.lib.rasr_cache import FileArchive, open_file_archive
+from i6_core.lib.rasr_cache_dataset import RasrCacheDataset
+
+ALLOPHONES = ["[SILENCE]{#+#}@i@f", "a{#+b}", "b{a+#}"]
+
+
+def _write_caches(tmpdir, dim, num_segments=12, num_caches=2):
+    """
+    Writes feature and alignment caches of random segments, split into `num_caches` caches with a bundle each
+
+    :return: feature bundle, alignment bundle, allophone file, features and alignments per segment
+    """
+    rng = np.random.RandomState(dim)
+    features = {}
+    alignments = {}
+    feature_caches = []
+    alignment_caches = []
+    for part in range(num_caches):
+        feature_caches.append(os.path.join(tmpdir, "features.cache.%d" % (part + 1)))
+        alignment_caches.append(os.path.join(tmpdir, "alignment.cache.%d" % (part + 1)))
+        feature_archive = FileArchive(feature_caches[-1], must_exists=False)
+        alignment_archive = FileArchive(alignment_caches[-1], must_exists=False)
+        for i in range(part, num_segments, num_caches):
+            name = "corpus/rec%d/seg" % i
+            num_frames = rng.randint(1, 300)
+            features[name] = rng.randn(num_frames, dim).astype(np.float32)
+            times = [(0.01 * t, 0.01 * t + 0.025) for t in range(num_frames)]
+            feature_archive.addFeatureCache(name, features[name], times)
+            # runs of silence and speech, some of them longer than the maximum run length of the cache format
+            allophones = np.repeat(rng.randint(0, len(ALLOPHONES), num_frames), rng.randint(1, 200, num_frames))
+            allophones = allophones[:num_frames]
+            states = np.where(allophones == 0, 0, rng.randint(0, 3, num_frames))
+            alignments[name] = allophones + (states << 26)
+            alignment_archive.addAlignmentCache(name, list(zip(range(num_frames), allophones, states)))
+        for archive in [feature_archive, alignment_archive]:
+            archive.finalize()
+            archive.f.close()
+
+    feature_bundle = os.path.join(tmpdir, "features.cache.bundle")
+    alignment_bundle = os.path.join(tmpdir, "alignment.cache.bundle")
+    for bundle, caches in [(feature_bundle, feature_caches), (alignment_bundle, alignment_caches)]:
+        with open(bundle, "wt") as f:
+            f.write("\n".join(caches) + "\n")
+    allophone_file = os.path.join(tmpdir, "allophones")
+    with open(allophone_file, "wt") as f:
+        f.write("# allophones\n" + "\n".join(ALLOPHONES) + "\n")
+    return feature_bundle, alignment_bundle, allophone_file, features, alignments
+
+
+@pytest.mark.parametrize("dim", [1, 5])
+def test_read_arrays(dim):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        feature_bundle, alignment_bundle, allophone_file, features, alignments = _write_caches(tmpdir, dim)
+        feature_archive = open_file_archive(feature_bundle)
+        alignment_archive = open_file_archive(alignment_bundle)
+        alignment_archive.setAllophones(allophone_file)
+        for name in features:
+            times, feats = feature_archive.read(name, "feat_array")
+            ref_times, ref_feats = feature_archive.read(name, "feat")
+            assert feats.dtype == np.float32 and feats.shape == features[name].shape
+            np.testing.assert_array_equal(feats, np.stack(ref_feats))
+            np.testing.assert_array_equal(feats, features[name])
+            np.testing.assert_array_equal(times, np.stack(ref_times))
+
+            times, allophones, states = alignment_archive.read(name, "align_array")
+            alignment = alignment_archive.read(name, "align")
+            assert [(t, a, s) for t, a, s, _ in alignment] == list(zip(times, allophones, states))
+            np.testing.assert_array_equal(times, np.arange(len(features[name])))
+            np.testing.assert_array_equal(allophones + (states << 26), alignments[name])
+
+
+@pytest.mark.parametrize("dim", [1, 5])
+def test_rasr_cache_dataset(dim):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        feature_bundle, alignment_bundle, allophone_file, features, alignments = _write_caches(tmpdir, dim)
+        dataset = RasrCacheDataset(
+            {"features": feature_bundle}, {"classes": alignment_bundle}, allophone_file=allophone_file
+        )
+        assert sorted(dataset.segment_names) == sorted(features)
+        # the lengths derived from the entry sizes are the real numbers of frames
+        np.testing.assert_array_equal(dataset.lengths, [len(features[name]) for name in dataset.segment_names])
+
+        max_frames = 600
+        batches = dataset.get_batch_indices(max_seqs=3, max_frames=max_frames, sort_window=4)
+        assert sorted(np.concatenate(batches).tolist()) == list(range(len(dataset)))
+        for indices in batches:
+            assert 0 < len(indices) <= 3
+            assert len(indices) == 1 or dataset.lengths[indices].max() * len(indices) <= max_frames
+
+            batch = dataset.get_batch(indices)
+            assert batch.segment_names == [dataset.segment_names[idx] for idx in indices]
+            max_len = dataset.lengths[indices].max()
+            assert batch.data["features"].shape == (len(indices), max_len, dim)
+            assert batch.data["classes"].shape == (len(indices), max_len)
+            for i, name in enumerate(batch.segment_names):
+                length = len(features[name])
+                assert batch.lengths["features"][i] == batch.lengths["classes"][i] == length
+                np.testing.assert_array_equal(batch.data["features"][i, :length], features[name])
+                np.testing.assert_array_equal(batch.data["classes"][i, :length], alignments[name])
+                assert (batch.data["features"][i, length:] == 0).all()
+                assert (batch.data["classes"][i, length:] == 0).all()
+
+        # without shuffling the batches are consecutive and only limited by max_seqs
+        batches = dataset.get_batch_indices(max_seqs=5, shuffle=False)
+        assert [indices.tolist() for indices in batches] == [[0, 1, 2, 3, 4], [5, 6, 7, 8, 9], [10, 11]]
+
+        # iterate_batches reads the same batches in background threads
+        seen = []
+        for batch in dataset.iterate_batches(max_seqs=3, max_frames=max_frames, sort_window=4, num_workers=3):
+            seen += batch.segment_names
+        assert sorted(seen) == sorted(features)
+        assert dataset.counters.num_segments == len(features)
+        assert dataset.counters.num_frames == sum(len(feats) for feats in features.values())
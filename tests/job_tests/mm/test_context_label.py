@@ -0,0 +1,157 @@
+import os
+import tempfile
+
+import h5py
+import numpy as np
+import pytest
+from sisyphus import setup_path
+
+from i6_core.lib.rasr_cache import FileArchive
+from i6_core.mm.context_label import DenseLabelInfo, GetPhonemeLabelsFromNoTyingDense
+
+Path = setup_path(__package__)
+
+CONTEXTS = ["#", "a", "b", "c"]
+
+
+def _decompose_per_label(dense_label, dense_label_info):
+    """
+    Decomposition of a single dense label, as it was done frame by frame
+    """
+    future_label = dense_label % dense_label_info.n_contexts
+    pop_future_label = dense_label // dense_label_info.n_contexts
+    past_label = pop_future_label % dense_label_info.n_contexts
+    center_state = pop_future_label // dense_label_info.n_contexts
+    if dense_label_info.use_word_end_classes:
+        center_state = center_state // 2
+    if dense_label_info.use_boundary_classes:
+        center_state = center_state // 4
+    center_label = center_state // dense_label_info.num_hmm_states_per_phon
+    return future_label, center_label, past_label
+
+
+@pytest.mark.parametrize("use_word_end_classes,use_boundary_classes", [(False, False), (True, False), (False, True)])
+def test_get_target_labels_from_dense(use_word_end_classes, use_boundary_classes):
+    info = DenseLabelInfo(
+        n_contexts=5,
+        use_word_end_classes=use_word_end_classes,
+        use_boundary_classes=use_boundary_classes,
+        num_hmm_states_per_phon=3,
+    )
+    dense_labels = np.arange(info.num_triphone_labels())
+    future, center, past = GetPhonemeLabelsFromNoTyingDense.get_target_labels_from_dense(dense_labels, info)
+    expected = [_decompose_per_label(int(label), info) for label in dense_labels]
+    assert list(zip(future.tolist(), center.tolist(), past.tolist())) == expected
+    assert GetPhonemeLabelsFromNoTyingDense.get_target_labels_from_dense(int(dense_labels[-1]), info) == expected[-1]
+
+
+def _write_inputs(tmpdir, info, num_caches=2, num_segments=7):
+    """
+    Writes alignment caches with a bundle, the allophones and a dense tying with word end classes
+
+    :return: bundle, allophone file, dense tying file and the (past, center, future) labels per segment
+    """
+    rng = np.random.RandomState(5)
+    allophones = []
+    contexts = []
+    dense_tying = {}
+    for center in range(1, len(CONTEXTS)):
+        for past in range(len(CONTEXTS)):
+            for future in range(len(CONTEXTS)):
+                for word_end in range(2):
+                    allophone = "%s{%s+%s}%s" % (CONTEXTS[center], CONTEXTS[past], CONTEXTS[future], "@f" * word_end)
+                    allophones.append(allophone)
+                    contexts.append((past, center, future))
+                    for state in range(info.num_hmm_states_per_phon):
+                        center_state = (center * info.num_hmm_states_per_phon + state) * 2 + word_end
+                        dense_label = (center_state * info.n_contexts + past) * info.n_contexts + future
+                        dense_tying["%s.%d" % (allophone, state)] = dense_label
+    contexts = np.array(contexts)
+
+    labels = {}
+    caches = []
+    for part in range(num_caches):
+        caches.append(os.path.join(tmpdir, "alignment.cache.%d" % (part + 1)))
+        archive = FileArchive(caches[-1], must_exists=False)
+        for i in range(part, num_segments, num_caches):
+            name = "corpus/rec%d/seg" % i
+            num_frames = rng.randint(1, 200)
+            allophone_idxs = np.repeat(rng.randint(0, len(allophones), num_frames), rng.randint(1, 20, num_frames))
+            allophone_idxs = allophone_idxs[:num_frames]
+            states = rng.randint(0, info.num_hmm_states_per_phon, num_frames)
+            archive.addAlignmentCache(name, list(zip(range(num_frames), allophone_idxs, states)))
+            labels[name] = tuple(contexts[allophone_idxs, i] for i in range(3))
+        archive.finalize()
+        archive.f.close()
+
+    bundle = os.path.join(tmpdir, "alignment.cache.bundle")
+    with open(bundle, "wt") as f:
+        f.write("\n".join(caches) + "\n")
+    allophone_file = os.path.join(tmpdir, "allophones")
+    with open(allophone_file, "wt") as f:
+        f.write("# allophones\n" + "\n".join(allophones) + "\n")
+    dense_tying_file = os.path.join(tmpdir, "dense-tying")
+    with open(dense_tying_file, "wt") as f:
+        f.write("".join("%s %d\n" % (k, v) for k, v in dense_tying.items()))
+    return bundle, allophone_file, dense_tying_file, labels
+
+
+def _read_hdf(path, key=None):
+    """
+    :return: seq tag -> data of the main stream or the extra stream `key`
+    """
+    with h5py.File(path, "r") as f:
+        tags = [tag.decode() if isinstance(tag, bytes) else tag for tag in f["seqTags"][()]]
+        if key is None:
+            data, lengths = f["inputs"][()], f["seqLengths"][:, 0]
+        else:
+            column = 1 + sorted(f["targets/data"].keys()).index(key)
+            data, lengths = f["targets/data"][key][()], f["seqLengths"][:, column]
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+    return {tag: data[start:end] for tag, start, end in zip(tags, offsets[:-1], offsets[1:])}
+
+
+@pytest.mark.parametrize("multi_stream", [False, True])
+@pytest.mark.parametrize("sparse", [False, True])
+@pytest.mark.parametrize("num_workers", [1, 2])
+def test_get_phoneme_labels_from_no_tying_dense(multi_stream, sparse, num_workers):
+    info = DenseLabelInfo(
+        n_contexts=len(CONTEXTS), use_word_end_classes=True, use_boundary_classes=False, num_hmm_states_per_phon=3
+    )
+    with tempfile.TemporaryDirectory() as tmpdir:
+        bundle, allophone_file, dense_tying_file, labels = _write_inputs(tmpdir, info)
+        job = GetPhonemeLabelsFromNoTyingDense(
+            alignment_cache_path=Path(bundle),
+            allophone_path=Path(allophone_file),
+            dense_tying_path=Path(dense_tying_file),
+            dense_label_info=info,
+            sparse=sparse,
+            multi_stream=multi_stream,
+            num_workers=num_workers,
+        )
+        if multi_stream:
+            job.out_hdf_contexts = Path(os.path.join(tmpdir, "contexts.hdf"))
+        else:
+            job.out_hdf_left_context = Path(os.path.join(tmpdir, "left_context.hdf"))
+            job.out_hdf_right_context = Path(os.path.join(tmpdir, "right_context.hdf"))
+            job.out_hdf_center_context = Path(os.path.join(tmpdir, "center_context.hdf"))
+        job.run()
+
+        if multi_stream:
+            path = job.out_hdf_contexts.get_path()
+            streams = [_read_hdf(path, "left_context"), _read_hdf(path), _read_hdf(path, "right_context")]
+        else:
+            streams = [
+                _read_hdf(job.out_hdf_left_context.get_path()),
+                _read_hdf(job.out_hdf_center_context.get_path()),
+                _read_hdf(job.out_hdf_right_context.get_path()),
+            ]
+
+    # the segments are written in the order of the caches in the bundle
+    expected_tags = ["corpus/rec%d/seg" % i for i in [0, 2, 4, 6, 1, 3, 5]]
+    for stream, name in zip(streams, ["past", "center", "future"]):
+        assert list(stream) == expected_tags, name
+    for tag in expected_tags:
+        for stream, expected in zip(streams, labels[tag]):
+            assert stream[tag].shape == ((len(expected),) if sparse else (len(expected), 1))
+            np.testing.assert_array_equal(stream[tag].reshape(-1), expected)
@@ -0,0 +1,67 @@
+import json
+import os
+import tempfile
+
+import numpy as np
+
+from i6_core.lib.rasr_cache import FileArchive
+from i6_core.mm.tdp import _count_transitions
+
+ALLOPHONES = ["[SILENCE]{#+#}@i@f", "a{#+b}", "b{a+#}", "c{b+a}"]
+
+
+def _count_transitions_per_frame(alignments):
+    """
+    Counts the transitions frame by frame, like the job did on the output of the archiver
+    """
+    trans_mapping = np.asarray([[0, 1, 2], [2, 0, 1], [1, 2, 0]])
+    trans_dict = {"phon": {0: 0, 1: 0, 2: 0}, "si": {0: 0, 1: 0, 2: 0}}
+    for alignment in alignments:
+        transitions = {"phon": [], "si": []}
+        for allophone, state in alignment:
+            if "#" in ALLOPHONES[allophone]:
+                transitions["si"].append(state)
+            else:
+                transitions["phon"].append(state)
+        for phon, states in transitions.items():
+            prev = 0
+            for t in states:
+                trans_dict[phon][int(trans_mapping[prev, t])] += 1
+                prev = t
+    return trans_dict
+
+
+def test_count_transitions():
+    rng = np.random.RandomState(1)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        alignment_path = os.path.join(tmpdir, "alignment.cache.1")
+        segment_path = os.path.join(tmpdir, "segments.1")
+        allophone_path = os.path.join(tmpdir, "allophones")
+        out_path = os.path.join(tmpdir, "trans.count.1")
+        with open(allophone_path, "wt") as f:
+            f.write("# allophones\n" + "\n".join(ALLOPHONES) + "\n")
+
+        archive = FileArchive(alignment_path, must_exists=False)
+        alignments = []
+        segments = []
+        for i in range(20):
+            num_frames = rng.randint(1, 500)
+            allophones = np.repeat(rng.randint(0, len(ALLOPHONES), num_frames), rng.randint(1, 30, num_frames))
+            states = np.repeat(rng.randint(0, 3, num_frames), rng.randint(1, 10, num_frames))
+            alignment = list(zip(allophones[:num_frames], states[:num_frames]))
+            segments.append("corpus/rec%d/seg" % i)
+            alignments.append(alignment)
+            archive.addAlignmentCache(segments[-1], [(t, a, s) for t, (a, s) in enumerate(alignment)])
+        archive.finalize()
+        archive.f.close()
+        # segments which are not in the cache are skipped
+        with open(segment_path, "wt") as f:
+            f.write("\n".join(segments + ["corpus/missing/seg"]) + "\n")
+
+        assert _count_transitions((1, alignment_path, segment_path, allophone_path, out_path)) == 1
+        with open(out_path, "rt") as f:
+            counts = json.load(f)
+
+    expected = _count_transitions_per_frame(alignments)
+    assert counts == {phon: {str(i): float(c) for i, c in d.items()} for phon, d in expected.items()}
+    assert all(c > 0 for d in counts.values() for c in d.values())
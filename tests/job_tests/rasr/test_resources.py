@@ -0,0 +1,92 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+from i6_core.rasr.resources import (
+    ResourceUsage,
+    find_resource_metric_files,
+    load_resource_usages,
+    recommend_rqmt,
+    run_and_measure,
+    write_resource_usage,
+)
+
+GB = 1024**3
+
+
+def _usage(wall_time: float, peak_rss: int, cpu_time: float = 0.0, returncode: int = 0) -> ResourceUsage:
+    return ResourceUsage(
+        cmd=["./run.sh"],
+        returncode=returncode,
+        start_time=0.0,
+        wall_time=wall_time,
+        user_time=cpu_time,
+        system_time=0.0,
+        peak_rss=peak_rss,
+        hostname="node",
+    )
+
+
+def test_recommend_rqmt():
+    # the maximum over all tasks: 2 hours and 3 GB, scaled by the default margins 1.5 and 1.25
+    usages = [_usage(3600.0, 2 * GB, cpu_time=3600.0), _usage(7200.0, 3 * GB, cpu_time=7200.0)]
+    assert recommend_rqmt([usages]) == {"time": 3.0, "cpu": 1, "mem": 4}
+
+    # the time is rounded up to the granularity, the memory up to whole GB
+    rqmt = recommend_rqmt([[_usage(3601.0, int(3.3 * GB))]], time_margin=1.0, mem_margin=1.0)
+    assert rqmt["time"] == 1.25 and rqmt["mem"] == 4
+    assert recommend_rqmt([[_usage(3601.0, GB)]], time_margin=1.0, time_granularity=1.0)["time"] == 2.0
+    assert recommend_rqmt([[_usage(3600.0, 2 * GB)]], time_margin=1.0, mem_margin=1.0) == {
+        "time": 1.0,
+        "cpu": 1,
+        "mem": 2,
+    }
+
+    # lower bounds for short and small tasks
+    assert recommend_rqmt([[_usage(10.0, 1024)]]) == {"time": 0.5, "cpu": 1, "mem": 1}
+    assert recommend_rqmt([[_usage(10.0, 1024)]], min_time=1.0, min_mem=2) == {"time": 1.0, "cpu": 1, "mem": 2}
+
+    # multi-threaded tasks, a ratio slightly above a whole number does not result in another cpu
+    assert recommend_rqmt([[_usage(100.0, GB, cpu_time=395.0)]])["cpu"] == 4
+    assert recommend_rqmt([[_usage(100.0, GB, cpu_time=405.0)]])["cpu"] == 4
+    assert recommend_rqmt([[_usage(100.0, GB, cpu_time=420.0)]])["cpu"] == 5
+
+    # failed invocations are ignored
+    assert recommend_rqmt([[_usage(36000.0, 100 * GB, returncode=1), _usage(60.0, GB)]])["mem"] == 2
+    assert recommend_rqmt([[_usage(60.0, GB, returncode=-9)]]) is None
+    assert recommend_rqmt([]) is None
+
+
+def test_write_and_find_metric_files():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        work_dir = os.path.join(tmpdir, "AlignmentJob.abc", "work")
+        os.makedirs(work_dir)
+        metrics_file = os.path.join(work_dir, "alignment.log.1.resources.json")
+        # retries are appended to the same file
+        write_resource_usage(metrics_file, _usage(60.0, GB, returncode=1))
+        write_resource_usage(metrics_file, _usage(7200.0, 2 * GB))
+        assert load_resource_usages(metrics_file) == [_usage(60.0, GB, returncode=1), _usage(7200.0, 2 * GB)]
+
+        files = find_resource_metric_files([os.path.join(tmpdir, "AlignmentJob.abc")])
+        assert files == [metrics_file]
+        assert recommend_rqmt(files) == {"time": 3.0, "cpu": 1, "mem": 3}
+
+
+def test_run_and_measure():
+    # the memory of a grandchild process is included in the measurement
+    script = "import subprocess, sys; sys.exit(subprocess.call([sys.executable, '-c', 'x = bytearray(200 * 2**20)']))"
+    returncode, usage = run_and_measure([sys.executable, "-c", script])
+    assert returncode == 0 and usage.returncode == 0
+    assert usage.peak_rss >= 200 * 2**20
+    assert usage.wall_time > 0 and usage.cpu_time > 0
+
+    returncode, usage = run_and_measure([sys.executable, "-c", "import sys; sys.exit(3)"])
+    assert returncode == 3 and usage.returncode == 3
+
+    returncode, usage = run_and_measure([sys.executable, "-c", "import os, signal; os.kill(os.getpid(), 9)"])
+    assert returncode == -9
+
+    with pytest.raises(FileNotFoundError):
+        run_and_measure(["/nonexistent/binary"])
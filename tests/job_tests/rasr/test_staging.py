@@ -0,0 +1,162 @@
+import errno
+import gzip
+import os
+import tempfile
+import threading
+import time
+
+import pytest
+
+from i6_core.rasr.command import RasrCommand
+from i6_core.rasr.staging import NodeLocalCache, atomic_move, parallel_copy
+
+
+def _write(path: str, content: str):
+    with open(path, "wt") as f:
+        f.write(content)
+
+
+def _read(path: str) -> str:
+    with open(path, "rt") as f:
+        return f.read()
+
+
+def test_parallel_copy():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        src_dir = os.path.join(tmpdir, "src")
+        dst_dir = os.path.join(tmpdir, "dst")
+        os.makedirs(src_dir)
+        os.makedirs(dst_dir)
+        for i in range(20):
+            _write(os.path.join(src_dir, "file.%d" % i), "content %d" % i)
+
+        parallel_copy(
+            ((os.path.join(src_dir, "file.%d" % i), os.path.join(dst_dir, "file.%d" % i)) for i in range(20)),
+            num_workers=4,
+        )
+        for i in range(20):
+            assert _read(os.path.join(dst_dir, "file.%d" % i)) == "content %d" % i
+
+        with pytest.raises(FileNotFoundError):
+            parallel_copy([(os.path.join(src_dir, "missing"), os.path.join(dst_dir, "missing"))])
+
+
+def test_atomic_move(monkeypatch):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        src = os.path.join(tmpdir, "src")
+        dst = os.path.join(tmpdir, "dst")
+        _write(src, "content")
+        atomic_move(src, dst)
+        assert not os.path.exists(src)
+        assert _read(dst) == "content"
+
+        # moving across file systems copies to a temporary file next to the destination first
+        replace = os.replace
+        calls = []
+
+        def replace_across_devices(a, b):
+            calls.append((a, b))
+            if len(calls) == 1:
+                raise OSError(errno.EXDEV, "cross-device link")
+            replace(a, b)
+
+        monkeypatch.setattr(os, "replace", replace_across_devices)
+        _write(src, "other content")
+        atomic_move(src, dst)
+        assert not os.path.exists(src)
+        assert _read(dst) == "other content"
+        assert len(calls) == 2 and calls[1][1] == dst and calls[1][0] != src
+        assert os.listdir(tmpdir) == ["dst"]
+
+
+def test_node_local_cache():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        cache_dir = os.path.join(tmpdir, "cache")
+        src = os.path.join(tmpdir, "mixtures")
+        _write(src, "mixtures 1")
+
+        with NodeLocalCache(cache_dir) as cache:
+            local_path = cache.get(src)
+            assert local_path != src and _read(local_path) == "mixtures 1"
+            assert cache.get(src) == local_path
+
+        # a changed input results in a new entry
+        _write(src, "mixtures 2, longer")
+        with NodeLocalCache(cache_dir) as cache:
+            new_local_path = cache.get(src)
+            assert new_local_path != local_path and _read(new_local_path) == "mixtures 2, longer"
+
+            # the entry in use is kept, the old entry is evicted
+            cache.min_unused_time = 0
+            cache.evict(0)
+            assert os.path.exists(new_local_path)
+            assert not os.path.exists(local_path)
+
+        # released entries can be evicted
+        NodeLocalCache(cache_dir, min_unused_time=0).evict(0)
+        assert not os.path.exists(new_local_path)
+
+
+def test_node_local_cache_concurrent_get_and_evict():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        cache_dir = os.path.join(tmpdir, "cache")
+        sources = []
+        for i in range(4):
+            sources.append(os.path.join(tmpdir, "input.%d" % i))
+            _write(sources[-1], "input %d " % i * 1000)
+        errors = []
+
+        def task(task_id: int):
+            try:
+                for step in range(10):
+                    src = sources[(task_id + step) % len(sources)]
+                    # max_size 0 evicts every entry that is not in use by any task
+                    with NodeLocalCache(cache_dir, max_size=0, min_unused_time=0) as cache:
+                        local_path = cache.get(src)
+                        time.sleep(0.001)
+                        assert _read(local_path) == _read(src)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=task, args=(i,)) for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert not errors, errors
+
+
+class _ConcurrentCommand(RasrCommand):
+    concurrent = 3
+
+
+def test_run_script_concurrent_tmp_dirs():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        work_dir = os.path.join(tmpdir, "work")
+        os.makedirs(work_dir)
+        _write(os.path.join(work_dir, "config"), "config")
+        # the outputs of other tasks must not be copied into the temp dir of a task
+        _write(
+            os.path.join(work_dir, "run.sh"),
+            "#!/bin/sh\n"
+            'for f in out.*; do test -e "$f" && exit 1; done\n'
+            "cat config > out.$1\n"
+            "echo task $1 > $2\n",
+        )
+        os.chmod(os.path.join(work_dir, "run.sh"), 0o755)
+
+        command = _ConcurrentCommand()
+        cwd = os.getcwd()
+        os.chdir(work_dir)
+        try:
+            for task_id in [2, 1, 3, 1]:
+                log_file = os.path.join(tmpdir, "log.%d" % task_id)
+                command.run_script(task_id, log_file, retries=0, use_tmp_dir=True)
+                with gzip.open(log_file + ".gz", "rt") as f:
+                    assert f.read() == "task %d\n" % task_id
+        finally:
+            os.chdir(cwd)
+
+        for task_id in [1, 2, 3]:
+            assert _read(os.path.join(work_dir, "out.%d" % task_id)) == "config"
+        assert not any(fn.startswith("crash_dir") for fn in os.listdir(work_dir))
@@ -0,0 +1,75 @@
+import os
+import tempfile
+
+import numpy as np
+import pytest
+
+from i6_core.lib.checkpoint_averaging import average_torch_checkpoints, get_average_weights
+
+
+def _checkpoints():
+    return [
+        {"linear/W": np.array([[1.0, 2.0], [3.0, 4.0]]), "linear/b": np.array([0.0, 1.0])},
+        {"linear/W": np.array([[3.0, 2.0], [1.0, 0.0]]), "linear/b": np.array([2.0, 1.0])},
+        {"linear/W": np.array([[5.0, 8.0], [2.0, 2.0]]), "linear/b": np.array([4.0, 7.0])},
+    ]
+
+
+def _average(checkpoints, weights):
+    return {name: sum(w * ckpt[name] for w, ckpt in zip(weights, checkpoints)) for name in checkpoints[0]}
+
+
+def test_uniform_average():
+    weights = get_average_weights(3)
+    assert weights == pytest.approx([1 / 3] * 3)
+    avg = _average(_checkpoints(), weights)
+    np.testing.assert_allclose(avg["linear/W"], [[3.0, 4.0], [2.0, 2.0]])
+    np.testing.assert_allclose(avg["linear/b"], [2.0, 3.0])
+
+
+def test_weighted_average():
+    weights = get_average_weights(3, weights=[1.0, 1.0, 2.0])
+    assert weights == pytest.approx([0.25, 0.25, 0.5])
+    avg = _average(_checkpoints(), weights)
+    np.testing.assert_allclose(avg["linear/W"], [[3.5, 5.0], [2.0, 2.0]])
+    np.testing.assert_allclose(avg["linear/b"], [2.5, 4.0])
+
+    with pytest.raises(AssertionError):
+        get_average_weights(3, weights=[1.0, 2.0])
+    with pytest.raises(AssertionError):
+        get_average_weights(2, weights=[1.0, 1.0], ema_decay=0.5)
+
+
+@pytest.mark.parametrize("decay", [0.0, 0.5, 0.9])
+def test_ema_weights(decay):
+    checkpoints = _checkpoints()
+    # ema_0 = p_0, ema_i = decay * ema_(i-1) + (1 - decay) * p_i
+    ema = dict(checkpoints[0])
+    for ckpt in checkpoints[1:]:
+        ema = {name: decay * ema[name] + (1.0 - decay) * ckpt[name] for name in ema}
+
+    weights = get_average_weights(3, ema_decay=decay)
+    assert sum(weights) == pytest.approx(1.0)
+    avg = _average(checkpoints, weights)
+    for name in ema:
+        np.testing.assert_allclose(avg[name], ema[name])
+
+
+def test_average_torch_checkpoints():
+    torch = pytest.importorskip("torch")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        paths = []
+        for epoch, ckpt in enumerate(_checkpoints(), start=1):
+            paths.append(os.path.join(tmpdir, "epoch.%03d.pt" % epoch))
+            model = {name: torch.tensor(value, dtype=torch.float16) for name, value in ckpt.items()}
+            model["steps"] = torch.tensor(epoch)
+            torch.save({"model": model, "epoch": epoch}, paths[-1])
+
+        out_path = os.path.join(tmpdir, "avg.pt")
+        average_torch_checkpoints(paths, out_path, get_average_weights(3, weights=[1.0, 1.0, 2.0]))
+        out = torch.load(out_path)
+        assert out["epoch"] == 3
+        assert list(out["model"]) == ["linear/W", "linear/b", "steps"]
+        assert out["model"]["linear/W"].dtype == torch.float16
+        np.testing.assert_allclose(out["model"]["linear/W"].float().numpy(), [[3.5, 5.0], [2.0, 2.0]])
+        assert int(out["model"]["steps"]) == 3
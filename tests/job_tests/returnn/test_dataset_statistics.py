@@ -0,0 +1,81 @@
+import numpy as np
+
+from i6_core.lib.dataset_statistics import FeatureStatistics
+
+
+def _sharded_statistics(shards, histogram_range=None, histogram_bins=1000):
+    """
+    Statistics per shard, each one accumulated over chunks of random size like the buffers of the workers,
+    and merged afterwards
+    """
+    rng = np.random.RandomState(1)
+    stats = FeatureStatistics(shards[0].shape[1], histogram_range, histogram_bins)
+    for shard in shards:
+        shard_stats = FeatureStatistics(shard.shape[1], histogram_range, histogram_bins)
+        start = 0
+        while start < len(shard):
+            end = start + rng.randint(1, 50)
+            shard_stats.add(shard[start:end])
+            start = end
+        stats.merge(shard_stats)
+    return stats
+
+
+def test_merge_sharded_statistics():
+    rng = np.random.RandomState(0)
+    # offset and scale differ per dimension, the large offset checks the numerical stability of the merge
+    data = rng.randn(1000, 3) * [1.0, 0.01, 5.0] + [0.0, 1e4, -3.0]
+    split_points = np.sort(rng.choice(np.arange(1, len(data)), size=4, replace=False))
+    # an empty shard in the middle, like a worker without any sequence
+    shards = np.split(data, split_points) + [data[:0]]
+    shards.insert(2, data[:0])
+    assert sum(len(shard) for shard in shards) == len(data)
+
+    stats = _sharded_statistics(shards)
+    assert stats.count == len(data)
+    np.testing.assert_allclose(stats.mean, np.mean(data, axis=0), rtol=1e-12)
+    np.testing.assert_allclose(stats.std_dev, np.std(data, axis=0), rtol=1e-9)
+    np.testing.assert_array_equal(stats.min, np.min(data, axis=0))
+    np.testing.assert_array_equal(stats.max, np.max(data, axis=0))
+
+    total_mean, total_std_dev = stats.total_mean_and_std_dev()
+    np.testing.assert_allclose(total_mean, np.mean(data), rtol=1e-12)
+    np.testing.assert_allclose(total_std_dev, np.std(data), rtol=1e-9)
+
+    # merging into or from empty statistics does not change anything
+    empty = FeatureStatistics(3)
+    empty.merge(stats)
+    np.testing.assert_array_equal(empty.mean, stats.mean)
+    np.testing.assert_array_equal(empty.m2, stats.m2)
+    stats.merge(FeatureStatistics(3))
+    assert stats.count == len(data)
+
+
+def test_histogram_and_percentiles():
+    rng = np.random.RandomState(0)
+    data = np.stack([rng.uniform(-4.0, 4.0, 2000), rng.randn(2000), rng.uniform(0.0, 1.0, 2000)], axis=1)
+    histogram_range = (-4.0, 4.0)
+    bins = 800
+    shards = np.split(data, [300, 300, 1700])
+    stats = _sharded_statistics(shards, histogram_range, bins)
+
+    assert stats.histogram.shape == (3, bins)
+    for d in range(3):
+        reference, _ = np.histogram(np.clip(data[:, d], *histogram_range), bins=bins, range=histogram_range)
+        np.testing.assert_array_equal(stats.histogram[d], reference)
+
+    # the interpolation within a bin is exact up to the bin width
+    qs = [0, 1, 5, 25, 50, 75, 95, 99, 100]
+    percentiles = stats.percentiles(qs)
+    assert percentiles.shape == (3, len(qs))
+    bin_width = (histogram_range[1] - histogram_range[0]) / bins
+    np.testing.assert_allclose(percentiles, np.percentile(data, qs, axis=0).T, atol=2 * bin_width)
+
+
+def test_histogram_outer_bins():
+    stats = FeatureStatistics(2, histogram_range=(0.0, 1.0), histogram_bins=4)
+    stats.add(np.array([[-5.0, 0.3], [0.0, 0.5], [1.0, 0.74], [7.0, 0.76]]))
+    np.testing.assert_array_equal(stats.histogram, [[2, 0, 0, 2], [0, 1, 2, 1]])
+    # the percentiles 0 and 100 are the borders of the outermost non-empty bins
+    np.testing.assert_allclose(stats.percentiles([0, 50, 100]), [[0.0, 0.25, 1.0], [0.25, 0.625, 1.0]])
+    assert np.isnan(FeatureStatistics(2, histogram_range=(0.0, 1.0)).percentiles([50])).all()
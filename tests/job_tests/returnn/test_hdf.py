@@ -0,0 +1,87 @@
+import os
+import tempfile
+
+import h5py
+import numpy as np
+from sisyphus import setup_path, tk
+
+from i6_core.lib import corpus
+from i6_core.returnn.dataset import SpeakerLabelHDFFromBlissJob, _get_hdf_seq_lens
+
+Path = setup_path(__package__)
+
+
+def test_speaker_label_hdf():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        c = corpus.Corpus()
+        c.name = "test"
+        for name in ["spk1", "spk2"]:
+            speaker = corpus.Speaker()
+            speaker.name = name
+            c.add_speaker(speaker)
+        for idx, speaker_name in enumerate(["spk2", "spk1", "spk2"]):
+            recording = corpus.Recording()
+            recording.name = "rec%d" % idx
+            recording.audio = "rec%d.wav" % idx
+            recording.speaker_name = speaker_name
+            segment = corpus.Segment(start=0.0, end=1.0, orth="a")
+            segment.name = "seg"
+            recording.add_segment(segment)
+            c.add_recording(recording)
+        corpus_file = os.path.join(tmpdir, "corpus.xml")
+        c.dump(corpus_file)
+
+        job = SpeakerLabelHDFFromBlissJob(Path(corpus_file))
+        job.out_speaker_hdf = Path(os.path.join(tmpdir, "speaker_labels.hdf"))
+        job.out_speaker_dict = Path(os.path.join(tmpdir, "speaker_dict.pkl"))
+        job.out_num_speakers = tk.Variable(os.path.join(tmpdir, "num_speakers"))
+        job.run()
+
+        with h5py.File(job.out_speaker_hdf.get_path(), "r") as f:
+            assert f.attrs["numSeqs"] == 3 and f.attrs["numLabels"] == 2
+            assert np.array_equal(f["inputs"][()], [1, 0, 1])
+            assert np.array_equal(f["seqLengths"][()], [[1, 0], [1, 0], [1, 0]])
+            assert [tag.decode() for tag in f["seqTags"][()]] == ["test/rec0/seg", "test/rec1/seg", "test/rec2/seg"]
+
+
+def _write_multi_target_hdf(path, tags, lengths, data_keys, labels_keys):
+    """
+    HDF file with inputs and several targets, the columns of seqLengths are given by `lengths`
+    """
+    with h5py.File(path, "w") as f:
+        f.create_dataset("inputs", data=np.zeros((int(sum(lengths[:, 0])), 2), dtype="float32"))
+        f.create_dataset("seqLengths", data=lengths)
+        f.create_dataset("seqTags", data=[tag.encode() for tag in tags], dtype=h5py.special_dtype(vlen=str))
+        for group in ["targets/data", "targets/size", "targets/labels"]:
+            f.create_group(group)
+        for key in data_keys:
+            f["targets/data"].create_dataset(key, data=np.zeros((0,), dtype="int32"))
+            f["targets/size"].attrs[key] = [10, 1]
+        for key in labels_keys:
+            f["targets/labels"].create_dataset(key, data=np.array([b"dummy-label"]), dtype="S11")
+
+
+def test_hdf_seq_lens_multi_target():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        # "align" only exists in targets/labels and has the first target column, before "alignment"
+        old_file = os.path.join(tmpdir, "old.hdf")
+        lengths = np.array([[10, 1, 2, 3, 4], [20, 5, 6, 7, 8]], dtype="int32")
+        _write_multi_target_hdf(old_file, ["a", "b"], lengths, ["alignment", "classes", "orth"], ["align"])
+        dataset = {"class": "HDFDataset", "files": [old_file]}
+        assert _get_hdf_seq_lens(dataset, "data") == [("a", 10), ("b", 20)]
+        assert _get_hdf_seq_lens(dataset, "align") == [("a", 1), ("b", 5)]
+        assert _get_hdf_seq_lens(dataset, "alignment") == [("a", 2), ("b", 6)]
+        assert _get_hdf_seq_lens(dataset, "classes") == [("a", 3), ("b", 7)]
+        assert _get_hdf_seq_lens(dataset, "orth") == [("a", 4), ("b", 8)]
+
+        # files without a column for the labels only target, as read by current RETURNN versions
+        new_file = os.path.join(tmpdir, "new.hdf")
+        lengths = np.array([[30, 9, 10, 11]], dtype="int32")
+        _write_multi_target_hdf(new_file, ["c"], lengths, ["alignment", "classes", "orth"], ["align", "classes"])
+        dataset = {"class": "HDFDataset", "files": [new_file]}
+        assert _get_hdf_seq_lens(dataset, "classes") == [("c", 10)]
+        assert _get_hdf_seq_lens(dataset, "align") is None
+
+        # the column layout differs between the files
+        dataset = {"class": "HDFDataset", "files": [old_file, new_file]}
+        assert _get_hdf_seq_lens(dataset, "classes") is None
@@ -2,7 +2,7 @@ import os
 import tempfile
 from sisyphus import setup_path
 
-from i6_core.returnn.search import SearchBPEtoWordsJob
+from i6_core.returnn.search import SearchBPEtoWordsJob, SearchWordsToCTMJob
 
 Path = setup_path(__package__)
 
@@ -31,3 +31,27 @@ def test_search_bpe_to_words_nbest():
         reference_dict = eval(open(reference_word_search_results.get_path(), "rt").read())
         job_dict = eval(open(bpe_to_words_job.out_word_search_results.get_path(), "rt").read())
         assert reference_dict == job_dict
+
+
+def test_search_words_to_ctm_single():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        ctm_job = SearchWordsToCTMJob(Path("files/word_search_results_single.py"), Path("files/test_ctm.corpus.xml"))
+        ctm_job.out_ctm_file = Path(os.path.join(tmpdir, "search.ctm"))
+        ctm_job.run()
+
+        reference = open(Path("files/test_ctm_single.ctm").get_path(), "rt").read()
+        assert open(ctm_job.out_ctm_file.get_path(), "rt").read() == reference
+
+
+def test_search_words_to_ctm_nbest():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        ctm_job = SearchWordsToCTMJob(
+            Path("files/word_search_results_nbest.py"), Path("files/test_ctm.corpus.xml"), n_best=2
+        )
+        ctm_job.out_ctm_file = Path(os.path.join(tmpdir, "search.ctm"))
+        ctm_job.run()
+
+        lines = open(ctm_job.out_ctm_file.get_path(), "rt").read().splitlines()
+        assert lines[0].endswith("<n-best>")
+        ranks = {line.split()[-1] for line in lines if not line.startswith(";;")}
+        assert ranks == {"1", "2"}
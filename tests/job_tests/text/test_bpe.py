@@ -0,0 +1,56 @@
+import gzip
+import os
+import subprocess
+import sys
+import tempfile
+
+import pytest
+from sisyphus import setup_path
+
+from i6_core.lib.bpe import apply_bpe_to_file
+from i6_core.tools.git import CloneGitRepositoryJob
+
+Path = setup_path(__package__)
+
+BPE_CODES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lexicon", "files", "bpe.codes")
+
+# line boundaries of str.splitlines which are not line breaks in text mode, next to \r\n and \r
+TEXT = (
+    "THE THEORY OF EBONY\n"
+    "A NEW\x0bYORK\n"
+    "BACKLOG\x1cCENTERING\x1dDINNERTIME\x1eREMORSEFUL\n"
+    "SENTIMENTAL\x85POMMES\u2028ABANDONING\r\n"
+    "INGLEBOROUGH\rTHE END\n"
+    "  LEADING AND TRAILING  \n"
+    "\n"
+) * 20 + "NO FINAL LINE BREAK"
+
+
+@pytest.mark.parametrize("num_workers", [1, 3])
+def test_apply_bpe_to_file(num_workers):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        subword_nmt_job = CloneGitRepositoryJob(
+            url="https://github.com/rwth-i6/subword-nmt",
+            checkout_folder_name="subword-nmt",
+        )
+        subword_nmt_job.out_repository = Path(os.path.join(tmpdir, "subword_nmt_repo"))
+        subword_nmt_job.run()
+        apply_bpe_script = os.path.join(subword_nmt_job.out_repository.get_path(), "apply_bpe.py")
+
+        text_file = os.path.join(tmpdir, "text.txt")
+        with open(text_file, "wb") as f:
+            f.write(TEXT.encode("utf-8"))
+        with gzip.open(text_file + ".gz", "wb") as f:
+            f.write(TEXT.encode("utf-8"))
+
+        ref_file = os.path.join(tmpdir, "ref.txt")
+        subprocess.check_call([sys.executable, apply_bpe_script, "-c", BPE_CODES, "-i", text_file, "-o", ref_file])
+        with open(ref_file, "rb") as f:
+            reference = f.read()
+
+        # byte range shards for uncompressed input, line shards for gzipped input, both split into several shards
+        for input_file in [text_file, text_file + ".gz"]:
+            out_file = os.path.join(tmpdir, "out.txt")
+            apply_bpe_to_file(apply_bpe_script, BPE_CODES, input_file, out_file, num_workers=num_workers, shard_size=64)
+            with open(out_file, "rb") as f:
+                assert f.read() == reference, input_file
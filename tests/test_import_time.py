@@ -0,0 +1,112 @@
+"""
+Checks that importing the job packages does not import heavy runtime dependencies.
+
+Building the graph in the Sisyphus manager and starting a mini task imports the job modules, but the dependencies
+which are only needed inside the tasks of a job (e.g. librosa, torch) have to be imported within the task functions.
+
+Run as script to get a benchmark of the import time of each subpackage:
+`python3 -m i6_core.tests.test_import_time` from one folder above i6_core
+"""
+import os
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+import pytest
+
+ROOT_PACKAGE = __package__.split(".")[0]
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# only allowed to be imported at runtime of a job
+LAZY_MODULES = ["h5py", "librosa", "pyarrow", "scipy", "soundfile", "tensorflow", "torch"]
+
+# lib contains the runtime helpers of the jobs, it is checked via the job packages which import it
+NON_JOB_PACKAGES = ["docs", "lib", "tests"]
+
+_IMPORT_CODE = """
+import importlib, pkgutil
+import {package} as package
+for module in pkgutil.walk_packages(package.__path__, package.__name__ + ".", onerror=lambda name: None):
+    try:
+        importlib.import_module(module.name)
+    except ImportError:
+        pass  # modules with missing optional dependencies
+"""
+
+
+def get_subpackages() -> List[str]:
+    """
+    :return: names of the job packages of i6_core
+    """
+    return sorted(
+        name
+        for name in os.listdir(ROOT_DIR)
+        if name not in NON_JOB_PACKAGES and os.path.isfile(os.path.join(ROOT_DIR, name, "__init__.py"))
+    )
+
+
+def measure_import(package: str) -> Tuple[Dict[str, int], int]:
+    """
+    Imports the package with all its submodules in a fresh interpreter with `python -X importtime`
+
+    :param package: full name of the package
+    :return: cumulative import time in microseconds for each imported module and the total import time
+    """
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(p for p in sys.path if p)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _IMPORT_CODE.format(package=package)],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        env=env,
+        universal_newlines=True,
+    )
+    if result.returncode != 0:
+        raise ImportError("importing %s failed:\n%s" % (package, result.stderr[-2000:]))
+
+    times = {}
+    total = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        if not cumulative.strip().isdigit():
+            continue  # header
+        times[name.strip()] = int(cumulative)
+        if not name[1:].startswith(" "):
+            # imports on the top level, the nested imports are included in their cumulative time
+            total += int(cumulative)
+    return times, total
+
+
+@pytest.mark.parametrize("subpackage", get_subpackages())
+def test_no_heavy_imports(subpackage):
+    times, _ = measure_import("%s.%s" % (ROOT_PACKAGE, subpackage))
+    heavy = sorted({name.split(".")[0] for name in times} & set(LAZY_MODULES))
+    assert not heavy, "importing %s.%s imports %s, move these imports into the task functions" % (
+        ROOT_PACKAGE,
+        subpackage,
+        ", ".join(heavy),
+    )
+
+
+def main():
+    print("%-24s %12s  %s" % ("subpackage", "total [ms]", "slowest dependencies"))
+    for subpackage in get_subpackages():
+        package = "%s.%s" % (ROOT_PACKAGE, subpackage)
+        try:
+            times, total = measure_import(package)
+        except ImportError as e:
+            print("%-24s %12s  %s" % (subpackage, "failed", str(e).splitlines()[-1]))
+            continue
+        external = {
+            name: t
+            for name, t in times.items()
+            if "." not in name and name not in (ROOT_PACKAGE, "sisyphus", "importlib", "pkgutil")
+        }
+        slowest = sorted(external.items(), key=lambda x: -x[1])[:3]
+        print("%-24s %12.1f  %s" % (subpackage, total / 1000, ", ".join("%s %.1f" % (n, t / 1000) for n, t in slowest)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+import os
+import random
+import tempfile
+import threading
+import time
+
+import pytest
+
+from i6_core.util import partition_into_tree, reduce_tree, reduce_tree_parallel
+
+
+@pytest.mark.parametrize("num_leaves,num_workers", [(1, 1), (2, 4), (23, 1), (23, 4), (50, 8)])
+def test_reduce_tree_parallel(num_leaves, num_workers):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        leaves = []
+        for i in range(num_leaves):
+            leaves.append(os.path.join(tmpdir, "leaf.%d" % i))
+            with open(leaves[-1], "wt") as f:
+                f.write("<%d>" % i)
+        tree = partition_into_tree(leaves, 3)
+
+        # contents of the merges of the sequential reduction, in the order of their merge numbers
+        expected = []
+
+        def concat(elements):
+            expected.append("".join(elements))
+            return expected[-1]
+
+        reduce_tree(concat, partition_into_tree(["<%d>" % i for i in range(num_leaves)], 3))
+
+        lock = threading.Lock()
+        merged = {}
+
+        def merge(elements, merge_num):
+            # the merges finish in random order, the concatenation is not commutative
+            time.sleep(random.random() * 0.01)
+            content = ""
+            for path in elements:
+                with open(path, "rt") as f:
+                    content += f.read()
+            out_path = os.path.join(tmpdir, "merge.%d" % merge_num)
+            with open(out_path, "wt") as f:
+                f.write(content)
+            with lock:
+                merged[merge_num] = content
+            return out_path
+
+        result = reduce_tree_parallel(merge, tree, num_workers=num_workers, cleanup=os.unlink)
+
+        with open(result, "rt") as f:
+            assert f.read() == "".join("<%d>" % i for i in range(num_leaves))
+        assert merged == {i + 1: content for i, content in enumerate(expected)}
+        # the intermediate results are removed, the leaves are kept
+        assert sorted(os.listdir(tmpdir)) == sorted([os.path.basename(result)] + [os.path.basename(l) for l in leaves])
+        assert result == os.path.join(tmpdir, "merge.%d" % len(expected))
@@ -1,10 +1,6 @@
 __all__ = ["ApplyBPEModelToLexiconJob", "ApplyBPEToTextJob"]
 
-import subprocess as sp
 import os
-import shutil
-import sys
-import tempfile
 from typing import Optional
 import xml.etree.ElementTree as ET
 
@@ -12,6 +8,7 @@ from sisyphus import *
 
 Path = setup_path(__package__)
 
+from i6_core.lib.bpe import BpeApplier, apply_bpe_to_file
 from i6_core.lib.lexicon import Lexicon
 import i6_core.util as util
 
@@ -54,31 +51,12 @@ class ApplyBPEModelToLexiconJob(Job):
                 for t in eval:
                     lm_tokens.add(t)
 
-        lm_tokens = list(lm_tokens)
-
-        with util.uopen("words", "wt") as f:
-            for t in lm_tokens:
-                f.write("%s\n" % t)
-
-        apply_binary = self.subword_nmt_repo.join_right("subword_nmt/apply_bpe.py")
-        args = [
-            sys.executable,
-            apply_binary.get_path(),
-            "--input",
-            "words",
-            "--codes",
+        applier = BpeApplier(
+            self.subword_nmt_repo.join_right("subword_nmt/apply_bpe.py").get_path(),
             self.bpe_codes.get_path(),
-            "--output",
-            "bpes",
-        ]
-        if self.bpe_vocab is not None:
-            args += ["--vocabulary", self.bpe_vocab.get_path()]
-        sp.run(args, check=True)
-
-        with util.uopen("bpes", "rt") as f:
-            bpe_tokens = [l.strip().split() for l in f]
-
-        w2b = {w: b for w, b in zip(lm_tokens, bpe_tokens)}
+            self.bpe_vocab.get_path() if self.bpe_vocab is not None else None,
+        )
+        w2b = {w: applier.apply_line(w + "\n").strip().split() for w in lm_tokens}
 
         for l in lexicon.lemmata:
             if l.special is None and len(l.orth) > 0:
@@ -112,6 +90,7 @@ class ApplyBPEToTextJob(Job):
         subword_nmt_repo: Optional[tk.Path] = None,
         gzip_output: bool = False,
         mini_task=True,
+        num_workers: int = 1,
     ):
         """
         :param text_file: words text file to convert to bpe
@@ -121,6 +100,8 @@ class ApplyBPEToTextJob(Job):
         :param subword_nmt_repo: subword nmt repository path. see also `CloneGitRepositoryJob`
         :param gzip_output: use gzip on the output text
         :param mini_task: if the Job should run locally, e.g. only a small (<1M lines) text should be processed
+        :param num_workers: number of processes that apply the BPE codes to shards of the text, sets the cpu rqmt
+            if not running as mini task
         """
         self.text_file = text_file
         self.bpe_codes = bpe_codes
@@ -131,7 +112,8 @@ class ApplyBPEToTextJob(Job):
         self.out_bpe_text = self.output_path("words_to_bpe.txt.gz" if gzip_output else "words_to_bpe.txt")
 
         self.mini_task = mini_task
-        self.rqmt = {"cpu": 1, "mem": 2, "time": 2}
+        self.num_workers = num_workers
+        self.rqmt = {"cpu": num_workers, "mem": 2, "time": 2}
 
     def tasks(self):
         if self.mini_task:
@@ -140,36 +122,17 @@ class ApplyBPEToTextJob(Job):
             yield Task("run", rqmt=self.rqmt)
 
     def run(self):
-        with tempfile.TemporaryDirectory(prefix=gs.TMP_PREFIX) as tmp:
-            input_file = self.text_file.get_path()
-            tmp_infile = os.path.join(tmp, "in_text.txt")
-            tmp_outfile = os.path.join(tmp, "out_text.txt")
-            with util.uopen(tmp_infile, "wt") as out:
-                sp.call(["zcat", "-f", input_file], stdout=out)
-            cmd = [
-                sys.executable,
-                os.path.join(self.subword_nmt_repo.get_path(), "apply_bpe.py"),
-                "--input",
-                tmp_infile,
-                "--codes",
-                self.bpe_codes.get_path(),
-                "--output",
-                tmp_outfile,
-            ]
-
-            if self.bpe_vocab:
-                cmd += ["--vocabulary", self.bpe_vocab.get_path()]
-
-            util.create_executable("apply_bpe.sh", cmd)
-            sp.run(cmd, check=True)
-
-            if self.gzip_output:
-                with util.uopen(tmp_outfile, "rt") as fin, util.uopen(self.out_bpe_text, "wb") as fout:
-                    sp.call(["gzip"], stdin=fin, stdout=fout)
-            else:
-                shutil.copy(tmp_outfile, self.out_bpe_text.get_path())
+        apply_bpe_to_file(
+            os.path.join(self.subword_nmt_repo.get_path(), "apply_bpe.py"),
+            self.bpe_codes.get_path(),
+            self.text_file.get_path(),
+            self.out_bpe_text.get_path(),
+            vocab_file=self.bpe_vocab.get_path() if self.bpe_vocab is not None else None,
+            num_workers=self.num_workers if not self.mini_task else 1,
+        )
 
     @classmethod
     def hash(cls, parsed_args):
         del parsed_args["mini_task"]
+        del parsed_args["num_workers"]
         return super().hash(parsed_args)
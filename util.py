@@ -1,5 +1,7 @@
 from collections.abc import Mapping
+import concurrent.futures
 import gzip
+import heapq
 import logging
 import os
 import shutil
@@ -7,7 +9,7 @@ import stat
 import subprocess as sp
 import xml.dom.minidom
 import xml.etree.ElementTree as ET
-from typing import Dict, Any, List, Optional, Union
+from typing import Any, Callable, Dict, List, Optional, Sequence, Union
 
 from sisyphus import *
 from sisyphus.delayed_ops import DelayedBase, DelayedFormat
@@ -143,6 +145,67 @@ def reduce_tree(func, tree):
     return func([(reduce_tree(func, e) if type(e) == list else e) for e in tree])
 
 
+def reduce_tree_parallel(
+    func: Callable[[List, int], Any],
+    tree: List,
+    num_workers: int = 1,
+    cleanup: Optional[Callable[[Any], None]] = None,
+) -> Any:
+    """
+    Same as :func:`reduce_tree`, but independent nodes are reduced concurrently by up to `num_workers` threads.
+    A node is reduced as soon as all its sub-lists are reduced, so all merges of one tree level can run at the same
+    time. The threads only wait for `func`, which is meant to run external commands (e.g. RASR merges).
+
+    :param func: called with the elements of a node and the number of the node. The nodes are numbered from 1 in the
+        order in which :func:`reduce_tree` would reduce them, so log files of a node keep their names.
+    :param tree: nested list, e.g. from :func:`partition_into_tree`
+    :param num_workers: maximum number of nodes that are reduced at the same time
+    :param cleanup: called with each intermediate result after the parent node is reduced, e.g. to delete temp files
+    :return: result of the root node
+    """
+    # post-order of reduce_tree: (elements, child node indices)
+    nodes = []
+
+    def add_node(node):
+        children = [add_node(e) if type(e) == list else None for e in node]
+        nodes.append((node, children))
+        return len(nodes) - 1
+
+    add_node(tree)
+    results = [None] * len(nodes)
+    parents = {}
+    waiting = {}
+    for idx, (node, children) in enumerate(nodes):
+        child_idxs = [c for c in children if c is not None]
+        waiting[idx] = len(child_idxs)
+        for c in child_idxs:
+            parents[c] = idx
+
+    def run(idx):
+        node, children = nodes[idx]
+        elements = [results[c] if c is not None else e for e, c in zip(node, children)]
+        result = func(elements, idx + 1)
+        if cleanup is not None:
+            for c in children:
+                if c is not None:
+                    cleanup(results[c])
+        return result
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(num_workers, 1)) as executor:
+        running = {executor.submit(run, idx): idx for idx, count in waiting.items() if count == 0}
+        while running:
+            finished, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in finished:
+                idx = running.pop(future)
+                results[idx] = future.result()
+                parent = parents.get(idx)
+                if parent is not None:
+                    waiting[parent] -= 1
+                    if waiting[parent] == 0:
+                        running[executor.submit(run, parent)] = parent
+    return results[-1]
+
+
 def uopen(path: Union[str, tk.Path], *args, **kwargs) -> Union[gzip.open, open]:
     path = tk.uncached_path(path)
     if path.endswith(".gz"):
@@ -185,6 +248,25 @@ def chunks(l: List, n: int) -> List[List]:
         start = end
 
 
+def balanced_partition(costs: Sequence[float], n: int) -> List[List[int]]:
+    """
+    Splits items into n parts with (approximately) equal total cost, using the longest-processing-time-first
+    heuristic: the items are assigned in order of decreasing cost to the part with the currently lowest total cost.
+    This is at most 4/3 worse than the optimal partition.
+
+    :param costs: cost of each item, e.g. the segment durations
+    :param n: number of parts
+    :return: n lists of item indices, each in ascending order
+    """
+    heap = [(0.0, i) for i in range(n)]
+    parts = [[] for _ in range(n)]
+    for idx in sorted(range(len(costs)), key=lambda i: costs[i], reverse=True):
+        load, part = heapq.heappop(heap)
+        parts[part].append(idx)
+        heapq.heappush(heap, (load + costs[idx], part))
+    return [sorted(p) for p in parts]
+
+
 def relink(src: str, dst: str):
     if os.path.exists(dst) or os.path.islink(dst):
         os.remove(dst)